@@ -326,9 +326,10 @@ class DiskTempThread(threading.Thread):
 
             try:
                 with Client() as c:
+                    temperatures = c.call("disk.temperatures", self.disks, {"powermode": self.powermode})
                     self.temperatures = {
                         disk: temperature * 1000
-                        for disk, temperature in c.call("disk.temperatures", self.disks, self.powermode).items()
+                        for disk, temperature in temperatures.items()
                         if temperature is not None
                     }
             except Exception as e:
@@ -1,17 +1,128 @@
-__all__ = ["serialize_result"]
+import datetime
+import functools
+import types
+import typing
+
+import annotated_types
+from pydantic import BaseModel
+from pydantic.fields import FieldInfo
+
+from middlewared.api.base.model import _ForUpdateSerializerMixin
+from middlewared.utils.lang import undefined
+
+__all__ = ["serialize_result", "passthrough_model"]
+
+# Types that strict validation returns as is
+PASSTHROUGH_TYPES = (typing.Any, str, int, bool, None, types.NoneType, datetime.date, datetime.datetime, datetime.time)
 
 
 def serialize_result(model, result, expose_secrets):
     """
     Serializes a `result` of the method execution using the corresponding `model`.
 
+    Method results are trusted, so if the `model` would return the `result` unchanged (see `passthrough_model`),
+    the `result` is returned as is, without being validated.
+
     :param model: `BaseModel` that defines method return value.
     :param result: method return value.
     :param expose_secrets: if false, will replace `Secret` parameters with a placeholder.
     :return: serialized method execution result.
     """
+    if passthrough_model(model):
+        return result
+
     return model(result=result).model_dump(
         context={"expose_secrets": expose_secrets},
         warnings=False,
         by_alias=True,
     )["result"]
+
+
+@functools.cache
+def passthrough_model(model: type[BaseModel]) -> bool:
+    """
+    Returns `True` if validating a valid value with `model` and dumping it results in an equal value (dict keys might
+    come in a different order): the model is strict, contains no secrets, aliases, excluded fields, defaults,
+    validators, serializers or types that strict validation converts (i.e. `float` converts `int` values).
+
+    The result is cached as it is requested for the same models over and over again.
+    """
+    return _passthrough_model(model, set())
+
+
+def _passthrough_model(model, seen):
+    if model in seen:
+        return True
+
+    seen.add(model)
+
+    config = model.model_config
+    if not config.get("strict") or config.get("extra", "ignore") == "ignore" or model.__pydantic_root_model__:
+        return False
+
+    decorators = model.__pydantic_decorators__
+    if (
+        decorators.validators or decorators.field_validators or decorators.root_validators or
+        decorators.model_validators or decorators.field_serializers or decorators.computed_fields
+    ):
+        return False
+
+    if decorators.model_serializers and not (
+        # Only removes `undefined` values, results don't contain them
+        issubclass(model, _ForUpdateSerializerMixin) and set(decorators.model_serializers) == {"serialize_model"}
+    ):
+        return False
+
+    for name, field in model.model_fields.items():
+        if not field.is_required() and field.default is not undefined:
+            return False
+
+        if not _passthrough_field_info(name, field, seen) or not _passthrough_annotation(field.annotation, seen):
+            return False
+
+    return True
+
+
+def _passthrough_field_info(name, field, seen):
+    if field.alias not in (None, name) or field.serialization_alias not in (None, name):
+        return False
+
+    if field.exclude or field.default_factory is not None:
+        return False
+
+    return all(_passthrough_metadata(metadata, seen) for metadata in field.metadata)
+
+
+def _passthrough_metadata(metadata, seen):
+    if isinstance(metadata, FieldInfo):
+        return (
+            metadata.alias is None and metadata.serialization_alias is None and not metadata.exclude and
+            all(_passthrough_metadata(i, seen) for i in metadata.metadata)
+        )
+
+    # Constraints like `min_length` only validate
+    return isinstance(metadata, annotated_types.BaseMetadata)
+
+
+def _passthrough_annotation(annotation, seen):
+    if annotation in PASSTHROUGH_TYPES or annotation in (list, dict):
+        return True
+
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _passthrough_model(annotation, seen)
+
+    origin = typing.get_origin(annotation)
+    if origin is typing.Literal:
+        return True
+
+    args = typing.get_args(annotation)
+    if origin is typing.Annotated:
+        return (
+            all(_passthrough_metadata(metadata, seen) for metadata in args[1:]) and
+            _passthrough_annotation(args[0], seen)
+        )
+
+    if origin in (typing.Union, types.UnionType, list, dict):
+        return all(_passthrough_annotation(arg, seen) for arg in args)
+
+    return False
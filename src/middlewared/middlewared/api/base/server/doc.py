@@ -1,3 +1,4 @@
+import functools
 import inspect
 import re
 
@@ -29,6 +30,16 @@ class APIDumpEvent(BaseModel):
     schemas: dict
 
 
+@functools.cache
+def model_json_schema(model: type[BaseModel], mode: str = "validation") -> dict:
+    """
+    JSON schema of `model` with all the references replaced. Models are shared between API versions, so each schema is
+    only generated once. The returned value must not be modified.
+    """
+    schema = model.model_json_schema(mode=mode)
+    return replace_refs(schema, schema.get("$defs", {}))
+
+
 class APIDumper:
     def __init__(self, version: str, api: API):
         self.version = version
@@ -80,11 +91,8 @@ class APIDumper:
         )
 
     def _dump_method_schemas(self, method: Method):
-        accepts_json_schema = method.methodobj.new_style_accepts.model_json_schema()
-        accepts_json_schema = replace_refs(accepts_json_schema, accepts_json_schema.get("$defs", {}))
-
-        returns_json_schema = method.methodobj.new_style_returns.model_json_schema(mode="serialization")
-        returns_json_schema = replace_refs(returns_json_schema, returns_json_schema.get("$defs", {}))
+        accepts_json_schema = model_json_schema(method.methodobj.new_style_accepts)
+        returns_json_schema = model_json_schema(method.methodobj.new_style_returns, "serialization")
 
         return {
             "type": "object",
@@ -130,9 +138,7 @@ class APIDumper:
     def _dump_event_schemas(self, event: Event):
         properties = {}
         for name, model in event.event["models"].items():
-            schema = model.model_json_schema()
-            schema = replace_refs(schema, schema.get("$defs", {}))
-            properties[name] = schema
+            properties[name] = model_json_schema(model)
 
         return {
             "type": "object",
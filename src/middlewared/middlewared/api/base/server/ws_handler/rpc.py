@@ -18,6 +18,7 @@ from middlewared.schema import Error
 from middlewared.service_exception import (CallException, CallError, ValidationError, ValidationErrors, adapt_exception,
                                            get_errname)
 from middlewared.utils.debug import get_frame_details
+from middlewared.utils.json_ import dumps_chunked
 from middlewared.utils.lang import undefined
 from middlewared.utils.limits import MsgSizeError, MsgSizeLimit, parse_message
 from middlewared.utils.lock import SoftHardSemaphore, SoftHardSemaphoreLimit
@@ -50,6 +51,17 @@ class RpcWebSocketApp(App):
     def send(self, data):
         asyncio.run_coroutine_threadsafe(self.ws.send_str(json.dumps(data)), self.middleware.loop)
 
+    async def send_chunked(self, data):
+        """
+        Same as `send`, but very large messages (i.e. method call results) are encoded without blocking the event loop.
+        Must be called from the event loop.
+        """
+        try:
+            await self.ws.send_str(await dumps_chunked(data))
+        except ConnectionError:
+            # The client has disconnected. `send` ignores this too, this must not be reported as a method call failure.
+            pass
+
     def send_error(self, id_: Any, code: int, message: str, data: Any = None):
         error = {
             "jsonrpc": "2.0",
@@ -345,7 +357,7 @@ class RpcWebSocketHandler(BaseWebSocketHandler):
                                                exc_info=True)
         else:
             if id_ != undefined:
-                app.send({
+                await app.send_chunked({
                     "jsonrpc": "2.0",
                     "result": result,
                     "id": id_,
@@ -160,7 +160,7 @@ class WebSocketApplication(RpcWebSocketApp):
                         serviceobj, methodobj, self, result
                     )
 
-            self._send(
+            await self.send_chunked(
                 {
                     "id": message["id"],
                     "msg": "result",
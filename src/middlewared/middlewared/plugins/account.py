@@ -51,6 +51,7 @@ from middlewared.service import CallError, CRUDService, ValidationErrors, pass_a
 from middlewared.service_exception import MatchNotFound
 import middlewared.sqlalchemy as sa
 from middlewared.utils import run, filter_list
+from middlewared.utils.api_key_cache import API_KEY_CACHE
 from middlewared.utils.crypto import generate_nt_hash, sha512_crypt, generate_string
 from middlewared.utils.directoryservices.constants import DSType, DSStatus
 from middlewared.utils.filesystem.copy import copytree, CopyTreeConfig
@@ -690,6 +691,7 @@ class UserService(CRUDService):
 
         user = self.middleware.call_sync('user.get_instance', pk)
         audit_callback(user['username'])
+        old_username = user['username']
 
         if app and app.authenticated_credentials.is_user_session:
             same_user_logged_in = user['username'] == (self.middleware.call_sync('auth.me', app=app))['pw_name']
@@ -862,6 +864,8 @@ class UserService(CRUDService):
 
         self.middleware.call_sync('service.reload', 'ssh')
         self.middleware.call_sync('service.reload', 'user')
+        # User may have been locked, disabled or renamed
+        API_KEY_CACHE.invalidate(username=old_username)
         if user['smb'] and must_change_pdb_entry:
             self.middleware.call_sync('smb.update_passdb_user', user)
 
@@ -973,6 +977,7 @@ class UserService(CRUDService):
         self.middleware.call_sync('datastore.delete', 'account.bsdusers', pk)
         self.middleware.call_sync('service.reload', 'ssh')
         self.middleware.call_sync('service.reload', 'user')
+        API_KEY_CACHE.invalidate(username=user['username'])
         try:
             self.middleware.call_sync('idmap.gencache.del_idmap_cache_entry', {
                 'entry_type': 'UID2SID',
@@ -1832,6 +1837,8 @@ class GroupService(CRUDService):
         await self.middleware.call('datastore.update', 'account.bsdgroups', pk, group, {'prefix': 'bsdgrp_'})
 
         await self.middleware.call('service.reload', 'user')
+        # Group membership determines privileges of the cached API key credentials
+        API_KEY_CACHE.invalidate()
         return pk
 
     @api_method(GroupDeleteArgs, GroupDeleteResult, audit='Delete group', audit_callback=True)
@@ -1885,6 +1892,7 @@ class GroupService(CRUDService):
             await self.middleware.call('smb.del_groupmap', group['id'])
 
         await self.middleware.call('service.reload', 'user')
+        API_KEY_CACHE.invalidate()
         try:
             await self.middleware.call('idmap.gencache.del_idmap_cache_entry', {
                 'entry_type': 'GID2SID',
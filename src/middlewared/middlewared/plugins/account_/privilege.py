@@ -7,6 +7,7 @@ from middlewared.api.current import *
 from middlewared.plugins.account import unixhash_is_valid
 from middlewared.service import CallError, CRUDService, filter_list, private, ValidationErrors
 from middlewared.service_exception import MatchNotFound
+from middlewared.utils.api_key_cache import API_KEY_CACHE
 from middlewared.utils.privilege_constants import ALLOW_LIST_FULL_ADMIN, LocalAdminGroups
 from middlewared.utils.privilege import (
     privilege_has_webui_access,
@@ -146,6 +147,8 @@ class PrivilegeService(CRUDService):
             id_,
             new,
         )
+        # Roles of the cached API key credentials may have changed
+        API_KEY_CACHE.invalidate()
 
         return await self.get_instance(id_)
 
@@ -165,6 +168,7 @@ class PrivilegeService(CRUDService):
             self._config.datastore,
             id_
         )
+        API_KEY_CACHE.invalidate()
 
         return response
 
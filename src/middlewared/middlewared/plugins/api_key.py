@@ -1,3 +1,4 @@
+import copy
 import pam
 import errno
 
@@ -13,6 +14,7 @@ from middlewared.service import CRUDService, pass_app, periodic, private, Valida
 from middlewared.service_exception import CallError
 import middlewared.sqlalchemy as sa
 from middlewared.utils import filter_list
+from middlewared.utils.api_key_cache import API_KEY_CACHE
 from middlewared.utils.auth import LEGACY_API_KEY_USERNAME
 from middlewared.utils.crypto import generate_pbkdf2_512, generate_string
 from middlewared.utils.privilege import credential_has_full_admin
@@ -254,11 +256,13 @@ class ApiKeyService(CRUDService):
             id_,
             self.compress(new),
         )
+        API_KEY_CACHE.invalidate(key_id=id_)
 
         if not key:
             return new
 
         self.middleware.call_sync('etc.generate', 'pam_middleware')
+        API_KEY_CACHE.invalidate(key_id=id_)
         self.middleware.call_sync('api_key.check_status')
         return dict(new, key=f"{new['id']}-{key}")
 
@@ -286,6 +290,7 @@ class ApiKeyService(CRUDService):
         )
 
         await self.middleware.call('etc.generate', 'pam_middleware')
+        API_KEY_CACHE.invalidate(key_id=id_)
         await self.check_status()
         return response
 
@@ -345,6 +350,16 @@ class ApiKeyService(CRUDService):
         except ValueError:
             return None
 
+        # Repeated requests with the same key are served from the cache of verified keys. It is invalidated whenever
+        # API keys or their users are changed.
+        digest = API_KEY_CACHE.digest(key)
+        if (cached := API_KEY_CACHE.get(digest)) is not None:
+            return copy.deepcopy(cached.result)
+
+        if API_KEY_CACHE.failed(digest):
+            return None
+
+        generation = API_KEY_CACHE.generation
         entry = await self.get_instance(key_id)
         resp = await self.middleware.call('auth.authenticate_plain',
                                           entry['username'],
@@ -352,12 +367,18 @@ class ApiKeyService(CRUDService):
                                           True)
 
         if resp['pam_response']['code'] != pam.PAM_SUCCESS:
+            API_KEY_CACHE.put_failure(digest, generation)
             return None
 
-        return (resp['user_data'], {
+        result = (resp['user_data'], {
             'id': entry['id'],
             'name': entry['name'],
         })
+        API_KEY_CACHE.put(
+            digest, generation, entry['id'], entry['username'], copy.deepcopy(result),
+            entry['expires_at'].timestamp() if entry['expires_at'] else None,
+        )
+        return result
 
     @private
     async def revoke(self, key_id):
@@ -366,6 +387,8 @@ class ApiKeyService(CRUDService):
         that is called when API key passed as plain-text over insecure transport."""
         await self.middleware.call('datastore.update', self._config.datastore, key_id, {'expiry': -1})
         await self.middleware.call('etc.generate', 'pam_middleware')
+        # Verifications that have been started before the key was deactivated in the pam_tdb file are not cached
+        API_KEY_CACHE.invalidate(key_id=key_id)
         await self.check_status()
 
     @api_method(ApiKeyMyKeysArgs, ApiKeyMyKeysResult, roles=['READONLY_ADMIN', 'API_KEY_READ'])
@@ -1,8 +1,11 @@
 import datetime
 import errno
-import json
 import os
 import subprocess
+import threading
+import time
+
+import libzfs
 
 from middlewared.api import api_method
 from middlewared.api.current import (
@@ -21,6 +24,17 @@ from middlewared.service_exception import CallError, ValidationError
 from middlewared.utils import filter_list
 from middlewared.utils.size import format_size
 
+BE_PROPERTIES = ["creation", "origin", "used"]
+# Boot environments are invalidated by changes made through this service and by ZFS events on the boot pool
+# (i.e. boot environments created by the update installer). The timeout only refreshes `used`, which changes
+# without any event.
+BE_CACHE_TIMEOUT = 300
+BE_CACHE_EVENTS = (
+    "sysevent.fs.zfs.config_sync",
+    "sysevent.fs.zfs.history_event",
+    "sysevent.fs.zfs.pool_import",
+)
+
 
 def run_zectl_cmd(cmd):
     try:
@@ -36,6 +50,83 @@ def run_zectl_cmd(cmd):
         return cp.returncode == 0
 
 
+def gather_boot_environments(zfs, bp_name, active_be):
+    """
+    Read boot environments of `bp_name` boot pool in a single pass over `{bp_name}/ROOT` using `zfs`
+    libzfs handle. Alongside the boot environments, the datasets which are clones (and their origins)
+    are returned for every boot environment.
+    """
+    activated_be = zfs.get(bp_name).properties["bootfs"].value
+    environments = []
+    clones = {}
+    for root in zfs.datasets_serialized(
+        datasets=[f"{bp_name}/ROOT"], props=BE_PROPERTIES, user_props=True, retrieve_children=True,
+    ):
+        for ds in root.get("children") or []:
+            props = ds["properties"]
+            used = int(props["used"]["rawvalue"])
+            environments.append(
+                {
+                    "id": os.path.basename(ds["name"]),
+                    "dataset": ds["name"],
+                    "active": active_be == ds["name"],
+                    "activated": activated_be == ds["name"],
+                    "created": datetime.datetime.utcfromtimestamp(
+                        int(props["creation"]["rawvalue"])
+                    ),
+                    "used_bytes": used,
+                    "used": format_size(used),
+                    "keep": props.get("zectl:keep", {}).get("value") == "True",
+                    "can_activate": props.get("truenas:kernel_version", {}).get("value", "-") != "-",
+                }
+            )
+
+            clones[ds["name"]] = be_clones = []
+            children = list(ds.get("children") or [])
+            while children:
+                child = children.pop()
+                if (origin := child["properties"]["origin"]["value"]) and origin != "-":
+                    be_clones.append((child["name"], origin))
+                children.extend(child.get("children") or [])
+
+    return {"environments": environments, "clones": clones}
+
+
+class BootEnvironmentCache:
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.data = None
+        self.expires = 0
+        self.generation = 0
+
+    def get(self):
+        """
+        Returns cached data (or `None`) along with the generation the caller must pass
+        to `put` so that data gathered while the cache was invalidated is discarded.
+        """
+        with self.lock:
+            if self.data is not None and self.expires > time.monotonic():
+                return self.data, self.generation
+
+            return None, self.generation
+
+    def put(self, data, generation):
+        with self.lock:
+            if generation == self.generation:
+                self.data = data
+                self.expires = time.monotonic() + self.timeout
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.data = None
+
+
+BE_CACHE = BootEnvironmentCache(BE_CACHE_TIMEOUT)
+
+
 class BootEnvironmentService(Service):
     class Config:
         namespace = "boot.environment"
@@ -43,25 +134,27 @@ class BootEnvironmentService(Service):
         cli_private = True
 
     @private
-    def zfs_get_props(self):
-        zget = "zfs get -r -d 1"
-        zget += " truenas:kernel_version,zectl:keep,used,creation"
-        bp_name = self.middleware.call_sync("boot.pool_name")
-        root = f"{bp_name}/ROOT"
-        json_flags = "-j --json-int"  # json format, raw numbers
-        try:
-            cp = subprocess.run(
-                " ".join([zget, root, json_flags]),
-                shell=True,
-                check=True,
-                capture_output=True,
-            )
-        except subprocess.CalledProcessError as cpe:
-            self.logger.error("getting zfs properties failed: %r", cpe.stderr)
-        except Exception:
-            self.logger.exception("Unexpected failure getting zfs properties")
-        else:
-            return json.loads(cp.stdout), bp_name
+    def boot_environments(self):
+        data, generation = BE_CACHE.get()
+        if data is None:
+            bp_name = self.middleware.call_sync("boot.pool_name")
+            active_be = self.middleware.call_sync(
+                "filesystem.mount_info", [["mountpoint", "=", "/"]], {"get": True}
+            )["mount_source"]
+            try:
+                with libzfs.ZFS() as zfs:
+                    data = gather_boot_environments(zfs, bp_name, active_be)
+            except libzfs.ZFSException:
+                self.logger.error("Failed to retrieve boot environments", exc_info=True)
+                return {"environments": [], "clones": {}}
+
+            BE_CACHE.put(data, generation)
+
+        return data
+
+    @private
+    def invalidate_cache(self):
+        BE_CACHE.invalidate()
 
     @private
     def validate_be(self, schema_name, name, should_exist=True):
@@ -77,57 +170,22 @@ class BootEnvironmentService(Service):
     @private
     def promote_current_datasets(self):
         be = self.query([["active", "=", True]], {"get": True})
-        be_datasets = subprocess.run(
-            f"zfs list -o origin -r {be['dataset']} -j", capture_output=True, shell=True
-        )
-        for ds, info in json.loads(be_datasets.stdout)["datasets"].items():
-            if ds.startswith(f"{be['dataset']}/"):
-                origin = info["properties"]["origin"]["value"]
-                if origin != "-":
-                    self.logger.info(
-                        f"Promoting dataset {ds} as it is a clone of {origin}"
-                    )
-                    try:
-                        self.middleware.call_sync("pool.dataset.promote", ds)
-                    except Exception:
-                        self.logger.exception("Unexpected error promoting %r", ds)
+        for ds, origin in self.boot_environments()["clones"].get(be["dataset"], []):
+            self.logger.info(
+                f"Promoting dataset {ds} as it is a clone of {origin}"
+            )
+            try:
+                self.middleware.call_sync("pool.dataset.promote", ds)
+            except Exception:
+                self.logger.exception("Unexpected error promoting %r", ds)
+
+        self.invalidate_cache()
 
     @filterable_api_method(item=BootEnvironmentEntry, roles=['BOOT_ENV_READ'])
     def query(self, filters, options):
-        results = list()
-        try:
-            info, bp_name = self.zfs_get_props()
-        except TypeError:
-            return results
-
-        active_be = self.middleware.call_sync(
-            "filesystem.mount_info", [["mountpoint", "=", "/"]], {"get": True}
-        )["mount_source"]
-        activated_be = self.middleware.call_sync(
-            "zfs.pool.query", [["name", "=", bp_name]], {"get": True}
-        )["properties"]["bootfs"]["value"]
-        for ds_name, ds_info in info["datasets"].items():
-            if ds_name == f"{bp_name}/ROOT":
-                continue
-
-            props = ds_info["properties"]
-            results.append(
-                {
-                    "id": os.path.basename(ds_name),
-                    "dataset": ds_name,
-                    "active": active_be == ds_name,
-                    "activated": activated_be == ds_name,
-                    "created": datetime.datetime.utcfromtimestamp(
-                        props["creation"]["value"]
-                    ),
-                    "used_bytes": props["used"]["value"],
-                    "used": format_size(props["used"]["value"]),
-                    "keep": props["zectl:keep"]["value"] == "True",
-                    "can_activate": props["truenas:kernel_version"]["value"] != "-",
-                }
-            )
-
-        return filter_list(results, filters, options)
+        return filter_list(
+            [be.copy() for be in self.boot_environments()["environments"]], filters, options
+        )
 
     @api_method(BootEnvironmentActivateArgs, BootEnvironmentActivateResult, roles=["BOOT_ENV_WRITE"])
     def activate(self, data):
@@ -141,14 +199,20 @@ class BootEnvironmentService(Service):
                 "boot.environment.activate", f"{data['id']!r} can not be activated"
             )
         else:
-            run_zectl_cmd(["activate", data["id"]])
+            try:
+                run_zectl_cmd(["activate", data["id"]])
+            finally:
+                self.invalidate_cache()
             return self.query([["id", "=", data["id"]]], {"get": True})
 
     @api_method(BootEnvironmentCloneArgs, BootEnvironmentCloneResult, roles=['BOOT_ENV_WRITE'])
     def clone(self, data):
         be = self.validate_be("boot.environment.clone", data["id"])
         self.validate_be("boot.environment.clone", data["target"], should_exist=False)
-        run_zectl_cmd(["create", "-r", "-e", be["dataset"], data["target"]])
+        try:
+            run_zectl_cmd(["create", "-r", "-e", be["dataset"], data["target"]])
+        finally:
+            self.invalidate_cache()
         return self.query([["id", "=", data["target"]]], {"get": True})
 
     @api_method(BootEnvironmentDestroyArgs, BootEnvironmentDestroyResult, roles=['BOOT_ENV_WRITE'])
@@ -158,21 +222,36 @@ class BootEnvironmentService(Service):
                 "boot.environment.destroy",
                 "Deleting the active boot environment is not allowed",
             )
-        run_zectl_cmd(["destroy", data["id"]])
+        try:
+            run_zectl_cmd(["destroy", data["id"]])
+        finally:
+            self.invalidate_cache()
 
     @api_method(BootEnvironmentKeepArgs, BootEnvironmentKeepResult, roles=['BOOT_ENV_WRITE'])
     def keep(self, data):
-        self.middleware.call_sync(
-            "zfs.dataset.update",
-            self.validate_be("boot.environment.keep", data["id"])["dataset"],
-            {
-                "properties": {"zectl:keep": {"value": str(data["value"])}},
-            },
-        )
+        try:
+            self.middleware.call_sync(
+                "zfs.dataset.update",
+                self.validate_be("boot.environment.keep", data["id"])["dataset"],
+                {
+                    "properties": {"zectl:keep": {"value": str(data["value"])}},
+                },
+            )
+        finally:
+            self.invalidate_cache()
         return self.query([["id", "=", data["id"]]], {"get": True})
 
 
+async def zfs_events_hook(middleware, data):
+    if data["class"] in BE_CACHE_EVENTS:
+        bp_name = await middleware.call("boot.pool_name")
+        if data.get("pool") == bp_name or data.get("history_dsname", "").startswith(f"{bp_name}/"):
+            BE_CACHE.invalidate()
+
+
 async def setup(middleware):
+    middleware.register_hook("zfs.pool.events", zfs_events_hook)
+
     if not await middleware.call("system.ready"):
         # Installer clones `/var/log` dataset of the previous install to avoid copying logs. When booting, we must
         # promote the clone to be an independent dataset so that the origin dataset becomes deletable.
@@ -40,7 +40,10 @@ class CatalogService(Service):
 
         questions_context = self.middleware.call_sync('catalog.get_normalized_questions_context')
 
-        app_details = get_app_details(app_location, train_data[options['train']][app_name], questions_context)
+        app_details = get_app_details(
+            app_location, train_data[options['train']][app_name], questions_context,
+            self.middleware.call_sync('catalog.app_versions', options['train'], app_name),
+        )
         recommended_apps = self.middleware.call_sync('catalog.retrieve_recommended_apps')
         if options['train'] in recommended_apps and app_name in recommended_apps[options['train']]:
             app_details['recommended'] = True
@@ -16,7 +16,8 @@ from middlewared.api.current import CatalogAppsArgs, CatalogAppsResult
 from middlewared.service import private, Service
 
 from .apps_util import get_app_version_details
-from .utils import get_cache_key, OFFICIAL_LABEL
+from .catalog_index import CatalogIndex
+from .utils import get_cache_key, OFFICIAL_LABEL, thaw
 
 
 class CatalogService(Service):
@@ -29,9 +30,11 @@ class CatalogService(Service):
     @private
     def train_to_apps_version_mapping(self):
         mapping = {}
-        for train, train_data in self.apps({
+        for train, train_data in self.apps_index({
             'cache': True,
             'cache_only': True,
+            'retrieve_all_trains': True,
+            'trains': [],
         }).items():
             mapping[train] = {}
             for app_data in train_data.values():
@@ -64,54 +67,63 @@ class CatalogService(Service):
         `options.trains` is a list of train name(s) which will allow selective filtering to retrieve only information
         of desired trains in a catalog. If `options.retrieve_all_trains` is set, it has precedence over `options.train`.
         """
+        return thaw(self.apps_index(options))
+
+    @private
+    def apps_index(self, options):
+        """
+        Same as `catalog.apps` but returns the (frozen) trains of the catalog index as is, without copying them.
+        """
         catalog = self.middleware.call_sync('catalog.config')
         all_trains = options['retrieve_all_trains']
-        cache_available = False
+        trains_filter = None if all_trains else options['trains']
 
         if options['cache']:
-            cache_key = get_cache_key(catalog['label'])
-            try:
-                orig_cached_data = self.middleware.call_sync('cache.get', cache_key)
-            except KeyError:
-                orig_cached_data = None
-
-            cache_available = orig_cached_data is not None
-
-        if options['cache'] and options['cache_only'] and not cache_available:
-            return {}
-
-        if options['cache'] and cache_available:
-            cached_data = {}
-            for train in orig_cached_data:
-                if not all_trains and train not in options['trains']:
-                    continue
+            if (index := self.cached_index(catalog['label'])) is not None:
+                return index.get_trains(trains_filter)
+            elif options['cache_only']:
+                return {}
 
-                train_data = {}
-                for catalog_app in orig_cached_data[train]:
-                    train_data[catalog_app] = {k: v for k, v in orig_cached_data[train][catalog_app].items()}
-
-                cached_data[train] = train_data
-
-            return cached_data
-        elif not os.path.exists(catalog['location']):
+        if not os.path.exists(catalog['location']):
             return {}
 
-        if all_trains:
+        # If we are going to cache the data, we want all the trains of the catalog
+        retrieve_all_trains = all_trains or options['cache']
+        if retrieve_all_trains:
             # We can only safely say that the catalog is healthy if we retrieve data for all trains
             self.middleware.call_sync('alert.oneshot_delete', 'CatalogNotHealthy', catalog['label'])
 
-        trains = self.get_trains(catalog, options)
+        index = CatalogIndex(self.get_trains(catalog, {**options, 'retrieve_all_trains': retrieve_all_trains}))
 
-        if all_trains:
+        if retrieve_all_trains:
             # We will only update cache if we are retrieving data of all trains for a catalog
             # which happens when we sync catalog(s) periodically or manually
             # We cache for 90000 seconds giving system an extra 1 hour to refresh it's cache which
             # happens after 24h - which means that for a small amount of time it's possible that user
             # come with a case where system is trying to access cached data but it has expired and it's
             # reading again from disk hence the extra 1 hour.
-            self.middleware.call_sync('cache.put', get_cache_key(catalog['label']), trains, 90000)
+            self.middleware.call_sync('cache.put', get_cache_key(catalog['label']), index, 90000)
+
+        return index.get_trains(trains_filter)
+
+    @private
+    def cached_index(self, label):
+        try:
+            return self.middleware.call_sync('cache.get', get_cache_key(label))
+        except KeyError:
+            return None
+
+    @private
+    def app_versions(self, train, app_name):
+        """
+        Returns versions of `app_name` app of `train` train (without normalized questions) from the cached catalog
+        index. They are frozen and shared by all the callers.
+        """
+        index = self.cached_index(self.middleware.call_sync('catalog.config')['label'])
+        if index is None or not index.has_app(train, app_name):
+            return None
 
-        return trains
+        return index.get_app_versions(train, app_name)
 
     @private
     def get_trains(self, catalog, options):
@@ -14,6 +14,8 @@ from middlewared.plugins.update_.utils import can_update
 from middlewared.service import CallError
 from middlewared.utils import sw_info
 
+from .utils import thaw
+
 
 RE_VERSION_PATTERN = re.compile(r'(\d{2}\.\d{2}(?:\.\d)*)')  # We are only interested in XX.XX here
 
@@ -91,20 +93,29 @@ def get_app_version_details(version_path: str, questions_context: dict) -> dict:
     }))
 
 
-def get_app_details(app_location: str, app_data: dict, questions_context: dict) -> dict:
+def get_app_versions(app_location: str) -> dict:
     app_name = os.path.basename(app_location)
-    app_data['versions'] = retrieve_cached_versions_data(os.path.join(app_location, CACHED_VERSION_FILE_NAME), app_name)
+    versions = retrieve_cached_versions_data(os.path.join(app_location, CACHED_VERSION_FILE_NAME), app_name)
 
-    # At this point, we have cached versions and apps data - now we want to do the following:
+    # At this point, we have cached versions data - now we want to do the following:
     # 1) Update location in each version entry
     # 2) Make sure default values have been normalised
-    # 3) Normalise questions
-    for version_name, version_data in app_data['versions'].items():
+    # Questions are normalised by `get_app_details` as that depends on the questions context
+    for version_name, version_data in versions.items():
         minimum_scale_version_check_update(version_data)
         version_data.update({
             'location': os.path.join(app_location, version_name),
             'values': get_app_default_values(version_data),
         })
+
+    return versions
+
+
+def get_app_details(app_location: str, app_data: dict, questions_context: dict, versions: dict | None = None) -> dict:
+    # `app_data` and `versions` can be shared (frozen) catalog data, so we work on a copy of them
+    app_data = thaw(app_data)
+    app_data['versions'] = get_app_versions(app_location) if versions is None else thaw(versions)
+    for version_data in app_data['versions'].values():
         normalize_questions(version_data, questions_context)
 
     return app_data
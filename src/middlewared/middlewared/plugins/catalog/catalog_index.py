@@ -0,0 +1,38 @@
+import threading
+import types
+
+from .apps_util import get_app_versions
+from .utils import freeze
+
+
+class CatalogIndex:
+    """
+    Catalog apps details keyed by train and app name. Everything is frozen so that it can be handed out to all
+    the consumers without copying it. Versions of an app are only read (and then kept) when they are asked for.
+    """
+
+    def __init__(self, trains, load_versions=get_app_versions):
+        self.trains = freeze(trains)
+        self.load_versions = load_versions
+        self.lock = threading.Lock()
+        # (train, app name) -> frozen versions of the app
+        self.versions = {}
+
+    def get_trains(self, trains=None):
+        if trains is None:
+            return self.trains
+
+        return types.MappingProxyType({k: v for k, v in self.trains.items() if k in trains})
+
+    def has_app(self, train, app_name):
+        return app_name in self.trains.get(train, {})
+
+    def get_app_versions(self, train, app_name):
+        key = (train, app_name)
+        with self.lock:
+            if (versions := self.versions.get(key)) is not None:
+                return versions
+
+        versions = freeze(self.load_versions(self.trains[train][app_name]['location']))
+        with self.lock:
+            return self.versions.setdefault(key, versions)
@@ -3,7 +3,7 @@ from middlewared.api.current import CatalogSyncArgs, CatalogSyncResult
 from middlewared.service import job, private, Service
 
 from .git_utils import pull_clone_repository
-from .utils import OFFICIAL_LABEL, OFFICIAL_CATALOG_REPO, OFFICIAL_CATALOG_BRANCH
+from .utils import get_cache_key, OFFICIAL_LABEL, OFFICIAL_CATALOG_REPO, OFFICIAL_CATALOG_BRANCH
 
 
 class CatalogService(Service):
@@ -27,12 +27,14 @@ class CatalogService(Service):
             await self.middleware.call(
                 'catalog.update_git_repository', catalog['location'], OFFICIAL_CATALOG_REPO, OFFICIAL_CATALOG_BRANCH
             )
+            # Catalog content has changed on disk, drop the apps details (and versions) read from it
+            await self.middleware.call('cache.pop', get_cache_key(catalog['label']))
             job.set_progress(15, 'Reading catalog information')
             # Update feature map cache whenever official catalog is updated
             await self.middleware.call('catalog.get_feature_map', False)
             await self.middleware.call('catalog.retrieve_recommended_apps', False)
 
-            await self.middleware.call('catalog.apps', {
+            await self.middleware.call('catalog.apps_index', {
                 'cache': False,
                 'cache_only': False,
                 'retrieve_all_trains': True,
@@ -46,7 +46,12 @@ class CatalogService(ConfigService):
         """
         Retrieve available trains.
         """
-        return list(await self.middleware.call('catalog.apps', {'cache': True, 'cache_only': True}))
+        return list(await self.middleware.call('catalog.apps_index', {
+            'cache': True,
+            'cache_only': True,
+            'retrieve_all_trains': True,
+            'trains': [],
+        }))
 
     @private
     async def extend_context(self, rows, extra):
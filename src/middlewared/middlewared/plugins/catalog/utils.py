@@ -1,4 +1,5 @@
 import os
+import types
 
 from middlewared.utils import MIDDLEWARE_RUN_DIR
 
@@ -13,3 +14,21 @@ TMP_IX_APPS_CATALOGS = os.path.join(MIDDLEWARE_RUN_DIR, 'ix-apps/catalogs')
 
 def get_cache_key(label: str) -> str:
     return f'catalog_{label}_train_details'
+
+
+def freeze(data):
+    """Read-only copy of JSON-like `data` which can be shared between consumers without copying it."""
+    if isinstance(data, dict):
+        return types.MappingProxyType({k: freeze(v) for k, v in data.items()})
+    elif isinstance(data, list):
+        return tuple(freeze(v) for v in data)
+    return data
+
+
+def thaw(data):
+    """Mutable copy of `data` (which can be frozen)."""
+    if isinstance(data, (dict, types.MappingProxyType)):
+        return {k: thaw(v) for k, v in data.items()}
+    elif isinstance(data, (list, tuple)):
+        return [thaw(v) for v in data]
+    return data
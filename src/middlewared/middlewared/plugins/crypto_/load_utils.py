@@ -1,8 +1,10 @@
+import copy
 import datetime
 import dateutil
 import dateutil.parser
 import logging
 import re
+import time
 
 from contextlib import suppress
 from cryptography.hazmat.backends import default_backend
@@ -11,6 +13,7 @@ from cryptography.hazmat.primitives.asymmetric import dsa, ec, ed25519, ed448, r
 from OpenSSL import crypto
 from typing import Optional, Union
 
+from .parse_cache import PARSE_CACHE
 from .utils import RE_CERTIFICATE
 
 
@@ -24,19 +27,28 @@ def parse_cert_date_string(date_value: str) -> str:
 
 
 def load_certificate(certificate: str, get_issuer: bool = False) -> dict:
+    # Local timezone is part of the key as `from` / `until` are local times
+    cert_info, not_after = PARSE_CACHE.get('certificate', certificate, parse_certificate, get_issuer, time.tzname)
+    if not cert_info:
+        return {}
+
+    cert_info = copy.deepcopy(cert_info)
+    cert_info['expired'] = datetime.datetime.now() > not_after
+    return cert_info
+
+
+def parse_certificate(certificate: str, get_issuer: bool, tzname: tuple) -> tuple[dict, datetime.datetime | None]:
     try:
         # digest_algorithm, lifetime, country, state, city, organization, organizational_unit,
         # email, common, san, serial, chain, fingerprint
         cert = crypto.load_certificate(crypto.FILETYPE_PEM, certificate)
         from_date = parse_cert_date_string(cert.get_notBefore())
         until_date = parse_cert_date_string(cert.get_notAfter())
-        expired = datetime.datetime.now() > datetime.datetime.strptime(
-            parse_cert_date_string(cert.get_notAfter()), '%a %b %d %H:%M:%S %Y'
-        )
+        not_after = datetime.datetime.strptime(until_date, '%a %b %d %H:%M:%S %Y')
     except (crypto.Error, OverflowError):
         # Overflow error is raised when the certificate has a lifetime which will never expire
         # and we don't support such certificates
-        return {}
+        return {}, None
     else:
         cert_info = get_x509_subject(cert)
         if get_issuer:
@@ -68,10 +80,10 @@ def load_certificate(certificate: str, get_issuer: bool = False) -> dict:
             'serial': cert.get_serial_number(),
             'chain': len(RE_CERTIFICATE.findall(certificate)) > 1,
             'fingerprint': cert.digest('sha1').decode(),
-            'expired': expired,
         })
 
-        return cert_info
+        # `expired` depends on the current time so it is set by `load_certificate`
+        return cert_info, not_after
 
 
 def get_x509_subject(obj: Union[crypto.X509, crypto.X509Req]) -> dict:
@@ -129,6 +141,10 @@ def parse_name_components(obj: crypto.X509Name) -> str:
 
 
 def load_certificate_request(csr: str) -> dict:
+    return copy.deepcopy(PARSE_CACHE.get('csr', csr, parse_certificate_request))
+
+
+def parse_certificate_request(csr: str) -> dict:
     try:
         csr_obj = crypto.load_certificate_request(crypto.FILETYPE_PEM, csr)
     except crypto.Error:
@@ -152,7 +168,38 @@ def load_private_key(key_string: str, passphrase: Optional[str] = None) -> Union
         )
 
 
+def load_private_key_info(key_string: str) -> Optional[tuple[int, str]]:
+    """Returns (key length, key type) of PEM encoded private key `key_string` or `None` if it can't be loaded."""
+    return PARSE_CACHE.get('private_key_info', key_string, parse_private_key_info)
+
+
+def parse_private_key_info(key_string: str) -> Optional[tuple[int, str]]:
+    if not (key_obj := load_private_key(key_string)):
+        return None
+
+    if isinstance(key_obj, ed25519.Ed25519PrivateKey):
+        key_length = 32
+    else:
+        key_length = key_obj.key_size
+
+    if isinstance(key_obj, (ec.EllipticCurvePrivateKey, ed25519.Ed25519PrivateKey)):
+        key_type = 'EC'
+    elif isinstance(key_obj, rsa.RSAPrivateKey):
+        key_type = 'RSA'
+    elif isinstance(key_obj, dsa.DSAPrivateKey):
+        key_type = 'DSA'
+    else:
+        key_type = 'OTHER'
+
+    return key_length, key_type
+
+
 def get_serial_from_certificate_safe(certificate: Union[str, None]) -> Optional[int]:
+    # CA signing looks up serials of all the certificates signed by the CA
+    return PARSE_CACHE.get('serial', certificate, parse_serial_from_certificate)
+
+
+def parse_serial_from_certificate(certificate: Union[str, None]) -> Optional[int]:
     try:
         cert = crypto.load_certificate(crypto.FILETYPE_PEM, certificate)
     except crypto.Error:
@@ -0,0 +1,48 @@
+import collections
+import hashlib
+import threading
+from typing import Any, Callable
+
+
+PARSE_CACHE_SIZE = 4096
+
+
+class ParseCache:
+    """
+    Bounded (LRU) cache of values parsed from PEM encoded certificates, CSRs and keys. Entries are keyed by the
+    SHA-256 digest of the PEM so that the PEM (which can be a private key) itself is not kept here.
+    """
+
+    def __init__(self, maxsize: int = PARSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    def get(self, kind: str, pem: str, parse: Callable, *args) -> Any:
+        """
+        Returns `parse(pem, *args)`, calling it only if the result for the same `kind`, `pem` and `args` is not
+        cached. Callers must not modify the returned value.
+        """
+        if not isinstance(pem, str):
+            return parse(pem, *args)
+
+        key = (kind, hashlib.sha256(pem.encode()).digest(), args)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        value = parse(pem, *args)
+        with self.lock:
+            self.entries[key] = value
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+        return value
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+PARSE_CACHE = ParseCache()
@@ -3,11 +3,9 @@ import logging
 import os
 
 from collections import defaultdict
-from cryptography.hazmat.primitives.asymmetric import dsa, ec, rsa
-from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 from typing import Union
 
-from .load_utils import load_certificate, load_certificate_request, load_private_key
+from .load_utils import load_certificate, load_certificate_request, load_private_key_info
 from .utils import (
     CA_TYPE_EXISTING, CA_TYPE_INTERNAL, CA_TYPE_INTERMEDIATE, CERT_TYPE_EXISTING, CERT_TYPE_INTERNAL,
     CERT_TYPE_CSR, CERT_ROOT_PATH, CERT_CA_ROOT_PATH, RE_CERTIFICATE
@@ -105,20 +103,8 @@ def normalize_cert_attrs(cert: dict) -> None:
             cert_extend_report_error('certificate', cert)
 
     if cert['privatekey']:
-        key_obj = load_private_key(cert['privatekey'])
-        if key_obj:
-            if isinstance(key_obj, Ed25519PrivateKey):
-                cert['key_length'] = 32
-            else:
-                cert['key_length'] = key_obj.key_size
-            if isinstance(key_obj, (ec.EllipticCurvePrivateKey, Ed25519PrivateKey)):
-                cert['key_type'] = 'EC'
-            elif isinstance(key_obj, rsa.RSAPrivateKey):
-                cert['key_type'] = 'RSA'
-            elif isinstance(key_obj, dsa.DSAPrivateKey):
-                cert['key_type'] = 'DSA'
-            else:
-                cert['key_type'] = 'OTHER'
+        if key_info := load_private_key_info(cert['privatekey']):
+            cert['key_length'], cert['key_type'] = key_info
         else:
             cert_extend_report_error('private key', cert)
 
@@ -84,12 +84,54 @@ class DatastoreService(Service):
     def execute(self, *args):
         return self.connection.execute(*args)
 
+    @private
+    def execute_many(self, queries):
+        """
+        Execute compiled `queries` (a list of `(sql, params)`) in a single transaction.
+        """
+        with self.connection.begin():
+            for sql, params in queries:
+                self.connection.execute(sql, params)
+
     @private
     def execute_write(self, stmt, options=None):
         options = options or {}
         options.setdefault('ha_sync', True)
         options.setdefault('return_last_insert_rowid', False)
 
+        sql, binds = self._compile(stmt)
+
+        result = self.connection.execute(sql, binds)
+
+        self.middleware.call_hook_inline("datastore.post_execute_write", sql, binds, options)
+
+        if options['return_last_insert_rowid']:
+            return self.fetchall("SELECT last_insert_rowid()")[0][0]
+
+        return result
+
+    @private
+    def execute_write_many(self, stmts, options=None):
+        """
+        Execute `stmts` (a list of `(statement, expected_rowcount)`) in a single transaction. The transaction is
+        rolled back if any statement fails or does not affect `expected_rowcount` rows (unless it is `None`).
+        """
+        options = options or {}
+        options.setdefault('ha_sync', True)
+
+        queries = []
+        with self.connection.begin():
+            for stmt, expected_rowcount in stmts:
+                sql, binds = self._compile(stmt)
+                result = self.connection.execute(sql, binds)
+                if expected_rowcount is not None and result.rowcount != expected_rowcount:
+                    raise RuntimeError(f'{result.rowcount} rows were affected, expecting {expected_rowcount}')
+
+                queries.append((sql, binds))
+
+        self.middleware.call_hook_inline("datastore.post_execute_write_many", queries, options)
+
+    def _compile(self, stmt):
         compiled = stmt.compile(self.engine, compile_kwargs={"render_postcompile": True})
 
         sql = compiled.string
@@ -103,14 +145,7 @@ class DatastoreService(Service):
             else:
                 binds.append(value)
 
-        result = self.connection.execute(sql, binds)
-
-        self.middleware.call_hook_inline("datastore.post_execute_write", sql, binds, options)
-
-        if options['return_last_insert_rowid']:
-            return self.fetchall("SELECT last_insert_rowid()")[0][0]
-
-        return result
+        return sql, binds
 
     @private
     def fetchall(self, query, params=None):
@@ -1,7 +1,7 @@
 from sqlalchemy import and_, types
 from sqlalchemy.sql import sqltypes
 
-from middlewared.schema import accepts, Any, Bool, Dict, Str
+from middlewared.schema import accepts, Any, Bool, Dict, List, Str
 from middlewared.service import Service
 
 from .filter import FilterMixin
@@ -49,13 +49,7 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         """
         table = self._get_table(name)
         insert, relationships = self._extract_relationships(table, options['prefix'], data)
-
-        for column in table.c:
-            if column.default is not None:
-                insert.setdefault(column.name, column.default.arg)
-            if not column.nullable:
-                if isinstance(column.type, (types.String, types.Text)):
-                    insert.setdefault(column.name, '')
+        self._set_insert_defaults(table, insert)
 
         pk_column = self._get_pk(table)
         return_last_insert_rowid = type(pk_column.type) == sqltypes.Integer
@@ -141,6 +135,74 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
 
         return id_
 
+    @accepts(
+        Str('name'),
+        List('operations', items=[Dict(
+            'operation',
+            Str('action', enum=['INSERT', 'UPDATE', 'DELETE'], required=True),
+            Any('id'),
+            Dict('data', additional_attrs=True),
+        )]),
+        Dict(
+            'options',
+            Bool('ha_sync', default=True),
+            Str('prefix', default=''),
+            Bool('send_events', default=True),
+        ),
+    )
+    async def bulk_write(self, name, operations, options):
+        """
+        Apply `operations` (inserts, updates by id and deletes by id) to `name` in a single transaction.
+
+        Unlike issuing the same number of `datastore.insert`/`datastore.update`/`datastore.delete` calls this
+        only needs one round-trip to the database thread (and, on HA systems, to the other controller).
+        Many-to-many relationships are not supported. Inserted rows must have their primary key specified.
+        """
+        table = self._get_table(name)
+        pk_column = self._get_pk(table)
+
+        stmts = []
+        inserted = []
+        for operation in operations:
+            if operation['action'] in ('INSERT', 'UPDATE'):
+                values, relationships = self._extract_relationships(table, options['prefix'], operation['data'])
+                if relationships:
+                    raise RuntimeError(f'{name!r} many-to-many relationships can\'t be written in bulk')
+
+            if operation['action'] == 'INSERT':
+                self._set_insert_defaults(table, values)
+                if values.get(pk_column.name) is None:
+                    raise RuntimeError(f'{name!r} rows inserted in bulk must have their primary key specified')
+
+                stmts.append((table.insert().values(**values), None))
+                inserted.append(values)
+            elif operation['action'] == 'UPDATE':
+                if values:
+                    stmts.append((table.update().values(**values).where(pk_column == operation['id']), 1))
+            else:
+                stmts.append((table.delete().where(pk_column == operation['id']), None))
+
+        if stmts:
+            await self.middleware.call('datastore.execute_write_many', stmts, {'ha_sync': options['ha_sync']})
+
+        if options['send_events']:
+            for values in inserted:
+                await self.middleware.call('datastore.send_insert_events', name, values)
+
+            for operation in operations:
+                if operation['action'] == 'UPDATE':
+                    await self.middleware.call('datastore.send_update_events', name, operation['id'])
+                elif operation['action'] == 'DELETE':
+                    await self.middleware.call('datastore.send_delete_events', name, operation['id'])
+
+    def _set_insert_defaults(self, table, insert):
+        for column in table.c:
+            if column.default is not None:
+                insert.setdefault(column.name, column.default.arg)
+            if not column.nullable:
+                if isinstance(column.type, (types.String, types.Text)):
+                    insert.setdefault(column.name, '')
+
     def _extract_relationships(self, table, prefix, data):
         relationships = self._get_relationships(table)
 
@@ -1,3 +1,4 @@
+import os
 import re
 
 import pyudev
@@ -6,13 +7,18 @@ import libsgio
 from middlewared.plugins.disk_.disk_info import get_partition_size_info
 from middlewared.schema import Dict, returns
 from middlewared.service import Service, accepts, private
-from middlewared.utils.disks import DISKS_TO_IGNORE, get_disk_names, get_disk_serial_from_block_device, safe_retrieval
+from middlewared.utils.disks import (
+    DISKS_TO_IGNORE, get_disk_names, get_disk_serial_from_block_device, get_partition_name, safe_retrieval,
+)
 from middlewared.utils.functools_ import cache
 from middlewared.utils.gpu import get_gpus
 from middlewared.utils.serial import serial_port_choices
 
+from .disk_inventory import DISK_INVENTORY
+
 
 RE_NVME_PRIV = re.compile(r'nvme[0-9]+c')
+PARTITION_KEYS = tuple('ID_PART_ENTRY_' + i for i in ('TYPE', 'UUID', 'NUMBER', 'SIZE'))
 ISCSI_DEV_PATH = re.compile(
     r'/devices/platform/host[0-9]+/session[0-9]+/target[0-9]+:[0-9]+:[0-9]+/[0-9]+:[0-9]+:[0-9]+:[0-9]+/block/.*'
 )
@@ -57,57 +63,132 @@ class DeviceService(Service):
     @private
     def get_disks(self, get_partitions=False, serial_only=False):
         ctx = pyudev.Context()
-        disks = {}
-        for dev in ctx.list_devices(subsystem='block', DEVTYPE='disk'):
-            if dev.sys_name.startswith(DISKS_TO_IGNORE) or RE_NVME_PRIV.match(dev.sys_name):
-                continue
-            if is_iscsi_device(dev):
+        if serial_only and not DISK_INVENTORY.populated:
+            # Serials are read from udev database, there is no need to build the inventory for them
+            disks = {}
+            for dev in filter(lambda d: not self._is_ignored_disk(d), self._list_disks(ctx)):
+                try:
+                    disks[dev.sys_name] = self.get_disk_serial(dev)
+                except Exception:
+                    self.logger.debug('Failed to retrieve disk serial for %s', dev.sys_name, exc_info=True)
+
+            return disks
+
+        self.sync_disk_inventory(ctx)
+        if get_partitions:
+            self.sync_disk_inventory_partitions(ctx)
+
+        disks = DISK_INVENTORY.get(get_partitions)
+        if serial_only:
+            return {name: disk['serial'] for name, disk in disks.items()}
+
+        return disks
+
+    def _list_disks(self, ctx):
+        return ctx.list_devices(subsystem='block', DEVTYPE='disk')
+
+    def _is_ignored_disk(self, dev):
+        return dev.sys_name.startswith(DISKS_TO_IGNORE) or RE_NVME_PRIV.match(dev.sys_name) or is_iscsi_device(dev)
+
+    @private
+    def sync_disk_inventory(self, ctx):
+        """
+        Build disk inventory or re-read the disks that udev events have marked as stale.
+        """
+        if not DISK_INVENTORY.populated:
+            full = True
+            generations = DISK_INVENTORY.get_generations()
+            devices = self._list_disks(ctx)
+            disks = {}
+        elif stale := DISK_INVENTORY.get_stale():
+            full = False
+            generations = DISK_INVENTORY.get_generations(stale)
+            devices = []
+            for name in stale:
+                try:
+                    devices.append(pyudev.Devices.from_name(ctx, 'block', name))
+                except pyudev.DeviceNotFoundByNameError:
+                    pass
+            # disks that are not found are gone
+            disks = dict.fromkeys(stale)
+        else:
+            return
+
+        ignored = set()
+        failed = set()
+        for dev in devices:
+            if dev.device_type != 'disk' or self._is_ignored_disk(dev):
+                disks.pop(dev.sys_name, None)
+                ignored.add(dev.sys_name)
                 continue
 
             try:
-                if serial_only:
-                    disks[dev.sys_name] = self.get_disk_serial(dev)
-                else:
-                    disks[dev.sys_name] = self.get_disk_details(ctx, dev, get_partitions)
+                disks[dev.sys_name] = self.get_disk_details(ctx, dev)
             except Exception:
                 self.logger.debug('Failed to retrieve disk details for %s', dev.sys_name, exc_info=True)
+                disks[dev.sys_name] = None
+                failed.add(dev.sys_name)
 
-        return disks
+        DISK_INVENTORY.update(disks, ignored, generations, full, failed)
+
+    @private
+    def sync_disk_inventory_partitions(self, ctx):
+        """
+        Read partitions of the inventory disks that don't have them cached using a single udev enumeration.
+        """
+        if not (sectorsizes := DISK_INVENTORY.get_missing_partitions()):
+            return
+
+        generations = DISK_INVENTORY.get_generations(sectorsizes)
+        partitions = {name: [] for name in sectorsizes}
+        for dev in ctx.list_devices(subsystem='block', DEVTYPE='partition'):
+            # sys_path looks like `/sys/devices/.../block/sda/sda1`
+            parent = os.path.basename(os.path.dirname(dev.sys_path))
+            if parent in partitions and (part := self._get_partition(dev, parent, sectorsizes[parent])):
+                partitions[parent].append(part)
+
+        for parts in partitions.values():
+            parts.sort(key=lambda part: part['partition_number'])
+
+        DISK_INVENTORY.update_partitions(partitions, generations)
 
     @private
     def get_disk_partitions(self, dev):
-        parts = []
-        keys = tuple('ID_PART_ENTRY_' + i for i in ('TYPE', 'UUID', 'NUMBER', 'SIZE'))
-        parent = dev.sys_name
-        for i in filter(lambda x: all(x.get(k) for k in keys), dev.children):
-            part_num = int(i['ID_PART_ENTRY_NUMBER'])
-            part_name = self.middleware.call_sync('disk.get_partition_for_disk', parent, part_num)
-            pinfo = get_partition_size_info(parent, int(i['ID_PART_ENTRY_OFFSET']), int(i['ID_PART_ENTRY_SIZE']))
-            part = {
-                'name': part_name,
-                'id': part_name,
-                'path': f'/dev/{parent}',
-                'disk': parent,
-                'fs_label': i.get('ID_FS_LABEL'),
-                'partition_type': i['ID_PART_ENTRY_TYPE'],
-                'partition_number': part_num,
-                'partition_uuid': i['ID_PART_ENTRY_UUID'],
-                'start_sector': pinfo.start_sector,
-                'end_sector': pinfo.end_sector,
-                'start': pinfo.start_byte,
-                'end': pinfo.end_byte,
-                'size': pinfo.total_bytes,
-                'encrypted_provider': None,
-            }
+        lbs = self.safe_retrieval(dev.attributes, 'queue/logical_block_size', None, asint=True)
+        return list(filter(None, (self._get_partition(i, dev.sys_name, lbs) for i in dev.children)))
 
-            for attr in filter(lambda x: x.startswith('holders/md'), i.attributes.available_attributes):
-                # looks like `holders/md123`
-                part['encrypted_provider'] = f'/dev/{attr.split("/", 1)[1].strip()}'
-                break
+    def _get_partition(self, dev, parent, lbs=None):
+        if not all(dev.get(k) for k in PARTITION_KEYS):
+            return
 
-            parts.append(part)
+        part_num = int(dev['ID_PART_ENTRY_NUMBER'])
+        part_name = get_partition_name(parent, part_num)
+        pinfo = get_partition_size_info(
+            parent, int(dev['ID_PART_ENTRY_OFFSET']), int(dev['ID_PART_ENTRY_SIZE']), lbs,
+        )
+        part = {
+            'name': part_name,
+            'id': part_name,
+            'path': f'/dev/{parent}',
+            'disk': parent,
+            'fs_label': dev.get('ID_FS_LABEL'),
+            'partition_type': dev['ID_PART_ENTRY_TYPE'],
+            'partition_number': part_num,
+            'partition_uuid': dev['ID_PART_ENTRY_UUID'],
+            'start_sector': pinfo.start_sector,
+            'end_sector': pinfo.end_sector,
+            'start': pinfo.start_byte,
+            'end': pinfo.end_byte,
+            'size': pinfo.total_bytes,
+            'encrypted_provider': None,
+        }
+
+        for attr in filter(lambda x: x.startswith('holders/md'), dev.attributes.available_attributes):
+            # looks like `holders/md123`
+            part['encrypted_provider'] = f'/dev/{attr.split("/", 1)[1].strip()}'
+            break
 
-        return parts
+        return part
 
     @private
     def get_disk_details(self, ctx, dev, get_partitions=False):
@@ -150,17 +231,25 @@ class DeviceService(Service):
         if get_partitions:
             disk['parts'] = self.get_disk_partitions(dev)
 
-        if self.safe_retrieval(dev.attributes, 'queue/rotational', None) == '1':
-            disk['type'] = 'HDD'
-            disk['rotationrate'] = self._get_rotation_rate(f'/dev/{dev.sys_name}')
-        else:
-            disk['type'] = 'SSD'
-            disk['rotationrate'] = None
+        rotational = self.safe_retrieval(dev.attributes, 'queue/rotational', None) == '1'
+        disk['type'] = 'HDD' if rotational else 'SSD'
 
         if disk['serial'] and disk['lunid']:
             disk['serial_lunid'] = f'{disk["serial"]}_{disk["lunid"]}'
 
-        disk['dif'] = self.is_dif_formatted(ctx, {'subsystem': disk['subsystem'], 'hctl': disk['hctl']})
+        # Rotation rate and DIF status require an ioctl and sysfs reads, they never change for the same device
+        identity = (dev.sys_name, dev.device_number, disk['serial'], disk['lunid'])
+        if (immutable := DISK_INVENTORY.get_immutable(identity)) is None:
+            device_path = f'/dev/{dev.sys_name}'
+            immutable = {
+                'rotationrate': self._get_rotation_rate(device_path) if rotational else None,
+                'dif': self.is_dif_formatted(ctx, {'subsystem': disk['subsystem'], 'hctl': disk['hctl']}),
+            }
+            if device_path not in self.DISK_ROTATION_ERROR_LOG_CACHE:
+                # Do not cache failed ioctl result so that it is retried
+                DISK_INVENTORY.set_immutable(identity, immutable)
+
+        disk.update(immutable)
 
         return disk
 
@@ -264,3 +353,12 @@ class DeviceService(Service):
         for gpu in gpus:
             gpu['available_to_host'] = gpu['addr']['pci_slot'] not in to_isolate_gpus
         return gpus
+
+
+async def udev_block_devices_hook(middleware, data):
+    DISK_INVENTORY.on_udev_event(data)
+
+
+async def setup(middleware):
+    # Must run before other `udev.block` hooks so that they see up-to-date disks
+    middleware.register_hook('udev.block', udev_block_devices_hook, order=-1000)
@@ -0,0 +1,140 @@
+from collections import defaultdict
+import copy
+import os
+import threading
+
+from middlewared.utils.disks import DISKS_TO_IGNORE
+
+
+class DiskInventory:
+    """
+    Details of the disks present in the system, built once and then kept up to date by udev events so that
+    `device.get_disks` does not have to enumerate and query every block device on each call.
+
+    Events only mark the disk they concern as stale, disks are re-read on the next `device.get_disks` call.
+    Attributes that can't change for the lifetime of a device (i.e. rotation rate or DIF status that require
+    an ioctl or extra sysfs reads) are kept separately, per device identity, so re-reading a disk is cheap.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.populated = False
+        # disk name -> disk details (without partitions)
+        self.disks = {}
+        # disk name -> partitions
+        self.partitions = {}
+        # names of whole disk block devices that are not reported (i.e. iSCSI devices)
+        self.ignored = set()
+        # names of disks that must be re-read
+        self.stale = set()
+        # Bumped on each event for the disk so that results of a read that raced with the event are discarded
+        self.generations = defaultdict(int)
+        # (name, device number, serial, lunid) -> immutable attributes
+        self.immutable = {}
+
+    def get_generations(self, names=None):
+        with self.lock:
+            if names is None:
+                return dict(self.generations)
+
+            return {name: self.generations[name] for name in names}
+
+    def get_stale(self):
+        with self.lock:
+            return set(self.stale)
+
+    def get_missing_partitions(self):
+        """
+        Returns logical block sizes of the disks that don't have their partitions cached.
+        """
+        with self.lock:
+            return {name: disk['sectorsize'] for name, disk in self.disks.items() if name not in self.partitions}
+
+    def update(self, disks, ignored, generations, full=False, failed=()):
+        """
+        Store `disks` details (`None` for disks that are gone) read while disk `generations` were current.
+        Disks that `failed` to be read are retried on the next update.
+        """
+        with self.lock:
+            if full:
+                self.disks = {}
+                self.partitions = {}
+                self.ignored = set()
+                self.stale = {name for name, generation in self.generations.items()
+                              if generations.get(name, 0) != generation}
+
+            for name, disk in disks.items():
+                if self.generations[name] != generations.get(name, 0):
+                    self.stale.add(name)
+                    continue
+
+                self.stale.discard(name)
+                self.partitions.pop(name, None)
+                if disk is None:
+                    self.disks.pop(name, None)
+                else:
+                    self.disks[name] = disk
+
+            for name in ignored:
+                if self.generations[name] == generations.get(name, 0):
+                    self.stale.discard(name)
+                    self.ignored.add(name)
+
+            self.stale.update(failed)
+            self.populated = True
+
+    def update_partitions(self, partitions, generations):
+        with self.lock:
+            for name, parts in partitions.items():
+                if name in self.disks and self.generations[name] == generations.get(name, 0):
+                    self.partitions[name] = parts
+
+    def get(self, get_partitions=False):
+        with self.lock:
+            disks = copy.deepcopy(self.disks)
+            if get_partitions:
+                for name, disk in disks.items():
+                    disk['parts'] = copy.deepcopy(self.partitions.get(name, []))
+
+            return disks
+
+    def get_immutable(self, identity):
+        return self.immutable.get(identity)
+
+    def set_immutable(self, identity, attributes):
+        with self.lock:
+            self.immutable[identity] = attributes
+
+    def invalidate(self, name=None, removed=False):
+        with self.lock:
+            if name is None:
+                self.populated = False
+                self.stale.clear()
+                for disk_name in self.generations:
+                    self.generations[disk_name] += 1
+                return
+
+            self.generations[name] += 1
+            self.stale.add(name)
+            self.partitions.pop(name, None)
+            self.ignored.discard(name)
+            if removed:
+                self.immutable = {k: v for k, v in self.immutable.items() if k[0] != name}
+
+    def on_udev_event(self, data):
+        if data.get('SUBSYSTEM') != 'block':
+            return
+
+        if data.get('DEVTYPE') == 'disk':
+            name = data['SYS_NAME']
+        elif data.get('DEVTYPE') == 'partition':
+            # DEVPATH looks like `/devices/.../block/sda/sda1`
+            name = os.path.basename(os.path.dirname(data.get('DEVPATH', '')))
+        else:
+            return
+
+        if name and not name.startswith(DISKS_TO_IGNORE):
+            self.invalidate(name, removed=data.get('ACTION') == 'remove' and data.get('DEVTYPE') == 'disk')
+
+
+DISK_INVENTORY = DiskInventory()
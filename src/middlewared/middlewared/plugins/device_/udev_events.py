@@ -6,6 +6,8 @@ from middlewared.service import private, Service
 from middlewared.utils import run
 from middlewared.utils.threading import start_daemon_thread
 
+from .disk_inventory import DISK_INVENTORY
+
 
 class DeviceService(Service):
 
@@ -33,6 +35,7 @@ def udev_events(middleware):
             monitor.set_receive_buffer_size(_256MB)
             monitor.filter_by(subsystem='block')
             monitor.filter_by(subsystem='dlm')
+            monitor.filter_by(subsystem='enclosure')
             monitor.filter_by(subsystem='net')
             for device in iter(monitor.poll, None):
                 middleware.call_hook_sync(
@@ -40,6 +43,8 @@ def udev_events(middleware):
                 )
         except Exception:
             middleware.logger.error('Polling udev failed', exc_info=True)
+            # Events might have been lost
+            DISK_INVENTORY.invalidate()
             time.sleep(10)
 
 
@@ -135,8 +135,8 @@ class DiskService(CRUDService):
             if await self.middleware.call('truenas.is_ix_hardware') or disk['name'].startswith('nvme'):
                 disk['supports_smart'] = True
             else:
-                disk_query = await self.middleware.call('disk.smartctl', disk['name'], ['-a', '--json=c'], {'silent': True})
-                disk['supports_smart'] = disk_query.get('smart_support', {}).get('available', False)
+                smart_data = await self.middleware.call('disk.smart_data', disk['name']) or {}
+                disk['supports_smart'] = smart_data.get('smart_support', {}).get('available', False)
 
         if disk['name'] in context['boot_pool_disks']:
             disk['pool'] = context['boot_pool_name']
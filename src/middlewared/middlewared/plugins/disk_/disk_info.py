@@ -8,6 +8,7 @@ import time
 import pyudev
 
 from middlewared.service import CallError, private, Service
+from middlewared.utils.disks import get_partition_name
 from .gpt_utils import read_gpt_partitions
 
 # The basic unit of a block I/O is a sector. A sector is
@@ -36,17 +37,20 @@ PART_INFO_FIELDS = (
 PART_INFO = collections.namedtuple('part_info', PART_INFO_FIELDS, defaults=(0,) * len(PART_INFO_FIELDS))
 
 
-def get_partition_size_info(disk_name, s_offset, s_size):
+def get_partition_size_info(disk_name, s_offset, s_size, lbs=None):
     """Kernel sysfs reports most disk files related to "size" in 512 bytes.
     To properly calculate the starting SECTOR of partitions, you must
     look at logical_block_size (again, reported in 512 bytes) and
     do some calculations. It is _very_ important to do this properly
     since almost all userspace tools that format disks expect partition
-    positions to be in sectors."""
-    lbs = 0
-    with contextlib.suppress(FileNotFoundError, ValueError):
-        with open(f'/sys/block/{disk_name}/queue/logical_block_size') as f:
-            lbs = int(f.read().strip())
+    positions to be in sectors.
+
+    `lbs` can be passed to avoid reading logical_block_size for each partition of the disk."""
+    if lbs is None:
+        lbs = 0
+        with contextlib.suppress(FileNotFoundError, ValueError):
+            with open(f'/sys/block/{disk_name}/queue/logical_block_size') as f:
+                lbs = int(f.read().strip())
 
     if not lbs:
         # this should never happen
@@ -235,9 +239,4 @@ class DiskService(Service):
 
     @private
     def get_partition_for_disk(self, disk, partition):
-        if disk.startswith(('nvme', 'pmem')):
-            # FIXME: This is a hack for nvme/pmem disks, however let's please come up with a better way
-            # to link disks with their partitions
-            return f'{disk}p{partition}'
-        else:
-            return f'{disk}{partition}'
+        return get_partition_name(disk, partition)
@@ -1,4 +1,3 @@
-import json
 import re
 
 from middlewared.schema import Bool, Dict, Int, List, returns, Str
@@ -38,7 +37,11 @@ class DiskService(Service):
         """
         Returns S.M.A.R.T. attributes values for specified disk name.
         """
-        output = json.loads(await self.middleware.call('disk.smartctl', name, ['-a', '--json=c']))
+        sample = (await self.middleware.call('disk.smart_samples', [name]))[name]
+        if sample['error']:
+            raise CallError(sample['error'])
+
+        output = sample['data']
 
         if 'ata_smart_attributes' in output:
             return output['ata_smart_attributes']['table']
@@ -0,0 +1,159 @@
+import asyncio
+import collections
+import glob
+import json
+import time
+
+from middlewared.common.smart.smartctl import smartctl
+from middlewared.service import periodic, private, Service
+
+# Same as collectd/netdata polling interval, consumers ask for values that are a little less old than this
+SMART_SAMPLE_INTERVAL = 300
+SMARTCTL_CONCURRENCY = 8
+
+SmartSample = collections.namedtuple('SmartSample', ['data', 'standby', 'error', 'timestamp'])
+
+
+class SmartCollector:
+    """
+    Parsed `smartctl -a --json=c` output for each disk along with the time it was sampled, shared by all the
+    S.M.A.R.T. consumers (temperatures, attributes, `supports_smart`) so that a disk is not queried once per
+    consumer.
+
+    Concurrent requests for the same disk and power mode are served by a single `smartctl` run and no more than
+    `concurrency` `smartctl` processes are run at once.
+    """
+
+    def __init__(self, concurrency=SMARTCTL_CONCURRENCY):
+        self.concurrency = concurrency
+        self.semaphore = None
+        # disk name -> SmartSample
+        self.samples = {}
+        # (disk name, power mode) -> future of the sample being taken
+        self.pending = {}
+
+    def get_cached(self, name, max_age, powermode=None):
+        """
+        Returns a sample of disk `name` that is not older than `max_age` seconds.
+
+        A disk that was found in standby is not woken up by re-sampling it unless `powermode` is `NEVER`.
+        """
+        if (sample := self.samples.get(name)) is None:
+            return None
+
+        if sample.timestamp <= time.monotonic() - max_age:
+            return None
+
+        if sample.standby and powermode == 'NEVER':
+            return None
+
+        return sample
+
+    async def get(self, sample, names, powermode, max_age=None, timeout=None):
+        """
+        Returns samples for disks `names` using `sample(name, powermode)` coroutine to query the disks which do not
+        have a cached sample that is not older than `max_age` seconds.
+
+        Disks for which `sample` did not complete within `timeout` seconds (the time spent waiting for other disks
+        to be sampled is not counted) are returned as `None`.
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.BoundedSemaphore(self.concurrency)
+
+        async def get_one(name):
+            if max_age is not None and (cached := self.get_cached(name, max_age, powermode)) is not None:
+                return cached
+
+            key = (name, powermode)
+            if (future := self.pending.get(key)) is None:
+                future = self.pending[key] = asyncio.ensure_future(self._sample(sample, name, powermode, timeout))
+                future.add_done_callback(lambda f: self.pending.pop(key, None))
+
+            # One of the callers being cancelled must not cancel the sample for the others
+            return await asyncio.shield(future)
+
+        return dict(zip(names, await asyncio.gather(*map(get_one, names))))
+
+    async def _sample(self, sample, name, powermode, timeout):
+        async with self.semaphore:
+            try:
+                data, standby, error = await asyncio.wait_for(sample(name, powermode), timeout)
+            except asyncio.TimeoutError:
+                return None
+            except Exception as e:
+                data, standby, error = None, False, str(e)
+
+        self.samples[name] = result = SmartSample(data, standby, error, time.monotonic())
+        return result
+
+    def clear(self):
+        self.samples = {}
+
+
+SMART_COLLECTOR = SmartCollector()
+
+
+def read_hwmon_temperature(name):
+    """
+    Reads disk `name` temperature exposed by the kernel hwmon driver. `nvme` driver reads it from the SMART / Health
+    Information log page, `drivetemp` uses SCT status or SMART attributes read with SG_IO.
+    """
+    for path in (
+        glob.glob(f'/sys/block/{name}/device/hwmon*/temp1_input') +
+        glob.glob(f'/sys/block/{name}/device/hwmon/hwmon*/temp1_input')
+    ):
+        try:
+            with open(path) as f:
+                return int(f.read().strip()) // 1000
+        except (OSError, ValueError):
+            continue
+
+
+class DiskService(Service):
+
+    @private
+    async def smart_sample(self, name, powermode):
+        if (smartctl_args := await self.middleware.call('disk.smartctl_args', name)) is None:
+            return None, False, f'S.M.A.R.T. is unavailable for disk {name}'
+
+        cp = await smartctl(smartctl_args + ['-a', '-n', powermode.lower(), '--json=c'], check=False,
+                            encoding='utf8', errors='ignore')
+        if (cp.returncode & 0b11) != 0:
+            # smartctl prints `Device is in STANDBY mode, exit(2)` when it does not wake up the disk
+            standby = powermode != 'NEVER' and cp.returncode == 2 and 'mode, exit(' in cp.stdout
+            return None, standby, f'smartctl failed for disk {name}:\n{cp.stdout}{cp.stderr}'
+
+        try:
+            return json.loads(cp.stdout), False, None
+        except ValueError:
+            return None, False, f'Invalid smartctl output for disk {name}:\n{cp.stdout}'
+
+    @private
+    async def smart_samples(self, names, options=None):
+        """
+        Returns S.M.A.R.T. samples for disks `names`. A cached sample is used if it is not older than `cache` seconds
+        (`null` to always sample the disks).
+        """
+        options = {'cache': SMART_SAMPLE_INTERVAL, 'powermode': 'NEVER', 'timeout': None, **(options or {})}
+        samples = await SMART_COLLECTOR.get(
+            lambda name, powermode: self.middleware.call('disk.smart_sample', name, powermode),
+            names, options['powermode'], options['cache'], options['timeout'],
+        )
+        return {name: sample._asdict() if sample else None for name, sample in samples.items()}
+
+    @private
+    async def smart_data(self, name, options=None):
+        if sample := (await self.smart_samples([name], options))[name]:
+            return sample['data']
+
+    @private
+    async def reset_smart_cache(self):
+        SMART_COLLECTOR.clear()
+
+    @periodic(SMART_SAMPLE_INTERVAL, run_on_start=False)
+    @private
+    async def smart_collect(self):
+        names = await self.middleware.call('disk.disks_for_temperature_monitoring')
+        powermode = (await self.middleware.call('smart.config'))['powermode']
+        # Samples taken a little earlier are still good enough
+        await self.smart_samples(names, {'cache': SMART_SAMPLE_INTERVAL - 30, 'powermode': powermode})
@@ -10,6 +10,41 @@ from middlewared.utils.time_utils import utc_now
 RE_IDENT = re.compile(r'^\{(?P<type>.+?)\}(?P<value>.+)$')
 
 
+class SysDisksIndex:
+    """
+    Maps disk identifiers to the names of the system disks (`device.get_disks` result) they identify and back.
+    """
+
+    def __init__(self, sys_disks):
+        self.sys_disks = sys_disks
+        # identifier type -> identifier value -> disk name
+        self.disks = {'uuid': {}, 'devicename': {}, 'serial_lunid': {}, 'serial': {}}
+        for disk, info in sys_disks.items():
+            for part in info.get('parts', []):
+                self.disks['uuid'].setdefault(part['partition_uuid'], part['disk'])
+
+            for tp, key in (('devicename', 'name'), ('serial_lunid', 'serial_lunid'), ('serial', 'serial')):
+                self.disks[tp].setdefault(info.get(key), disk)
+
+        self.identifiers = {}
+
+    def ident_to_dev(self, ident):
+        if not ident or not (search := RE_IDENT.search(ident)):
+            return
+
+        if (disks := self.disks.get(search.group('type'))) is None:
+            return
+
+        return disks.get(search.group('value'))
+
+    def dev_to_ident(self, name):
+        try:
+            return self.identifiers[name]
+        except KeyError:
+            ident = self.identifiers[name] = dev_to_ident(name, self.sys_disks)
+            return ident
+
+
 class DiskService(Service, ServiceChangeMixin):
 
     DISK_EXPIRECACHE_DAYS = 7
@@ -78,21 +113,7 @@ class DiskService(Service, ServiceChangeMixin):
 
     @private
     def ident_to_dev(self, ident, sys_disks):
-        if not ident or not (search := RE_IDENT.search(ident)):
-            return
-
-        tp = search.group('type')
-        value = search.group('value')
-        mapping = {'uuid': 'uuid', 'devicename': 'name', 'serial_lunid': 'serial_lunid', 'serial': 'serial'}
-        if tp not in mapping:
-            return
-
-        for disk, info in sys_disks.items():
-            if tp == 'uuid':
-                for part in filter(lambda x: x['partition_uuid'] == value, info['parts']):
-                    return part['disk']
-            elif info.get(mapping[tp]) == value:
-                return disk
+        return SysDisksIndex(sys_disks).ident_to_dev(ident)
 
     @private
     def dev_to_ident(self, name, sys_disks):
@@ -118,32 +139,29 @@ class DiskService(Service, ServiceChangeMixin):
         job.set_progress(10, 'Enumerating system disks')
         sys_disks = self.middleware.call_sync('device.get_disks', True)
         number_of_disks = self.log_disk_info(sys_disks)
+        index = SysDisksIndex(sys_disks)
 
         job.set_progress(20, 'Enumerating disk information from database')
         db_disks = self.middleware.call_sync('datastore.query', 'storage.disk', [], {'order_by': ['disk_expiretime']})
 
-        options = {'send_events': False, 'ha_sync': False}
-        seen_disks = {}
+        job.set_progress(40, f'Syncing {number_of_disks} disks')
+        # disk identifier -> database row as it should be after the sync
+        rows = {}
+        inserted = set()
         changed = set()
         deleted = set()
         dif_formatted_disks = []
-        increment = round((40 - 20) / number_of_disks, 3)  # 20% of the total percentage
-        progress_percent = 40
-        for idx, disk in enumerate(db_disks, start=1):
-            progress_percent += increment
-            job.set_progress(progress_percent, f'Syncing disk {idx}/{number_of_disks}')
-
+        seen_disks = set()
+        for disk in db_disks:
             original_disk = disk.copy()
+            rows[disk['disk_identifier']] = disk
 
-            name = self.ident_to_dev(disk['disk_identifier'], sys_disks)
-            if not name or self.dev_to_ident(name, sys_disks) != disk['disk_identifier']:
+            name = index.ident_to_dev(disk['disk_identifier'])
+            if not name or index.dev_to_ident(name) != disk['disk_identifier']:
                 # 1. can't translate identitifer to device
                 # 2. or can't translate device to identifier
                 if not disk['disk_expiretime']:
                     disk['disk_expiretime'] = utc_now() + timedelta(days=self.DISK_EXPIRECACHE_DAYS)
-                    self.middleware.call_sync(
-                        'datastore.update', 'storage.disk', disk['disk_identifier'], disk, options
-                    )
                     changed.add(disk['disk_identifier'])
                 elif disk['disk_expiretime'] < utc_now():
                     # Disk expire time has surpassed, go ahead and remove it
@@ -152,7 +170,7 @@ class DiskService(Service, ServiceChangeMixin):
                             'kmip.reset_sed_disk_password', disk['disk_identifier'], disk['disk_kmip_uuid'],
                             background=True
                         )
-                    self.middleware.call_sync('datastore.delete', 'storage.disk', disk['disk_identifier'], options)
+                    rows.pop(disk['disk_identifier'])
                     deleted.add(disk['disk_identifier'])
                 continue
             else:
@@ -170,27 +188,16 @@ class DiskService(Service, ServiceChangeMixin):
                 disk['disk_expiretime'] = utc_now() + timedelta(days=self.DISK_EXPIRECACHE_DAYS)
 
             if self._disk_changed(disk, original_disk):
-                self.middleware.call_sync('datastore.update', 'storage.disk', disk['disk_identifier'], disk, options)
                 changed.add(disk['disk_identifier'])
 
-            seen_disks[name] = disk
+            seen_disks.add(name)
 
-        qs = None
-        progress_percent = 70
+        job.set_progress(70, 'Syncing new disks')
         for name in filter(lambda x: x not in seen_disks, sys_disks):
-            progress_percent += increment
-            disk_identifier = self.dev_to_ident(name, sys_disks)
-            if qs is None:
-                qs = self.middleware.call_sync('datastore.query', 'storage.disk')
-
-            if disk := [i for i in qs if i['disk_identifier'] == disk_identifier]:
-                new = False
-                disk = disk[0]
-                job.set_progress(progress_percent, f'Updating disk {name!r}')
-            else:
-                new = True
-                disk = {'disk_identifier': disk_identifier}
-                job.set_progress(progress_percent, f'Syncing new disk {name!r}')
+            disk_identifier = index.dev_to_ident(name)
+            if (disk := rows.get(disk_identifier)) is None:
+                disk = rows[disk_identifier] = {'disk_identifier': disk_identifier}
+                inserted.add(disk_identifier)
 
             original_disk = disk.copy()
             disk['disk_name'] = name
@@ -199,29 +206,35 @@ class DiskService(Service, ServiceChangeMixin):
             if sys_disks[name]['dif']:
                 dif_formatted_disks.append(name)
 
-            if not new:
-                if self._disk_changed(disk, original_disk):
-                    self.middleware.call_sync(
-                        'datastore.update', 'storage.disk', disk['disk_identifier'], disk, options
-                    )
-                    changed.add(disk['disk_identifier'])
-            else:
-                self.middleware.call_sync('datastore.insert', 'storage.disk', disk, options)
-                changed.add(disk['disk_identifier'])
+            if self._disk_changed(disk, original_disk):
+                changed.add(disk_identifier)
+
+        changed -= inserted
+        if changed or inserted or deleted:
+            job.set_progress(90, f'Writing {len(changed) + len(inserted) + len(deleted)} disk changes to database')
+            # Only changed rows are written, all at once in a single transaction which (on HA systems) is replicated
+            # to the standby controller as a whole
+            self.middleware.call_sync('datastore.bulk_write', 'storage.disk', [
+                {'action': 'DELETE', 'id': identifier} for identifier in deleted
+            ] + [
+                {'action': 'UPDATE', 'id': identifier, 'data': rows[identifier]} for identifier in changed
+            ] + [
+                {'action': 'INSERT', 'data': rows[identifier]} for identifier in inserted
+            ], {'send_events': False})
 
         if dif_formatted_disks:
             self.middleware.call_sync('alert.oneshot_create', 'DifFormatted', dif_formatted_disks)
         else:
             self.middleware.call_sync('alert.oneshot_delete', 'DifFormatted', None)
 
-        if changed or deleted:
+        if changed or inserted or deleted:
             job.set_progress(92, 'Restarting necessary services')
             self.middleware.call_sync('disk.restart_services_after_sync')
 
             # we query the db again since we've made changes to it
             job.set_progress(94, 'Emitting disk events')
             disks = {i['disk_identifier']: i for i in self.middleware.call_sync('datastore.query', 'storage.disk')}
-            for change in changed:
+            for change in changed | inserted:
                 self.middleware.send_event('disk.query', 'CHANGED', id=change, fields=disks[change])
             for delete in deleted:
                 self.middleware.send_event('disk.query', 'REMOVED', id=delete)
@@ -230,14 +243,6 @@ class DiskService(Service, ServiceChangeMixin):
             job.set_progress(95, 'Synchronizing ZFS GUIDs')
             self.middleware.call_sync('disk.sync_all_zfs_guid')
 
-        if licensed and status == 'MASTER':
-            job.set_progress(96, 'Synchronizing database to standby controller')
-            # there could be, literally, > 1k database changes in this method on large systems
-            # so we're not sync'ing these db changes synchronously. Instead we're sync'ing the
-            # entire database to the remote node after we're done. The (potential) speed
-            # improvement this provides is substantial
-            self.middleware.call_sync('failover.datastore.force_send')
-
         job.set_progress(100, 'Syncing all disks complete')
         return 'OK'
 
@@ -1,19 +1,24 @@
-import asyncio
 import datetime
-import time
-import json
 
 from middlewared.api import api_method
 from middlewared.api.current import DiskTemperatureAlertsArgs, DiskTemperatureAlertsResult
 from middlewared.common.smart.smartctl import SMARTCTL_POWERMODES
 from middlewared.schema import accepts, Bool, Dict, Int, List, returns, Str
 from middlewared.service import private, Service
-from middlewared.utils.asyncio_ import asyncio_map
 from middlewared.utils.disk_temperatures import parse_smartctl_for_temperature_output
 
+from .smart_collector import read_hwmon_temperature, SMART_COLLECTOR
+
+
+def temperature_from_smart_data(data):
+    if data:
+        try:
+            return parse_smartctl_for_temperature_output(data)
+        except KeyError:
+            return None
+
 
 class DiskService(Service):
-    cache = {}
 
     @private
     async def disks_for_temperature_monitoring(self):
@@ -34,6 +39,7 @@ class DiskService(Service):
             'options',
             Int('cache', default=None, null=True),
             Str('powermode', enum=SMARTCTL_POWERMODES, default=SMARTCTL_POWERMODES[0]),
+            Bool('direct', default=False),
         ),
         deprecated=[
             (
@@ -48,28 +54,15 @@ class DiskService(Service):
         """
         Returns temperature for device `name` using specified S.M.A.R.T. `powermode`. If `cache` is not null
         then the last cached within `cache` seconds value is used.
-        """
-        if options['cache'] is not None:
-            if cached := self.cache.get(name):
-                temperature, cache_time = cached
-                if cache_time > time.monotonic() - options['cache']:
-                    return temperature
-
-        temperature = await self.middleware.call('disk.temperature_uncached', name, options['powermode'])
-
-        self.cache[name] = (temperature, time.monotonic())
-        return temperature
 
-    @private
-    async def temperature_uncached(self, name, powermode):
-        if output := await self.middleware.call('disk.smartctl', name, ['-a', '-n', powermode.lower(), '--json=c'], {'silent': True}):
-            return parse_smartctl_for_temperature_output(json.loads(output))
+        If `direct` is true then the temperature is read from the kernel (without running `smartctl`) when it is
+        available and this can be done without waking up the disk (NVMe disks or `powermode` is `NEVER`).
+        """
+        return (await self._temperatures([name], options, None))[name]
 
     @private
     async def reset_temperature_cache(self):
-        self.cache = {}
-
-    temperatures_semaphore = asyncio.BoundedSemaphore(8)
+        await self.middleware.call('disk.reset_smart_cache')
 
     @accepts(
         List('names', items=[Str('name')]),
@@ -80,6 +73,7 @@ class DiskService(Service):
             Int('cache', default=290, null=True),
             Bool('only_cached', default=False),
             Str('powermode', enum=SMARTCTL_POWERMODES, default=SMARTCTL_POWERMODES[0]),
+            Bool('direct', default=False),
         ),
         deprecated=[
             (
@@ -99,24 +93,30 @@ class DiskService(Service):
         if len(names) == 0:
             names = await self.disks_for_temperature_monitoring()
 
-        if options.pop('only_cached'):
+        if options['only_cached']:
             return {
-                disk: temperature
-                for disk, (temperature, cache_time) in self.cache.items()
-                if (
-                    disk in names and
-                    cache_time > time.monotonic() - 610  # Double collectd polling interval + a little bit
-                )
+                name: temperature_from_smart_data(sample.data)
+                for name in names
+                # Double collectd polling interval + a little bit
+                if (sample := SMART_COLLECTOR.get_cached(name, 610))
             }
 
-        async def temperature(name):
-            try:
-                async with asyncio.timeout(15):
-                    return await self.middleware.call('disk.temperature', name, options)
-            except asyncio.TimeoutError:
-                return None
+        return await self._temperatures(names, options, 15)
+
+    async def _temperatures(self, names, options, timeout):
+        temperatures = {}
+        if options['direct']:
+            for name in names:
+                if name.startswith('nvme') or options['powermode'] == 'NEVER':
+                    temperatures[name] = await self.middleware.run_in_thread(read_hwmon_temperature, name)
+
+        samples = await self.middleware.call('disk.smart_samples', [
+            name for name in names if temperatures.get(name) is None
+        ], {'cache': options['cache'], 'powermode': options['powermode'], 'timeout': timeout})
+        for name, sample in samples.items():
+            temperatures[name] = temperature_from_smart_data(sample['data'] if sample else None)
 
-        return dict(zip(names, await asyncio_map(temperature, names, semaphore=self.temperatures_semaphore)))
+        return {name: temperatures[name] for name in names}
 
     @accepts(List('names', items=[Str('name')]), Int('days', default=7), roles=['REPORTING_READ'])
     @returns(Dict('temperatures', additional_attrs=True))
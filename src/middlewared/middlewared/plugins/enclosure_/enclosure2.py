@@ -2,10 +2,13 @@
 #
 # Licensed under the terms of the TrueNAS Enterprise License Agreement
 # See the file LICENSE.IX for complete terms and conditions
+import copy
 import errno
+import threading
+import time
 
 from middlewared.schema import Dict, Int, Str, accepts
-from middlewared.service import Service, filterable
+from middlewared.service import Service, filterable, periodic
 from middlewared.service_exception import CallError, MatchNotFound, ValidationError
 from middlewared.utils import filter_list
 
@@ -19,6 +22,13 @@ from .r30_drive_identify import set_slot_status as r30_set_slot_status
 from .ses_enclosures2 import get_ses_enclosures
 from .sysfs_disks import toggle_enclosure_slot_identifier
 
+# `enclosure2.query` calls made within this many seconds return the same element statuses
+ENCLOSURE_STATUS_TTL = 10
+# Enclosures are re-created from scratch this often (i.e. to pick up JBOF status that is only
+# available through Redfish or changes for which we did not receive an event)
+ENCLOSURE_REFRESH_INTERVAL = 300
+ENCLOSURE_VIEWS = ('ses', 'nvme', 'jbof')
+
 
 class Enclosure2Service(Service):
 
@@ -26,6 +36,19 @@ class Enclosure2Service(Service):
         cli_namespace = 'storage.enclosure2'
         private = True
 
+    def __init__(self, *args, **kwargs):
+        super(Enclosure2Service, self).__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        # bsg path -> `Enclosure` so that only SES status pages are read on subsequent calls
+        self._ses_cache = dict()
+        # 'nvme'/'jbof' -> enclosures
+        self._views = dict()
+        # views that must be re-created from scratch
+        self._stale = set(ENCLOSURE_VIEWS)
+        self._enclosures = None
+        self._enclosures_time = None
+
     def get_ses_enclosures(self):
         """This generates the "raw" list of enclosures detected on the system. It
         serves as the "entry" point to "enclosure2.query" and is foundational in
@@ -36,7 +59,7 @@ class Enclosure2Service(Service):
         formatting it into a structured object that will be consumed by the webUI
         team as well as on the backend (alerts, drive identifiction, etc).
         """
-        return get_ses_enclosures()
+        return get_ses_enclosures(cache=self._ses_cache)
 
     async def map_jbof(self, jbof_qry=None):
         """This method serves as an endpoint to easily be able to test
@@ -88,11 +111,16 @@ class Enclosure2Service(Service):
         except MatchNotFound:
             raise ValidationError('enclosure2.set_slot_status', f'Enclosure with id: {data["enclosure_id"]} not found')
 
+        # identification status is read when the enclosure views are created so they are invalidated once the
+        # status is written (otherwise a concurrent query could cache the previous status)
         if enc_info['id'].endswith('_nvme_enclosure'):
             if enc_info['id'].startswith('r30'):
                 # an all nvme flash system so drive identification is handled
                 # in a completely different way than sata/scsi
-                return r30_set_slot_status(data['slot'], data['status'])
+                try:
+                    return r30_set_slot_status(data['slot'], data['status'])
+                finally:
+                    self.invalidate(['nvme'])
             elif enc_info['id'].startswith(('f60', 'f100', 'f130')):
                 try:
                     return fseries_set_slot_status(data['slot'], data['status'])
@@ -102,14 +130,19 @@ class Enclosure2Service(Service):
                         return self.middleware.call_sync(
                             'failover.call_remote', 'enclosure2.set_slot_status', [data], opts
                         )
+                finally:
+                    self.invalidate(['nvme'])
             else:
                 # mseries, and some rseries have mapped nvme enclosures but they
                 # don't support drive LED identification
                 return
         elif enc_info['model'] == JbofModels.ES24N.name:
-            return self.middleware.call_sync(
-                'enclosure2.jbof_set_slot_status', data['enclosure_id'], data['slot'], data['status']
-            )
+            try:
+                return self.middleware.call_sync(
+                    'enclosure2.jbof_set_slot_status', data['enclosure_id'], data['slot'], data['status']
+                )
+            finally:
+                self.invalidate(['jbof'])
 
         if enc_info['pci'] is None:
             raise ValidationError('enclosure2.set_slot_status', 'Unable to determine PCI address for enclosure')
@@ -128,10 +161,61 @@ class Enclosure2Service(Service):
                     )
                 except FileNotFoundError:
                     raise CallError(f'Slot: {data["slot"]!r} not found', errno.ENOENT)
+                finally:
+                    self.invalidate(['ses'])
 
     async def jbof_set_slot_status(self, ident, slot, status):
         return await _jbof_set_slot_status(ident, slot, status)
 
+    def invalidate(self, views=ENCLOSURE_VIEWS):
+        """Re-create enclosures of `views` (`ses`, `nvme` and/or `jbof`) from scratch
+        on the next `enclosure2.query` call instead of only refreshing their status."""
+        with self._lock:
+            self._stale.update(views)
+
+    @periodic(ENCLOSURE_REFRESH_INTERVAL, run_on_start=False)
+    def refresh(self):
+        self.invalidate()
+
+    def get_enclosures(self):
+        """Enclosures are expensive to create (INQUIRY, sysfs scans, Redfish requests)
+        so they are kept between the calls. SES enclosures only have their status page
+        read again (and only the elements that changed are parsed) unless udev reported
+        a change of enclosures or disks."""
+        with self._build_lock:
+            with self._lock:
+                if self._enclosures is not None and not self._stale and (
+                    time.monotonic() - self._enclosures_time < ENCLOSURE_STATUS_TTL
+                ):
+                    return copy.deepcopy(self._enclosures)
+
+                stale, self._stale = self._stale, set()
+
+            if 'ses' in stale:
+                self._ses_cache.clear()
+            if 'nvme' in stale or 'nvme' not in self._views:
+                self._views['nvme'] = self.map_nvme()
+            if 'jbof' in stale or 'jbof' not in self._views:
+                self._views['jbof'] = self.middleware.call_sync('enclosure2.map_jbof')
+
+            enclosures = []
+            for i in copy.deepcopy(self.get_ses_enclosures() + self._views['nvme'] + self._views['jbof']):
+                if i.pop('should_ignore'):
+                    continue
+
+                enclosures.append(i)
+
+            combine_enclosures(enclosures)
+
+            enclosures = sorted(
+                enclosures, key=lambda enclosure: (0 if enclosure["controller"] else 1, enclosure['id'])
+            )
+
+            with self._lock:
+                self._enclosures, self._enclosures_time = enclosures, time.monotonic()
+
+            return copy.deepcopy(enclosures)
+
     @filterable
     def query(self, filters, options):
         enclosures = []
@@ -140,10 +224,7 @@ class Enclosure2Service(Service):
             return enclosures
 
         labels = self.middleware.call_sync('enclosure.label.get_all')
-        for i in self.get_ses_enclosures() + self.map_nvme() + self.middleware.call_sync('enclosure2.map_jbof'):
-            if i.pop('should_ignore'):
-                continue
-
+        for i in self.get_enclosures():
             # this is a user-provided string to label the enclosures so we'll add it at as a
             # top-level dictionary key "label", if the user hasn't provided a label then we'll
             # fill in the info with whatever is in the "name" key. The "name" key is the
@@ -152,8 +233,19 @@ class Enclosure2Service(Service):
             i['label'] = labels.get(i['id']) or i['name']
             enclosures.append(i)
 
-        combine_enclosures(enclosures)
+        return filter_list(enclosures, filters, options)
 
-        enclosures = sorted(enclosures, key=lambda enclosure: (0 if enclosure["controller"] else 1, enclosure['id']))
 
-        return filter_list(enclosures, filters, options)
+async def udev_block_devices_hook(middleware, data):
+    if data.get('DEVTYPE') == 'disk' and data.get('ACTION') in ('add', 'remove'):
+        # disks are mapped to the enclosure slots when the enclosures are created
+        await middleware.call('enclosure2.invalidate', ['ses', 'nvme', 'jbof'])
+
+
+async def udev_enclosure_hook(middleware, data):
+    await middleware.call('enclosure2.invalidate', ['ses'])
+
+
+async def setup(middleware):
+    middleware.register_hook('udev.block', udev_block_devices_hook)
+    middleware.register_hook('udev.enclosure', udev_enclosure_hook)
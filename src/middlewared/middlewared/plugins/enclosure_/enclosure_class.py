@@ -38,11 +38,22 @@ class Enclosure:
         self._get_model_and_controller()
         self._should_ignore_enclosure()
         self.sysfs_map, self.disks_map, self.elements = dict(), dict(), dict()
+        # element index -> (raw element as read from the status page, parsed element)
+        self.parsed_elements = dict()
         if not self.should_ignore:
             self.sysfs_map = map_disks_to_enclosure_slots(self)
             self.disks_map = self._get_array_device_mapping_info()
             self.elements = self._parse_elements(enc_stat['elements'])
 
+    def update_status(self, enc_stat):
+        """Apply a status page that was read again from the enclosure. Elements
+        whose raw status did not change since the last read are not parsed again.
+        NOTE: disk to slot mapping is only determined when this object is created
+        so it must be re-created when disks are added or removed."""
+        self.status = list(enc_stat['status'])
+        if not self.should_ignore:
+            self.elements = self._parse_elements(enc_stat['elements'])
+
     def asdict(self):
         """This method is what is returned in enclosure2.query"""
         return {
@@ -260,85 +271,106 @@ class Enclosure:
                 return found
 
     def _parse_elements(self, elements):
-        final = {}
-        disk_position_mapping = self.determine_disk_slot_positions()
+        final, parsed_elements = {}, {}
+        disk_position_mapping = None
         for slot, element in elements.items():
-            try:
-                element_type = ELEMENT_TYPES[element['type']]
-            except KeyError:
-                # means the element type that's being
-                # reported to us is unknown so log it
-                # and continue on
-                logger.warning('Unknown element type: %r for %r', element['type'], self.devname)
-                continue
+            raw = (element['type'], tuple(element['status']), element['descriptor'])
+            if (cached := self.parsed_elements.get(slot)) is not None and cached[0] == raw:
+                parsed = cached[1]
+            else:
+                if disk_position_mapping is None:
+                    disk_position_mapping = self.determine_disk_slot_positions()
 
-            try:
-                element_status = ELEMENT_DESC[element['status'][0]]
-            except KeyError:
-                # means the elements status reported by the enclosure
-                # is not mapped so just report unknown
-                element_status = 'UNKNOWN'
+                parsed = self._parse_element(slot, element, disk_position_mapping)
 
-            if self._ignore_element(element_status, element):
+            parsed_elements[slot] = (raw, parsed)
+            if parsed is None:
                 continue
 
-            if element_type[0] not in final:
+            element_type, mapped_slot, value = parsed
+            if element_type not in final:
                 # first time seeing this element type so add it
-                final[element_type[0]] = {}
-
-            # convert list of integers representing the elements
-            # raw status to an integer so it can be converted
-            # appropriately based on the element type
-            value_raw = 0
-            for val in element['status']:
-                value_raw = (value_raw << 8) + val
-
-            mapped_slot = slot
-            parsed = {
-                'descriptor': element['descriptor'].strip(),
-                'status': element_status,
-                'value': element_type[1](value_raw),
-                'value_raw': value_raw,
-            }
-            if element_type[0] == 'Array Device Slot' and self.disks_map:
-                try:
-                    dinfo = self.disks_map[slot]
-                    sysfs_slot = dinfo[SYSFS_SLOT_KEY]
-                    parsed['dev'] = self.sysfs_map[sysfs_slot].name
-                except KeyError:
-                    # this happens on some of the MINI platforms, for example,
-                    # the MINI-3.0-XL+ because we map the 1st drive and only
-                    # the 1st drive from the Virtual AHCI controller with id
-                    # that ends with 002. However, we send a standard enclosure
-                    # diagnostics command so all the other elements will return
-                    continue
-
-                # does this enclosure slot support identification? (i.e. lighting up LED)
-                parsed[SUPPORTS_IDENTIFY_KEY] = dinfo[SUPPORTS_IDENTIFY_KEY]
-
-                # does this enclosure slot support reporting identification status?
-                # (i.e. whether the LED is currently lit up)
-                if dinfo.get(SUPPORTS_IDENTIFY_STATUS_KEY, parsed[SUPPORTS_IDENTIFY_KEY]):
-                    parsed[DRIVE_BAY_LIGHT_STATUS] = self.sysfs_map[sysfs_slot].locate
-                else:
-                    parsed[DRIVE_BAY_LIGHT_STATUS] = None
-
-                mapped_slot = dinfo[MAPPED_SLOT_KEY]
-                # is this a front, rear or internal slot?
-                parsed.update(disk_position_mapping.get(mapped_slot, dict()))
-
-                parsed['original'] = {
-                    'enclosure_id': self.encid,
-                    'enclosure_sg': self.sg,
-                    'enclosure_bsg': self.bsg,
-                    'descriptor': f'slot{sysfs_slot}',
-                    'slot': sysfs_slot,
-                }
-
-            final[element_type[0]].update({mapped_slot: parsed})
+                final[element_type] = {}
+
+            if mapped_slot is not None:
+                final[element_type].update({mapped_slot: value})
 
+        self.parsed_elements = parsed_elements
         return final
 
+    def _parse_element(self, slot, element, disk_position_mapping):
+        """Returns a tuple of element type name, mapped slot and the parsed element.
+        `None` is returned for the elements that are not reported."""
+        try:
+            element_type = ELEMENT_TYPES[element['type']]
+        except KeyError:
+            # means the element type that's being
+            # reported to us is unknown so log it
+            # and continue on
+            logger.warning('Unknown element type: %r for %r', element['type'], self.devname)
+            return None
+
+        try:
+            element_status = ELEMENT_DESC[element['status'][0]]
+        except KeyError:
+            # means the elements status reported by the enclosure
+            # is not mapped so just report unknown
+            element_status = 'UNKNOWN'
+
+        if self._ignore_element(element_status, element):
+            return None
+
+        # convert list of integers representing the elements
+        # raw status to an integer so it can be converted
+        # appropriately based on the element type
+        value_raw = 0
+        for val in element['status']:
+            value_raw = (value_raw << 8) + val
+
+        mapped_slot = slot
+        parsed = {
+            'descriptor': element['descriptor'].strip(),
+            'status': element_status,
+            'value': element_type[1](value_raw),
+            'value_raw': value_raw,
+        }
+        if element_type[0] == 'Array Device Slot' and self.disks_map:
+            try:
+                dinfo = self.disks_map[slot]
+                sysfs_slot = dinfo[SYSFS_SLOT_KEY]
+                parsed['dev'] = self.sysfs_map[sysfs_slot].name
+            except KeyError:
+                # this happens on some of the MINI platforms, for example,
+                # the MINI-3.0-XL+ because we map the 1st drive and only
+                # the 1st drive from the Virtual AHCI controller with id
+                # that ends with 002. However, we send a standard enclosure
+                # diagnostics command so all the other elements will return
+                return element_type[0], None, None
+
+            # does this enclosure slot support identification? (i.e. lighting up LED)
+            parsed[SUPPORTS_IDENTIFY_KEY] = dinfo[SUPPORTS_IDENTIFY_KEY]
+
+            # does this enclosure slot support reporting identification status?
+            # (i.e. whether the LED is currently lit up)
+            if dinfo.get(SUPPORTS_IDENTIFY_STATUS_KEY, parsed[SUPPORTS_IDENTIFY_KEY]):
+                parsed[DRIVE_BAY_LIGHT_STATUS] = self.sysfs_map[sysfs_slot].locate
+            else:
+                parsed[DRIVE_BAY_LIGHT_STATUS] = None
+
+            mapped_slot = dinfo[MAPPED_SLOT_KEY]
+            # is this a front, rear or internal slot?
+            parsed.update(disk_position_mapping.get(mapped_slot, dict()))
+
+            parsed['original'] = {
+                'enclosure_id': self.encid,
+                'enclosure_sg': self.sg,
+                'enclosure_bsg': self.bsg,
+                'descriptor': f'slot{sysfs_slot}',
+                'slot': sysfs_slot,
+            }
+
+        return element_type[0], mapped_slot, parsed
+
     @property
     def model(self):
         return self.__model
@@ -15,17 +15,30 @@ def get_ses_enclosure_status(bsg_path):
         logger.error('Error querying enclosure status for %r', bsg_path, exc_info=True)
 
 
-def get_ses_enclosures(asdict=True):
+def get_ses_enclosures(asdict=True, cache=None):
+    """`cache` is a dictionary (bsg path -> `Enclosure`) kept by the caller between
+    the calls. Enclosures found in it only have their status page read and applied
+    instead of being created from scratch. It is updated with the enclosures found."""
     rv = list()
+    found = dict()
     with suppress(FileNotFoundError):
         for i in Path('/sys/class/enclosure').iterdir():
             bsg = f'/dev/bsg/{i.name}'
             if (status := get_ses_enclosure_status(bsg)):
-                sg = next((i / 'device/scsi_generic').iterdir())
-                enc = Enclosure(bsg, f'/dev/{sg.name}', status)
+                if cache is not None and (enc := cache.get(bsg)) is not None and enc.encid == status['id']:
+                    enc.update_status(status)
+                else:
+                    sg = next((i / 'device/scsi_generic').iterdir())
+                    enc = Enclosure(bsg, f'/dev/{sg.name}', status)
+
+                found[bsg] = enc
                 if asdict:
                     rv.append(enc.asdict())
                 else:
                     rv.append(enc)
 
+    if cache is not None:
+        cache.clear()
+        cache.update(found)
+
     return rv
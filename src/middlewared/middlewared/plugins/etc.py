@@ -1,7 +1,10 @@
 import asyncio
 from collections import defaultdict
-import imp
+import copy
+import importlib.util
+import json
 import os
+import time
 
 from mako import exceptions
 from middlewared.service import CallError, Service
@@ -50,11 +53,23 @@ class PyRenderer(object):
 
     def __init__(self, service):
         self.service = service
+        # path -> (mtime, module)
+        self.modules = {}
+
+    def load_module(self, path):
+        module_path = f'{path}.py'
+        mtime = os.stat(module_path).st_mtime_ns
+        if (cached := self.modules.get(path)) and cached[0] == mtime:
+            return cached[1]
+
+        spec = importlib.util.spec_from_file_location(os.path.basename(path), module_path)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        self.modules[path] = (mtime, mod)
+        return mod
 
     async def render(self, path, ctx):
-        name = os.path.basename(path)
-        find = imp.find_module(name, [os.path.dirname(path)])
-        mod = imp.load_module(name, *find)
+        mod = self.load_module(path)
         args = [self.service, self.service.middleware]
         if ctx is not None:
             args.append(ctx)
@@ -65,6 +80,28 @@ class PyRenderer(object):
             return await self.service.middleware.run_in_thread(mod.render, *args)
 
 
+class ContextCache(object):
+    """
+    Memoizes `ctx` method calls so that groups generated within the same checkpoint that need e.g. `smb.config`
+    share a single call.
+    """
+
+    def __init__(self, middleware):
+        self.middleware = middleware
+        self.calls = {}
+
+    def start(self, method, args):
+        key = (method, json.dumps(args))
+        if (task := self.calls.get(key)) is None:
+            task = self.calls[key] = asyncio.ensure_future(self.middleware.call(method, *args))
+
+        return task
+
+    async def call(self, method, args):
+        # Each group gets its own copy as renderers are free to modify the context they are given
+        return copy.deepcopy(await self.start(method, args))
+
+
 class EtcService(Service):
 
     GROUPS = {
@@ -388,17 +425,27 @@ class EtcService(Service):
             'mako': MakoRenderer(self),
             'py': PyRenderer(self),
         }
+        self.timings = {}
+
+    async def gather_ctx(self, methods, ctx_cache=None):
+        if ctx_cache is None:
+            ctx_cache = ContextCache(self.middleware)
 
-    async def gather_ctx(self, methods):
-        rv = {}
+        keys = []
         for m in methods:
             method = m['method']
-            args = m.get('args', [])
             prefix = m.get('ctx_prefix', None)
-            key = f'{prefix}.{method}' if prefix else method
-            rv[key] = await self.middleware.call(method, *args)
+            keys.append(f'{prefix}.{method}' if prefix else method)
 
-        return rv
+        results = await asyncio.gather(
+            *[ctx_cache.call(m['method'], m.get('args', [])) for m in methods], return_exceptions=True,
+        )
+        # All the calls are awaited so that none of their exceptions goes unretrieved
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        return dict(zip(keys, results))
 
     def get_perms_and_ownership(self, entry):
         user_name = entry.get('owner')
@@ -437,19 +484,25 @@ class EtcService(Service):
         return changes
 
     async def generate(self, name, checkpoint=None):
+        return await self._generate(name, checkpoint)
+
+    async def _generate(self, name, checkpoint=None, ctx_cache=None):
         group = self.GROUPS.get(name)
         if group is None:
             raise ValueError('{0} group not found'.format(name))
 
         output = []
         async with self.LOCKS[name]:
+            start = time.monotonic()
             if isinstance(group, dict):
-                ctx = await self.gather_ctx(group['ctx'])
+                ctx = await self.gather_ctx(group['ctx'], ctx_cache)
                 entries = group['entries']
             else:
                 ctx = None
                 entries = group
 
+            ctx_time = time.monotonic() - start
+
             for entry in entries:
                 renderer = self._renderers.get(entry['type'])
                 if renderer is None:
@@ -503,18 +556,45 @@ class EtcService(Service):
                         'changes': FileChanges.dump(changes)
                     })
 
+            self.timings[name] = {
+                'checkpoint': checkpoint,
+                'ctx': ctx_time,
+                'render': time.monotonic() - start - ctx_time,
+            }
+
         return output
 
     async def generate_checkpoint(self, checkpoint):
         if checkpoint not in await self.get_checkpoints():
             raise CallError(f'"{checkpoint}" not recognised')
 
-        for name in self.GROUPS.keys():
+        start = time.monotonic()
+        groups = [name for name in self.GROUPS.keys() if self.group_has_checkpoint(name, checkpoint)]
+
+        # Groups are rendered one by one in their usual order, each distinct `ctx` method call is only made once
+        # (by the first group that needs it) and its result is shared with the groups that follow.
+        ctx_cache = ContextCache(self.middleware)
+        for name in groups:
             try:
-                await self.generate(name, checkpoint)
+                await self._generate(name, checkpoint, ctx_cache)
             except Exception:
                 self.logger.error(f'Failed to generate {name} group', exc_info=True)
 
+        self.logger.debug('Generated %r checkpoint (%d groups) in %.2f seconds', checkpoint, len(groups),
+                          time.monotonic() - start)
+
+    def group_has_checkpoint(self, name, checkpoint):
+        group = self.GROUPS[name]
+        entries = group['entries'] if isinstance(group, dict) else group
+        return any(entry.get('checkpoint', 'initial') == checkpoint for entry in entries)
+
+    async def get_timings(self):
+        """
+        Returns how long it took to gather the context and to render the entries of each group the last time
+        it was generated.
+        """
+        return self.timings
+
     async def get_checkpoints(self):
         return self.checkpoints
 
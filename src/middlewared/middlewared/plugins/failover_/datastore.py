@@ -34,6 +34,15 @@ class FailoverDatastoreService(Service):
 
         await self.middleware.call('datastore.execute', sql, params)
 
+    async def sql_many(self, data, queries):
+        if await self.middleware.call('system.version') != data['version']:
+            return
+
+        if await self.middleware.call('failover.status') != 'BACKUP':
+            return
+
+        await self.middleware.call('datastore.execute_many', queries)
+
     failure = False
 
     def is_failure(self):
@@ -172,8 +181,40 @@ def hook_datastore_execute_write(middleware, sql, params, options):
         middleware.call_sync('failover.datastore.set_failure')
 
 
+def hook_datastore_execute_write_many(middleware, queries, options):
+    # Same as `hook_datastore_execute_write` but replicates all queries of the transaction in a single call
+
+    if not options['ha_sync']:
+        return
+
+    if not middleware.call_sync('failover.licensed'):
+        return
+
+    if middleware.call_sync('failover.datastore.is_failure'):
+        return
+
+    try:
+        middleware.call_sync(
+            'failover.call_remote',
+            'failover.datastore.sql_many',
+            [
+                {
+                    'version': middleware.call_sync('system.version'),
+                },
+                queries,
+            ],
+            {
+                'timeout': 60,
+            },
+        )
+    except Exception as e:
+        middleware.logger.warning('Error replicating SQL transaction on the remote node: %r', e)
+        middleware.call_sync('failover.datastore.set_failure')
+
+
 async def setup(middleware):
     if not await middleware.call('system.is_enterprise'):
         return
 
     middleware.register_hook('datastore.post_execute_write', hook_datastore_execute_write, inline=True)
+    middleware.register_hook('datastore.post_execute_write_many', hook_datastore_execute_write_many, inline=True)
@@ -1,17 +1,26 @@
+import copy
 from subprocess import run
 
-from middlewared.service import job, Service, filterable, filterable_returns
+from middlewared.service import job, periodic, private, Service, filterable, filterable_returns
 from middlewared.utils import filter_list
 from middlewared.schema import accepts, returns, Dict
 from middlewared.service_exception import CallError
 
+from .utils import IpmiSampler, sdr_cache_args
+
 SEL_LOCK = 'sel_lock'
+SEL_POLL_INTERVAL = 60
+SEL_RECORD_ID_MAX = 0xFFFE  # 0xFFFF is reserved
+SEL_SAMPLER = IpmiSampler()
 
 
-def get_sel_data(data):
+def get_sel_data(data, first_record_id=None):
     cmd = ['ipmi-sel']
     if data == 'elist':
         cmd.extend(['-v', '--no-header-output', '--comma-separated-output', '--non-abbreviated-units'])
+        cmd.extend(sdr_cache_args())
+        if first_record_id is not None:
+            cmd.append(f'--range={first_record_id}-{SEL_RECORD_ID_MAX}')
     elif data == 'info':
         cmd.extend(['--info'])
     else:
@@ -25,34 +34,109 @@ def get_sel_data(data):
     return rv
 
 
+def parse_sel_elist(lines):
+    rv = []
+    for line in lines:
+        if (values := line.strip().split(',')) and len(values) == 7:
+            rv.append({
+                'id': values[0].strip(),
+                'date': values[1].strip(),
+                'time': values[2].strip(),
+                'name': values[3].strip(),
+                'type': values[4].strip(),
+                'event_direction': values[5].strip(),
+                'event': values[6].strip(),
+            })
+
+    return rv
+
+
+def parse_sel_state(lines):
+    """
+    Returns the `ipmi-sel --info` values that change when records are added to or erased from the SEL.
+    """
+    info = {}
+    for line in lines:
+        key, sep, value = line.partition(':')
+        if sep:
+            info[key.strip().lower()] = value.strip()
+
+    try:
+        entries = int(info['number of log entries'])
+    except (KeyError, ValueError):
+        entries = None
+
+    return {
+        'entries': entries,
+        'added': info.get('recent addition timestamp'),
+        'erased': info.get('recent erase timestamp'),
+    }
+
+
+def last_record_id(records):
+    try:
+        return max(int(record['id']) for record in records)
+    except ValueError:
+        return None
+
+
 class IpmiSelService(Service):
 
     class Config:
         namespace = 'ipmi.sel'
         cli_namespace = 'service.ipmi.sel'
 
+    @private
+    def read(self, previous):
+        """
+        Reads the SEL extended list. Only the records added since `previous` read are read from the BMC if no records
+        were erased in the meantime.
+        """
+        if not self.middleware.call_sync('ipmi.is_loaded'):
+            return None
+
+        state = parse_sel_state(get_sel_data('info'))
+        if previous is not None and None not in state.values():
+            records = previous['records']
+            if state == previous['state']:
+                return previous
+
+            if (
+                state['erased'] == previous['state']['erased'] and state['entries'] > len(records) and
+                (last := last_record_id(records)) is not None and last < SEL_RECORD_ID_MAX
+            ):
+                records = records + parse_sel_elist(get_sel_data('elist', last + 1))
+                # Records might have been overwritten if the SEL is full; start over if anything does not add up
+                if len(records) == state['entries']:
+                    return {'state': state, 'records': records}
+
+        return {'state': state, 'records': parse_sel_elist(get_sel_data('elist'))}
+
+    @private
+    def sample(self, options=None):
+        """
+        Returns SEL extended list records along with the time they were read at. The records are re-read if the
+        cached ones are older than `cache` seconds (`null` to always re-read them).
+        """
+        options = {'cache': SEL_POLL_INTERVAL, **(options or {})}
+        value, timestamp = SEL_SAMPLER.get(self.read, options['cache'])
+        # Callers are free to modify the result
+        return {'records': copy.deepcopy(value['records']) if value else [], 'timestamp': timestamp}
+
+    @periodic(SEL_POLL_INTERVAL, run_on_start=False)
+    @private
+    def poll(self):
+        if self.middleware.call_sync('ipmi.is_loaded'):
+            # Records read a little earlier are still good enough
+            self.sample({'cache': SEL_POLL_INTERVAL - 10})
+
     @filterable(roles=['IPMI_READ'])
     @filterable_returns(Dict('ipmi_elist', additional_attrs=True))
     @job(lock=SEL_LOCK, lock_queue_size=1, transient=True)
     def elist(self, job, filters, options):
         """Query IPMI System Event Log (SEL) extended list"""
-        rv = []
-        if not self.middleware.call_sync('ipmi.is_loaded'):
-            return rv
-
         job.set_progress(78, 'Enumerating extended event log info')
-        for line in get_sel_data('elist'):
-            if (values := line.strip().split(',')) and len(values) == 7:
-                rv.append({
-                    'id': values[0].strip(),
-                    'date': values[1].strip(),
-                    'time': values[2].strip(),
-                    'name': values[3].strip(),
-                    'type': values[4].strip(),
-                    'event_direction': values[5].strip(),
-                    'event': values[6].strip(),
-                })
-
+        rv = self.sample()['records']
         job.set_progress(100, 'Parsing extended event log complete')
         return filter_list(rv, filters, options)
 
@@ -80,5 +164,6 @@ class IpmiSelService(Service):
     def clear(self, job):
         if self.middleware.call_sync('ipmi.is_loaded'):
             cp = run(['ipmi-sel', '--clear'], capture_output=True)
+            SEL_SAMPLER.clear()
             if cp.returncode:
                 raise CallError(cp.stderr.decode().strip() or f'Unexpected failure with returncode: {cp.returncode!r}')
@@ -1,11 +1,18 @@
+import copy
 from random import uniform
 from subprocess import run
 from time import sleep
 
-from middlewared.service import Service, filterable, filterable_returns, private
+from middlewared.service import Service, filterable, filterable_returns, periodic, private
 from middlewared.utils import filter_list
 from middlewared.schema import List, Dict
 
+from .utils import IpmiSampler, sdr_cache_args
+
+# Consumers (alert sources, UI) are served readings that are not older than this
+SENSORS_POLL_INTERVAL = 60
+SENSORS_SAMPLER = IpmiSampler()
+
 
 def get_sensors_data():
     cmd = [
@@ -15,7 +22,7 @@ def get_sensors_data():
         '--non-abbreviated-units',
         '--output-sensor-state',
         '--output-sensor-thresholds',
-    ]
+    ] + sdr_cache_args()
     rv = []
     cp = run(cmd, capture_output=True)
     if cp.returncode == 0 and cp.stdout:
@@ -66,9 +73,8 @@ class IpmiSensorsService(Service):
 
         return rv, reread
 
-    @filterable(roles=['IPMI_READ'])
-    @filterable_returns(List('sensors', items=[Dict('sensor', additional_attrs=True)]))
-    def query(self, filters, options):
+    @private
+    def read(self):
         sensors, reread = self.query_impl()
         if reread is not None:
             max_retries = 3
@@ -83,4 +89,27 @@ class IpmiSensorsService(Service):
                 else:
                     max_retries -= 1
 
-        return filter_list(sensors, filters, options)
+        return sensors
+
+    @private
+    def sample(self, options=None):
+        """
+        Returns sensor readings along with the time they were read at. Readings are read from the BMC if the cached
+        ones are older than `cache` seconds (`null` to always read them).
+        """
+        options = {'cache': SENSORS_POLL_INTERVAL, **(options or {})}
+        sensors, timestamp = SENSORS_SAMPLER.get(lambda previous: self.read(), options['cache'])
+        # Callers are free to modify the result
+        return {'sensors': copy.deepcopy(sensors), 'timestamp': timestamp}
+
+    @periodic(SENSORS_POLL_INTERVAL, run_on_start=False)
+    @private
+    def poll(self):
+        if self.middleware.call_sync('ipmi.is_loaded'):
+            # Readings taken a little earlier are still good enough
+            self.sample({'cache': SENSORS_POLL_INTERVAL - 10})
+
+    @filterable(roles=['IPMI_READ'])
+    @filterable_returns(List('sensors', items=[Dict('sensor', additional_attrs=True)]))
+    def query(self, filters, options):
+        return filter_list(self.sample()['sensors'], filters, options)
@@ -0,0 +1,61 @@
+import os
+import threading
+import time
+
+from middlewared.utils import MIDDLEWARE_RUN_DIR
+
+# freeipmi tools read the whole SDR repository from the BMC (which takes seconds) on every run unless it is cached
+IPMI_SDR_CACHE_DIR = os.path.join(MIDDLEWARE_RUN_DIR, 'ipmi-sdr-cache')
+
+
+def sdr_cache_args():
+    """
+    Arguments making freeipmi tools cache the SDR repository in `IPMI_SDR_CACHE_DIR` so that it is only read once
+    (and re-read automatically if the BMC reports it was changed) and later runs fetch sensor readings only.
+    """
+    os.makedirs(IPMI_SDR_CACHE_DIR, mode=0o700, exist_ok=True)
+    return ['--quiet-cache', '--sdr-cache-recreate', f'--sdr-cache-directory={IPMI_SDR_CACHE_DIR}']
+
+
+class IpmiSampler:
+    """
+    Last value sampled from the BMC along with the time it was sampled.
+
+    Only one sample is taken at a time: callers that find the cached value too old while it is being re-sampled wait
+    for that sample instead of querying the BMC once more.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = None
+        self.timestamp = None  # time.time()
+        self.sampled = None  # time.monotonic()
+
+    def get_cached(self, max_age):
+        if self.sampled is None or self.sampled <= time.monotonic() - max_age:
+            return None
+
+        return self.value, self.timestamp
+
+    def get(self, sample, max_age=None):
+        """
+        Returns `(value, timestamp)` using `sample(previous value)` to re-sample the value if the cached one is
+        older than `max_age` seconds (`None` to always re-sample).
+        """
+        if max_age is not None and (cached := self.get_cached(max_age)) is not None:
+            return cached
+
+        started = time.monotonic()
+        with self.lock:
+            # The value might have been sampled while we were waiting for the lock
+            if self.sampled is not None and self.sampled >= started:
+                return self.value, self.timestamp
+
+            self.value = sample(self.value)
+            self.timestamp = time.time()
+            self.sampled = time.monotonic()
+            return self.value, self.timestamp
+
+    def clear(self):
+        with self.lock:
+            self.value = self.timestamp = self.sampled = None
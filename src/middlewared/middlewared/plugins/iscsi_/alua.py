@@ -152,12 +152,10 @@ class iSCSITargetAluaService(Service):
             self.logger.debug(f'Activating {len(todo)} extents')
             retries = 10
             while todo and retries:
-                do_again = []
-                for item in todo:
-                    # Mark them active
-                    if not await self.middleware.call('iscsi.scst.activate_extent', *item):
-                        self.logger.debug(f'Cannot Activate extent {item}')
-                        do_again.append(item)
+                # Mark them active
+                do_again = await self.middleware.call('iscsi.scst.activate_extents', todo)
+                for item in do_again:
+                    self.logger.debug(f'Cannot Activate extent {item}')
                 if not do_again:
                     break
                 await asyncio.sleep(1)
@@ -208,6 +206,8 @@ class iSCSITargetAluaService(Service):
         self.logger.debug('Updating LUNs')
         await self.middleware.call('iscsi.scst.suspend', 10)
         self.logger.debug('iSCSI suspended')
+        iscsi_luns = []
+        fc_luns = []
         for assoc in assocs:
             extent_id = assoc['extent']
             if extent_id in extents:
@@ -217,17 +217,13 @@ class iSCSITargetAluaService(Service):
                     target_mode = targets[target_id]['mode']
                     if target_mode in ['ISCSI', 'BOTH']:
                         iqn = f'{iqn_basename}:{target_name}'
-                        await self.middleware.call('iscsi.scst.replace_iscsi_lun',
-                                                   iqn,
-                                                   extents[extent_id]['name'],
-                                                   assoc['lunid'])
+                        iscsi_luns.append([iqn, extents[extent_id]['name'], assoc['lunid']])
                     if target_mode in ['FC', 'BOTH'] and target_id in fcports:
                         if wwpn := wwn_as_colon_hex(fcports[target_id]):
-                            await self.middleware.call('iscsi.scst.replace_fc_lun',
-                                                       wwpn,
-                                                       extents[extent_id]['name'],
-                                                       assoc['lunid'])
-        self.logger.debug('Updated LUNs')
+                            fc_luns.append([wwpn, extents[extent_id]['name'], assoc['lunid']])
+        # Failures are logged by iscsi.scst.batch_write
+        result = await self.middleware.call('iscsi.scst.replace_luns', iscsi_luns, fc_luns)
+        self.logger.debug('Updated LUNs (%d failed)', len(result['errors']))
         await self.middleware.call('iscsi.scst.set_node_optimized', thisnode)
         self.logger.debug('Switched optimized node')
         if await self.middleware.call('iscsi.scst.clear_suspend'):
@@ -5,7 +5,82 @@ from middlewared.api import api_method
 from middlewared.api.current import IscsiGlobalSessionsArgs, IscsiGlobalSessionsResult
 from middlewared.service import private, Service
 from middlewared.service_exception import MatchNotFound
-from middlewared.utils import filter_list, run
+from middlewared.utils import run
+from middlewared.utils.directory_table import DirectoryTable, scan_directory
+
+SCST_ISCSI_TARGETS_PATH = '/sys/kernel/scst_tgt/targets/iscsi'
+
+
+def scan_sessions():
+    for target_dir, target_inode in scan_directory(SCST_ISCSI_TARGETS_PATH):
+        target = target_dir.rsplit('/', 1)[-1]
+        for session_dir, inode in scan_directory(os.path.join(target_dir, 'sessions')):
+            yield session_dir, inode, {
+                'initiator': session_dir.rsplit('/', 1)[-1].rsplit('#', 1)[0],
+                'target': target,
+                'target_alias': target.rsplit(':', 1)[-1],
+            }
+
+
+def read_session(session_dir, keys):
+    ip_file = glob.glob(f'{session_dir}/*/ip')
+    if not ip_file:
+        return None
+
+    # Initiator alias is another name sent by initiator but we are unable to retrieve it in scst
+    session_dict = {
+        'initiator': keys['initiator'],
+        'initiator_alias': None,
+        'target': keys['target'],
+        'target_alias': keys['target_alias'],
+        'header_digest': None,
+        'data_digest': None,
+        'max_data_segment_length': None,
+        'max_receive_data_segment_length': None,
+        'max_xmit_data_segment_length': None,
+        'max_burst_length': None,
+        'first_burst_length': None,
+        'immediate_data': False,
+        'iser': False,
+        'offload': False,  # It is a chelsio NIC driver to offload iscsi, we are not using it so far
+    }
+    try:
+        with open(ip_file[0], 'r') as f:
+            session_dict['initiator_addr'] = f.read().strip()
+    except FileNotFoundError:
+        # Connection is gone
+        return None
+
+    for k, f, op in (
+        ('header_digest', 'HeaderDigest', None),
+        ('data_digest', 'DataDigest', None),
+        ('max_burst_length', 'MaxBurstLength', lambda i: int(i)),
+        ('max_receive_data_segment_length', 'MaxRecvDataSegmentLength', lambda i: int(i)),
+        ('max_xmit_data_segment_length', 'MaxXmitDataSegmentLength', lambda i: int(i)),
+        ('first_burst_length', 'FirstBurstLength', lambda i: int(i)),
+        ('immediate_data', 'ImmediateData', lambda i: True if i == 'Yes' else False),
+    ):
+        f_path = os.path.join(session_dir, f)
+        if os.path.exists(f_path):
+            with open(f_path, 'r') as fd:
+                data = fd.read().strip()
+                if data != 'None':
+                    if op:
+                        data = op(data)
+                    session_dict[k] = data
+
+    # We get recv/emit data segment length, keeping consistent with freebsd, we can
+    # take the maximum of two and show it for max_data_segment_length
+    if session_dict['max_xmit_data_segment_length'] and session_dict['max_receive_data_segment_length']:
+        session_dict['max_data_segment_length'] = max(
+            session_dict['max_receive_data_segment_length'], session_dict['max_xmit_data_segment_length']
+        )
+
+    return session_dict
+
+
+# Session parameters are negotiated at login so they are read once per session
+SESSIONS = DirectoryTable(scan_sessions, read_session, ['initiator', 'target', 'target_alias'])
 
 
 class ISCSIGlobalService(Service):
@@ -23,65 +98,10 @@ class ISCSIGlobalService(Service):
         Get a list of currently running iSCSI sessions. This includes initiator and target names
         and the unique connection IDs.
         """
-        sessions = []
-        global_info = self.middleware.call_sync('iscsi.global.config')
-        base_path = '/sys/kernel/scst_tgt/targets/iscsi'
-        for target_dir in glob.glob(f'{base_path}/{global_info["basename"]}*'):
-            target = target_dir.rsplit('/', 1)[-1]
-            if target.startswith(f'{global_info["basename"]}:HA:'):
-                continue
-            for session in os.listdir(os.path.join(target_dir, 'sessions')):
-                session_dir = os.path.join(target_dir, 'sessions', session)
-                ip_file = glob.glob(f'{session_dir}/*/ip')
-                if not ip_file:
-                    continue
-
-                # Initiator alias is another name sent by initiator but we are unable to retrieve it in scst
-                session_dict = {
-                    'initiator': session.rsplit('#', 1)[0],
-                    'initiator_alias': None,
-                    'target': target,
-                    'target_alias': target.rsplit(':', 1)[-1],
-                    'header_digest': None,
-                    'data_digest': None,
-                    'max_data_segment_length': None,
-                    'max_receive_data_segment_length': None,
-                    'max_xmit_data_segment_length': None,
-                    'max_burst_length': None,
-                    'first_burst_length': None,
-                    'immediate_data': False,
-                    'iser': False,
-                    'offload': False,  # It is a chelsio NIC driver to offload iscsi, we are not using it so far
-                }
-                with open(ip_file[0], 'r') as f:
-                    session_dict['initiator_addr'] = f.read().strip()
-                for k, f, op in (
-                    ('header_digest', 'HeaderDigest', None),
-                    ('data_digest', 'DataDigest', None),
-                    ('max_burst_length', 'MaxBurstLength', lambda i: int(i)),
-                    ('max_receive_data_segment_length', 'MaxRecvDataSegmentLength', lambda i: int(i)),
-                    ('max_xmit_data_segment_length', 'MaxXmitDataSegmentLength', lambda i: int(i)),
-                    ('first_burst_length', 'FirstBurstLength', lambda i: int(i)),
-                    ('immediate_data', 'ImmediateData', lambda i: True if i == 'Yes' else False),
-                ):
-                    f_path = os.path.join(session_dir, f)
-                    if os.path.exists(f_path):
-                        with open(f_path, 'r') as fd:
-                            data = fd.read().strip()
-                            if data != 'None':
-                                if op:
-                                    data = op(data)
-                                session_dict[k] = data
-
-                # We get recv/emit data segment length, keeping consistent with freebsd, we can
-                # take the maximum of two and show it for max_data_segment_length
-                if session_dict['max_xmit_data_segment_length'] and session_dict['max_receive_data_segment_length']:
-                    session_dict['max_data_segment_length'] = max(
-                        session_dict['max_receive_data_segment_length'], session_dict['max_xmit_data_segment_length']
-                    )
-
-                sessions.append(session_dict)
-        return filter_list(sessions, filters, options)
+        basename = self.middleware.call_sync('iscsi.global.config')['basename']
+        return SESSIONS.query(
+            [['target', '^', basename], ['target', '!^', f'{basename}:HA:']] + filters, options,
+        )
 
     @private
     def resync_readonly_property_for_zvol(self, id_, read_only_value):
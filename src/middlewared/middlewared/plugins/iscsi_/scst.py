@@ -1,7 +1,10 @@
-import asyncio
+import collections
+import concurrent.futures
+import os
 import pathlib
+import time
 
-from middlewared.service import Service
+from middlewared.service import CallError, Service
 from .utils import ISCSI_TARGET_PARAMETERS
 
 SCST_BASE = '/sys/kernel/scst_tgt'
@@ -10,6 +13,78 @@ SCST_DEVICES = '/sys/kernel/scst_tgt/devices'
 SCST_SUSPEND = '/sys/kernel/scst_tgt/suspend'
 SCST_CONTROLLER_A_TARGET_GROUPS_STATE = '/sys/kernel/scst_tgt/device_groups/targets/target_groups/controller_A/state'
 SCST_CONTROLLER_B_TARGET_GROUPS_STATE = '/sys/kernel/scst_tgt/device_groups/targets/target_groups/controller_B/state'
+# SCST sysfs writes for different targets and devices are run in parallel by this many threads
+SCST_WRITE_WORKERS = 8
+# Number of the slowest writes reported in the timing trace
+SCST_WRITE_TRACE_SLOWEST = 5
+
+
+def scst_path_write(path, text):
+    p = pathlib.Path(path)
+    realpath = str(p.resolve())
+    if realpath.startswith(SCST_BASE) and p.exists():
+        p.write_text(text)
+    else:
+        raise ValueError(f'Unexpected path "{realpath}"')
+
+
+def scst_batch_write(writes, workers=SCST_WRITE_WORKERS):
+    """
+    Perform SCST sysfs `writes` (list of `(path, text)`).
+
+    Writes are grouped by the directory of the written attribute (i.e. by device for `cluster_mode`, by target for
+    LUN `mgmt`). Writes within a group are done sequentially in the order given and groups are written in parallel
+    by no more than `workers` threads. A failed write does not stop the others.
+
+    Returns failed writes along with the timing trace.
+    """
+    groups = collections.defaultdict(list)
+    for path, text in writes:
+        groups[os.path.dirname(path)].append((path, text))
+
+    def write_group(group):
+        errors = []
+        timings = []
+        for path, text in group:
+            start = time.monotonic()
+            try:
+                scst_path_write(path, text)
+            except Exception as e:
+                errors.append({'path': path, 'text': text, 'error': str(e)})
+            timings.append((time.monotonic() - start, path))
+
+        return errors, timings
+
+    start = time.monotonic()
+    errors = []
+    timings = []
+    if groups:
+        with concurrent.futures.ThreadPoolExecutor(min(workers, len(groups)), 'scst_write') as executor:
+            for group_errors, group_timings in executor.map(write_group, groups.values()):
+                errors.extend(group_errors)
+                timings.extend(group_timings)
+
+    return {
+        'errors': errors,
+        'trace': {
+            'writes': len(timings),
+            'groups': len(groups),
+            'elapsed': time.monotonic() - start,
+            'write_time': sum(elapsed for elapsed, path in timings),
+            'slowest': [
+                {'path': path, 'elapsed': elapsed}
+                for elapsed, path in sorted(timings, reverse=True)[:SCST_WRITE_TRACE_SLOWEST]
+            ],
+        },
+    }
+
+
+def iscsi_lun_mgmt_path(iqn):
+    return f'{SCST_BASE}/targets/iscsi/{iqn}/ini_groups/security_group/luns/mgmt'
+
+
+def fc_lun_mgmt_path(wwpn):
+    return f'{SCST_BASE}/targets/qla2x00t/{wwpn}/luns/mgmt'
 
 
 class iSCSITargetService(Service):
@@ -19,18 +94,34 @@ class iSCSITargetService(Service):
         private = True
 
     def path_write(self, path, text):
-        p = pathlib.Path(path)
-        realpath = str(p.resolve())
-        if realpath.startswith(SCST_BASE) and p.exists():
-            p.write_text(text)
-        else:
-            raise ValueError(f'Unexpected path "{realpath}"')
+        scst_path_write(path, text)
+
+    def batch_write(self, writes, description='SCST sysfs writes'):
+        """
+        Perform SCST sysfs `writes` (list of `(path, text)`) in parallel. Failures are logged and returned.
+        """
+        result = scst_batch_write(writes)
+        trace = result['trace']
+        self.logger.debug(
+            '%s: %d writes (%d groups) in %.3fs (%.3fs spent writing), slowest: %s', description, trace['writes'],
+            trace['groups'], trace['elapsed'], trace['write_time'],
+            ', '.join(f'{i["path"]} ({i["elapsed"]:.3f}s)' for i in trace['slowest']),
+        )
+        for error in result['errors']:
+            self.logger.warning('%s: failed to write %r to %r: %s', description, error['text'].strip(), error['path'],
+                                error['error'])
+
+        return result
 
-    async def set_all_cluster_mode(self, value):
-        text = f'{int(value)}\n'
-        paths = await self.middleware.call('iscsi.scst.cluster_mode_paths')
-        if paths:
-            await asyncio.gather(*[self.middleware.call('iscsi.scst.path_write', path, text) for path in paths])
+    def set_paths(self, paths, text, description):
+        if paths and (errors := self.batch_write([(path, text) for path in paths], description)['errors']):
+            raise CallError(
+                f'{description}: failed to write {len(errors)} of {len(paths)} paths: ' +
+                ', '.join(f'{error["path"]}: {error["error"]}' for error in errors[:5])
+            )
+
+    def set_all_cluster_mode(self, value):
+        self.set_paths(self.cluster_mode_paths(), f'{int(value)}\n', f'Set cluster_mode {int(value)}')
 
     def cluster_mode_paths(self):
         scst_tgt_devices = pathlib.Path(SCST_DEVICES)
@@ -71,11 +162,11 @@ class iSCSITargetService(Service):
     async def set_device_cluster_mode(self, device, value):
         await self.middleware.call('iscsi.scst.path_write', f'{SCST_DEVICES}/{device}/cluster_mode', f'{int(value)}\n')
 
-    async def set_devices_cluster_mode(self, devices, value):
-        text = f'{int(value)}\n'
-        paths = [f'{SCST_DEVICES}/{device}/cluster_mode' for device in devices]
-        if paths:
-            await asyncio.gather(*[self.middleware.call('iscsi.scst.path_write', path, text) for path in paths])
+    def set_devices_cluster_mode(self, devices, value):
+        self.set_paths(
+            [f'{SCST_DEVICES}/{device}/cluster_mode' for device in devices], f'{int(value)}\n',
+            f'Set cluster_mode {int(value)}',
+        )
 
     def disable(self):
         pathlib.Path(SCST_TARGETS_ISCSI_ENABLED_PATH).write_text('0\n')
@@ -110,12 +201,15 @@ class iSCSITargetService(Service):
     def is_kernel_module_loaded(self):
         return pathlib.Path(SCST_BASE).exists()
 
+    def extent_active_path(self, extent_name, extenttype):
+        if extenttype == 'DISK':
+            return f'{SCST_BASE}/handlers/vdisk_blockio/{extent_name}/active'
+        else:
+            return f'{SCST_BASE}/handlers/vdisk_fileio/{extent_name}/active'
+
     def activate_extent(self, extent_name, extenttype, path):
         if pathlib.Path(path).exists():
-            if extenttype == 'DISK':
-                p = pathlib.Path(f'{SCST_BASE}/handlers/vdisk_blockio/{extent_name}/active')
-            else:
-                p = pathlib.Path(f'{SCST_BASE}/handlers/vdisk_fileio/{extent_name}/active')
+            p = pathlib.Path(self.extent_active_path(extent_name, extenttype))
             try:
                 p.write_text('1\n')
                 return True
@@ -125,17 +219,46 @@ class iSCSITargetService(Service):
         else:
             return False
 
+    def activate_extents(self, extents):
+        """
+        Activate `extents` (list of `[extent_name, extenttype, path]`). Returns the extents that could not be
+        activated.
+        """
+        failed = []
+        writes = {}
+        for extent in extents:
+            if pathlib.Path(extent[2]).exists():
+                writes[self.extent_active_path(extent[0], extent[1])] = extent
+            else:
+                failed.append(extent)
+
+        for error in self.batch_write([(path, '1\n') for path in writes], 'Activate extents')['errors']:
+            failed.append(writes[error['path']])
+
+        return failed
+
     def delete_iscsi_lun(self, iqn, lun):
         pathlib.Path(f'{SCST_BASE}/targets/iscsi/{iqn}/ini_groups/security_group/luns/mgmt').write_text(f'del {lun}\n')
 
     def replace_iscsi_lun(self, iqn, extent, lun):
-        pathlib.Path(f'{SCST_BASE}/targets/iscsi/{iqn}/ini_groups/security_group/luns/mgmt').write_text(f'replace {extent} {lun}\n')
+        pathlib.Path(iscsi_lun_mgmt_path(iqn)).write_text(f'replace {extent} {lun}\n')
 
     def delete_fc_lun(self, wwpn, lun):
         pathlib.Path(f'{SCST_BASE}/targets/qla2x00t/{wwpn}/luns/mgmt').write_text(f'del {lun}\n')
 
     def replace_fc_lun(self, wwpn, extent, lun):
-        pathlib.Path(f'{SCST_BASE}/targets/qla2x00t/{wwpn}/luns/mgmt').write_text(f'replace {extent} {lun}\n')
+        pathlib.Path(fc_lun_mgmt_path(wwpn)).write_text(f'replace {extent} {lun}\n')
+
+    def replace_luns(self, iscsi_luns, fc_luns):
+        """
+        Replace LUNs of iSCSI targets (`iscsi_luns` is a list of `[iqn, extent, lun]`) and Fibre Channel ports
+        (`fc_luns` is a list of `[wwpn, extent, lun]`) in a single batch.
+        """
+        return self.batch_write(
+            [(iscsi_lun_mgmt_path(iqn), f'replace {extent} {lun}\n') for iqn, extent, lun in iscsi_luns] +
+            [(fc_lun_mgmt_path(wwpn), f'replace {extent} {lun}\n') for wwpn, extent, lun in fc_luns],
+            'Replace LUNs',
+        )
 
     def set_node_optimized(self, node):
         """Update which node is reported as being the active/optimized path."""
@@ -3,7 +3,8 @@ import subprocess
 import time
 
 import middlewared.sqlalchemy as sa
-from middlewared.plugins.jbof.redfish import (InvalidCredentialsError,
+from middlewared.plugins.jbof.redfish import (AsyncRedfishClient,
+                                              InvalidCredentialsError,
                                               RedfishClient)
 from middlewared.schema import (Bool, Dict, Int, IPAddr, List, Password, Patch,
                                 Str, accepts, returns)
@@ -188,6 +189,7 @@ class JBOFService(CRUDService):
         data['id'] = await self.middleware.call(
             'datastore.insert', self._config.datastore, data,
             {'prefix': self._config.datastore_prefix})
+        await self.middleware.call('enclosure2.invalidate', ['jbof'])
 
         return await self.get_instance(data['id'])
 
@@ -217,6 +219,9 @@ class JBOFService(CRUDService):
         await self.middleware.call(
             'datastore.update', self._config.datastore, id_, new,
             {'prefix': self._config.datastore_prefix})
+        if any(old[k] != new[k] for k in ('uuid', 'mgmt_ip1', 'mgmt_ip2', 'mgmt_username', 'mgmt_password')):
+            await self.forget_redfish_clients(old)
+        await self.middleware.call('enclosure2.invalidate', ['jbof'])
 
         return await self.get_instance(id_)
 
@@ -249,8 +254,23 @@ class JBOFService(CRUDService):
 
         # Now delete the entry
         response = await self.middleware.call('datastore.delete', self._config.datastore, id_)
+        await self.forget_redfish_clients(data)
+        await self.middleware.call('enclosure2.invalidate', ['jbof'])
         return response
 
+    @private
+    async def forget_redfish_clients(self, data):
+        """Drop the cached redfish clients (and their cached responses) of the JBOF described by `data`."""
+        for key in ('mgmt_ip1', 'mgmt_ip2'):
+            if mgmt_ip := data.get(key):
+                RedfishClient.cache_unset(mgmt_ip)
+
+        if rclient := AsyncRedfishClient.cache_unset(data['uuid']):
+            try:
+                await rclient.close()
+            except Exception:
+                self.logger.debug('Failed to close redfish client for JBOF %r', data['uuid'], exc_info=True)
+
     @accepts()
     async def reapply_config(self):
         """
@@ -504,8 +524,7 @@ class JBOFService(CRUDService):
         """Return a dict keyed by IP address where the value is the corresponding MAC address."""
         redfish = RedfishClient.cache_get(mgmt_ip)
         macs = {}
-        for uri in self.fabric_interface_choices(mgmt_ip):
-            netdata = redfish.get_uri(uri)
+        for netdata in redfish.get_uris(self.fabric_interface_choices(mgmt_ip)).values():
             for address in netdata['IPv4Addresses']:
                 macs[address['Address']] = netdata['MACAddress']
         return macs
@@ -1,9 +1,13 @@
 import asyncio
+import collections
 import enum
 import errno
 import json
 import logging
 import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode
 
 import aiohttp
@@ -14,6 +18,10 @@ from truenas_api_client import Client
 from urllib3.exceptions import InsecureRequestWarning
 
 DEFAULT_REDFISH_TIMEOUT_SECS = 10
+# Cached responses are used as-is for this long, then they are revalidated using their ETag
+DEFAULT_REDFISH_CACHE_TTL_SECS = 300
+# Maximum number of concurrent requests (and of kept-alive connections) to a single controller
+REDFISH_MAX_CONNECTIONS = 4
 HEADER = {'Content-Type': 'application/json', 'Vary': 'accept'}
 REDFISH_ROOT_PATH = '/redfish/v1'
 ODATA_ID = '@odata.id'
@@ -40,6 +48,55 @@ class AuthMethod(enum.Enum):
         raise ValueError('Invalid auth method', authtype)
 
 
+CachedResponse = collections.namedtuple('CachedResponse', ['uri', 'value', 'etag', 'timestamp'])
+
+
+class ResponseCache:
+    """
+    Redfish responses (or values derived from them) kept for `ttl` seconds, along with the `ETag` the
+    controller returned so that they can be revalidated with a conditional request once they expire.
+    """
+
+    def __init__(self, ttl=DEFAULT_REDFISH_CACHE_TTL_SECS):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, key, fresh_only=True):
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry is not None and fresh_only and time.monotonic() - entry.timestamp >= self.ttl:
+            return None
+
+        return entry
+
+    def set(self, key, uri, value, etag=None):
+        with self.lock:
+            self.entries[key] = CachedResponse(uri, value, etag, time.monotonic())
+
+        return value
+
+    def touch(self, key):
+        with self.lock:
+            if (entry := self.entries.get(key)) is not None:
+                self.entries[key] = entry._replace(timestamp=time.monotonic())
+
+    def invalidate(self, uri=None):
+        """Forget the responses for `uri` (all the responses if it is not specified)."""
+        with self.lock:
+            if uri is None:
+                self.entries.clear()
+            else:
+                uri = uri.split('?')[0]
+                for key, entry in list(self.entries.items()):
+                    if entry.uri.split('?')[0] == uri:
+                        del self.entries[key]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+
 class AbstractRedfishClient:
 
     @property
@@ -70,7 +127,8 @@ class RedfishClient(AbstractRedfishClient):
         authtype=AuthMethod.BASIC,
         default_prefix=REDFISH_ROOT_PATH,
         verify=False,
-        timeout=DEFAULT_REDFISH_TIMEOUT_SECS
+        timeout=DEFAULT_REDFISH_TIMEOUT_SECS,
+        cache_ttl=DEFAULT_REDFISH_CACHE_TTL_SECS,
     ):
         self.log_requests = False
         self.base_url = base_url.rstrip('/')
@@ -85,7 +143,12 @@ class RedfishClient(AbstractRedfishClient):
         self.authorization_key = None
         self.session_location = None
         self.timeout = timeout
-        self.cache = {}
+        self.cache = ResponseCache(cache_ttl)
+        # Keep the connections to the controller alive so that TLS handshake is not done for every request
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=REDFISH_MAX_CONNECTIONS,
+        ))
         self.root = self.get_root_object()
         try:
             self.login_url = self.root['Links']['Sessions']['@odata.id']
@@ -120,8 +183,16 @@ class RedfishClient(AbstractRedfishClient):
 
     @classmethod
     def cache_set(cls, key, value):
+        if (old := cls.client_cache.get(key)) is not None and old is not value:
+            old.close()
+
         cls.client_cache[key] = value
 
+    @classmethod
+    def cache_unset(cls, key):
+        if (client := cls.client_cache.pop(key, None)) is not None:
+            client.close()
+
     @classmethod
     def cache_get(cls, mgmt_ip, jbof_query=None):
         try:
@@ -141,53 +212,92 @@ class RedfishClient(AbstractRedfishClient):
 
             return redfish
 
-    def _cached_fetch(self, cache_key, uri, use_cached=True):
-        if use_cached and cache_key in self.cache:
-            return self.cache[cache_key]
+    def close(self):
+        self.session.close()
+
+    def invalidate(self, uri=None):
+        """Drop cached responses for `uri` (or all of them)."""
+        self.cache.invalidate(self._full_uri(uri) if uri else None)
+
+    def _cached_fetch(self, cache_key, uri, use_cached=True, transform=None):
+        """
+        Return the (transformed) JSON response for `uri`. When `use_cached` is set, a response cached less than
+        the cache TTL ago is returned without a request. Otherwise the cached response is revalidated with its ETag
+        (controller answers `304 Not Modified` without a body if it did not change).
+        """
+        if use_cached and (entry := self.cache.get(cache_key)) is not None:
+            return entry.value
+
+        headers = {}
+        if (entry := self.cache.get(cache_key, fresh_only=False)) is not None and entry.etag:
+            headers['If-None-Match'] = entry.etag
+
+        r = self.get(uri, headers=headers)
+        if r.status_code == 304 and entry is not None:
+            self.cache.touch(cache_key)
+            return entry.value
 
-        r = self.get(uri)
         if r.ok:
-            self.cache[cache_key] = self._members(r.json())
-            return self.cache[cache_key]
+            value = r.json()
+            if transform is not None:
+                value = transform(value)
+
+            return self.cache.set(cache_key, self._full_uri(uri), value, r.headers.get('ETag'))
+
+    def _cached_fetch_members(self, cache_key, uri, use_cached=True):
+        return self._cached_fetch(cache_key, uri, use_cached, self._members)
+
+    def get_uris(self, uris, use_cached=True):
+        """Fetch several `uris` concurrently. Returns a dict of uri -> JSON response (`None` if it failed)."""
+        uris = list(uris)
+        if len(uris) < 2:
+            return {uri: self.get_uri(uri, use_cached) for uri in uris}
+
+        with ThreadPoolExecutor(min(len(uris), REDFISH_MAX_CONNECTIONS)) as executor:
+            return dict(zip(uris, executor.map(lambda uri: self.get_uri(uri, use_cached), uris)))
 
     def chassis(self, use_cached=True):
-        return self._cached_fetch('chassis', '/Chassis', use_cached)
+        return self._cached_fetch_members('chassis', '/Chassis', use_cached)
 
     def managers(self, use_cached=True):
-        return self._cached_fetch('managers', '/Managers', use_cached)
+        return self._cached_fetch_members('managers', '/Managers', use_cached)
 
     def mgmt_ethernet_interfaces(self, iom, use_cached=True):
         uri = f'{self.managers()[iom]}/EthernetInterfaces'
-        return self._cached_fetch(f'{iom}/mgmt_ethernet_interfaces', uri, use_cached)
+        return self._cached_fetch_members(f'{iom}/mgmt_ethernet_interfaces', uri, use_cached)
 
     def mgmt_ip(self):
         return socket.gethostbyname(self.base_url.split('/')[-1])
 
-    def iom_eth_mgmt_ips(self, eth_uri):
+    def _eth_ipv4_addresses(self, data):
         result = []
-        # Do not want any cached value.  IPs can change.
-        data = self.get_uri(eth_uri, False)
-        for ipv4_address in data.get('IPv4Addresses', []):
+        for ipv4_address in (data or {}).get('IPv4Addresses', []):
             addr = ipv4_address.get('Address')
             if addr:
                 result.append(addr)
         return result
 
+    def iom_eth_mgmt_ips(self, eth_uri):
+        # Do not want any cached value.  IPs can change.
+        return self._eth_ipv4_addresses(self.get_uri(eth_uri, False))
+
     def iom_mgmt_ips(self, iom):
         result = []
-        for eth_uri in self.mgmt_ethernet_interfaces(iom).values():
-            # Do not want any cached value.  IPs can change.
-            result.extend(self.iom_eth_mgmt_ips(eth_uri))
+        # Do not want any cached value.  IPs can change.
+        for data in self.get_uris(self.mgmt_ethernet_interfaces(iom).values(), False).values():
+            result.extend(self._eth_ipv4_addresses(data))
         return result
 
     def mgmt_ips(self):
         result = []
-        for iom in self.managers():
-            result.extend(self.iom_mgmt_ips(iom))
+        eth_uris = [uri for iom in self.managers() for uri in self.mgmt_ethernet_interfaces(iom).values()]
+        # Do not want any cached value.  IPs can change.
+        for data in self.get_uris(eth_uris, False).values():
+            result.extend(self._eth_ipv4_addresses(data))
         return result
 
     def network_device_functions(self, iom, use_cached=True):
-        return self._cached_fetch(
+        return self._cached_fetch_members(
             f'{iom}/network_device_functions',
             f'/Chassis/{iom}/NetworkAdapters/1/NetworkDeviceFunctions', use_cached
         )
@@ -201,13 +311,7 @@ class RedfishClient(AbstractRedfishClient):
         return result
 
     def get_uri(self, uri, use_cached=True):
-        if use_cached and uri in self.cache:
-            return self.cache[uri]
-
-        r = self.get(uri)
-        if r.ok:
-            self.cache[uri] = r.json()
-            return self.cache[uri]
+        return self._cached_fetch(uri, uri, use_cached)
 
     def get_root_object(self):
         return self.get(self.prefix).json()
@@ -274,21 +378,20 @@ class RedfishClient(AbstractRedfishClient):
                     with the http request.
         """
         if method == 'get':
-            req = requests.get
+            req = self.session.get
         elif method == 'post':
-            req = requests.post
+            req = self.session.post
         elif method == 'put':
-            req = requests.put
+            req = self.session.put
         elif method == 'delete':
-            req = requests.delete
+            req = self.session.delete
         else:
             raise ValueError(f'Invalid request type: {method}')
 
-        if not url.startswith('https://'):
-            if url.startswith(self.prefix):
-                url = f'{self.base_url}{url}'
-            else:
-                url = f'{self.base_url}{self.prefix}{url}'
+        url = self._full_uri(url)
+        if method != 'get':
+            # The resource is being modified
+            self.cache.invalidate(url)
 
         if 'auth' in kwargs:
             auth = kwargs['auth']
@@ -296,7 +399,7 @@ class RedfishClient(AbstractRedfishClient):
             auth = self.auth
         timeout = kwargs.get('timeout', self.timeout)
         payload = kwargs.get('data', {})
-        headers = kwargs.get('headers', {})
+        headers = dict(kwargs.get('headers', {}))
 
         if self.log_requests:
             LOGGER.debug('%r %r %r', method.upper(), url, payload)
@@ -326,6 +429,15 @@ class RedfishClient(AbstractRedfishClient):
             raise InvalidCredentialsError('HTTP 401 Unauthorized returned: Invalid credentials supplied')
         return r
 
+    def _full_uri(self, url):
+        if not url.startswith('https://'):
+            if url.startswith(self.prefix):
+                url = f'{self.base_url}{url}'
+            else:
+                url = f'{self.base_url}{self.prefix}{url}'
+
+        return url
+
     def configure_fabric_interface(
         self,
         uri,
@@ -381,7 +493,7 @@ class AsyncRedfishClient(AbstractRedfishClient):
         self.authorization_key = None
         self.session_location = {}
         self.timeout = aiohttp.ClientTimeout(total=timeout)
-        self.cache = {}
+        self.cache = ResponseCache()
         self.root = None
         self._sessions = {}
         # Implement a little value cache
@@ -442,7 +554,8 @@ class AsyncRedfishClient(AbstractRedfishClient):
 
     @classmethod
     def cache_unset(cls, key):
-        del cls.client_cache[key]
+        """Remove the client from the cache. Returns it so that the caller can `close` it."""
+        return cls.client_cache.pop(key, None)
 
     @classmethod
     async def cache_get(cls, uuid, jbof_query=None):
@@ -589,13 +702,12 @@ class AsyncRedfishClient(AbstractRedfishClient):
         self._sessions = {}
 
     async def _cached_fetch(self, cache_key, uri, use_cached=True):
-        if use_cached and cache_key in self.cache:
-            return self.cache[cache_key]
+        if use_cached and (entry := self.cache.get(cache_key)) is not None:
+            return entry.value
 
         r = await self.get(uri)
         if r:
-            self.cache[cache_key] = self._members(r)
-            return self.cache[cache_key]
+            return self.cache.set(cache_key, uri, self._members(r))
 
     async def chassis(self, use_cached=True):
         return await self._cached_fetch('chassis', '/Chassis', use_cached)
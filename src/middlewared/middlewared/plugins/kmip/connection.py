@@ -4,8 +4,11 @@
 # See the file LICENSE.IX for complete terms and conditions
 
 import contextlib
+import queue
 import socket
+import threading
 import uuid
+from concurrent.futures import as_completed, ThreadPoolExecutor
 
 from kmip.core import enums
 from kmip.pie.client import ProxyKmipClient
@@ -14,6 +17,75 @@ from kmip.pie.objects import SecretData
 
 from middlewared.service import CallError
 
+from .utils import KMIP_MAX_CONNECTIONS
+
+
+class KMIPConnectionPool:
+    """
+    Bounded set of connections to the KMIP server which are used to process many keys concurrently. Connections are
+    opened on demand (at most `size` of them) and are all closed when the pool is closed.
+    """
+
+    def __init__(self, connect, size=KMIP_MAX_CONNECTIONS):
+        self.connect = connect
+        self.size = size
+        self.lock = threading.Lock()
+        self.stack = contextlib.ExitStack()
+        self.idle = queue.SimpleQueue()
+        self.opened = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.stack.close()
+            self.idle = queue.SimpleQueue()
+            self.opened = 0
+
+    @contextlib.contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                # Only `size` threads ever use the pool concurrently, so we never open more connections than that
+                conn = self.stack.enter_context(self.connect())
+                self.opened += 1
+
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+    def map(self, func, items, progress=None):
+        """
+        Call `func(item, conn)` for each of `items` concurrently and yield `(item, result, exception)` as they are
+        processed. `progress(processed, total)` is called after each item.
+        """
+        def run(item):
+            with self.connection() as conn:
+                return func(item, conn)
+
+        if not items:
+            return
+
+        with ThreadPoolExecutor(min(self.size, len(items))) as executor:
+            futures = {executor.submit(run, item): item for item in items}
+            for i, future in enumerate(as_completed(futures), 1):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield futures[future], None, e
+                else:
+                    yield futures[future], result, None
+
+                if progress:
+                    progress(i, len(items))
+
 
 class KMIPServerMixin:
 
@@ -36,6 +108,18 @@ class KMIPServerMixin:
         except (ClientConnectionFailure, ClientConnectionNotOpen, socket.timeout) as e:
             raise CallError(f'Failed to connect to KMIP Server: {e}')
 
+    def _connection_pool(self, data=None):
+        return KMIPConnectionPool(lambda: self._connection(data))
+
+    def _progress_callback(self, job, description, weight=100, offset=0):
+        if job is None:
+            return None
+
+        def progress(processed, total):
+            job.set_progress(offset + int(processed * weight / total), f'{processed}/{total} {description}')
+
+        return progress
+
     def _test_connection(self, data=None):
         # Test if we are able to connect to the KMIP Server
         try:
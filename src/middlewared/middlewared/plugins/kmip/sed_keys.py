@@ -106,7 +106,7 @@ class KMIPService(Service, KMIPServerMixin):
         return False
 
     @private
-    def push_sed_keys(self, ids=None):
+    def push_sed_keys(self, ids=None, job=None):
         """
         When push SED keys is initiated, we carry out following steps:
 
@@ -124,69 +124,80 @@ class KMIPService(Service, KMIPServerMixin):
         The same steps are followed for system.advanced.
         """
         adv_config = self.middleware.call_sync('datastore.config', 'system.advanced', {'prefix': 'adv_'})
-        failed = []
-        with self._connection(self.middleware.call_sync('kmip.connection_config')) as conn:
-            for disk in self.middleware.call_sync(
+        disks = [
+            disk for disk in self.middleware.call_sync(
                 'datastore.query', 'storage.disk', [['identifier', 'in', ids]] if ids else [], {'prefix': 'disk_'}
-            ):
-                if not disk['passwd'] and disk['kmip_uid']:
-                    try:
-                        key = self._retrieve_secret_data(disk['kmip_uid'], conn)
-                    except Exception as e:
-                        self.middleware.logger.debug(f'Failed to retrieve key for {disk["identifier"]}: {e}')
+            ) if disk['passwd'] or disk['kmip_uid']
+        ]
+        for disk in filter(lambda d: d['passwd'], disks):
+            self.disks_keys[disk['identifier']] = disk['passwd']
+
+        def push(disk, conn):
+            if not disk['passwd']:
+                return self._retrieve_secret_data(disk['kmip_uid'], conn)
+
+            destroy_successful = False
+            if disk['kmip_uid']:
+                # This needs to be revoked and destroyed
+                destroy_successful = self._revoke_and_destroy_key(
+                    disk['kmip_uid'], conn, self.middleware.logger, disk['identifier']
+                )
+            # Returns database changes, `kmip_uid` is only set if the key was pushed successfully
+            try:
+                uid = self._register_secret_data(disk['identifier'], disk['passwd'], conn)
+            except Exception:
+                return {'kmip_uid': None} if destroy_successful else None
+            else:
+                return {'passwd': '', 'kmip_uid': uid}
+
+        failed = []
+        updates = []
+        with self._connection_pool(self.middleware.call_sync('kmip.connection_config')) as pool:
+            for disk, result, error in pool.map(push, disks, self._progress_callback(job, 'disks synced')):
+                if not disk['passwd']:
+                    if error is None:
+                        self.disks_keys[disk['identifier']] = result
                     else:
-                        self.disks_keys[disk['identifier']] = key
-                    continue
-                elif not disk['passwd']:
+                        self.middleware.logger.debug(f'Failed to retrieve key for {disk["identifier"]}: {error}')
                     continue
 
-                self.disks_keys[disk['identifier']] = disk['passwd']
-                destroy_successful = False
-                if disk['kmip_uid']:
-                    # This needs to be revoked and destroyed
-                    destroy_successful = self._revoke_and_destroy_key(
-                        disk['kmip_uid'], conn, self.middleware.logger, disk['identifier']
-                    )
-                try:
-                    uid = self._register_secret_data(disk['identifier'], self.disks_keys[disk['identifier']], conn)
-                except Exception:
+                if error is None and result:
+                    updates.append({'action': 'UPDATE', 'id': disk['identifier'], 'data': result})
+                if error is not None or not result or not result['kmip_uid']:
                     failed.append(disk['identifier'])
-                    update_data = {'kmip_uid': None} if destroy_successful else {}
-                else:
-                    update_data = {'passwd': '', 'kmip_uid': uid}
-                if update_data:
-                    self.middleware.call_sync(
-                        'datastore.update', 'storage.disk', disk['identifier'], update_data, {'prefix': 'disk_'}
-                    )
-            if not adv_config['sed_passwd'] and adv_config['kmip_uid']:
-                try:
-                    key = self._retrieve_secret_data(adv_config['kmip_uid'], conn)
-                except Exception:
-                    failed.append('Global SED Key')
-                else:
-                    self.global_sed_key = key
-            elif adv_config['sed_passwd']:
-                if adv_config['kmip_uid']:
-                    self._revoke_and_destroy_key(
-                        adv_config['kmip_uid'], conn, self.middleware.logger, 'SED Global Password'
-                    )
-                    self.middleware.call_sync(
-                        'datastore.update', 'system.advanced', adv_config['id'], {'adv_kmip_uid': None}
-                    )
-                self.global_sed_key = adv_config['sed_passwd']
-                try:
-                    uid = self._register_secret_data('global_sed_key', self.global_sed_key, conn)
-                except Exception:
-                    failed.append('Global SED Key')
-                else:
-                    self.middleware.call_sync(
-                        'datastore.update', 'system.advanced',
-                        adv_config['id'], {'adv_sed_passwd': '', 'adv_kmip_uid': uid}
-                    )
+
+            self.middleware.call_sync('datastore.bulk_write', 'storage.disk', updates, {'prefix': 'disk_'})
+
+            with pool.connection() as conn:
+                if not adv_config['sed_passwd'] and adv_config['kmip_uid']:
+                    try:
+                        key = self._retrieve_secret_data(adv_config['kmip_uid'], conn)
+                    except Exception:
+                        failed.append('Global SED Key')
+                    else:
+                        self.global_sed_key = key
+                elif adv_config['sed_passwd']:
+                    if adv_config['kmip_uid']:
+                        self._revoke_and_destroy_key(
+                            adv_config['kmip_uid'], conn, self.middleware.logger, 'SED Global Password'
+                        )
+                        self.middleware.call_sync(
+                            'datastore.update', 'system.advanced', adv_config['id'], {'adv_kmip_uid': None}
+                        )
+                    self.global_sed_key = adv_config['sed_passwd']
+                    try:
+                        uid = self._register_secret_data('global_sed_key', self.global_sed_key, conn)
+                    except Exception:
+                        failed.append('Global SED Key')
+                    else:
+                        self.middleware.call_sync(
+                            'datastore.update', 'system.advanced',
+                            adv_config['id'], {'adv_sed_passwd': '', 'adv_kmip_uid': uid}
+                        )
         return failed
 
     @private
-    def pull_sed_keys(self):
+    def pull_sed_keys(self, job=None):
         """
         We pull SED keys from the KMIP server when SED sync has been disabled. In this case, following steps
         are executed:
@@ -202,29 +213,52 @@ class KMIPService(Service, KMIPServerMixin):
         """
         failed = []
         connection_successful = self.middleware.call_sync('kmip.test_connection')
-        for disk in self.middleware.call_sync(
+        disks = self.middleware.call_sync(
             'datastore.query', 'storage.disk', [['kmip_uid', '!=', None]], {'prefix': 'disk_'}
-        ):
-            try:
-                if disk['passwd']:
-                    key = disk['passwd']
-                elif self.disks_keys.get(disk['identifier']):
-                    key = self.disks_keys[disk['identifier']]
-                elif connection_successful:
-                    with self._connection(self.middleware.call_sync('kmip.connection_config')) as conn:
-                        key = self._retrieve_secret_data(disk['kmip_uid'], conn)
-                else:
-                    raise Exception('Failed to sync disk')
-            except Exception:
-                failed.append(disk['identifier'])
-            else:
-                update_data = {'passwd': key, 'kmip_uid': None}
-                self.middleware.call_sync(
-                    'datastore.update', 'storage.disk', disk['identifier'], update_data, {'prefix': 'disk_'}
-                )
-                self.disks_keys.pop(disk['identifier'], None)
-                if connection_successful:
-                    self.middleware.call_sync('kmip.delete_kmip_secret_data', disk['kmip_uid'])
+        )
+        keys = {}
+        for disk in disks:
+            if disk['passwd']:
+                keys[disk['identifier']] = disk['passwd']
+            elif self.disks_keys.get(disk['identifier']):
+                keys[disk['identifier']] = self.disks_keys[disk['identifier']]
+
+        to_retrieve = [disk for disk in disks if disk['identifier'] not in keys]
+        if connection_successful:
+            with self._connection_pool(self.middleware.call_sync('kmip.connection_config')) as pool:
+                for disk, key, error in pool.map(
+                    lambda disk, conn: self._retrieve_secret_data(disk['kmip_uid'], conn), to_retrieve,
+                    self._progress_callback(job, 'keys retrieved', 50),
+                ):
+                    if error is None:
+                        keys[disk['identifier']] = key
+        failed.extend(disk['identifier'] for disk in to_retrieve if disk['identifier'] not in keys)
+
+        synced = [disk for disk in disks if disk['identifier'] in keys]
+        # Keys must be safely stored in the database before they are removed from the KMIP server
+        self.middleware.call_sync('datastore.bulk_write', 'storage.disk', [
+            {
+                'action': 'UPDATE', 'id': disk['identifier'],
+                'data': {'passwd': keys[disk['identifier']], 'kmip_uid': None},
+            }
+            for disk in synced
+        ], {'prefix': 'disk_'})
+        for disk in synced:
+            self.disks_keys.pop(disk['identifier'], None)
+
+        if connection_successful and synced:
+            with self._connection_pool(self.middleware.call_sync('kmip.connection_config')) as pool:
+                for disk, result, error in pool.map(
+                    lambda disk, conn: self._revoke_and_destroy_key(
+                        disk['kmip_uid'], conn, self.middleware.logger, disk['identifier']
+                    ),
+                    synced, self._progress_callback(job, 'keys removed from KMIP server', 50, 50),
+                ):
+                    if error is not None:
+                        self.middleware.logger.debug(
+                            f'Failed to remove key of {disk["identifier"]} from KMIP server: {error}'
+                        )
+
         adv_config = self.middleware.call_sync('datastore.config', 'system.advanced', {'prefix': 'adv_'})
         if adv_config['kmip_uid']:
             key = None
@@ -263,11 +297,11 @@ class KMIPService(Service, KMIPServerMixin):
         conn_successful = self.middleware.call_sync('kmip.test_connection', None, True)
         if config['enabled'] and config['manage_sed_disks']:
             if conn_successful:
-                failed = self.push_sed_keys(ids)
+                failed = self.push_sed_keys(ids, job)
             else:
                 return
         else:
-            failed = self.pull_sed_keys()
+            failed = self.pull_sed_keys(job)
         ret_failed = failed.copy()
         try:
             failed.remove('Global SED Key')
@@ -4,3 +4,5 @@
 # See the file LICENSE.IX for complete terms and conditions
 
 SUPPORTED_SSL_VERSIONS = ['PROTOCOL_TLSv1', 'PROTOCOL_TLSv1_1', 'PROTOCOL_TLSv1_2']
+# Maximum number of concurrent connections to the KMIP server used while syncing keys
+KMIP_MAX_CONNECTIONS = 4
@@ -27,75 +27,109 @@ class KMIPService(Service, KMIPServerMixin):
         return False
 
     @private
-    def push_zfs_keys(self, ids=None):
+    def existing_datasets(self):
+        # Only dataset names are needed, so don't retrieve any properties
+        return {ds['id'] for ds in self.middleware.call_sync(
+            'zfs.dataset.query', [], {'extra': {'retrieve_properties': False, 'flat': True}}
+        )}
+
+    @private
+    def push_zfs_keys(self, ids=None, job=None):
         datasets = self.middleware.call_sync(
             'datastore.query', 'storage.encrypteddataset', [['id', 'in', ids]] if ids else []
         )
-        existing_datasets = {ds['name']: ds for ds in self.middleware.call_sync('pool.dataset.query')}
+        existing_datasets = self.existing_datasets()
+        datasets = [ds for ds in datasets if ds['name'] in existing_datasets]
+        # We want to make sure we have the KMIP server's keys and in-memory keys in sync. Keys which are in memory
+        # already and are still valid do not need to be retrieved again.
+        valid_keys = self.middleware.call_sync('zfs.dataset.check_keys', {
+            ds['name']: self.zfs_keys[ds['name']]
+            for ds in datasets if not ds['encryption_key'] and ds['name'] in self.zfs_keys
+        })
+        datasets = [ds for ds in datasets if ds['encryption_key'] or not valid_keys.get(ds['name'])]
+        for ds in filter(lambda d: d['encryption_key'], datasets):
+            self.zfs_keys[ds['name']] = ds['encryption_key']
+
+        def push(ds, conn):
+            if not ds['encryption_key']:
+                return self._retrieve_secret_data(ds['kmip_uid'], conn)
+
+            destroy_successful = False
+            if ds['kmip_uid']:
+                # This needs to be revoked and destroyed
+                destroy_successful = self._revoke_and_destroy_key(ds['kmip_uid'], conn, self.middleware.logger)
+                if not destroy_successful:
+                    self.middleware.logger.debug(f'Failed to destroy key from KMIP Server for {ds["name"]}')
+            # Returns database changes, `kmip_uid` is only set if the key was pushed successfully
+            try:
+                uid = self._register_secret_data(ds['name'], ds['encryption_key'], conn)
+            except Exception:
+                return {'kmip_uid': None} if destroy_successful else None
+            else:
+                return {'encryption_key': None, 'kmip_uid': uid}
+
         failed = []
-        with self._connection(self.middleware.call_sync('kmip.connection_config')) as conn:
-            for ds in filter(lambda d: d['name'] in existing_datasets, datasets):
+        updates = []
+        with self._connection_pool(self.middleware.call_sync('kmip.connection_config')) as pool:
+            for ds, result, error in pool.map(push, datasets, self._progress_callback(job, 'datasets synced')):
                 if not ds['encryption_key']:
-                    # We want to make sure we have the KMIP server's keys and in-memory keys in sync
-                    try:
-                        if ds['name'] in self.zfs_keys and self.middleware.call_sync(
-                            'zfs.dataset.check_key', ds['name'], {'key': self.zfs_keys[ds['name']]}
-                        ):
-                            continue
-                        else:
-                            key = self._retrieve_secret_data(ds['kmip_uid'], conn)
-                    except Exception as e:
-                        self.middleware.logger.debug(f'Failed to retrieve key for {ds["name"]}: {e}')
+                    if error is None:
+                        self.zfs_keys[ds['name']] = result
                     else:
-                        self.zfs_keys[ds['name']] = key
+                        self.middleware.logger.debug(f'Failed to retrieve key for {ds["name"]}: {error}')
                     continue
 
-                self.zfs_keys[ds['name']] = ds['encryption_key']
-                destroy_successful = False
-                if ds['kmip_uid']:
-                    # This needs to be revoked and destroyed
-                    destroy_successful = self._revoke_and_destroy_key(ds['kmip_uid'], conn, self.middleware.logger)
-                    if not destroy_successful:
-                        self.middleware.logger.debug(f'Failed to destroy key from KMIP Server for {ds["name"]}')
-                try:
-                    uid = self._register_secret_data(ds['name'], self.zfs_keys[ds['name']], conn)
-                except Exception:
+                if error is None and result:
+                    updates.append({'action': 'UPDATE', 'id': ds['id'], 'data': result})
+                if error is not None or not result or not result['kmip_uid']:
                     failed.append(ds['name'])
-                    update_data = {'kmip_uid': None} if destroy_successful else {}
-                else:
-                    update_data = {'encryption_key': None, 'kmip_uid': uid}
-                if update_data:
-                    self.middleware.call_sync('datastore.update', 'storage.encrypteddataset', ds['id'], update_data)
+
+        self.middleware.call_sync('datastore.bulk_write', 'storage.encrypteddataset', updates)
         self.zfs_keys = {k: v for k, v in self.zfs_keys.items() if k in existing_datasets}
         return failed
 
     @private
-    def pull_zfs_keys(self):
+    def pull_zfs_keys(self, job=None):
         datasets = self.middleware.call_sync('datastore.query', 'storage.encrypteddataset', [['kmip_uid', '!=', None]])
-        existing_datasets = {ds['name']: ds for ds in self.middleware.call_sync('pool.dataset.query')}
+        existing_datasets = self.existing_datasets()
+        datasets = [ds for ds in datasets if ds['name'] in existing_datasets]
         failed = []
         connection_successful = self.middleware.call_sync('kmip.test_connection')
-        for ds in filter(lambda d: d['name'] in existing_datasets, datasets):
-            try:
-                if ds['encryption_key']:
-                    key = ds['encryption_key']
-                elif ds['name'] in self.zfs_keys and self.middleware.call_sync(
-                    'zfs.dataset.check_key', ds['name'], {'key': self.zfs_keys[ds['name']]}
+        keys = {ds['name']: ds['encryption_key'] for ds in datasets if ds['encryption_key']}
+        valid_keys = self.middleware.call_sync('zfs.dataset.check_keys', {
+            ds['name']: self.zfs_keys[ds['name']]
+            for ds in datasets if ds['name'] not in keys and ds['name'] in self.zfs_keys
+        })
+        keys.update({name: self.zfs_keys[name] for name, valid in valid_keys.items() if valid})
+        to_retrieve = [ds for ds in datasets if ds['name'] not in keys]
+        if connection_successful:
+            with self._connection_pool(self.middleware.call_sync('kmip.connection_config')) as pool:
+                for ds, key, error in pool.map(
+                    lambda ds, conn: self._retrieve_secret_data(ds['kmip_uid'], conn), to_retrieve,
+                    self._progress_callback(job, 'keys retrieved', 50),
                 ):
-                    key = self.zfs_keys[ds['name']]
-                elif connection_successful:
-                    with self._connection(self.middleware.call_sync('kmip.connection_config')) as conn:
-                        key = self._retrieve_secret_data(ds['kmip_uid'], conn)
-                else:
-                    raise Exception('Failed to sync dataset')
-            except Exception:
-                failed.append(ds['name'])
-            else:
-                update_data = {'encryption_key': key, 'kmip_uid': None}
-                self.middleware.call_sync('datastore.update', 'storage.encrypteddataset', ds['id'], update_data)
-                self.zfs_keys.pop(ds['name'], None)
-                if connection_successful:
-                    self.middleware.call_sync('kmip.delete_kmip_secret_data', ds['kmip_uid'])
+                    if error is None:
+                        keys[ds['name']] = key
+        failed.extend(ds['name'] for ds in to_retrieve if ds['name'] not in keys)
+
+        synced = [ds for ds in datasets if ds['name'] in keys]
+        # Keys must be safely stored in the database before they are removed from the KMIP server
+        self.middleware.call_sync('datastore.bulk_write', 'storage.encrypteddataset', [
+            {'action': 'UPDATE', 'id': ds['id'], 'data': {'encryption_key': keys[ds['name']], 'kmip_uid': None}}
+            for ds in synced
+        ])
+        for ds in synced:
+            self.zfs_keys.pop(ds['name'], None)
+
+        if connection_successful and synced:
+            with self._connection_pool(self.middleware.call_sync('kmip.connection_config')) as pool:
+                for ds, result, error in pool.map(
+                    lambda ds, conn: self._revoke_and_destroy_key(ds['kmip_uid'], conn, self.middleware.logger),
+                    synced, self._progress_callback(job, 'keys removed from KMIP server', 50, 50),
+                ):
+                    if error is not None:
+                        self.middleware.logger.debug(f'Failed to remove key of {ds["name"]} from KMIP server: {error}')
+
         self.zfs_keys = {k: v for k, v in self.zfs_keys.items() if k in existing_datasets}
         return failed
 
@@ -108,11 +142,11 @@ class KMIPService(Service, KMIPServerMixin):
         conn_successful = self.middleware.call_sync('kmip.test_connection', None, True)
         if config['enabled'] and config['manage_zfs_keys']:
             if conn_successful:
-                failed = self.push_zfs_keys(ids)
+                failed = self.push_zfs_keys(ids, job)
             else:
                 return
         else:
-            failed = self.pull_zfs_keys()
+            failed = self.pull_zfs_keys(job)
         if failed:
             self.middleware.call_sync(
                 'alert.oneshot_create', 'KMIPZFSDatasetsSyncFailure', {'datasets': ','.join(failed)}
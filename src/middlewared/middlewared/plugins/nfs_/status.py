@@ -8,6 +8,56 @@ from middlewared.schema import accepts, Int, returns, Str, Dict
 from middlewared.service import Service, private, filterable, filterable_returns
 from middlewared.service_exception import CallError
 from middlewared.utils import filter_list
+from middlewared.utils.directory_table import DIRECTORY_TABLE_TTL, DirectoryTable, scan_directory
+
+NFSD_CLIENTS_PATH = "/proc/fs/nfsd/clients"
+
+
+def read_nfs4_client_info(id_):
+    """
+    See the following link:
+        NFS 4.1 spec: https://www.rfc-editor.org/rfc/rfc8881.html
+    """
+    info = {}
+    with suppress(FileNotFoundError):
+        with open(os.path.join(NFSD_CLIENTS_PATH, id_, "info"), "r") as f:
+            info = yaml.safe_load(f.read())
+
+    return info
+
+
+def read_nfs4_client_states(id_):
+    """
+    Detailed information regarding current open files per NFS client
+    TODO: review formatting of this field
+    """
+    states = []
+    with suppress(FileNotFoundError):
+        with open(os.path.join(NFSD_CLIENTS_PATH, id_, "states"), "r") as f:
+            states = yaml.safe_load(f.read())
+
+    # states file may be empty, which changes it to None type
+    # return empty list in this case
+    return states or []
+
+
+def scan_nfs4_clients():
+    for path, inode in scan_directory(NFSD_CLIENTS_PATH):
+        yield path, inode, {"id": os.path.basename(path)}
+
+
+def read_nfs4_client(path, keys):
+    return {
+        "id": keys["id"],
+        "info": read_nfs4_client_info(keys["id"]),
+        "states": read_nfs4_client_states(keys["id"]),
+    }
+
+
+# Client status and open files change all the time so they are not kept for longer than the listing
+NFS4_CLIENTS = DirectoryTable(
+    scan_nfs4_clients, read_nfs4_client, ["id"], entry_ttl=DIRECTORY_TABLE_TTL, skips=False,
+)
 
 
 class NFSService(Service):
@@ -79,31 +129,11 @@ class NFSService(Service):
 
     @private
     def get_nfs4_client_info(self, id_):
-        """
-        See the following link:
-            NFS 4.1 spec: https://www.rfc-editor.org/rfc/rfc8881.html
-        """
-        info = {}
-        with suppress(FileNotFoundError):
-            with open(f"/proc/fs/nfsd/clients/{id_}/info", "r") as f:
-                info = yaml.safe_load(f.read())
-
-        return info
+        return read_nfs4_client_info(id_)
 
     @private
     def get_nfs4_client_states(self, id_):
-        """
-        Detailed information regarding current open files per NFS client
-        TODO: review formatting of this field
-        """
-        states = []
-        with suppress(FileNotFoundError):
-            with open(f"/proc/fs/nfsd/clients/{id_}/states", "r") as f:
-                states = yaml.safe_load(f.read())
-
-        # states file may be empty, which changes it to None type
-        # return empty list in this case
-        return states or []
+        return read_nfs4_client_states(id_)
 
     # NFS_WRITE because this exposes hostnames, IP addresses and other details
     # READONLY is considered administrative-level permission
@@ -181,18 +211,11 @@ class NFSService(Service):
         'callback state':   Current callback 'service' status for this client: 'UP', 'DOWN', 'FAULT' or 'UNKNOWN'
                             Linux clients usually indicate 'UP'
                             FreeBSD clients may indicate 'DOWN' but are still functional
-        """
-        clients = []
-        with suppress(FileNotFoundError):
-            for client in os.listdir("/proc/fs/nfsd/clients/"):
-                entry = {
-                    "id": client,
-                    "info": self.get_nfs4_client_info(client),
-                    "states": self.get_nfs4_client_states(client),
-                }
-                clients.append(entry)
 
-        return filter_list(clients, filters, options)
+        Clients are listed at most every few seconds. Only the clients that are returned are read unless `info` or
+        `states` are used for filtering or sorting.
+        """
+        return NFS4_CLIENTS.query(filters, options)
 
     @accepts(roles=['SHARING_NFS_READ'])
     @returns(Int('number_of_clients'))
@@ -204,6 +227,7 @@ class NFSService(Service):
         """
 
         cnt = 0
+        # NFSv4 clients are counted without reading their info and states
         for op in (self.get_nfs3_clients, self.get_nfs4_clients):
             cnt += op([], {"count": True})
 
@@ -217,8 +241,9 @@ class NFSService(Service):
         returned in `get_nfs4_clients`.
         """
         with suppress(FileNotFoundError):
-            with open(f"/proc/fs/nfsd/clients/{client_id}/ctl", "w") as f:
+            with open(os.path.join(NFSD_CLIENTS_PATH, client_id, "ctl"), "w") as f:
                 f.write("expire\n")
+        NFS4_CLIENTS.clear()
 
     @private
     def get_threadpool_mode(self):
@@ -1,5 +1,9 @@
 import os
 import pathlib
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from middlewared.api import api_method
 from middlewared.api.current import (
@@ -11,6 +15,90 @@ from middlewared.service import Service, private
 from middlewared.utils.mount import getmntinfo
 
 
+DETAILS_COLLECTOR_WORKERS = 8
+# Collected shares/tasks are invalidated by CRUD events of the respective services. The timeout
+# is only a safety net for consumers that change without sending an event (i.e. virt devices).
+DETAILS_CACHE_TIMEOUT = 300
+DETAILS_CACHE_EVENTS = (
+    'app.query',
+    'cloudsync.query',
+    'iscsi.extent.query',
+    'iscsi.target.query',
+    'iscsi.targetextent.query',
+    'pool.snapshottask.query',
+    'replication.query',
+    'rsynctask.query',
+    'sharing.nfs.query',
+    'sharing.smb.query',
+    'virt.instance.query',
+    'vm.device.query',
+    'vm.query',
+)
+
+
+class DetailsCache:
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.data = None
+        self.expires = 0
+        self.generation = 0
+
+    def get(self):
+        """
+        Returns cached data (or `None`) along with the generation the caller must pass
+        to `put` so that data collected while the cache was invalidated is discarded.
+        """
+        with self.lock:
+            if self.data is not None and self.expires > time.monotonic():
+                return self.data, self.generation
+
+            return None, self.generation
+
+    def put(self, data, generation):
+        with self.lock:
+            if generation == self.generation:
+                self.data = data
+                self.expires = time.monotonic() + self.timeout
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.data = None
+
+
+DETAILS_CACHE = DetailsCache(DETAILS_CACHE_TIMEOUT)
+
+
+class DatasetIndex:
+    """
+    Entries indexed by the path they reference and by the dataset they live on (zvol name or
+    the `mount_source` of the path) so that matching them with datasets does not require a
+    scan of every entry for every dataset.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.by_path = defaultdict(list)
+        self.by_dataset = defaultdict(list)
+
+    def add(self, entry, path=None, dataset=None):
+        idx = len(self.entries)
+        self.entries.append(entry)
+        if path:
+            self.by_path[path].append(idx)
+        if dataset:
+            self.by_dataset[dataset].append(idx)
+
+    def lookup(self, ds):
+        matches = set(self.by_dataset.get(ds['id'], []))
+        if ds['mountpoint']:
+            matches.update(self.by_path.get(ds['mountpoint'], []))
+
+        return [self.entries[idx].copy() for idx in sorted(matches)]
+
+
 class PoolDatasetService(Service):
 
     class Config:
@@ -79,8 +167,10 @@ class PoolDatasetService(Service):
         datasets = self.middleware.call_sync('pool.dataset.query', filters, options)
         mnt_info = getmntinfo()
         info = self.build_details(mnt_info)
+        # last entry wins in case of stacked mounts on the same mountpoint
+        mnt_info_by_mountpoint = {i['mountpoint']: i for i in mnt_info.values()}
         for dataset in datasets:
-            self.collapse_datasets(dataset, info, mnt_info)
+            self.collapse_datasets(dataset, info, mnt_info_by_mountpoint)
 
         return datasets
 
@@ -127,7 +217,7 @@ class PoolDatasetService(Service):
     def get_mntinfo(self, ds, mntinfo):
         atime = case = True
         readonly = False
-        for devid, info in filter(lambda x: x[1]['mountpoint'] == ds['mountpoint'], mntinfo.items()):
+        if info := mntinfo.get(ds['mountpoint']):
             atime = not ('NOATIME' in info['mount_opts'])
             readonly = 'RO' in info['mount_opts']
             case = any((i for i in ('CASESENSITIVE', 'CASEMIXED') if i in info['super_opts']))
@@ -138,156 +228,179 @@ class PoolDatasetService(Service):
         # if it's set to "mixed" on linux, it's treated as case sensitive.
         return atime, case, readonly
 
+    @private
+    def collect_details(self):
+        """
+        Query everything that is correlated with datasets by `build_details`. The queries
+        are independent of each other so they are issued concurrently and the result is
+        cached until one of `DETAILS_CACHE_EVENTS` is received.
+        """
+        data, generation = DETAILS_CACHE.get()
+        if data is not None:
+            return data
+
+        collectors = {
+            'iscsi_targetextent': ('iscsi.targetextent.query',),
+            'iscsi_target': ('iscsi.target.query',),
+            'iscsi_extent': ('iscsi.extent.query',),
+            'nfs': ('sharing.nfs.query',),
+            'smb': ('sharing.smb.query',),
+            'repl': ('datastore.query', 'storage.replication', [], {'prefix': 'repl_'}),
+            'snap': ('datastore.query', 'storage.task', [], {'prefix': 'task_'}),
+            'cloud': ('datastore.query', 'tasks.cloudsync'),
+            'rsync': ('rsynctask.query',),
+            'vm': ('vm.device.query', [['attributes.dtype', 'in', ['RAW', 'DISK']]]),
+            'vm_names': ('datastore.query', 'vm.vm'),
+            'app': ('app.query',),
+            'virt_instance': ('pool.dataset.collect_virt_instance_disks',),
+        }
+        with ThreadPoolExecutor(max_workers=DETAILS_COLLECTOR_WORKERS, thread_name_prefix='dataset_details') as exc:
+            futures = {k: exc.submit(self.middleware.call_sync, *args) for k, args in collectors.items()}
+            data = {k: future.result() for k, future in futures.items()}
+
+        DETAILS_CACHE.put(data, generation)
+        return data
+
+    @private
+    def collect_virt_instance_disks(self):
+        disks = []
+        for instance in self.middleware.call_sync('virt.instance.query'):
+            for device in self.middleware.call_sync('virt.instance.device_list', instance['id']):
+                if device['dev_type'] == 'DISK' and device['source']:
+                    disks.append(device | {'instance': instance['id']})
+
+        return disks
+
+    @private
+    def invalidate_details_cache(self):
+        DETAILS_CACHE.invalidate()
+
     @private
     def build_details(self, mntinfo):
+        raw = self.collect_details()
         results = {
-            'iscsi': [], 'nfs': [], 'smb': [],
-            'repl': [], 'snap': [], 'cloud': [],
-            'rsync': [], 'vm': [], 'app': [],
-            'virt_instance': [],
+            'iscsi': DatasetIndex(), 'nfs': DatasetIndex(), 'smb': DatasetIndex(),
+            'repl': Counter(), 'snap': Counter(), 'cloud': Counter(),
+            'rsync': Counter(), 'vm': DatasetIndex(), 'app': DatasetIndex(),
+            'virt_instance': DatasetIndex(),
         }
 
+        mount_sources = {}
+
+        def mount_source(path):
+            # many shares/tasks/apps commonly point to the same path so stat it only once
+            if path not in mount_sources:
+                mount_sources[path] = self.get_mount_info(path, mntinfo).get('mount_source')
+            return mount_sources[path]
+
         # iscsi
-        t_to_e = self.middleware.call_sync('iscsi.targetextent.query')
-        t = {i['id']: i for i in self.middleware.call_sync('iscsi.target.query')}
-        e = {i['id']: i for i in self.middleware.call_sync('iscsi.extent.query')}
+        t = {i['id']: i for i in raw['iscsi_target']}
+        e = {i['id']: i for i in raw['iscsi_extent']}
+        t_to_e = raw['iscsi_targetextent']
         for i in filter(lambda x: x['target'] in t and t[x['target']]['groups'] and x['extent'] in e, t_to_e):
             """
             1. make sure target's and extent's id exist in the target to extent table
             2. make sure the target has `groups` entry since, without it, it's impossible
                 that it's being shared via iscsi
             """
-            results['iscsi'].append({
-                'extent': e[i['extent']],
-                'target': t[i['target']],
-                'mount_info': self.get_mount_info(e[i['extent']]['path'], mntinfo),
-            })
+            extent = e[i['extent']]
+            if extent['type'] == 'DISK':
+                # we store extent information prefixed with `zvol/` (i.e. zvol/tank/zvol01).
+                results['iscsi'].add(
+                    {'enabled': extent['enabled'], 'type': 'DISK', 'path': f'/dev/{extent["path"]}'},
+                    dataset=extent['path'].removeprefix('zvol/'),
+                )
+            elif extent['type'] == 'FILE':
+                # this isn't common but possible, you can share a "file"
+                # via iscsi which means it's not a dataset but a file inside
+                # a dataset so we need to find the source dataset for the file
+                results['iscsi'].add(
+                    {'enabled': extent['enabled'], 'type': 'FILE', 'path': extent['path']},
+                    dataset=mount_source(extent['path']),
+                )
 
         # nfs and smb
-        for key in ('nfs', 'smb'):
-            for share in self.middleware.call_sync(f'sharing.{key}.query'):
-                share['mount_info'] = self.get_mount_info(share['path'], mntinfo)
-                results[key].append(share)
+        for share in raw['nfs']:
+            results['nfs'].add(
+                {'enabled': share['enabled'], 'path': share['path']},
+                path=share['path'], dataset=mount_source(share['path']),
+            )
+
+        for share in raw['smb']:
+            results['smb'].add(
+                {'enabled': share['enabled'], 'path': share['path'], 'share_name': share['name']},
+                path=share['path'], dataset=mount_source(share['path']),
+            )
 
         # replication
-        options = {'prefix': 'repl_'}
-        for task in self.middleware.call_sync('datastore.query', 'storage.replication', [], options):
+        for task in filter(lambda x: x['direction'] == 'PUSH', raw['repl']):
+            # we only care about replication tasks that are configured to push
             # replication can only be configured on a dataset so getting mount info is unnecessary
-            results['repl'].append(task)
+            results['repl'].update(task['source_datasets'])
 
         # snapshots
-        for task in self.middleware.call_sync('datastore.query', 'storage.task', [], {'prefix': 'task_'}):
-            # snapshots can only be configured on a dataset so getting mount info is unnecessary
-            results['snap'].append(task)
-
-        # cloud sync
-        for task in self.middleware.call_sync('datastore.query', 'tasks.cloudsync'):
-            task['mount_info'] = self.get_mount_info(task['path'], mntinfo)
-            results['cloud'].append(task)
+        # snapshots can only be configured on a dataset so getting mount info is unnecessary
+        results['snap'].update(task['dataset'] for task in raw['snap'])
 
-        # rsync
-        for task in self.middleware.call_sync('rsynctask.query'):
-            task['mount_info'] = self.get_mount_info(task['path'], mntinfo)
-            results['rsync'].append(task)
+        # cloud sync and rsync
+        for key in ('cloud', 'rsync'):
+            # we only care about tasks that are configured to push
+            results[key].update(
+                str(pathlib.PurePath(task['path'])) for task in raw[key] if task['direction'] == 'PUSH'
+            )
 
         # vm
-        for vm in self.middleware.call_sync('vm.device.query', [['attributes.dtype', 'in', ['RAW', 'DISK']]]):
+        vms_mapping = {vm['id']: vm for vm in raw['vm_names']}
+        for vm in raw['vm']:
+            entry = {'name': vms_mapping[vm['vm']]['name'], 'path': vm['attributes']['path']}
             if vm['attributes']['dtype'] == 'DISK':
                 # disk type is always a zvol
-                vm['zvol'] = zvol_path_to_name(vm['attributes']['path'])
+                results['vm'].add(entry, path=entry['path'], dataset=zvol_path_to_name(entry['path']))
             else:
                 # raw type is always a file
-                vm['mount_info'] = self.get_mount_info(vm['attributes']['path'], mntinfo)
+                results['vm'].add(entry, path=entry['path'], dataset=mount_source(entry['path']))
 
-            results['vm'].append(vm)
-
-        for app in self.middleware.call_sync('app.query'):
+        for app in raw['app']:
             for path_config in filter(
                 lambda p: p.get('source', '').startswith('/mnt/') and not p['source'].startswith('/mnt/.ix-'),
                 app['active_workloads']['volumes']
             ):
-                results['app'].append({
-                    'name': app['name'],
-                    'path': path_config['source'],
-                    'mount_info': self.get_mount_info(path_config['source'], mntinfo),
-                })
+                results['app'].add(
+                    {'name': app['name'], 'path': path_config['source']},
+                    path=path_config['source'], dataset=mount_source(path_config['source']),
+                )
 
         # virt instance
-        for instance in self.middleware.call_sync('virt.instance.query'):
-            for device in self.middleware.call_sync('virt.instance.device_list', instance['id']):
-                if device['dev_type'] != 'DISK':
-                    continue
-                if not device['source']:
-                    continue
-                device['instance'] = instance['id']
-                if device['source'].startswith('/dev/zvol/'):
-                    # disk type is always a zvol
-                    device['zvol'] = zvol_path_to_name(device['source'])
-                else:
-                    # raw type is always a file
-                    device['mount_info'] = self.get_mount_info(device['source'], mntinfo)
-                results['virt_instance'].append(device)
+        for device in raw['virt_instance']:
+            entry = {'name': device['instance'], 'path': device['source']}
+            if device['source'].startswith('/dev/zvol/'):
+                # disk type is always a zvol
+                results['virt_instance'].add(entry, path=entry['path'], dataset=zvol_path_to_name(entry['path']))
+            else:
+                # raw type is always a file
+                results['virt_instance'].add(entry, path=entry['path'], dataset=mount_source(entry['path']))
 
         return results
 
     @private
     def get_nfs_shares(self, ds, nfsshares):
-        nfs_shares = []
-        for share in nfsshares:
-            if share['path'] == ds['mountpoint'] or share['mount_info'].get('mount_source') == ds['id']:
-                nfs_shares.append({'enabled': share['enabled'], 'path': share['path']})
-
-        return nfs_shares
+        return nfsshares.lookup(ds)
 
     @private
     def get_smb_shares(self, ds, smbshares):
-        smb_shares = []
-        for share in smbshares:
-            if share['path'] == ds['mountpoint'] or share['mount_info'].get('mount_source') == ds['id']:
-                smb_shares.append({
-                    'enabled': share['enabled'],
-                    'path': share['path'],
-                    'share_name': share['name']
-                })
-
-        return smb_shares
+        return smbshares.lookup(ds)
 
     @private
     def get_iscsi_shares(self, ds, iscsishares):
-        iscsi_shares = []
-        for share in iscsishares:
-            if share['extent']['type'] == 'DISK' and share['extent']['path'].removeprefix('zvol/') == ds['id']:
-                # we store extent information prefixed with `zvol/` (i.e. zvol/tank/zvol01).
-                iscsi_shares.append({
-                    'enabled': share['extent']['enabled'],
-                    'type': 'DISK',
-                    'path': f'/dev/{share["extent"]["path"]}',
-                })
-            elif share['extent']['type'] == 'FILE' and share['mount_info'].get('mount_source') == ds['id']:
-                # this isn't common but possible, you can share a "file"
-                # via iscsi which means it's not a dataset but a file inside
-                # a dataset so we need to find the source dataset for the file
-                iscsi_shares.append({
-                    'enabled': share['extent']['enabled'],
-                    'type': 'FILE',
-                    'path': share['extent']['path'],
-                })
-
-        return iscsi_shares
+        return iscsishares.lookup(ds)
 
     @private
     def get_repl_tasks_count(self, ds, repltasks):
-        count = 0
-        for repl in filter(lambda x: x['direction'] == 'PUSH', repltasks):
-            # we only care about replication tasks that are configured to push
-            for src_ds in filter(lambda x: x == ds['id'], repl['source_datasets']):
-                count += 1
-
-        return count
+        return repltasks[ds['id']]
 
     @private
     def get_snapshot_tasks_count(self, ds, snaptasks):
-        return len([i for i in snaptasks if i['dataset'] == ds['id']])
+        return snaptasks[ds['id']]
 
     @private
     def get_cloudsync_tasks_count(self, ds, cldtasks):
@@ -300,45 +413,30 @@ class PoolDatasetService(Service):
     def _get_push_tasks_count(self, ds, tasks):
         count = 0
         if ds['mountpoint']:
-            for i in filter(lambda x: x['direction'] == 'PUSH', tasks):
-                # we only care about cloud sync tasks that are configured to push
-                if pathlib.Path(ds['mountpoint']).is_relative_to(i['path']):
-                    count += 1
+            # a task backing up the dataset itself or any of its parent paths counts
+            mountpoint = pathlib.PurePath(ds['mountpoint'])
+            for path in (mountpoint, *mountpoint.parents):
+                count += tasks[str(path)]
 
         return count
 
     @private
     def get_vms(self, ds, _vms):
-        vms = []
-        vms_mapping = {vm['id']: vm for vm in self.middleware.call_sync('datastore.query', 'vm.vm')}
-        for i in _vms:
-            if (
-                'zvol' in i and i['zvol'] == ds['id'] or
-                i['attributes']['path'] == ds['mountpoint'] or
-                i.get('mount_info', {}).get('mount_source') == ds['id']
-            ):
-                vms.append({'name': vms_mapping[i['vm']]['name'], 'path': i['attributes']['path']})
-
-        return vms
+        return _vms.lookup(ds)
 
     @private
     def get_virt_instances(self, ds, _instances):
-        instances = []
-        for i in _instances:
-            if (
-                'zvol' in i and i['zvol'] == ds['id'] or
-                i['source'] == ds['mountpoint'] or
-                i.get('mount_info', {}).get('mount_source') == ds['id']
-            ):
-                instances.append({'name': i['instance'], 'path': i['source']})
-
-        return instances
+        return _instances.lookup(ds)
 
     @private
     def get_apps(self, ds, _apps):
-        apps = []
-        for app in _apps:
-            if app['path'] == ds['mountpoint'] or app['mount_info'].get('mount_source') == ds['id']:
-                apps.append({'name': app['name'], 'path': app['path']})
+        return _apps.lookup(ds)
+
+
+async def _invalidate_details_cache(middleware, event_type, args):
+    await middleware.call('pool.dataset.invalidate_details_cache')
+
 
-        return apps
+async def setup(middleware):
+    for event in DETAILS_CACHE_EVENTS:
+        middleware.event_subscribe(event, _invalidate_details_cache)
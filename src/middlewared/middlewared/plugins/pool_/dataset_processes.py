@@ -6,6 +6,7 @@ import re
 from middlewared.plugins.zfs_.utils import zvol_name_to_path
 from middlewared.schema import accepts, Ref, returns, Str
 from middlewared.service import CallError, item_method, private, Service
+from middlewared.utils.open_files import resolve_targets, scan_processes
 
 from .utils import dataset_mountpoint
 
@@ -126,84 +127,74 @@ class PoolDatasetService(Service):
         `include_middleware`: include files opened by the middlewared process in output.
         These are not included by default.
         """
-        exact_matches = set()
-        include_devs = []
+        result = {}
+        for processes in self.processes_using_paths_by_path(paths, include_paths, include_middleware).values():
+            for proc in processes:
+                if proc['pid'] in result and include_paths:
+                    result[proc['pid']]['paths'] = sorted(set(result[proc['pid']]['paths']) | set(proc['paths']))
+                else:
+                    result.setdefault(proc['pid'], proc)
+
+        return sorted(result.values(), key=lambda proc: int(proc['pid']))
+
+    @private
+    def processes_using_paths_by_path(self, paths, include_paths=False, include_middleware=False):
+        """
+        Same as `processes_using_paths` but `/proc` is walked only once for all `paths` and
+        the result is grouped per each path of `paths`.
+        """
+        targets = {}
         for path in paths:
             if RE_ZD.match(path):
-                exact_matches.add(path)
+                targets[path] = [path]
+            elif path.startswith('/dev/zvol/') and os.path.isdir(path):
+                targets[path] = [
+                    os.path.join(root, f) for root, dirs, files in os.walk(path) for f in files
+                ]
             else:
-                try:
-                    if path.startswith("/dev/zvol/"):
-                        if os.path.isdir(path):
-                            for root, dirs, files in os.walk(path):
-                                for f in files:
-                                    exact_matches.add(os.path.realpath(os.path.join(root, f)))
-                        else:
-                            exact_matches.add(os.path.realpath(path))
-                    else:
-                        include_devs.append(os.stat(path).st_dev)
-                except FileNotFoundError:
+                targets[path] = [path]
+
+        found = scan_processes(
+            resolve_targets(targets),
+            include_paths=include_paths,
+            exclude_pids=() if include_middleware else (os.getpid(),),
+        )
+
+        procs = {}
+        services = {}
+        result = {path: [] for path in paths}
+        for path, pids in found.items():
+            for pid, found_paths in sorted(pids.items()):
+                if pid not in procs:
+                    procs[pid] = self._process_info(pid, services)
+                if procs[pid] is None:
+                    # process exited while we were inspecting it
                     continue
 
-        result = []
-        if include_devs or exact_matches:
-            for pid in os.listdir('/proc'):
-                if not pid.isdigit() or (not include_middleware and (int(pid) == os.getpid())):
-                    continue
+                proc = procs[pid].copy()
+                if include_paths:
+                    proc['paths'] = sorted(found_paths)
 
-                with contextlib.suppress(FileNotFoundError, ProcessLookupError):
-                    # FileNotFoundError for when a process is killed/exits
-                    # while we're iterating
-                    found = False
-                    found_paths = set()
-                    for f in os.listdir(f'/proc/{pid}/fd'):
-                        fd = f'/proc/{pid}/fd/{f}'
-                        is_link = False
-                        realpath = None
-                        with contextlib.suppress(FileNotFoundError):
-                            # Have second suppression here so that we don't lose list of files
-                            # if we have TOCTOU issue on one of files.
-                            #
-                            # We want to include file in list of paths in the following
-                            # situations:
-                            #
-                            # 1. File is regular file and has same device id as specified path
-                            # 2. File is a symbolic link and exactly matches a provided /dev/zvol or /dev/zd path
-                            if (
-                                (include_devs and os.stat(fd).st_dev in include_devs) or
-                                (
-                                    exact_matches and
-                                    (is_link := os.path.islink(fd)) and
-                                    (realpath := os.path.realpath(fd)) in exact_matches
-                                )
-                            ):
-                                found = True
-                                if include_paths:
-                                    if is_link:
-                                        # This is a path in `/dev/zvol` or `/dev/zd*`
-                                        found_paths.add(realpath)
-                                    else:
-                                        # We need to readlink to convert `/proc/<pid>/fd/<fd>` to
-                                        # the file's path name.
-                                        found_paths.add(os.readlink(fd))
-
-                    if found:
-                        with open(f'/proc/{pid}/comm') as comm:
-                            name = comm.read().strip()
-
-                        proc = {'pid': pid, 'name': name}
-
-                        if svc := self.middleware.call_sync('service.identify_process', name):
-                            proc['service'] = svc
-                        else:
-                            with open(f'/proc/{pid}/cmdline') as cmd:
-                                cmdline = cmd.read().replace('\u0000', ' ').strip()
-
-                            proc['cmdline'] = cmdline
-
-                        if include_paths:
-                            proc['paths'] = sorted(found_paths)
-
-                        result.append(proc)
+                result[path].append(proc)
 
         return result
+
+    def _process_info(self, pid, services):
+        with contextlib.suppress(FileNotFoundError, ProcessLookupError):
+            with open(f'/proc/{pid}/comm') as comm:
+                name = comm.read().strip()
+
+            proc = {'pid': str(pid), 'name': name}
+
+            if name not in services:
+                services[name] = self.middleware.call_sync('service.identify_process', name)
+
+            if svc := services[name]:
+                proc['service'] = svc
+            else:
+                with open(f'/proc/{pid}/cmdline') as cmd:
+                    cmdline = cmd.read().replace('\u0000', ' ').strip()
+
+                proc['cmdline'] = cmdline
+
+            return proc
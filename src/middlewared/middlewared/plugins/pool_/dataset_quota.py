@@ -1,6 +1,5 @@
 from middlewared.schema import accepts, Dict, Int, List, Ref, returns, Str
 from middlewared.service import item_method, Service, ValidationErrors
-from middlewared.utils import filter_list
 
 
 class PoolDatasetService(Service):
@@ -20,8 +19,8 @@ class PoolDatasetService(Service):
     async def get_quota(self, ds, quota_type, filters, options):
         """
         Return a list of the specified `quota_type` of quotas on the ZFS dataset `ds`.
-        Support `query-filters` and `query-options`. used_bytes may not instantly
-        update as space is used.
+        Support `query-filters` and `query-options` (including `offset` and `limit` for paging).
+        used_bytes may not instantly update as space is used.
 
         When quota_type is not DATASET, each quota entry has these fields:
 
@@ -45,10 +44,11 @@ class PoolDatasetService(Service):
         in an on-disk quota of 1 KiB.
         """
         dataset = (await self.middleware.call('pool.dataset.get_instance_quick', ds))['name']
-        quota_list = await self.middleware.call(
-            'zfs.dataset.get_quota', dataset, quota_type.lower()
+        # Filtering and paging is done where the quotas are collected so that names are only resolved for the
+        # returned entries and the full list of quotas does not need to be sent over from the process pool.
+        return await self.middleware.call(
+            'zfs.dataset.get_quota', dataset, quota_type.lower(), filters, options
         )
-        return filter_list(quota_list, filters, options)
 
     @accepts(
         Str('ds', required=True),
@@ -4,7 +4,8 @@ import os
 
 import middlewared.sqlalchemy as sa
 from middlewared.plugins.service_.services.all import all_services
-from middlewared.plugins.service_.services.base import IdentifiableServiceInterface
+from middlewared.plugins.service_.services.base import IdentifiableServiceInterface, SimpleService
+from middlewared.plugins.service_.services.unit_state import UNIT_STATE_CACHE
 from middlewared.plugins.service_.utils import app_has_write_privilege_for_service
 from middlewared.schema import accepts, Bool, Dict, Int, List, Ref, returns, Str
 from middlewared.service import filterable, CallError, CRUDService, pass_app, periodic, private
@@ -47,6 +48,22 @@ class ServiceService(CRUDService):
         if not isinstance(services, list):
             services = [services]
 
+        # Load the state of all units not yet known to the unit state cache in a single D-Bus call, every
+        # `get_state` below is then answered from the cache.
+        unit_names = []
+        for service in services:
+            service_object = self.SERVICES.get(service['service'])
+            if isinstance(service_object, SimpleService):
+                unit_name = service_object._get_systemd_unit_name()
+                if UNIT_STATE_CACHE.get_cached(unit_name) is None:
+                    unit_names.append(unit_name)
+
+        if unit_names:
+            try:
+                await self.middleware.run_in_thread(UNIT_STATE_CACHE.get, unit_names)
+            except Exception:
+                self.logger.warning('Failed to load systemd units state', exc_info=True)
+
         jobs = {
             asyncio.ensure_future(
                 (await self.middleware.call('service.object', service['service'])).get_state()
@@ -467,4 +484,6 @@ async def setup(middleware):
     for klass in all_services:
         await middleware.call('service.register_object', klass(middleware))
 
+    UNIT_STATE_CACHE.start()
+
     middleware.event_subscribe('system.ready', __event_service_ready)
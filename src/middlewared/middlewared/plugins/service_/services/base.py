@@ -12,6 +12,7 @@ from middlewared.utils import run
 
 from .base_interface import ServiceInterface, IdentifiableServiceInterface
 from .base_state import ServiceState
+from .unit_state import UNIT_STATE_CACHE
 
 logger = logging.getLogger(__name__)
 
@@ -35,14 +36,22 @@ class SimpleService(ServiceInterface, IdentifiableServiceInterface):
         return []
 
     async def get_state(self):
+        if (unit_state := UNIT_STATE_CACHE.get_cached(self._get_systemd_unit_name())) is not None:
+            return self._service_state(unit_state.active_state, unit_state.main_pid)
+
         return await self.middleware.run_in_thread(self._get_state_sync)
 
     def _get_state_sync(self):
+        name = self._get_systemd_unit_name()
+        if (unit_states := UNIT_STATE_CACHE.get([name])) is not None:
+            return self._service_state(unit_states[name].active_state, unit_states[name].main_pid)
+
         unit = self._get_systemd_unit()
+        return self._service_state(unit.Unit.ActiveState.decode("utf-8"), unit.MainPID)
 
-        state = unit.Unit.ActiveState
-        if state == b"active" or (self.systemd_async_start and state == b"activating"):
-            return ServiceState(True, list(filter(None, [unit.MainPID])))
+    def _service_state(self, active_state, main_pid):
+        if active_state == "active" or (self.systemd_async_start and active_state == "activating"):
+            return ServiceState(True, list(filter(None, [main_pid])))
         else:
             return ServiceState(False, [])
 
@@ -81,7 +90,14 @@ class SimpleService(ServiceInterface, IdentifiableServiceInterface):
         return f"{self.systemd_unit}.service".encode()
 
     async def _unit_action(self, action, wait=True, unit=None):
-        return await self.middleware.run_in_thread(self._unit_action_sync, action, wait, self.systemd_unit_timeout, unit=unit)
+        try:
+            return await self.middleware.run_in_thread(
+                self._unit_action_sync, action, wait, self.systemd_unit_timeout, unit=unit,
+            )
+        finally:
+            # The unit state cache listener might not have received the signals of the job yet, make the state checks
+            # that follow the action query the unit
+            UNIT_STATE_CACHE.invalidate(self._get_systemd_unit_name() if unit is None else unit.external_id)
 
     def _unit_action_sync(self, action, wait, timeout, unit=None):
         if unit is None:
@@ -0,0 +1,212 @@
+from collections import defaultdict, namedtuple
+import logging
+import re
+import select
+import threading
+import time
+
+from pystemd.dbuslib import DBus
+from pystemd.systemd1 import Manager, Unit
+
+logger = logging.getLogger(__name__)
+
+SYSTEMD_DESTINATION = b"org.freedesktop.systemd1"
+SYSTEMD_PATH = b"/org/freedesktop/systemd1"
+UNIT_PATH_PREFIX = "/org/freedesktop/systemd1/unit/"
+LISTENER_TIMEOUT = 60
+LISTENER_RESTART_DELAY = 5
+
+UnitState = namedtuple("UnitState", ["active_state", "main_pid"])
+
+
+def _str(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def unit_name_from_path(path):
+    """
+    Reverse systemd D-Bus object path escaping, i.e. `/org/freedesktop/systemd1/unit/ssh_2eservice` -> `ssh.service`
+    """
+    path = _str(path)
+    if not path or not path.startswith(UNIT_PATH_PREFIX):
+        return None
+
+    return re.sub(r"_([0-9a-f]{2})", lambda m: chr(int(m.group(1), 16)), path[len(UNIT_PATH_PREFIX):]).encode()
+
+
+class UnitStateCache:
+    """
+    Active state and main PID of systemd units kept up to date by a thread that listens to systemd
+    `PropertiesChanged` and `JobRemoved` signals so that service states can be answered without D-Bus round-trips.
+
+    Units are added to the cache on demand (in bulk, using a single `ListUnitsByNames` call). The cache is only
+    used while the listener is running, `get` returns `None` otherwise and callers should query the units directly.
+    """
+
+    def __init__(self, bus_factory=DBus, manager_factory=Manager, unit_factory=Unit):
+        self.bus_factory = bus_factory
+        self.manager_factory = manager_factory
+        self.unit_factory = unit_factory
+        self.lock = threading.Lock()
+        self.units = {}
+        # Bumped on each signal for the unit so that results of a `load` that raced with the signal are discarded
+        self.generations = defaultdict(int)
+        # Number of signals dispatched by the listener
+        self.signals = 0
+        self.listening = threading.Event()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True, name="systemd_unit_state")
+                self.thread.start()
+
+    def get_cached(self, name):
+        if self.listening.is_set():
+            return self.units.get(name)
+
+    def get(self, names):
+        """
+        Returns a dictionary of `UnitState` for the unit `names` or `None` if the cache can't be used.
+        """
+        if not self.listening.is_set():
+            return None
+
+        if missing := [name for name in names if name not in self.units]:
+            self.load(missing)
+
+        if not self.listening.is_set():
+            # Listener died while we were loading
+            return None
+
+        with self.lock:
+            return {name: self.units.get(name, UnitState("inactive", 0)) for name in names}
+
+    def load(self, names):
+        with self.lock:
+            generations = {name: self.generations[name] for name in names}
+
+        loaded = {}
+        with self.bus_factory() as bus:
+            manager = self.manager_factory(bus=bus)
+            manager.load()
+            for name, description, load_state, active_state, *_ in manager.Manager.ListUnitsByNames(names):
+                active_state = _str(active_state)
+                main_pid = 0
+                if active_state in ("active", "activating", "reloading", "deactivating"):
+                    unit = self.unit_factory(name, bus=bus)
+                    unit.load()
+                    main_pid = unit.MainPID
+
+                loaded[name] = UnitState(active_state, main_pid)
+
+        with self.lock:
+            for name in names:
+                if self.generations[name] == generations[name]:
+                    self.units[name] = loaded.get(name, UnitState("inactive", 0))
+
+    def invalidate(self, name=None):
+        with self.lock:
+            if name is None:
+                self.units.clear()
+                for unit_name in self.generations:
+                    self.generations[unit_name] += 1
+            else:
+                self.units.pop(name, None)
+                self.generations[name] += 1
+
+    def on_properties_changed(self, msg, error=None, userdata=None):
+        self.signals += 1
+        try:
+            msg.process_reply(True)
+            name = unit_name_from_path(msg.headers.get("Path"))
+            interface, changed, invalidated = msg.body
+        except Exception:
+            logger.debug("Unable to parse PropertiesChanged signal", exc_info=True)
+            self.invalidate()
+            return
+
+        if name is None:
+            return
+
+        changed = {_str(k): v for k, v in changed.items()}
+        with self.lock:
+            self.generations[name] += 1
+            if (state := self.units.get(name)) is None:
+                return
+
+            if invalidated:
+                self.units.pop(name)
+                return
+
+            if "ActiveState" in changed:
+                state = state._replace(active_state=_str(changed["ActiveState"]))
+            if "MainPID" in changed:
+                state = state._replace(main_pid=changed["MainPID"])
+            self.units[name] = state
+
+    def on_job_removed(self, msg, error=None, userdata=None):
+        self.signals += 1
+        try:
+            msg.process_reply(True)
+            # id, job, unit, result
+            name = msg.body[2]
+        except Exception:
+            logger.debug("Unable to parse JobRemoved signal", exc_info=True)
+            self.invalidate()
+            return
+
+        self.invalidate(name if isinstance(name, bytes) else name.encode())
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                logger.warning("systemd unit state listener failed", exc_info=True)
+            finally:
+                self.listening.clear()
+                self.invalidate()
+
+            time.sleep(LISTENER_RESTART_DELAY)
+
+    def _listen(self):
+        with self.bus_factory() as bus:
+            bus.match_signal(
+                SYSTEMD_DESTINATION, None, b"org.freedesktop.DBus.Properties", b"PropertiesChanged",
+                self.on_properties_changed, None,
+            )
+            bus.match_signal(
+                SYSTEMD_DESTINATION, SYSTEMD_PATH, b"org.freedesktop.systemd1.Manager", b"JobRemoved",
+                self.on_job_removed, None,
+            )
+
+            # systemd only emits signals when there is at least one subscriber
+            manager = self.manager_factory(bus=bus)
+            manager.load()
+            manager.Manager.Subscribe()
+
+            self.listening.set()
+
+            fd = bus.get_fd()
+            while True:
+                # Signals received during the `Subscribe` call (or along with the previous ones) are already read
+                # from the socket and `select` would not wake up for them
+                self._process(bus)
+                select.select([fd], [], [], LISTENER_TIMEOUT)
+
+    def _process(self, bus):
+        """
+        Process the messages queued on the bus connection until `sd_bus_process` has nothing to do.
+        """
+        while True:
+            signals = self.signals
+            # pystemd `process` returns the message that was not handled by any callback (an empty one if there was
+            # none) instead of the `sd_bus_process` return code. No signal dispatched and no message returned means
+            # that there was nothing to process.
+            if bus.process().is_empty() and self.signals == signals:
+                break
+
+
+UNIT_STATE_CACHE = UnitStateCache()
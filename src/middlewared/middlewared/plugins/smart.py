@@ -3,7 +3,6 @@ from datetime import datetime, timedelta, timezone
 import functools
 import re
 import time
-import json
 from typing import Any
 
 from humanize import ordinal
@@ -31,10 +30,10 @@ async def annotate_disk_smart_tests(middleware, tests_filter, disk):
     if disk["disk"] is None:
         return
 
-    output = await middleware.call("disk.smartctl", disk["disk"], ["-a", "--json=c"], {"silent": True})
-    if output is None:
+    # Self-test progress must be up to date
+    data = await middleware.call("disk.smart_data", disk["disk"], {"cache": None})
+    if data is None:
         return
-    data = json.loads(output)
 
     tests = parse_smart_selftest_results(data) or []
     current_test = parse_current_smart_selftest(data)
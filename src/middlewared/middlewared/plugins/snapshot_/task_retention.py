@@ -27,12 +27,10 @@ class PeriodicSnapshotTaskService(Service):
 
         result = defaultdict(list)
         if old != new:
-            old_snapshots = await self.middleware.call("zettarepl.periodic_snapshot_task_snapshots", old)
-            new_snapshots = await self.middleware.call("zettarepl.periodic_snapshot_task_snapshots", new)
-            if diff := old_snapshots - new_snapshots:
-                for snapshot in sorted(diff):
-                    dataset, snapshot = snapshot.split("@", 1)
-                    result[dataset].append(snapshot)
+            diff = await self.middleware.call("zettarepl.periodic_snapshot_task_snapshots_diff", old, new)
+            for snapshot in sorted(diff):
+                dataset, snapshot = snapshot.split("@", 1)
+                result[dataset].append(snapshot)
 
         return result
 
@@ -0,0 +1,112 @@
+import collections
+import contextlib
+import threading
+import time
+
+import libvirt
+
+from .supervisor.utils import DomainState
+
+# Lifecycle events keep domain states up to date, however, we still reconcile them with libvirt this often in case
+# any event was missed
+DOMAIN_STATES_RECONCILE_INTERVAL = 300
+
+DomainStateEntry = collections.namedtuple('DomainStateEntry', ['state', 'active'])
+
+
+def get_domain_state_entry(domain):
+    return DomainStateEntry(DomainState(domain.state()[0]), bool(domain.isActive()))
+
+
+class DomainStates:
+    """
+    libvirt domain name -> `DomainStateEntry` of all the domains defined in libvirt.
+
+    Entries are updated by libvirt domain lifecycle events and reconciled in bulk with `listAllDomains` whenever
+    libvirt connection changes, so that VM statuses can be reported without querying libvirt for each VM.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Serializes reconciliations (they share `updated`)
+        self.reconcile_lock = threading.Lock()
+        self.states = {}
+        self.connection = None
+        self.reconciled_at = None
+        # Names of the domains updated by events while reconciliation is in progress
+        self.updated = None
+
+    def update(self, domain):
+        """Update state of `domain` (called when a lifecycle event for it is received)."""
+        try:
+            entry = get_domain_state_entry(domain)
+        except libvirt.libvirtError:
+            # Domain has been undefined
+            entry = None
+
+        with self.lock:
+            name = domain.name()
+            if entry is None:
+                self.states.pop(name, None)
+            else:
+                self.states[name] = entry
+
+            if self.updated is not None:
+                self.updated.add(name)
+
+    def reconcile(self, connection):
+        with self.reconcile_lock:
+            self._reconcile(connection)
+
+    def _reconcile(self, connection):
+        with self.lock:
+            self.updated = set()
+
+        try:
+            states = {}
+            for domain in connection.listAllDomains():
+                with contextlib.suppress(libvirt.libvirtError):
+                    states[domain.name()] = get_domain_state_entry(domain)
+        finally:
+            with self.lock:
+                updated, self.updated = self.updated, None
+
+        with self.lock:
+            # Events received while we were listing domains are more recent than what we have listed
+            for name in updated:
+                if name in self.states:
+                    states[name] = self.states[name]
+                else:
+                    states.pop(name, None)
+
+            self.states = states
+            self.connection = connection
+            self.reconciled_at = time.monotonic()
+
+    def _needs_reconcile(self, connection):
+        with self.lock:
+            return self.connection is not connection or (
+                time.monotonic() - self.reconciled_at >= DOMAIN_STATES_RECONCILE_INTERVAL
+            )
+
+    def get_states(self, connection):
+        """
+        Returns states of all the domains defined in libvirt `connection`. They are reconciled with libvirt first
+        if the connection has changed since the last time (or if it has not been done in a while).
+        """
+        if self._needs_reconcile(connection):
+            with self.reconcile_lock:
+                # Another caller might have reconciled the states while we were waiting for the lock
+                if self._needs_reconcile(connection):
+                    self._reconcile(connection)
+
+        with self.lock:
+            return dict(self.states)
+
+    def clear(self):
+        with self.lock:
+            self.states = {}
+            self.connection = None
+
+
+DOMAIN_STATES = DomainStates()
@@ -4,6 +4,7 @@ import threading
 from middlewared.service import private, Service
 
 from .connection import LibvirtConnectionMixin
+from .domain_states import DOMAIN_STATES
 
 
 class VMService(Service, LibvirtConnectionMixin):
@@ -24,6 +25,9 @@ class VMService(Service, LibvirtConnectionMixin):
             7: 'PMSUSPENDED'
             Above is event mapping for internal reference
             """
+            # This needs to be done first so that `vm.query` below reports the new state
+            DOMAIN_STATES.update(dom)
+
             vm_id = dom.name().split('_')[0]
             vm = None
             if vm_id.isdigit():
@@ -78,3 +82,5 @@ class VMService(Service, LibvirtConnectionMixin):
         event_thread.start()
         self.LIBVIRT_CONNECTION.domainEventRegister(callback, None)
         self.LIBVIRT_CONNECTION.setKeepAlive(5, 3)
+        # Events are only received from now on
+        DOMAIN_STATES.reconcile(self.LIBVIRT_CONNECTION)
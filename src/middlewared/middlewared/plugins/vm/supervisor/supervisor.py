@@ -13,7 +13,7 @@ from middlewared.plugins.vm.devices import CDROM, DISK, NIC, PCI, RAW, DISPLAY,
 from middlewared.plugins.vm.utils import ACTIVE_STATES
 
 from .domain_xml import domain_children
-from .utils import create_element, DomainState
+from .utils import create_element, DomainState, get_domain_status
 
 
 class VMSupervisor(LibvirtConnectionMixin):
@@ -67,25 +67,7 @@ class VMSupervisor(LibvirtConnectionMixin):
 
     def status(self):
         domain = self.domain
-        domain_state = DomainState(domain.state()[0])
-        pid_path = os.path.join('/var/run/libvirt', 'qemu', f'{self.libvirt_domain_name}.pid')
-        if domain.isActive():
-            state = 'SUSPENDED' if domain_state == DomainState.PAUSED else 'RUNNING'
-        else:
-            state = 'STOPPED'
-
-        data = {
-            'state': state,
-            'pid': None,
-            'domain_state': domain_state.name,
-        }
-        if domain_state in (DomainState.PAUSED, DomainState.RUNNING):
-            with contextlib.suppress(FileNotFoundError):
-                # Do not make a stat call to check if file exists or not
-                with open(pid_path, 'r') as f:
-                    data['pid'] = int(f.read())
-
-        return data
+        return get_domain_status(self.libvirt_domain_name, DomainState(domain.state()[0]), domain.isActive())
 
     def memory_usage(self):
         # We return this in bytes
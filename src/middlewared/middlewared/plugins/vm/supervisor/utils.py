@@ -1,5 +1,7 @@
+import contextlib
 import enum
 import libvirt
+import os
 
 from middlewared.plugins.vm.utils import create_element  # noqa
 
@@ -13,3 +15,23 @@ class DomainState(enum.Enum):
     SHUTOFF = libvirt.VIR_DOMAIN_SHUTOFF
     CRASHED = libvirt.VIR_DOMAIN_CRASHED
     PMSUSPENDED = libvirt.VIR_DOMAIN_PMSUSPENDED
+
+
+def get_domain_status(domain_name, domain_state, active):
+    if active:
+        state = 'SUSPENDED' if domain_state == DomainState.PAUSED else 'RUNNING'
+    else:
+        state = 'STOPPED'
+
+    data = {
+        'state': state,
+        'pid': None,
+        'domain_state': domain_state.name,
+    }
+    if domain_state in (DomainState.PAUSED, DomainState.RUNNING):
+        with contextlib.suppress(FileNotFoundError):
+            # Do not make a stat call to check if file exists or not
+            with open(os.path.join('/var/run/libvirt', 'qemu', f'{domain_name}.pid'), 'r') as f:
+                data['pid'] = int(f.read())
+
+    return data
@@ -3,6 +3,7 @@ import contextlib
 from middlewared.service import CallError
 
 from .connection import LibvirtConnectionMixin
+from .domain_states import DOMAIN_STATES
 from .supervisor import VMSupervisor
 from .utils import ACTIVE_STATES
 
@@ -63,25 +64,40 @@ class VMSupervisorMixin(LibvirtConnectionMixin):
         if configured_status not in desired_status:
             raise CallError(f'VM state is currently not {" / ".join(desired_status)!r}')
 
+    @contextlib.contextmanager
+    def _updating_domain_state(self, vm_name):
+        try:
+            yield
+        finally:
+            # Lifecycle events are received asynchronously, update the domain state right away so that the checks
+            # following the action (i.e. `vm.start` after `vm.stop` in `vm.restart`) do not see the previous one
+            if domain := self.vms[vm_name].domain:
+                DOMAIN_STATES.update(domain)
+
     def _start(self, vm_name):
         self._check_add_domain(vm_name)
-        self.vms[vm_name].start(vm_data=self._vm_from_name(vm_name))
+        with self._updating_domain_state(vm_name):
+            self.vms[vm_name].start(vm_data=self._vm_from_name(vm_name))
 
     def _poweroff(self, vm_name):
         self._check_domain_status(vm_name, ACTIVE_STATES)
-        self.vms[vm_name].poweroff()
+        with self._updating_domain_state(vm_name):
+            self.vms[vm_name].poweroff()
 
     def _stop(self, vm_name, shutdown_timeout):
         self._check_domain_status(vm_name)
-        self.vms[vm_name].stop(shutdown_timeout)
+        with self._updating_domain_state(vm_name):
+            self.vms[vm_name].stop(shutdown_timeout)
 
     def _suspend(self, vm_name):
         self._check_domain_status(vm_name)
-        self.vms[vm_name].suspend()
+        with self._updating_domain_state(vm_name):
+            self.vms[vm_name].suspend()
 
     def _resume(self, vm_name):
         self._check_domain_status(vm_name, 'SUSPENDED')
-        self.vms[vm_name].resume()
+        with self._updating_domain_state(vm_name):
+            self.vms[vm_name].resume()
 
     def _status(self, vm_name):
         self._check_setup_connection()
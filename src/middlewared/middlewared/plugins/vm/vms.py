@@ -1,6 +1,7 @@
 import asyncio
 import errno
 import functools
+import libvirt
 import os
 import re
 import shlex
@@ -20,6 +21,8 @@ from middlewared.plugins.zfs_.utils import zvol_path_to_name
 from middlewared.service import CallError, CRUDService, item_method, job, private, ValidationErrors
 from middlewared.plugins.vm.numeric_set import parse_numeric_set
 
+from .domain_states import DOMAIN_STATES
+from .supervisor.utils import get_domain_status
 from .utils import ACTIVE_STATES, get_default_status, get_vm_nvram_file_name, SYSTEM_NVRAM_FOLDER_PATH
 from .vm_supervisor import VMSupervisorMixin
 
@@ -97,8 +100,16 @@ class VMService(CRUDService, VMSupervisorMixin):
             self._safely_check_setup_connection(5)
 
         libvirt_running = shutting_down is False and self._is_connection_alive()
+        domain_states = {}
+        if libvirt_running and rows:
+            try:
+                domain_states = DOMAIN_STATES.get_states(self.LIBVIRT_CONNECTION)
+            except libvirt.libvirtError:
+                self.logger.debug('Failed to retrieve libvirt domain states', exc_info=True)
+                libvirt_running = False
+
         for row in rows:
-            status[row['id']] = self.status_impl(row) if libvirt_running else get_default_status()
+            status[row['id']] = self.cached_status_impl(row, domain_states) if libvirt_running else get_default_status()
 
         return {
             'status': status,
@@ -431,6 +442,15 @@ class VMService(CRUDService, VMSupervisorMixin):
 
         return get_default_status()
 
+    @private
+    def cached_status_impl(self, vm, domain_states):
+        # Same as `status_impl` but uses domain states kept up to date by libvirt events
+        domain_name = f'{vm["id"]}_{vm["name"]}'
+        if vm['name'] in self.vms and (entry := domain_states.get(domain_name)):
+            return get_domain_status(domain_name, entry.state, entry.active)
+
+        return get_default_status()
+
     @api_method(VMLogFilePathArgs, VMLogFilePathResult, roles=['VM_READ'])
     def log_file_path(self, vm_id):
         """
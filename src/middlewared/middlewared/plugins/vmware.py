@@ -1,4 +1,5 @@
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import errno
 import socket
@@ -14,7 +15,11 @@ from middlewared.utils.time_utils import utc_now
 from pyVim import connect, task as VimTask
 from pyVmomi import vim, vmodl
 
+from .vmware_.inventory import VMInventory
+
 NFS_VOLUME_TYPES = ('NFS', 'NFS41')
+# Maximum number of VM snapshots created at the same time
+VMWARE_SNAPSHOT_WORKERS = 8
 
 
 class VMWareModel(sa.Model):
@@ -249,10 +254,11 @@ class VMWareService(CRUDService):
                 "matches": matches,
             })
 
-        ip_addresses = sum([
-            [alias["address"] for alias in interface["state"]["aliases"] if alias["type"] in ["INET", "INET6"]]
+        ip_addresses = [
+            alias["address"]
             for interface in self.middleware.call_sync("interface.query")
-        ], [])
+            for alias in interface["state"]["aliases"] if alias["type"] in ["INET", "INET6"]
+        ]
         iscsi_extents = defaultdict(list)
         for extent in self.middleware.call_sync("iscsi.extent.query", [], {"select": ["path", "naa"]}):
             if extent["path"].startswith("zvol/"):
@@ -282,13 +288,17 @@ class VMWareService(CRUDService):
                     "matches": iscsi_extents[fs["name"]],
                 })
 
+        filesystems_by_match = defaultdict(set)
+        for i, filesystem in enumerate(filesystems):
+            for match in filesystem.pop("matches"):
+                filesystems_by_match[match].add(i)
+
         for datastore in datastores:
-            datastore["filesystems"] = [filesystem["name"] for filesystem in filesystems
-                                        if set(filesystem["matches"]) & set(datastore["matches"])]
-            datastore.pop("matches")
+            matched = set()
+            for match in datastore.pop("matches"):
+                matched.update(filesystems_by_match.get(match, set()))
 
-        for filesystem in filesystems:
-            filesystem.pop("matches")
+            datastore["filesystems"] = [filesystems[i]["name"] for i in sorted(matched)]
 
         return {
             "datastores": sorted(datastores, key=lambda datastore: datastore["name"]),
@@ -397,75 +407,23 @@ class VMWareService(CRUDService):
         # then take the ZFS snapshot, then iterate again over all the VMWare "tasks" and undo
         # all the snaps we created in the first place.
         vmsnapobjs = []
-        for vmsnapobj in qs:
-            # Data structures that will be used to keep track of VMs that are snapped,
-            # as wel as VMs we tried to snap and failed, and VMs we realized we couldn't
-            # snapshot.
-            snapvms = []
-            snapvmfails = []
-            snapvmskips = []
-
-            try:
-                si = self.connect(vmsnapobj)
-                content = si.RetrieveContent()
-            except Exception as e:
-                self.logger.warning("VMware login to %s failed", vmsnapobj["hostname"], exc_info=True)
-                self.alert_vmware_login_failed(vmsnapobj, e)
-                continue
-
-            # There's no point to even consider VMs that are paused or powered off.
-            vm_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-            for vm in vm_view.view:
-                if vm.summary.runtime.powerState != "poweredOn":
+        sessions = {}
+        try:
+            for vmsnapobj in qs:
+                try:
+                    session = self.vsphere_session(sessions, vmsnapobj)
+                except Exception as e:
+                    self.logger.warning("VMware login to %s failed", vmsnapobj["hostname"], exc_info=True)
+                    self.alert_vmware_login_failed(vmsnapobj, e)
                     continue
 
-                if self._doesVMDependOnDataStore(vm, vmsnapobj["datastore"]):
-                    try:
-                        if self._canSnapshotVM(vm):
-                            if not self._findVMSnapshotByName(vm, vmsnapname):
-                                # have we already created a snapshot of the VM for this volume
-                                # iteration? can happen if the VM uses two datasets (a and b)
-                                # where both datasets are mapped to the same ZFS volume in TrueNAS.
-                                VimTask.WaitForTask(vm.CreateSnapshot_Task(
-                                    name=vmsnapname,
-                                    description=vmsnapdescription,
-                                    memory=False, quiesce=True,
-                                ))
-                            else:
-                                self.logger.debug("Not creating snapshot %s for VM %s because it "
-                                                  "already exists", vmsnapname, vm)
-                        else:
-                            # TODO:
-                            # we can try to shutdown the VM, if the user provided us an ok to do
-                            # so (might need a new list property in obj to know which VMs are
-                            # fine to shutdown and a UI to specify such exceptions)
-                            # otherwise can skip VM snap and then make a crash-consistent zfs
-                            # snapshot for this VM
-                            self.logger.info("Can't snapshot VM %s that depends on "
-                                             "datastore %s and filesystem %s. "
-                                             "Possibly using PT devices. Skipping.",
-                                             vm.name, vmsnapobj["datastore"], dataset)
-                            snapvmskips.append([vm.config.uuid, vm.name])
-                    except Exception as e:
-                        self.logger.warning("Snapshot of VM %s failed", vm.name, exc_info=True)
-                        self.middleware.call_sync("alert.oneshot_create", "VMWareSnapshotCreateFailed", {
-                            "hostname": vmsnapobj["hostname"],
-                            "vm": vm.name,
-                            "snapshot": vmsnapname,
-                            "error": self._vmware_exception_message(e),
-                        })
-                        snapvmfails.append([vm.config.uuid, vm.name])
-
-                    snapvms.append(vm.config.uuid)
-
-            self.disconnect(si)
-
-            vmsnapobjs.append({
-                "vmsnapobj": vmsnapobj,
-                "snapvms": snapvms,
-                "snapvmfails": snapvmfails,
-                "snapvmskips": snapvmskips,
-            })
+                vmsnapobjs.append({
+                    "vmsnapobj": vmsnapobj,
+                    **self.snapshot_vms(dataset, vmsnapobj, session, vmsnapname, vmsnapdescription),
+                })
+        finally:
+            for session in sessions.values():
+                self.disconnect(session["si"])
 
         # At this point we've completed snapshotting VMs.
 
@@ -479,44 +437,144 @@ class VMWareService(CRUDService):
                                            for vmsnapobj in vmsnapobjs)
         }
 
+    @private
+    def vsphere_session(self, sessions, vmsnapobj):
+        """
+        Connection to the vSphere server of `vmsnapobj` along with its VM inventory. These are shared (through
+        `sessions`) by all the VMWare "tasks" that use the same server during a snapshot run.
+        """
+        key = (vmsnapobj["hostname"], vmsnapobj["username"], vmsnapobj["password"])
+        if key not in sessions:
+            si = self.connect(vmsnapobj)
+            try:
+                inventory = VMInventory.retrieve(si.RetrieveContent())
+            except Exception:
+                self.disconnect(si)
+                raise
+
+            sessions[key] = {
+                "si": si,
+                "inventory": inventory,
+                # managed object ids of the VMs that were snapshotted during this run
+                "snapshotted": set(),
+            }
+
+        return sessions[key]
+
+    @private
+    def snapshot_vms(self, dataset, vmsnapobj, session, vmsnapname, vmsnapdescription):
+        # Data structures that will be used to keep track of VMs that are snapped,
+        # as wel as VMs we tried to snap and failed, and VMs we realized we couldn't
+        # snapshot.
+        snapvms = []
+        snapvmfails = []
+        snapvmskips = []
+
+        todo = []
+        # There's no point to even consider VMs that are paused or powered off.
+        for vm in filter(lambda vm: vm["powered_on"], session["inventory"].depending_on(vmsnapobj["datastore"])):
+            snapvms.append(vm["uuid"])
+            if not vm["can_snapshot"]:
+                # TODO:
+                # we can try to shutdown the VM, if the user provided us an ok to do
+                # so (might need a new list property in obj to know which VMs are
+                # fine to shutdown and a UI to specify such exceptions)
+                # otherwise can skip VM snap and then make a crash-consistent zfs
+                # snapshot for this VM
+                self.logger.info("Can't snapshot VM %s that depends on "
+                                 "datastore %s and filesystem %s. "
+                                 "Possibly using PT devices. Skipping.",
+                                 vm["name"], vmsnapobj["datastore"], dataset)
+                snapvmskips.append([vm["uuid"], vm["name"]])
+            elif vm["vm"]._moId in session["snapshotted"]:
+                # have we already created a snapshot of the VM for this volume
+                # iteration? can happen if the VM uses two datasets (a and b)
+                # where both datasets are mapped to the same ZFS volume in TrueNAS.
+                self.logger.debug("Not creating snapshot %s for VM %s because it "
+                                  "already exists", vmsnapname, vm["name"])
+            else:
+                session["snapshotted"].add(vm["vm"]._moId)
+                todo.append(vm)
+
+        def create_snapshot(vm):
+            try:
+                VimTask.WaitForTask(vm["vm"].CreateSnapshot_Task(
+                    name=vmsnapname,
+                    description=vmsnapdescription,
+                    memory=False, quiesce=True,
+                ))
+            except Exception as e:
+                self.logger.warning("Snapshot of VM %s failed", vm["name"], exc_info=True)
+                self.middleware.call_sync("alert.oneshot_create", "VMWareSnapshotCreateFailed", {
+                    "hostname": vmsnapobj["hostname"],
+                    "vm": vm["name"],
+                    "snapshot": vmsnapname,
+                    "error": self._vmware_exception_message(e),
+                })
+                return False
+
+            return True
+
+        if todo:
+            with ThreadPoolExecutor(min(VMWARE_SNAPSHOT_WORKERS, len(todo)), "vmware_snapshot") as executor:
+                for vm, created in zip(todo, executor.map(create_snapshot, todo)):
+                    if not created:
+                        snapvmfails.append([vm["uuid"], vm["name"]])
+                        # Let the next VMWare "task" that depends on this VM try again
+                        session["snapshotted"].discard(vm["vm"]._moId)
+
+        return {
+            "snapvms": snapvms,
+            "snapvmfails": snapvmfails,
+            "snapvmskips": snapvmskips,
+        }
+
     @private
     def snapshot_end(self, context):
         self.middleware.call_sync('network.general.will_perform_activity', 'vmware')
 
         vmsnapname = context["vmsnapname"]
 
-        for elem in context["vmsnapobjs"]:
-            vmsnapobj = elem["vmsnapobj"]
+        sessions = {}
+        try:
+            for elem in context["vmsnapobjs"]:
+                vmsnapobj = elem["vmsnapobj"]
+
+                try:
+                    session = self.vsphere_session(sessions, vmsnapobj)
+                    self.delete_vmware_login_failed_alert(vmsnapobj)
+                except Exception as e:
+                    self.logger.warning("VMware login failed to %s", vmsnapobj["hostname"])
+                    self.alert_vmware_login_failed(vmsnapobj, e)
+                    for vm_uuid in elem["snapvms"]:
+                        self.middleware.call_sync("vmware.defer_deleting_snapshot", vmsnapobj, vm_uuid, vmsnapname)
+                    continue
 
-            try:
-                si = self.connect(vmsnapobj)
-                self.delete_vmware_login_failed_alert(vmsnapobj)
-            except Exception as e:
-                self.logger.warning("VMware login failed to %s", vmsnapobj["hostname"])
-                self.alert_vmware_login_failed(vmsnapobj, e)
+                # vm is an object, so we'll dereference that object anywhere it's user facing.
                 for vm_uuid in elem["snapvms"]:
-                    self.middleware.call_sync("vmware.defer_deleting_snapshot", vmsnapobj, vm_uuid, vmsnapname)
-                continue
-
-            # vm is an object, so we'll dereference that object anywhere it's user facing.
-            for vm_uuid in elem["snapvms"]:
-                for vm in self.find_vms_by_uuid(si, vm_uuid):
-                    if [vm_uuid, vm.name] not in elem["snapvmfails"] and [vm_uuid, vm.name] not in elem["snapvmskips"]:
-                        try:
-                            self.delete_snapshot(vm, vmsnapname)
-                        except Exception as e:
-                            self.logger.debug(
-                                "Exception removing snapshot %s on %s", vmsnapname, vm.name, exc_info=True
-                            )
-                            self.middleware.call_sync("alert.oneshot_create", "VMWareSnapshotDeleteFailed", {
-                                "hostname": vmsnapobj["hostname"],
-                                "vm": vm.name,
-                                "snapshot": vmsnapname,
-                                "error": self._vmware_exception_message(e),
-                            })
-                            self.middleware.call_sync("vmware.defer_deleting_snapshot", vmsnapobj, vm_uuid, vmsnapname)
-
-            self.disconnect(si)
+                    for vm in session["inventory"].by_uuid.get(vm_uuid, []):
+                        if (
+                            [vm_uuid, vm["name"]] not in elem["snapvmfails"] and
+                            [vm_uuid, vm["name"]] not in elem["snapvmskips"]
+                        ):
+                            try:
+                                self.delete_snapshot(vm["vm"], vmsnapname)
+                            except Exception as e:
+                                self.logger.debug(
+                                    "Exception removing snapshot %s on %s", vmsnapname, vm["name"], exc_info=True
+                                )
+                                self.middleware.call_sync("alert.oneshot_create", "VMWareSnapshotDeleteFailed", {
+                                    "hostname": vmsnapobj["hostname"],
+                                    "vm": vm["name"],
+                                    "snapshot": vmsnapname,
+                                    "error": self._vmware_exception_message(e),
+                                })
+                                self.middleware.call_sync(
+                                    "vmware.defer_deleting_snapshot", vmsnapobj, vm_uuid, vmsnapname,
+                                )
+        finally:
+            for session in sessions.values():
+                self.disconnect(session["si"])
 
     @private
     def periodic_snapshot_task_begin(self, task_id):
@@ -571,43 +629,6 @@ class VMWareService(CRUDService):
         if snap:
             VimTask.WaitForTask(snap.RemoveSnapshot_Task(True))
 
-    # Check if a VM is using a certain datastore
-    def _doesVMDependOnDataStore(self, vm, dataStore):
-        try:
-            # simple case, VM config data is on a datastore.
-            # not sure how critical it is to snapshot the store that has config data, but best to do so
-            for i in vm.datastore:
-                if i.info.name.startswith(dataStore):
-                    return True
-            # check if VM has disks on the data store
-            # we check both "diskDescriptor" and "diskExtent" types of files
-            for device in vm.config.hardware.device:
-                if device.backing is None:
-                    continue
-                if hasattr(device.backing, 'fileName'):
-                    if device.backing.datastore is None:
-                        continue
-                    if device.backing.datastore.info.name == dataStore:
-                        return True
-        except Exception:
-            self.logger.debug('Exception in doesVMDependOnDataStore', exc_info=True)
-
-        return False
-
-    # check if VMware can snapshot a VM
-    def _canSnapshotVM(self, vm):
-        try:
-            # check for PCI pass-through devices
-            for device in vm.config.hardware.device:
-                if isinstance(device, vim.VirtualPCIPassthrough):
-                    return False
-            # consider supporting more cases of VMs that can't be snapshoted
-            # https://kb.vmware.com/selfservice/microsites/search.do?language=en_US&cmd=displayKC&externalId=1006392
-        except Exception:
-            self.logger.debug('Exception in canSnapshotVM', exc_info=True)
-
-        return True
-
     def _findVMSnapshotByName(self, vm, snapshotName):
         try:
             if vm.snapshot is None:
@@ -0,0 +1,121 @@
+from collections import defaultdict
+
+from pyVmomi import vim, vmodl
+
+VM_PROPERTIES = ["name", "config.uuid", "config.hardware.device", "runtime.powerState", "datastore"]
+
+
+def retrieve_objects(content, specs):
+    """
+    Retrieve properties of all managed objects below the root folder with a single PropertyCollector retrieval
+    (continued while the server pages the results). `specs` maps managed object types to the list of property
+    paths to retrieve.
+
+    Returns a list of `(managed object, {property path: value})`.
+    """
+    view = content.viewManager.CreateContainerView(content.rootFolder, list(specs), True)
+    try:
+        traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+            name="traverseView", path="view", skip=False, type=vim.view.ContainerView,
+        )
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal_spec])],
+            propSet=[
+                vmodl.query.PropertyCollector.PropertySpec(type=type_, pathSet=path_set, all=False)
+                for type_, path_set in specs.items()
+            ],
+        )
+
+        objects = []
+        collector = content.propertyCollector
+        result = collector.RetrievePropertiesEx([filter_spec], vmodl.query.PropertyCollector.RetrieveOptions())
+        while result is not None:
+            for object_content in result.objects:
+                objects.append((object_content.obj, {prop.name: prop.val for prop in object_content.propSet or []}))
+
+            if not result.token:
+                break
+
+            result = collector.ContinueRetrievePropertiesEx(result.token)
+
+        return objects
+    finally:
+        view.Destroy()
+
+
+def can_snapshot_vm(devices):
+    # check for PCI pass-through devices
+    # consider supporting more cases of VMs that can't be snapshoted
+    # https://kb.vmware.com/selfservice/microsites/search.do?language=en_US&cmd=displayKC&externalId=1006392
+    return not any(isinstance(device, vim.VirtualPCIPassthrough) for device in devices)
+
+
+class VMInventory:
+    """
+    Virtual machines of a vSphere server indexed by the datastores they depend on and by their UUID.
+    """
+
+    def __init__(self, objects):
+        datastore_names = {}
+        vms = []
+        for obj, props in objects:
+            if isinstance(obj, vim.Datastore):
+                datastore_names[obj._moId] = props.get("name")
+            elif isinstance(obj, vim.VirtualMachine):
+                vms.append((obj, props))
+
+        self.vms = []
+        self.by_uuid = defaultdict(list)
+        # VM config data is on these datastores
+        self.by_config_datastore = defaultdict(list)
+        # VM disks are on these datastores (we check both "diskDescriptor" and "diskExtent" types of files)
+        self.by_disk_datastore = defaultdict(list)
+        for obj, props in vms:
+            devices = props.get("config.hardware.device") or []
+            vm = {
+                "vm": obj,
+                "index": len(self.vms),
+                "name": props.get("name"),
+                "uuid": props.get("config.uuid"),
+                "powered_on": props.get("runtime.powerState") == "poweredOn",
+                "can_snapshot": can_snapshot_vm(devices),
+            }
+            self.vms.append(vm)
+            if vm["uuid"]:
+                self.by_uuid[vm["uuid"]].append(vm)
+
+            for datastore in set(
+                datastore_names.get(ds._moId) for ds in props.get("datastore") or []
+            ) - {None}:
+                self.by_config_datastore[datastore].append(vm)
+
+            disk_datastores = set()
+            for device in devices:
+                if device.backing is None or not hasattr(device.backing, "fileName"):
+                    continue
+                if device.backing.datastore is None:
+                    continue
+                if datastore := datastore_names.get(device.backing.datastore._moId):
+                    disk_datastores.add(datastore)
+
+            for datastore in disk_datastores:
+                self.by_disk_datastore[datastore].append(vm)
+
+    @classmethod
+    def retrieve(cls, content):
+        return cls(retrieve_objects(content, {
+            vim.Datastore: ["name"],
+            vim.VirtualMachine: VM_PROPERTIES,
+        }))
+
+    def depending_on(self, datastore):
+        """
+        VMs that have their config data on a datastore which name starts with `datastore` or disks on `datastore`.
+        """
+        vms = {}
+        for name, datastore_vms in self.by_config_datastore.items():
+            if name.startswith(datastore):
+                vms.update({vm["index"]: vm for vm in datastore_vms})
+
+        vms.update({vm["index"]: vm for vm in self.by_disk_datastore.get(datastore, [])})
+        return [vms[index] for index in sorted(vms)]
@@ -0,0 +1,130 @@
+from collections import defaultdict
+import threading
+
+from zettarepl.snapshot.name import parse_snapshot_name
+
+# Periodic snapshot task definition keys that determine which snapshots the task owns. Other keys (i.e. lifetime)
+# only affect when the owned snapshots are destroyed.
+OWNERSHIP_DEFINITION_KEYS = ("dataset", "recursive", "exclude", "naming-schema", "schedule")
+
+
+class SnapshotNameCache:
+    """
+    Results of parsing snapshot names with naming schemas, kept for each dataset.
+
+    Parsing snapshot names is what makes computing retention for hundreds of thousands of snapshots slow.
+    Parsing result only depends on the snapshot name and the naming schema so cached entries never go stale;
+    they are only dropped when the snapshots (or their datasets) are destroyed to keep the cache bounded.
+    """
+
+    def __init__(self, parse=parse_snapshot_name):
+        self.parse_fn = parse
+        self.lock = threading.Lock()
+        # dataset -> snapshot name -> naming schema -> parsed snapshot name (or `None` if it does not match)
+        self.datasets = defaultdict(dict)
+
+    def parse(self, dataset, name, naming_schema):
+        with self.lock:
+            try:
+                return self.datasets[dataset][name][naming_schema]
+            except KeyError:
+                pass
+
+        try:
+            parsed = self.parse_fn(name, naming_schema)
+        except ValueError:
+            parsed = None
+
+        with self.lock:
+            # `sync` might have replaced the dataset entries while we were parsing
+            self.datasets[dataset].setdefault(name, {})[naming_schema] = parsed
+
+        return parsed
+
+    def sync(self, snapshots):
+        """
+        Drop cached entries of snapshots that are no longer present in the complete listing of `snapshots`
+        of the datasets they belong to.
+        """
+        present = defaultdict(set)
+        for snapshot in snapshots:
+            present[snapshot.dataset].add(snapshot.name)
+
+        with self.lock:
+            for dataset, names in present.items():
+                if (cached := self.datasets.get(dataset)) and len(cached) > len(names):
+                    self.datasets[dataset] = {k: v for k, v in cached.items() if k in names}
+
+    def remove_snapshot(self, dataset, name, recursive=False):
+        with self.lock:
+            for cached_dataset, names in list(self.datasets.items()):
+                if cached_dataset == dataset or recursive and cached_dataset.startswith(f"{dataset}/"):
+                    names.pop(name, None)
+
+    def remove_dataset(self, dataset):
+        with self.lock:
+            for cached_dataset in list(self.datasets.keys()):
+                if cached_dataset == dataset or cached_dataset.startswith(f"{dataset}/"):
+                    self.datasets.pop(cached_dataset)
+
+    def clear(self):
+        with self.lock:
+            self.datasets.clear()
+
+
+SNAPSHOT_NAME_CACHE = SnapshotNameCache()
+
+
+class SnapshotOwnerMatcher:
+    """
+    Wraps zettarepl `PeriodicSnapshotTaskSnapshotOwner` to answer which snapshots the owner's task owns using
+    `SnapshotNameCache`.
+    """
+
+    def __init__(self, snapshot_owner, cache=SNAPSHOT_NAME_CACHE):
+        self.snapshot_owner = snapshot_owner
+        self.naming_schema = snapshot_owner.periodic_snapshot_task.naming_schema
+        self.cache = cache
+        self.owned_datasets = {}
+
+    def owns_dataset(self, dataset):
+        try:
+            return self.owned_datasets[dataset]
+        except KeyError:
+            owns = self.owned_datasets[dataset] = self.snapshot_owner.owns_dataset(dataset)
+            return owns
+
+    def owns_snapshot(self, dataset, name):
+        """
+        Returns parsed snapshot name if the snapshot is owned by the task and `None` otherwise.
+        """
+        if not self.owns_dataset(dataset):
+            return None
+
+        parsed_snapshot_name = self.cache.parse(dataset, name, self.naming_schema)
+        if parsed_snapshot_name is None or not self.snapshot_owner.owns_snapshot(dataset, parsed_snapshot_name):
+            return None
+
+        return parsed_snapshot_name
+
+
+def ownership_changed(old_definition, new_definition):
+    return any(old_definition[k] != new_definition[k] for k in OWNERSHIP_DEFINITION_KEYS)
+
+
+def owned_snapshots(matcher, snapshots):
+    return {str(snapshot) for snapshot in snapshots if matcher.owns_snapshot(snapshot.dataset, snapshot.name)}
+
+
+def owned_snapshots_diff(old_matcher, new_matcher, snapshots):
+    """
+    Returns snapshots owned by `old_matcher` task that are not owned by `new_matcher` task.
+    """
+    return {
+        str(snapshot)
+        for snapshot in snapshots
+        if (
+            old_matcher.owns_snapshot(snapshot.dataset, snapshot.name) and
+            not new_matcher.owns_snapshot(snapshot.dataset, snapshot.name)
+        )
+    }
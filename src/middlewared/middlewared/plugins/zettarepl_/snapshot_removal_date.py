@@ -13,6 +13,10 @@ from zettarepl.snapshot.task.snapshot_owner import PeriodicSnapshotTaskSnapshotO
 from zettarepl.snapshot.task.task import PeriodicSnapshotTask
 from zettarepl.transport.local import LocalShell
 
+from .retention import (
+    owned_snapshots, owned_snapshots_diff, ownership_changed, SNAPSHOT_NAME_CACHE, SnapshotOwnerMatcher,
+)
+
 
 class ZettareplService(Service):
     removal_dates = defaultdict(dict)
@@ -55,23 +59,35 @@ class ZettareplService(Service):
 
     def periodic_snapshot_task_snapshots(self, task):
         snapshots = list_snapshots(LocalShell(), task["dataset"], task["recursive"])
-        zettarepl_task = PeriodicSnapshotTask.from_data(None, self.middleware.call_sync(
-            "zettarepl.periodic_snapshot_task_definition", task,
-        ))
-        snapshot_owner = PeriodicSnapshotTaskSnapshotOwner(utc_now(), zettarepl_task)
-
-        task_snapshots = set()
-        for snapshot in snapshots:
-            if snapshot_owner.owns_dataset(snapshot.dataset):
-                try:
-                    parsed_snapshot_name = parse_snapshot_name(snapshot.name, task["naming_schema"])
-                except ValueError:
-                    pass
-                else:
-                    if snapshot_owner.owns_snapshot(snapshot.dataset, parsed_snapshot_name):
-                        task_snapshots.add(str(snapshot))
-
-        return task_snapshots
+        SNAPSHOT_NAME_CACHE.sync(snapshots)
+        return owned_snapshots(self._snapshot_owner_matcher(task), snapshots)
+
+    def periodic_snapshot_task_snapshots_diff(self, old, new):
+        """
+        Returns snapshots that are owned by periodic snapshot task `old` but will not be owned by it once it is
+        updated to `new`.
+        """
+        old_definition = self.middleware.call_sync("zettarepl.periodic_snapshot_task_definition", old)
+        new_definition = self.middleware.call_sync("zettarepl.periodic_snapshot_task_definition", new)
+        if not ownership_changed(old_definition, new_definition):
+            return set()
+
+        # Only snapshots owned by the old task can end up in the diff so there is no need to list the new ones
+        snapshots = list_snapshots(LocalShell(), old["dataset"], old["recursive"])
+        SNAPSHOT_NAME_CACHE.sync(snapshots)
+        return owned_snapshots_diff(
+            self._snapshot_owner_matcher(old, old_definition),
+            self._snapshot_owner_matcher(new, new_definition),
+            snapshots,
+        )
+
+    def _snapshot_owner_matcher(self, task, definition=None):
+        if definition is None:
+            definition = self.middleware.call_sync("zettarepl.periodic_snapshot_task_definition", task)
+
+        return SnapshotOwnerMatcher(
+            PeriodicSnapshotTaskSnapshotOwner(utc_now(), PeriodicSnapshotTask.from_data(task.get("id"), definition))
+        )
 
     def fixate_removal_date(self, datasets, task):
         property_name = self.middleware.call_sync("pool.snapshottask.removal_date_property")
@@ -107,35 +123,23 @@ class ZettareplService(Service):
 
     def annotate_snapshots(self, snapshots):
         property_name = self.middleware.call_sync("pool.snapshottask.removal_date_property")
-        zettarepl_tasks = [
-            PeriodicSnapshotTask.from_data(task["id"], self.middleware.call_sync(
-                "zettarepl.periodic_snapshot_task_definition", task,
-            ))
+        matchers = [
+            self._snapshot_owner_matcher(task)
             for task in self.middleware.call_sync("pool.snapshottask.query", [["enabled", "=", True]])
         ]
-        snapshot_owners = [
-            PeriodicSnapshotTaskSnapshotOwner(utc_now(), zettarepl_task)
-            for zettarepl_task in zettarepl_tasks
-        ]
 
         for snapshot in snapshots:
             task_destroy_at = None
             task_destroy_at_id = None
-            for snapshot_owner in snapshot_owners:
-                if snapshot_owner.owns_dataset(snapshot["dataset"]):
-                    try:
-                        parsed_snapshot_name = parse_snapshot_name(
-                            snapshot["snapshot_name"], snapshot_owner.periodic_snapshot_task.naming_schema
-                        )
-                    except ValueError:
-                        pass
-                    else:
-                        if snapshot_owner.owns_snapshot(snapshot["dataset"], parsed_snapshot_name):
-                            destroy_at = parsed_snapshot_name.datetime + snapshot_owner.periodic_snapshot_task.lifetime
+            for matcher in matchers:
+                parsed_snapshot_name = matcher.owns_snapshot(snapshot["dataset"], snapshot["snapshot_name"])
+                if parsed_snapshot_name is not None:
+                    periodic_snapshot_task = matcher.snapshot_owner.periodic_snapshot_task
+                    destroy_at = parsed_snapshot_name.datetime + periodic_snapshot_task.lifetime
 
-                            if task_destroy_at is None or task_destroy_at < destroy_at:
-                                task_destroy_at = destroy_at
-                                task_destroy_at_id = snapshot_owner.periodic_snapshot_task.id
+                    if task_destroy_at is None or task_destroy_at < destroy_at:
+                        task_destroy_at = destroy_at
+                        task_destroy_at_id = periodic_snapshot_task.id
 
             property_destroy_at = None
             if property_name in snapshot["properties"]:
@@ -172,6 +176,19 @@ async def pool_configuration_change(middleware, *args, **kwargs):
     middleware.create_task(middleware.call("zettarepl.load_removal_dates"))
 
 
+async def on_snapshot_event(middleware, event_type, args):
+    if event_type == "REMOVED":
+        dataset, snapshot = args["id"].split("@", 1)
+        SNAPSHOT_NAME_CACHE.remove_snapshot(dataset, snapshot, args.get("recursive", False))
+
+
+async def on_dataset_event(middleware, event_type, args):
+    if event_type == "REMOVED":
+        SNAPSHOT_NAME_CACHE.remove_dataset(args["id"])
+
+
 async def setup(middleware):
     middleware.create_task(middleware.call("zettarepl.load_removal_dates"))
     middleware.register_hook("pool.post_import", pool_configuration_change)
+    middleware.event_subscribe("zfs.snapshot.query", on_snapshot_event)
+    middleware.event_subscribe("pool.dataset.query", on_dataset_event)
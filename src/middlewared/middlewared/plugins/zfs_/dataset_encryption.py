@@ -159,6 +159,25 @@ class ZFSDatasetService(Service):
             self.logger.error(f'Failed to check key for {id_}', exc_info=True)
             raise CallError(f'Failed to check key for {id_}: {e}')
 
+    @accepts(Dict('keys', additional_attrs=True))
+    def check_keys(self, keys):
+        """
+        Check `keys` (dataset name -> key) in one call. Returns dataset name -> `true` if the key is valid, `false`
+        if it is not or if it could not be checked.
+        """
+        result = {}
+        with libzfs.ZFS() as zfs:
+            for id_, key in keys.items():
+                try:
+                    ds = zfs.get_dataset(id_)
+                    self.common_encryption_checks(id_, ds)
+                    result[id_] = ds.check_key(key=key)
+                except (libzfs.ZFSException, CallError) as e:
+                    self.logger.debug('Failed to check key for %r: %s', id_, e)
+                    result[id_] = False
+
+        return result
+
     @accepts(
         Str('id'),
         Dict(
@@ -2,6 +2,9 @@ import libzfs
 
 from middlewared.plugins.zfs_.utils import TNUserProp
 from middlewared.service import CallError, Service
+from middlewared.utils import filter_getattrs, filter_list, NULLS_FIRST, NULLS_LAST, REVERSE_CHAR
+from middlewared.utils.nss.resolve import resolve_names
+
 
 class ZFSDatasetService(Service):
 
@@ -36,18 +39,18 @@ class ZFSDatasetService(Service):
         ]
 
     # quota_type in ('USER', 'GROUP', 'DATASET', 'PROJECT')
-    def get_quota(self, ds, quota_type):
+    def get_quota(self, ds, quota_type, filters=None, options=None):
         quota_type = quota_type.upper()
         if quota_type == 'DATASET':
             dataset = self.middleware.call_sync('zfs.dataset.query', [('id', '=', ds)], {'get': True})
-            return [{
+            return filter_list([{
                 'quota_type': quota_type,
                 'id': ds,
                 'name': ds,
                 'quota': int(dataset['properties']['quota']['rawvalue']),
                 'refquota': int(dataset['properties']['refquota']['rawvalue']),
                 'used_bytes': int(dataset['properties']['used']['rawvalue']),
-            }]
+            }], filters, options)
         elif quota_type == 'USER':
             quota_props = [
                 libzfs.UserquotaProp.USERUSED,
@@ -113,19 +116,50 @@ class ZFSDatasetService(Service):
                 entry[key] = quota['space']
                 collected[rid] = entry
 
-        # Do name lookups last so we aren't repeating for all the quota props
-        # for each entry.
-        def add_name(entry):
-            try:
-                if quota_type == 'USER':
-                    entry['name'] = self.middleware.call_sync('user.get_user_obj', {'uid': entry['id']})['pw_name']
-                elif quota_type == 'GROUP':
-                    entry['name'] = self.middleware.call_sync('group.get_group_obj', {'gid': entry['id']})['gr_name']
-            except Exception:
-                self.logger.debug('Unable to resolve %s id %d to name', quota_type.lower(), entry['id'])
-            return entry
-
-        return [add_name(entry) for entry in collected.values()]
+        return self.filter_quota_entries(quota_type, list(collected.values()), filters, options)
+
+    def filter_quota_entries(self, quota_type, entries, filters, options):
+        """
+        Apply `filters` and `options` to the quota `entries` resolving ids to names only where needed.
+
+        Unless the names are used for filtering or sorting, the entries are filtered and paged first
+        so that only the ids in the returned page are resolved.
+        """
+        options = options or {}
+        if quota_type not in ('USER', 'GROUP'):
+            return filter_list(entries, filters, options)
+
+        name_needed = 'name' in {attr.split('.')[0] for attr in filter_getattrs(filters)} or any(
+            o.removeprefix(NULLS_FIRST).removeprefix(NULLS_LAST).removeprefix(REVERSE_CHAR) == 'name'
+            for o in options.get('order_by', [])
+        )
+        if name_needed:
+            self.add_names(quota_type, entries)
+            return filter_list(entries, filters, options)
+
+        page_options = {k: v for k, v in options.items() if k in ('order_by', 'offset', 'limit', 'count')}
+        if options.get('get'):
+            page_options['limit'] = 1
+
+        page = filter_list(entries, filters, page_options)
+        if options.get('count'):
+            return page
+
+        self.add_names(quota_type, page)
+        return filter_list(page, [], {k: v for k, v in options.items() if k in ('select', 'get')})
+
+    def add_names(self, quota_type, entries):
+        # Ids are resolved in a single batch rather than making an NSS lookup per quota entry
+        names = resolve_names(quota_type, [entry['id'] for entry in entries])
+        unresolved = 0
+        for entry in entries:
+            if (name := names[entry['id']]) is None:
+                unresolved += 1
+            else:
+                entry['name'] = name
+
+        if unresolved:
+            self.logger.debug('Unable to resolve %d %s ids to names', unresolved, quota_type.lower())
 
     def set_quota(self, ds, quotas):
         properties = {}
@@ -1,16 +1,26 @@
 import copy
 import errno
 import libzfs
+from collections import defaultdict
 
-from middlewared.schema import accepts, Bool, Dict, List, Str
-from middlewared.service import CallError, CRUDService, filterable, private, ValidationErrors
+from middlewared.schema import accepts, Bool, Dict, List, returns, Str
+from middlewared.service import CallError, CRUDService, filterable, job, private, ValidationErrors
 from middlewared.service_exception import InstanceNotFound
 from middlewared.utils import filter_list, filter_getattrs
 from middlewared.validators import Match, ReplicationSnapshotNamingSchema
 
-from .utils import get_snapshot_count_cached
+from .utils import delete_snapshots_batch, expand_snapshot_specs, get_snapshot_count_cached, parse_snapshot_spec
 from .validation_utils import validate_snapshot_name
 
+# Errors caused by particular snapshots of a batch being deleted
+SNAPSHOT_DELETE_ERRORS = {
+    libzfs.Error.BUSY, libzfs.Error.EXISTS, libzfs.Error.NOENT, errno.EBUSY, errno.EEXIST, errno.ENOENT,
+}
+
+
+def snapshot_delete_error(e):
+    return isinstance(e, libzfs.ZFSException) and e.code in SNAPSHOT_DELETE_ERRORS
+
 
 class ZFSSnapshot(CRUDService):
 
@@ -291,3 +301,87 @@ class ZFSSnapshot(CRUDService):
                 f'{self._config.namespace}.query', 'REMOVED', id=id_, recursive=options['recursive'],
             )
             return True
+
+    @accepts(
+        List('snapshots', items=[Str('snapshot', empty=False)], required=True),
+        Dict(
+            'options',
+            Bool('recursive', default=False),
+        ),
+        roles=['SNAPSHOT_DELETE'],
+    )
+    @returns(List('statuses', items=[Dict(
+        'status',
+        Str('snapshot', required=True),
+        Str('error', null=True, max_length=None, required=True),
+    )]))
+    @job()
+    def delete_many(self, job, snapshots, options):
+        """
+        Delete multiple snapshots. Snapshots are grouped by dataset and each group is destroyed at once
+        instead of destroying snapshots one by one.
+
+        A snapshot is specified either by its name (`tank/work@auto-1`) or as an inclusive range of
+        snapshots of a dataset (`tank/work@auto-1%auto-9`). Either end of the range may be omitted, i.e.
+        `tank/work@%auto-9` deletes all snapshots of `tank/work` up to and including `auto-9`.
+
+        `options.recursive` will also delete snapshots with the same name of child datasets.
+
+        Returns a status for each of `snapshots` (in the same order) with `error` set to `null` if the
+        snapshot (or all snapshots of the range) were deleted successfully.
+        """
+        statuses = [{'snapshot': snapshot, 'error': None} for snapshot in snapshots]
+        groups = defaultdict(list)
+        for index, snapshot in enumerate(snapshots):
+            try:
+                dataset, spec = parse_snapshot_spec(snapshot)
+            except ValueError as e:
+                statuses[index]['error'] = str(e)
+            else:
+                groups[dataset].append((index, spec))
+
+        job.set_progress(0, f'Deleting snapshots of {len(groups)} dataset(s)')
+        with libzfs.ZFS() as zfs:
+            for i, (dataset, specs) in enumerate(groups.items()):
+                try:
+                    ds = zfs.get_dataset(dataset)
+                    existing = sorted(
+                        zfs.snapshots_serialized(props=[], datasets=[dataset], recursive=False),
+                        # snapshots created by the same `zfs snapshot` call share transaction group
+                        key=lambda snap: (int(snap['createtxg']), snap['snapshot_name']),
+                    )
+                except libzfs.ZFSException as e:
+                    for index, spec in specs:
+                        statuses[index]['error'] = str(e)
+                    continue
+
+                batch, errors = expand_snapshot_specs(specs, [snap['snapshot_name'] for snap in existing])
+                for index, error in errors.items():
+                    statuses[index]['error'] = error
+
+                failed = delete_snapshots_batch(
+                    lambda names: ds.delete_snapshots({
+                        'all': False, 'recursive': options['recursive'], 'snapshots': names,
+                    }),
+                    batch,
+                    snapshot_delete_error,
+                )
+                for index, name in batch:
+                    if name in failed:
+                        error = f'{dataset}@{name}: {failed[name]}'
+                        if statuses[index]['error']:
+                            statuses[index]['error'] += f'\n{error}'
+                        else:
+                            statuses[index]['error'] = error
+                    else:
+                        self.middleware.send_event(
+                            f'{self._config.namespace}.query', 'REMOVED', id=f'{dataset}@{name}',
+                            recursive=options['recursive'],
+                        )
+
+                job.set_progress(
+                    (i + 1) / len(groups) * 100,
+                    f'Deleted {len(batch) - len(failed)} of {len(batch)} snapshot(s) of {dataset!r}',
+                )
+
+        return statuses
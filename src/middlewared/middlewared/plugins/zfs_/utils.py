@@ -23,7 +23,10 @@ from middlewared.utils.tdb import (
 logger = logging.getLogger(__name__)
 
 __all__ = [
+    "delete_snapshots_batch",
+    "expand_snapshot_specs",
     "get_snapshot_count_cached",
+    "parse_snapshot_spec",
     "path_to_dataset_impl",
     "paths_to_datasets_impl",
     "zvol_name_to_path",
@@ -363,3 +366,92 @@ def path_to_dataset_impl(path: str, mntinfo: dict | None = None) -> str:
         raise CallError(f'{path}: path is on boot pool')
 
     return ds_name
+
+
+def parse_snapshot_spec(spec: str) -> tuple[str, str | tuple[str | None, str | None]]:
+    """
+    Parse snapshot specification used by `zfs.snapshot.delete_many`: either a snapshot name
+    (`tank/work@auto-1`) or an inclusive range of snapshots of a dataset in the same syntax
+    `zfs destroy` uses (`tank/work@auto-1%auto-9`) where either end of the range may be omitted.
+
+    Returns dataset name and either snapshot name or a `(start, end)` tuple for ranges.
+    """
+    dataset, sep, name = spec.partition('@')
+    if not dataset or not sep or not name:
+        raise ValueError(f'{spec!r}: snapshot must be specified as <dataset>@<snapshot>')
+
+    if '%' in name:
+        start, end = name.split('%', 1)
+        if '%' in end:
+            raise ValueError(f'{spec!r}: invalid snapshot range')
+
+        return dataset, (start or None, end or None)
+
+    return dataset, name
+
+
+def expand_snapshot_specs(specs: list, snapshots: list[str]) -> tuple[list, dict]:
+    """
+    Resolve parsed snapshot specs of a single dataset against its existing `snapshots` names
+    (ordered by creation).
+
+    Returns a list of `(index, snapshot name)` tuples to delete (each snapshot only once, owned by
+    the first spec referencing it) and a dictionary of errors keyed by the index of a spec that could
+    not be resolved.
+    """
+    positions = {name: i for i, name in enumerate(snapshots)}
+    to_delete = {}
+    errors = {}
+    for index, spec in specs:
+        if isinstance(spec, str):
+            if spec not in positions:
+                errors[index] = f'Snapshot {spec!r} does not exist'
+                continue
+
+            to_delete.setdefault(spec, index)
+            continue
+
+        start, end = spec
+        for name in filter(None, (start, end)):
+            if name not in positions:
+                errors[index] = f'Snapshot {name!r} does not exist'
+                break
+        else:
+            first = positions[start] if start else 0
+            last = positions[end] if end else len(snapshots) - 1
+            if first > last:
+                errors[index] = f'Snapshot {start!r} was created after {end!r}'
+                continue
+
+            for name in snapshots[first:last + 1]:
+                to_delete.setdefault(name, index)
+
+    return [(index, name) for name, index in to_delete.items()], errors
+
+
+def delete_snapshots_batch(delete, batch: list, snapshot_error) -> dict:
+    """
+    Delete `batch` of `(index, snapshot name)` tuples with a single `delete(names)` call. ZFS destroys
+    snapshots atomically so if the call fails with an error that is caused by some of the snapshots
+    (`snapshot_error(exception)` returns `True`, i.e. a snapshot is busy), the batch is split in halves
+    until the snapshots that can't be deleted are found. Any other error (i.e. pool is read-only) is
+    reported for the whole batch as deleting fewer snapshots would fail the same way.
+
+    Returns a dictionary of `{snapshot name: error}` for snapshots that failed to be deleted.
+    """
+    if not batch:
+        return {}
+
+    try:
+        delete([name for index, name in batch])
+    except Exception as e:
+        if len(batch) == 1 or not snapshot_error(e):
+            return {name: str(e) for index, name in batch}
+
+        half = len(batch) // 2
+        return (
+            delete_snapshots_batch(delete, batch[:half], snapshot_error) |
+            delete_snapshots_batch(delete, batch[half:], snapshot_error)
+        )
+
+    return {}
@@ -1,6 +1,8 @@
+from unittest.mock import AsyncMock, Mock
+
 import pytest
 
-from middlewared.api.base.server.ws_handler.rpc import RpcWebSocketHandler
+from middlewared.api.base.server.ws_handler.rpc import RpcWebSocketApp, RpcWebSocketHandler
 
 
 @pytest.mark.parametrize(
@@ -97,3 +99,18 @@ async def test_validate_message(ws_msg, error_type):
             await RpcWebSocketHandler.validate_message(ws_msg)
     else:
         await RpcWebSocketHandler.validate_message(ws_msg)
+
+
+@pytest.mark.asyncio
+async def test_result_is_not_sent_to_disconnected_client():
+    middleware = Mock()
+    ws = Mock(send_str=AsyncMock(side_effect=ConnectionResetError("Cannot write to closing transport")))
+    app = RpcWebSocketApp(middleware, Mock(), ws)
+    app.send_error = Mock()
+    method = Mock(call=AsyncMock(return_value=[{"id": 1}]))
+
+    await RpcWebSocketHandler(middleware, []).process_method_call(app, 1, method, [])
+
+    ws.send_str.assert_awaited_once_with('{"jsonrpc": "2.0", "result": [{"id": 1}], "id": 1}')
+    app.send_error.assert_not_called()
+    middleware.logger.warning.assert_not_called()
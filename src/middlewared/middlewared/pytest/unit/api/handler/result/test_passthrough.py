@@ -0,0 +1,205 @@
+import datetime
+import time
+from typing import Literal
+
+from pydantic import Field, Secret, field_validator
+import pytest
+
+from middlewared.api.base import BaseModel, ForUpdateMetaclass, NonEmptyString, single_argument_result
+from middlewared.api.base.handler.result import passthrough_model, serialize_result
+from middlewared.api.base.model import query_result
+from middlewared.api.current import (
+    BootEnvironmentEntry, CronJobEntry, GroupEntry, NfsShareEntry, NTPPeerEntry, StaticRouteEntry, UserEntry,
+)
+
+ENTRIES = 5000
+CREATED = datetime.datetime(2024, 10, 1, 12, 30, tzinfo=datetime.timezone.utc)
+
+
+def dump_result(model, result, expose_secrets=False):
+    return model(result=result).model_dump(
+        context={"expose_secrets": expose_secrets},
+        warnings=False,
+        by_alias=True,
+    )["result"]
+
+
+def group(i):
+    return {
+        "id": i,
+        "gid": 3000 + i,
+        "name": f"group{i}",
+        "builtin": False,
+        "sudo_commands": [],
+        "sudo_commands_nopasswd": ["ALL"] if i % 2 else [],
+        "smb": True,
+        "group": f"group{i}",
+        "id_type_both": False,
+        "local": True,
+        "sid": f"S-1-5-21-1-2-3-{20000 + i}" if i % 3 else None,
+        "roles": ["READONLY_ADMIN"] if i % 5 == 0 else [],
+        "users": list(range(i % 7)),
+    }
+
+
+def boot_environment(i):
+    return {
+        "id": f"25.04-{i}",
+        "dataset": f"boot-pool/ROOT/25.04-{i}",
+        "active": i == 0,
+        "activated": i == 0,
+        "created": CREATED,
+        "used_bytes": 2 ** 30 + i,
+        "used": "1 GiB",
+        "keep": False,
+        "can_activate": True,
+    }
+
+
+def nfs_share(i):
+    return {
+        "id": i,
+        "path": f"/mnt/tank/share{i}",
+        "aliases": [],
+        "comment": "",
+        "networks": ["192.168.0.0/24"],
+        "hosts": [],
+        "ro": bool(i % 2),
+        "maproot_user": "root" if i % 2 else None,
+        "maproot_group": None,
+        "mapall_user": None,
+        "mapall_group": None,
+        "security": ["SYS", "KRB5"],
+        "enabled": True,
+        "locked": False,
+    }
+
+
+def static_route(i):
+    return {"destination": f"10.0.{i % 256}.0/24", "gateway": "192.168.0.1", "description": "", "id": i}
+
+
+@pytest.mark.parametrize("entry,factory", [
+    (GroupEntry, group),
+    (BootEnvironmentEntry, boot_environment),
+    (NfsShareEntry, nfs_share),
+    (StaticRouteEntry, static_route),
+])
+@pytest.mark.parametrize("select", [None, ["id"]])
+def test_query_result_is_identical(entry, factory, select):
+    model = query_result(entry)
+    assert passthrough_model(model)
+
+    items = [factory(i) for i in range(10)]
+    if select:
+        items = [{k: item[k] for k in select} for item in items]
+
+    for result in [items, items[0], len(items)]:
+        assert serialize_result(model, result, False) == dump_result(model, result)
+
+
+@pytest.mark.parametrize("entry", [
+    # `Secret` fields
+    UserEntry,
+    # `float` fields
+    NTPPeerEntry,
+    # Fields with default factories and model validators
+    CronJobEntry,
+])
+def test_query_result_is_validated(entry):
+    assert not passthrough_model(query_result(entry))
+
+
+class Nested(BaseModel):
+    name: NonEmptyString
+    type: Literal["A", "B"]
+
+
+class Plain(BaseModel):
+    id: int
+    nested: list[Nested]
+    data: dict
+    optional: Nested | None
+
+
+class PlainUpdate(Plain, metaclass=ForUpdateMetaclass):
+    pass
+
+
+class WithDefault(BaseModel):
+    id: int
+    enabled: bool = True
+
+
+class WithAlias(BaseModel):
+    id: int
+    schema_: str = Field(alias="schema")
+
+
+class WithSecret(BaseModel):
+    nested: list["SecretNested"]
+
+
+class SecretNested(BaseModel):
+    password: Secret[str]
+
+
+WithSecret.model_rebuild()
+
+
+class WithValidator(BaseModel):
+    name: str
+
+    @field_validator("name")
+    @classmethod
+    def validate_name(cls, value):
+        return value.lower()
+
+
+class WithFloat(BaseModel):
+    value: float
+
+
+@pytest.mark.parametrize("model,passthrough", [
+    (Plain, True),
+    (PlainUpdate, True),
+    (WithDefault, False),
+    (WithAlias, False),
+    (WithSecret, False),
+    (WithValidator, False),
+    (WithFloat, False),
+])
+def test_passthrough_model(model, passthrough):
+    assert passthrough_model(single_argument_result(model)) is passthrough
+
+
+@pytest.mark.parametrize("model,value", [
+    (WithDefault, {"id": 1}),
+    (WithAlias, {"id": 1, "schema": "public"}),
+    (WithSecret, {"nested": [{"password": "pass"}]}),
+    (WithValidator, {"name": "IVAN"}),
+    (WithFloat, {"value": 1}),
+])
+def test_non_passthrough_model_is_serialized(model, value):
+    result_model = single_argument_result(model)
+    assert serialize_result(result_model, value, False) == dump_result(result_model, value)
+
+
+def test_float_is_converted():
+    assert isinstance(serialize_result(single_argument_result(WithFloat), {"value": 1}, False)["value"], float)
+
+
+def test_serialize_benchmark():
+    model = query_result(GroupEntry)
+    result = [group(i) for i in range(ENTRIES)]
+
+    start = time.monotonic()
+    dumped = dump_result(model, result)
+    dump_elapsed = time.monotonic() - start
+
+    start = time.monotonic()
+    serialized = serialize_result(model, result, False)
+    elapsed = time.monotonic() - start
+
+    assert serialized == dumped
+    assert elapsed < dump_elapsed / 10, (elapsed, dump_elapsed)
@@ -0,0 +1,118 @@
+import unittest
+
+import pytest
+
+from middlewared.api.base.handler.result import serialize_result
+from middlewared.api.current import AppAvailableResponse, CatalogAppsResult
+from middlewared.plugins.catalog.apps_details import CatalogService
+from middlewared.plugins.catalog.apps_util import get_app_details
+from middlewared.plugins.catalog.catalog_index import CatalogIndex
+from middlewared.pytest.unit.middleware import Middleware
+
+APPS = 500
+VERSIONS = 50
+
+
+def generate_catalog():
+    return {
+        train: {
+            f'app{i}': {
+                'name': f'app{i}',
+                'location': f'/mnt/.ix-apps/truenas_catalog/trains/{train}/app{i}',
+                'app_readme': None,
+                'categories': ['media'],
+                'description': f'App {i}',
+                'healthy': True,
+                'healthy_error': None,
+                'home': f'https://app{i}.example.com',
+                'latest_version': f'1.0.{VERSIONS - 1}',
+                'latest_app_version': '1.0.0',
+                'latest_human_version': f'1.0.0_1.0.{VERSIONS - 1}',
+                'last_update': None,
+                'recommended': False,
+                'title': f'App {i}',
+                'maintainers': [{'name': 'truenas', 'url': 'https://www.truenas.com/', 'email': 'dev@ixsystems.com'}],
+                'tags': ['media'],
+                'screenshots': [],
+                'sources': [f'https://app{i}.example.com/source'],
+                'icon_url': None,
+            }
+            for i in range(APPS)
+        }
+        for train in ('stable', 'community')
+    }
+
+
+def generate_versions(app_location):
+    return {
+        f'1.0.{i}': {
+            'location': f'{app_location}/1.0.{i}',
+            'supported': True,
+            'values': {'timezone': 'UTC'},
+            'schema': {'groups': [], 'questions': [{'variable': 'timezone', 'schema': {'type': 'string'}}]},
+        }
+        for i in range(VERSIONS)
+    }
+
+
+@pytest.fixture()
+def index():
+    return CatalogIndex(generate_catalog(), unittest.mock.Mock(side_effect=generate_versions))
+
+
+def test_trains_are_not_copied(index):
+    assert index.get_trains() is index.get_trains()
+    assert list(index.get_trains(['community'])) == ['community']
+    assert index.get_trains(['community'])['community'] is index.get_trains()['community']
+
+    with pytest.raises(TypeError):
+        index.get_trains()['stable']['app0']['recommended'] = True
+    with pytest.raises(AttributeError):
+        index.get_trains()['stable']['app0']['categories'].append('games')
+
+
+def test_versions_are_loaded_lazily(index):
+    index.load_versions.assert_not_called()
+    assert index.has_app('stable', 'app1') and not index.has_app('stable', 'app1000')
+
+    versions = index.get_app_versions('stable', 'app1')
+    assert len(versions) == VERSIONS
+    assert index.get_app_versions('stable', 'app1') is versions
+    index.load_versions.assert_called_once_with('/mnt/.ix-apps/truenas_catalog/trains/stable/app1')
+
+
+@unittest.mock.patch('middlewared.plugins.catalog.apps_util.normalize_questions')
+def test_app_details_do_not_modify_index(mock_normalize_questions, index):
+    def normalize_questions(version_data, context):
+        version_data['schema']['questions'].append({'variable': 'extra'})
+
+    mock_normalize_questions.side_effect = normalize_questions
+    app_data = index.get_trains()['stable']['app1']
+    versions = index.get_app_versions('stable', 'app1')
+
+    app_details = get_app_details(app_data['location'], app_data, {}, versions)
+    app_details['categories'].append('games')
+
+    assert len(app_details['versions']) == VERSIONS
+    assert app_details['versions']['1.0.0']['schema']['questions'][-1] == {'variable': 'extra'}
+    assert len(versions['1.0.0']['schema']['questions']) == 1
+    assert app_data['categories'] == ('media',)
+    assert mock_normalize_questions.call_count == VERSIONS
+
+
+@pytest.mark.parametrize('options', [
+    {'retrieve_all_trains': True, 'trains': []},
+    {'retrieve_all_trains': False, 'trains': ['community']},
+])
+def test_apps_are_serialized(index, options):
+    m = Middleware()
+    m['catalog.config'] = lambda: {'label': 'TRUENAS', 'location': '/mnt/.ix-apps/truenas_catalog'}
+    m['cache.get'] = lambda key: index
+
+    apps = CatalogService(m).apps({'cache': True, 'cache_only': True, **options})
+    assert list(apps) == list(index.get_trains(options['trains'] or None))
+    assert serialize_result(CatalogAppsResult, apps, False) == apps
+
+    train = next(iter(apps))
+    app = {'catalog': 'TRUENAS', 'installed': False, 'train': train, **apps[train]['app0']}
+    assert AppAvailableResponse(**app).model_dump() == app
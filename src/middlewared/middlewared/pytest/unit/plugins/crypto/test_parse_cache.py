@@ -0,0 +1,115 @@
+import datetime
+from unittest.mock import patch
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from OpenSSL import crypto
+
+from middlewared.plugins.crypto_ import load_utils
+from middlewared.plugins.crypto_.load_utils import get_serial_from_certificate_safe
+from middlewared.plugins.crypto_.parse_cache import ParseCache
+from middlewared.plugins.crypto_.query_utils import normalize_cert_attrs
+from middlewared.plugins.crypto_.utils import CERT_TYPE_EXISTING
+
+CERTIFICATES = 1000
+
+
+def generate_certificate(i, key):
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, f'cert{i}.example.com')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(
+        key.public_key()
+    ).serial_number(i + 1).not_valid_before(now).not_valid_after(now + datetime.timedelta(days=365)).add_extension(
+        x509.SubjectAlternativeName([x509.DNSName(f'cert{i}.example.com')]), critical=False,
+    ).sign(key, hashes.SHA256())
+    return certificate.public_bytes(serialization.Encoding.PEM).decode()
+
+
+@pytest.fixture(scope='module')
+def certificates():
+    key = ec.generate_private_key(ec.SECP256R1())
+    privatekey = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption(),
+    ).decode()
+    return [
+        {
+            'id': i,
+            'name': f'cert{i}',
+            'type': CERT_TYPE_EXISTING,
+            'certificate': generate_certificate(i, key),
+            'privatekey': privatekey,
+            'CSR': None,
+            'signedby': None,
+            'revoked_date': None,
+            'acme': None,
+        }
+        for i in range(CERTIFICATES)
+    ]
+
+
+@pytest.fixture()
+def parse_cache():
+    cache = ParseCache(CERTIFICATES * 2)
+    with patch.object(load_utils, 'PARSE_CACHE', cache):
+        yield cache
+
+
+def normalize(certificates):
+    result = []
+    for cert in certificates:
+        cert = dict(cert)
+        normalize_cert_attrs(cert)
+        result.append(cert)
+
+    return result
+
+
+def test_certificates_are_parsed_once(certificates, parse_cache):
+    with patch.object(crypto, 'load_certificate', wraps=crypto.load_certificate) as load_certificate:
+        first = normalize(certificates)
+        assert load_certificate.call_count == CERTIFICATES
+
+        second = normalize(certificates)
+        assert load_certificate.call_count == CERTIFICATES
+
+    assert first == second
+    assert all(cert['parsed'] and not cert['expired'] for cert in second)
+    assert second[10]['common'] == 'cert10.example.com'
+    assert second[10]['san'] == ['DNS:cert10.example.com']
+    assert second[10]['chain_list'] == [certificates[10]['certificate']]
+    assert (second[10]['key_type'], second[10]['key_length']) == ('EC', 256)
+
+    # Results can be modified by the caller
+    second[10]['san'].append('DNS:other.example.com')
+    assert normalize(certificates[10:11])[0]['san'] == ['DNS:cert10.example.com']
+
+
+def test_expired_is_not_cached(certificates, parse_cache):
+    assert load_utils.load_certificate(certificates[0]['certificate'])['expired'] is False
+    later = datetime.datetime.now() + datetime.timedelta(days=400)
+    with patch.object(load_utils.datetime, 'datetime', wraps=datetime.datetime) as mock_datetime:
+        mock_datetime.now.return_value = later
+        assert load_utils.load_certificate(certificates[0]['certificate'])['expired'] is True
+
+
+def test_serials_are_cached(certificates, parse_cache):
+    with patch.object(crypto, 'load_certificate', wraps=crypto.load_certificate) as load_certificate:
+        for i in range(2):
+            assert [get_serial_from_certificate_safe(cert['certificate']) for cert in certificates] == list(
+                range(1, CERTIFICATES + 1)
+            )
+
+    assert load_certificate.call_count == CERTIFICATES
+
+
+def test_cache_is_bounded(certificates):
+    cache = ParseCache(100)
+    with patch.object(load_utils, 'PARSE_CACHE', cache):
+        normalize(certificates)
+
+    assert len(cache.entries) == 100
+    # Most recently used entries are kept
+    assert next(reversed(cache.entries))[0] == 'private_key_info'
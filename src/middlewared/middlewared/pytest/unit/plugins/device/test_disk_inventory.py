@@ -0,0 +1,379 @@
+import os
+from unittest.mock import Mock, patch
+
+import pytest
+
+from middlewared.plugins.device_ import device_info
+from middlewared.plugins.device_.device_info import DeviceService
+from middlewared.plugins.device_.disk_inventory import DiskInventory
+from middlewared.pytest.unit.middleware import Middleware
+
+# Recorded with `udevadm info --export-db` (unrelated devices and properties are omitted)
+UDEV_DB = """
+P: /devices/pci0000:00/0000:00:01.0/0000:01:00.0/host0/target0:0:0/0:0:0:0
+E: DEVPATH=/devices/pci0000:00/0000:00:01.0/0000:01:00.0/host0/target0:0:0/0:0:0:0
+E: SUBSYSTEM=scsi
+E: DEVTYPE=scsi_device
+E: DRIVER=sd
+
+P: /devices/pci0000:00/0000:00:01.0/0000:01:00.0/host0/target0:0:0/0:0:0:0/block/sda
+N: sda
+E: DEVPATH=/devices/pci0000:00/0000:00:01.0/0000:01:00.0/host0/target0:0:0/0:0:0:0/block/sda
+E: SUBSYSTEM=block
+E: DEVNAME=/dev/sda
+E: DEVTYPE=disk
+E: MAJOR=8
+E: MINOR=0
+E: ID_BUS=scsi
+E: ID_MODEL=HUH721212AL5200
+E: ID_VENDOR=HGST
+E: ID_SCSI_SERIAL=8DH5LTAH
+E: ID_WWN=0x5000cca270e3f1a4
+E: ID_PART_TABLE_TYPE=gpt
+
+P: /devices/pci0000:00/0000:00:01.0/0000:01:00.0/host0/target0:0:0/0:0:0:0/block/sda/sda1
+N: sda1
+E: DEVPATH=/devices/pci0000:00/0000:00:01.0/0000:01:00.0/host0/target0:0:0/0:0:0:0/block/sda/sda1
+E: SUBSYSTEM=block
+E: DEVTYPE=partition
+E: MAJOR=8
+E: MINOR=1
+E: ID_PART_ENTRY_TYPE=0657fd6d-a4ab-43c4-84e5-0933c84b4f4f
+E: ID_PART_ENTRY_UUID=9a1cbd9b-3bc6-4b8e-a4f2-0d5a8c7f6a21
+E: ID_PART_ENTRY_NUMBER=1
+E: ID_PART_ENTRY_OFFSET=128
+E: ID_PART_ENTRY_SIZE=4194304
+
+P: /devices/pci0000:00/0000:00:01.0/0000:01:00.0/host0/target0:0:0/0:0:0:0/block/sda/sda2
+N: sda2
+E: DEVPATH=/devices/pci0000:00/0000:00:01.0/0000:01:00.0/host0/target0:0:0/0:0:0:0/block/sda/sda2
+E: SUBSYSTEM=block
+E: DEVTYPE=partition
+E: MAJOR=8
+E: MINOR=2
+E: ID_FS_LABEL=tank
+E: ID_PART_ENTRY_TYPE=6a898cc3-1dd2-11b2-99a6-080020736631
+E: ID_PART_ENTRY_UUID=6b5d2b3e-6ff3-4c5e-9c41-4d04c1a3c7f0
+E: ID_PART_ENTRY_NUMBER=2
+E: ID_PART_ENTRY_OFFSET=4194432
+E: ID_PART_ENTRY_SIZE=23433576448
+
+P: /devices/pci0000:00/0000:00:1d.0/0000:3d:00.0/nvme/nvme0
+E: DEVPATH=/devices/pci0000:00/0000:00:1d.0/0000:3d:00.0/nvme/nvme0
+E: SUBSYSTEM=nvme
+
+P: /devices/pci0000:00/0000:00:1d.0/0000:3d:00.0/nvme/nvme0/nvme0n1
+N: nvme0n1
+E: DEVPATH=/devices/pci0000:00/0000:00:1d.0/0000:3d:00.0/nvme/nvme0/nvme0n1
+E: SUBSYSTEM=block
+E: DEVNAME=/dev/nvme0n1
+E: DEVTYPE=disk
+E: MAJOR=259
+E: MINOR=0
+E: ID_MODEL=INTEL SSDPE2KX010T8
+E: ID_SERIAL_SHORT=PHLJ912301GB1P0FGN
+E: ID_WWN=eui.01000000010000005cd2e4a3b1a54f51
+
+P: /devices/pci0000:00/0000:00:1d.0/0000:3d:00.0/nvme/nvme0/nvme0n1/nvme0n1p1
+N: nvme0n1p1
+E: DEVPATH=/devices/pci0000:00/0000:00:1d.0/0000:3d:00.0/nvme/nvme0/nvme0n1/nvme0n1p1
+E: SUBSYSTEM=block
+E: DEVTYPE=partition
+E: MAJOR=259
+E: MINOR=1
+E: ID_PART_ENTRY_TYPE=6a898cc3-1dd2-11b2-99a6-080020736631
+E: ID_PART_ENTRY_UUID=0c1b8d1e-9f0e-4d7f-9a0c-5e4bd1f0b2aa
+E: ID_PART_ENTRY_NUMBER=1
+E: ID_PART_ENTRY_OFFSET=256
+E: ID_PART_ENTRY_SIZE=1953525168
+
+P: /devices/platform/host7/session1/target7:0:0/7:0:0:0/block/sdb
+N: sdb
+E: DEVPATH=/devices/platform/host7/session1/target7:0:0/7:0:0:0/block/sdb
+E: SUBSYSTEM=block
+E: DEVTYPE=disk
+E: MAJOR=8
+E: MINOR=16
+E: ID_SCSI_SERIAL=3f2a1b0c-iscsi
+
+P: /devices/virtual/block/zd0
+N: zd0
+E: DEVPATH=/devices/virtual/block/zd0
+E: SUBSYSTEM=block
+E: DEVTYPE=disk
+E: MAJOR=230
+E: MINOR=0
+"""
+
+# sysfs attributes of the devices above
+SYSFS = {
+    "sda": {"size": b"23437770752", "queue/logical_block_size": b"512", "queue/rotational": b"1"},
+    "sda2": {"holders/md127": b""},
+    "nvme0n1": {"size": b"1953525168", "queue/logical_block_size": b"4096", "queue/rotational": b"0"},
+}
+
+
+class FakeAttributes(dict):
+    @property
+    def available_attributes(self):
+        return list(self)
+
+
+class FakeDevice:
+    def __init__(self, db, path, properties):
+        self.db = db
+        self.device_path = path
+        self.sys_path = f"/sys{path}"
+        self.sys_name = os.path.basename(path)
+        self.properties = properties
+        self.attributes = FakeAttributes(SYSFS.get(self.sys_name, {}))
+
+    @property
+    def device_type(self):
+        return self.properties.get("DEVTYPE")
+
+    @property
+    def device_number(self):
+        return os.makedev(int(self.properties.get("MAJOR", 0)), int(self.properties.get("MINOR", 0)))
+
+    @property
+    def parent(self):
+        path = os.path.dirname(self.device_path)
+        while path not in self.db.devices:
+            path = os.path.dirname(path)
+        return self.db.devices[path]
+
+    @property
+    def children(self):
+        return [dev for path, dev in self.db.devices.items() if path.startswith(f"{self.device_path}/")]
+
+    def get(self, key, default=None):
+        return self.properties.get(key, default)
+
+    def __getitem__(self, key):
+        return self.properties[key]
+
+
+class FakeUdevDatabase:
+    def __init__(self, export):
+        self.devices = {}
+        self.calls = {"list_devices": 0, "from_name": 0}
+        for record in export.strip().split("\n\n"):
+            path, properties = None, {}
+            for line in record.splitlines():
+                kind, value = line.split(": ", 1)
+                if kind == "P":
+                    path = value
+                elif kind == "E":
+                    k, v = value.split("=", 1)
+                    properties[k] = v
+            self.add(path, properties)
+
+    def add(self, path, properties):
+        self.devices[path] = FakeDevice(self, path, properties)
+
+    def remove(self, name):
+        self.devices = {path: dev for path, dev in self.devices.items() if dev.sys_name != name}
+
+    def list_devices(self, subsystem, DEVTYPE):
+        self.calls["list_devices"] += 1
+        return [
+            dev for dev in self.devices.values()
+            if dev.properties.get("SUBSYSTEM") == subsystem and dev.device_type == DEVTYPE
+        ]
+
+    def from_name(self, ctx, subsystem, name):
+        self.calls["from_name"] += 1
+        for dev in self.devices.values():
+            if dev.properties.get("SUBSYSTEM") == subsystem and dev.sys_name == name:
+                return dev
+
+        raise device_info.pyudev.DeviceNotFoundByNameError(subsystem, name)
+
+    def event(self, action, name):
+        dev = next(dev for dev in self.devices.values() if dev.sys_name == name)
+        return {"ACTION": action, **dev.properties, "SYS_NAME": name}
+
+
+@pytest.fixture()
+def device():
+    db = FakeUdevDatabase(UDEV_DB)
+    inventory = DiskInventory()
+    # `disk.get_partition_for_disk` must not be called
+    d = DeviceService(Middleware())
+    d._get_rotation_rate = Mock(return_value=7200)
+    d.is_dif_formatted = Mock(return_value=False)
+    with patch.object(device_info, "DISK_INVENTORY", inventory):
+        with patch.object(device_info.pyudev, "Context", Mock(return_value=db)):
+            with patch.object(device_info.pyudev.Devices, "from_name", db.from_name):
+                yield d, db, inventory
+
+
+def test_get_disks(device):
+    d, db, inventory = device
+
+    disks = d.get_disks(True)
+
+    # iSCSI and zvol devices are not reported
+    assert set(disks) == {"sda", "nvme0n1"}
+    assert disks["sda"]["serial_lunid"] == "8DH5LTAH_5000cca270e3f1a4"
+    assert disks["sda"]["hctl"] == "0:0:0:0"
+    assert disks["sda"]["driver"] == "sd"
+    assert disks["sda"]["rotationrate"] == 7200
+    assert disks["sda"]["type"] == "HDD"
+    assert disks["nvme0n1"]["lunid"] == "01000000010000005cd2e4a3b1a54f51"
+    assert disks["nvme0n1"]["type"] == "SSD"
+    assert disks["nvme0n1"]["rotationrate"] is None
+
+    assert [(p["name"], p["start_sector"], p["size"], p["encrypted_provider"]) for p in disks["sda"]["parts"]] == [
+        ("sda1", 128, 4194304 * 512, None),
+        ("sda2", 4194432, 23433576448 * 512, "/dev/md127"),
+    ]
+    # partition offsets are reported by udev in 512 byte units
+    assert [(p["name"], p["start_sector"], p["size"]) for p in disks["nvme0n1"]["parts"]] == [
+        ("nvme0n1p1", 32, 1953525168 * 512),
+    ]
+
+
+def test_get_disks_is_served_from_inventory(device):
+    d, db, inventory = device
+
+    disks = d.get_disks(True)
+    assert db.calls == {"list_devices": 2, "from_name": 0}
+    assert d._get_rotation_rate.call_count == 1
+
+    assert d.get_disks(True) == disks
+    assert d.get_disks() == {name: dict(disk, parts=[]) for name, disk in disks.items()}
+    assert d.get_disks(serial_only=True) == {"sda": "8DH5LTAH", "nvme0n1": "PHLJ912301GB1P0FGN"}
+    assert db.calls == {"list_devices": 2, "from_name": 0}
+    assert d._get_rotation_rate.call_count == 1
+
+    # Callers can't modify the inventory
+    d.get_disks(True)["sda"]["parts"].clear()
+    assert d.get_disks(True) == disks
+
+
+def test_serial_only_does_not_build_inventory(device):
+    d, db, inventory = device
+
+    assert d.get_disks(serial_only=True) == {"sda": "8DH5LTAH", "nvme0n1": "PHLJ912301GB1P0FGN"}
+    assert not inventory.populated
+    d._get_rotation_rate.assert_not_called()
+
+
+def test_change_event_rereads_disk(device):
+    d, db, inventory = device
+    d.get_disks(True)
+
+    db.devices[next(p for p, dev in db.devices.items() if dev.sys_name == "sda")].attributes["size"] = b"1024"
+    inventory.on_udev_event(db.event("change", "sda"))
+
+    disks = d.get_disks(True)
+    assert disks["sda"]["size"] == 1024 * 512
+    assert [p["name"] for p in disks["sda"]["parts"]] == ["sda1", "sda2"]
+    assert db.calls == {"list_devices": 3, "from_name": 1}
+    # Immutable attributes of the device are not queried again
+    assert d._get_rotation_rate.call_count == 1
+    assert d.is_dif_formatted.call_count == 2
+
+
+def test_remove_and_add_events(device):
+    d, db, inventory = device
+    d.get_disks()
+    sda = {path: dev.properties for path, dev in db.devices.items() if dev.sys_name.startswith("sda")}
+    event = db.event("remove", "sda")
+
+    db.remove("sda")
+    inventory.on_udev_event(event)
+    assert set(d.get_disks()) == {"nvme0n1"}
+
+    for path, properties in sda.items():
+        db.add(path, properties)
+    inventory.on_udev_event(db.event("add", "sda"))
+    assert set(d.get_disks()) == {"sda", "nvme0n1"}
+    # Device might have been replaced
+    assert d._get_rotation_rate.call_count == 2
+    assert db.calls["list_devices"] == 1
+
+
+def test_partition_event_invalidates_parent_partitions(device):
+    d, db, inventory = device
+    d.get_disks(True)
+
+    inventory.on_udev_event(db.event("change", "nvme0n1p1"))
+    assert inventory.get_stale() == {"nvme0n1"}
+    assert set(inventory.partitions) == {"sda"}
+
+    d.get_disks(True)
+    assert inventory.get_stale() == set()
+    assert db.calls == {"list_devices": 3, "from_name": 1}
+
+
+def test_ignored_device_events(device):
+    d, db, inventory = device
+    d.get_disks()
+
+    inventory.on_udev_event(db.event("change", "zd0"))
+    inventory.on_udev_event(db.event("change", "sdb"))
+    assert inventory.get_stale() == {"sdb"}
+
+    assert set(d.get_disks()) == {"sda", "nvme0n1"}
+    assert inventory.get_stale() == set()
+    assert inventory.ignored == {"sdb", "zd0"}
+
+
+def test_event_during_build_is_not_lost(device):
+    d, db, inventory = device
+    get_disk_details = d.get_disk_details
+
+    def racing_get_disk_details(ctx, dev, get_partitions=False):
+        disk = get_disk_details(ctx, dev, get_partitions)
+        if dev.sys_name == "sda":
+            # disk changed after its details were read
+            inventory.on_udev_event(db.event("change", "sda"))
+        return disk
+
+    d.get_disk_details = racing_get_disk_details
+    assert set(d.get_disks()) == {"nvme0n1"}
+    assert inventory.get_stale() == {"sda"}
+
+    d.get_disk_details = get_disk_details
+    assert set(d.get_disks()) == {"sda", "nvme0n1"}
+
+
+def test_invalidate_rebuilds_inventory(device):
+    d, db, inventory = device
+    d.get_disks()
+
+    inventory.invalidate()
+    d.get_disks()
+    assert db.calls["list_devices"] == 2
+    assert d._get_rotation_rate.call_count == 1
+
+
+def test_jbod_inventory(device):
+    d, db, inventory = device
+    template = {path: dev.properties for path, dev in db.devices.items() if "0:0:0:0" in path}
+    for i in range(1, 401):
+        name = f"sd{chr(ord('a') + i // 26)}{chr(ord('a') + i % 26)}"
+        SYSFS[name] = SYSFS["sda"]
+        for path, properties in template.items():
+            path = path.replace("0:0:0:0", f"0:0:{i}:0").replace("sda", name)
+            db.add(path, {k: v.replace("0:0:0:0", f"0:0:{i}:0").replace("sda", name).replace("8DH5LTAH", str(i))
+                          for k, v in properties.items()})
+
+    try:
+        disks = d.get_disks(True)
+    finally:
+        for name in list(SYSFS):
+            if name.startswith("sd") and name != "sda":
+                SYSFS.pop(name)
+
+    assert len(disks) == 402
+    assert all(len(disk["parts"]) == 2 for name, disk in disks.items() if name.startswith("sd"))
+    # partitions of all disks are gathered with a single enumeration
+    assert db.calls == {"list_devices": 2, "from_name": 0}
+
+    assert d.get_disks(True) == disks
+    assert db.calls == {"list_devices": 2, "from_name": 0}
+    assert d._get_rotation_rate.call_count == 401
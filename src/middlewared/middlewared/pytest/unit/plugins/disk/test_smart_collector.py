@@ -0,0 +1,139 @@
+import asyncio
+import json
+import subprocess
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from middlewared.plugins.disk_.smart_collector import DiskService, SmartCollector
+from middlewared.pytest.unit.middleware import Middleware
+
+
+class Sampler:
+    def __init__(self, standby=(), delay=0):
+        self.standby = standby
+        self.delay = delay
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, name, powermode):
+        self.calls.append((name, powermode))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+
+        if name in self.standby and powermode != "NEVER":
+            return None, True, f"smartctl failed for disk {name}"
+
+        return {"temperature": {"current": 30}}, False, None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_coalesced():
+    collector = SmartCollector()
+    sampler = Sampler(delay=0.1)
+
+    first, second = await asyncio.gather(
+        collector.get(sampler, ["sda", "sdb"], "NEVER"),
+        collector.get(sampler, ["sda"], "NEVER"),
+    )
+
+    assert first["sda"] is second["sda"]
+    assert sorted(sampler.calls) == [("sda", "NEVER"), ("sdb", "NEVER")]
+
+
+@pytest.mark.asyncio
+async def test_bounded_parallelism():
+    collector = SmartCollector(concurrency=3)
+    sampler = Sampler(delay=0.01)
+
+    samples = await collector.get(sampler, [f"sd{i}" for i in range(20)], "NEVER")
+
+    assert all(sample.data == {"temperature": {"current": 30}} for sample in samples.values())
+    assert sampler.max_running == 3
+
+
+@pytest.mark.asyncio
+async def test_cached_samples():
+    collector = SmartCollector()
+    sampler = Sampler()
+
+    sample = (await collector.get(sampler, ["sda"], "NEVER"))["sda"]
+    assert (await collector.get(sampler, ["sda"], "STANDBY", max_age=60))["sda"] is sample
+    assert len(sampler.calls) == 1
+
+    # Cache is not used when `max_age` is not specified
+    assert (await collector.get(sampler, ["sda"], "NEVER"))["sda"] is not sample
+    assert len(sampler.calls) == 2
+
+    collector.clear()
+    assert collector.get_cached("sda", 60) is None
+
+
+@pytest.mark.asyncio
+async def test_standby_disk_is_not_woken_up():
+    collector = SmartCollector()
+    sampler = Sampler(standby=["sda"])
+
+    sample = (await collector.get(sampler, ["sda"], "STANDBY"))["sda"]
+    assert sample.standby
+    assert sample.data is None
+
+    assert (await collector.get(sampler, ["sda"], "STANDBY", max_age=60))["sda"] is sample
+    assert len(sampler.calls) == 1
+
+    # Disk is queried if waking it up is allowed
+    sample = (await collector.get(sampler, ["sda"], "NEVER", max_age=60))["sda"]
+    assert sample.data == {"temperature": {"current": 30}}
+    assert sampler.calls == [("sda", "STANDBY"), ("sda", "NEVER")]
+
+
+@pytest.mark.asyncio
+async def test_timeout():
+    collector = SmartCollector(concurrency=1)
+    sampler = Sampler(delay=0.2)
+
+    # Time spent waiting for the other disk is not counted
+    samples = await collector.get(sampler, ["sda", "sdb"], "NEVER", timeout=0.3)
+    assert samples["sda"] is not None and samples["sdb"] is not None
+
+    assert await collector.get(sampler, ["sdc"], "NEVER", timeout=0.1) == {"sdc": None}
+    assert collector.get_cached("sdc", 60) is None
+
+
+@pytest.mark.asyncio
+async def test_sampler_exception_is_cached():
+    collector = SmartCollector()
+    sampler = AsyncMock(side_effect=ValueError("Invalid argument"))
+
+    sample = (await collector.get(sampler, ["sda"], "NEVER"))["sda"]
+    assert sample.data is None
+    assert sample.error == "Invalid argument"
+    assert collector.get_cached("sda", 60) is sample
+
+
+@pytest.mark.parametrize("powermode,returncode,stdout,result", [
+    ("NEVER", 0, json.dumps({"temperature": {"current": 35}}), ({"temperature": {"current": 35}}, False, None)),
+    (
+        "STANDBY", 2, "Device is in STANDBY mode, exit(2)\n",
+        (None, True, "smartctl failed for disk sda:\nDevice is in STANDBY mode, exit(2)\n"),
+    ),
+    (
+        "NEVER", 2, "Smartctl open device: /dev/sda failed\n",
+        (None, False, "smartctl failed for disk sda:\nSmartctl open device: /dev/sda failed\n"),
+    ),
+])
+@pytest.mark.asyncio
+async def test_smart_sample(powermode, returncode, stdout, result):
+    m = Middleware()
+    m["disk.smartctl_args"] = AsyncMock(return_value=["/dev/sda"])
+    cp = subprocess.CompletedProcess([], returncode, stdout, "")
+
+    with patch("middlewared.plugins.disk_.smart_collector.smartctl", AsyncMock(return_value=cp)) as smartctl:
+        assert await DiskService(m).smart_sample("sda", powermode) == result
+
+    assert smartctl.call_args[0][0] == ["/dev/sda", "-a", "-n", powermode.lower(), "--json=c"]
@@ -0,0 +1,142 @@
+import copy
+from datetime import timedelta
+from unittest.mock import Mock
+
+from middlewared.plugins.disk_.sync import DiskService, SysDisksIndex
+from middlewared.pytest.unit.middleware import Middleware
+from middlewared.utils.time_utils import utc_now
+
+DISKS = 1000
+
+
+def sys_disk(i):
+    name = f"sd{chr(ord('a') + i // 26 // 26)}{chr(ord('a') + i // 26 % 26)}{chr(ord('a') + i % 26)}"
+    return name, {
+        "name": name,
+        "serial": f"SERIAL{i}",
+        "lunid": f"5000c500{i:08x}",
+        "serial_lunid": f"SERIAL{i}_5000c500{i:08x}",
+        "rotationrate": 7200,
+        "type": "HDD",
+        "size": 12000138625024,
+        "subsystem": "scsi",
+        "number": 2048 + i,
+        "model": "ST12000NM0027",
+        "bus": "SCSI",
+        "dif": False,
+        "parts": [],
+    }
+
+
+def db_disk(name, disk):
+    return {
+        "disk_identifier": f"{{serial_lunid}}{disk['serial_lunid']}",
+        "disk_name": name,
+        "disk_expiretime": None,
+        "disk_kmip_uid": None,
+        **{
+            f"disk_{k}": disk[k]
+            for k in ("serial", "lunid", "rotationrate", "type", "subsystem", "number", "model", "bus")
+        },
+        "disk_size": str(disk["size"]),
+    }
+
+
+class FakeDatastore:
+    def __init__(self, rows):
+        self.rows = {row["disk_identifier"]: row for row in rows}
+        self.bulk_writes = []
+
+    def query(self, name, filters=None, options=None):
+        return copy.deepcopy(list(self.rows.values()))
+
+    def bulk_write(self, name, operations, options):
+        self.bulk_writes.append(operations)
+        for operation in copy.deepcopy(operations):
+            if "data" in operation:
+                # storage_disk.disk_size is a string
+                operation["data"]["disk_size"] = str(operation["data"]["disk_size"])
+
+            if operation["action"] == "DELETE":
+                self.rows.pop(operation["id"])
+            elif operation["action"] == "UPDATE":
+                self.rows[operation["id"]].update(operation["data"])
+            else:
+                assert operation["data"]["disk_identifier"] not in self.rows
+                self.rows[operation["data"]["disk_identifier"]] = {
+                    "disk_expiretime": None, "disk_kmip_uid": None, **operation["data"],
+                }
+
+
+def sync_all(sys_disks, rows):
+    datastore = FakeDatastore(rows)
+    m = Middleware()
+    m["failover.licensed"] = Mock(return_value=False)
+    m["device.get_disks"] = Mock(return_value=sys_disks)
+    m["datastore.query"] = datastore.query
+    m["datastore.bulk_write"] = datastore.bulk_write
+    m["alert.oneshot_create"] = Mock()
+    m["alert.oneshot_delete"] = Mock()
+    m["disk.restart_services_after_sync"] = Mock()
+
+    DiskService(m).sync_all(Mock(), {"zfs_guid": False})
+    return m, datastore
+
+
+def test_sync_all():
+    sys_disks = dict(sys_disk(i) for i in range(DISKS))
+    rows = [db_disk(name, disk) for name, disk in sys_disks.items()]
+    # disks moved to other slots
+    for row in rows[:10]:
+        row["disk_number"] += 1
+    # disks that are gone
+    for row in rows[10:15]:
+        sys_disks.pop(row["disk_name"])
+    # disks that have been gone for too long
+    for row in rows[15:20]:
+        sys_disks.pop(row["disk_name"])
+        row["disk_expiretime"] = utc_now() - timedelta(days=1)
+    # new disks
+    for i in range(DISKS, DISKS + 5):
+        name, disk = sys_disk(i)
+        sys_disks[name] = disk
+
+    m, datastore = sync_all(sys_disks, rows)
+
+    # All changes are written at once
+    assert len(datastore.bulk_writes) == 1
+    operations = datastore.bulk_writes[0]
+    assert sorted(o.get("id") for o in operations if o["action"] == "UPDATE") == sorted(
+        row["disk_identifier"] for row in rows[:15]
+    )
+    assert sorted(o["id"] for o in operations if o["action"] == "DELETE") == sorted(
+        row["disk_identifier"] for row in rows[15:20]
+    )
+    assert sorted(o["data"]["disk_name"] for o in operations if o["action"] == "INSERT") == sorted(
+        sys_disk(i)[0] for i in range(DISKS, DISKS + 5)
+    )
+
+    assert len(datastore.rows) == DISKS
+    assert all(datastore.rows[row["disk_identifier"]]["disk_expiretime"] is not None for row in rows[10:15])
+    assert all(datastore.rows[row["disk_identifier"]]["disk_number"] == sys_disks[row["disk_name"]]["number"]
+               for row in rows[:10])
+    assert m.send_event.call_count == 25
+
+    # Nothing changes the second time
+    m, datastore = sync_all(sys_disks, list(datastore.rows.values()))
+    assert datastore.bulk_writes == []
+    m["disk.restart_services_after_sync"].assert_not_called()
+
+
+def test_sys_disks_index_matches_first_disk():
+    sys_disks = dict(sys_disk(i) for i in range(3))
+    sys_disks["sdaab"]["serial"] = sys_disks["sdaaa"]["serial"]
+    sys_disks["sdaac"]["parts"] = [{"disk": "sdaac", "partition_uuid": "uuid1"}]
+    index = SysDisksIndex(sys_disks)
+
+    for ident in ["{serial}SERIAL0", "{serial_lunid}SERIAL2_5000c50000000002", "{devicename}sdaab", "{uuid}uuid1",
+                  "{serial}SERIAL9", "{unknown}sdaaa", "sdaaa", ""]:
+        assert index.ident_to_dev(ident) == DiskService(None).ident_to_dev(ident, sys_disks)
+
+    assert index.ident_to_dev("{serial}SERIAL0") == "sdaaa"
+    assert index.dev_to_ident("sdaab") == "{serial_lunid}SERIAL1_5000c50000000001"
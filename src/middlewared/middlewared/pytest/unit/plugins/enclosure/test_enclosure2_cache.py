@@ -0,0 +1,154 @@
+# Copyright (c) - iXsystems Inc.
+#
+# Licensed under the terms of the TrueNAS Enterprise License Agreement
+# See the file LICENSE.IX for complete terms and conditions
+
+import copy
+import json
+import os
+import pathlib
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from middlewared.plugins.enclosure_.enclosure2 import Enclosure2Service, udev_block_devices_hook
+from middlewared.plugins.enclosure_.enclosure_class import Enclosure
+from middlewared.plugins.enclosure_.sysfs_disks import BaseDev
+from middlewared.pytest.unit.middleware import Middleware
+
+ses_pages_dir = pathlib.Path(os.path.dirname(os.path.realpath(__file__))) / 'ses-pages'
+
+
+def load_ses_page(name):
+    with open(ses_pages_dir / name) as f:
+        page = json.load(f)
+
+    page['elements'] = {int(k): v for k, v in page['elements'].items()}
+    return page
+
+
+@pytest.fixture()
+def es24():
+    dmi = SimpleNamespace(system_product_name='TRUENAS-M60-HA', system_version='')
+    inquiry = {'vendor': 'iX', 'product': '4024Js', 'revision': '3010'}
+    sysfs_map = {i: BaseDev(name=f'sd{chr(ord("a") + i)}', locate='OFF') for i in range(19)}
+    with patch('middlewared.plugins.enclosure_.enclosure_class.parse_dmi', Mock(return_value=dmi)):
+        with patch('middlewared.plugins.enclosure_.enclosure_class.inquiry', Mock(return_value=inquiry)):
+            with patch('middlewared.plugins.enclosure_.enclosure_class.map_disks_to_enclosure_slots',
+                       Mock(return_value=sysfs_map)):
+                yield lambda page: Enclosure('/dev/bsg/17:0:0:0', '/dev/sg23', page)
+
+
+def test_update_status_only_parses_changed_elements(es24):
+    page = load_ses_page('ES24.json')
+    enc = es24(page)
+    assert enc.model == 'ES24'
+    assert enc.elements['Array Device Slot'][1]['dev'] == 'sda'
+    assert enc.elements['Power Supply'][26]['status'] == 'OK'
+
+    changed = copy.deepcopy(page)
+    # PSU R failed, disk inserted in slot 20
+    changed['elements'][26]['status'] = [2, 0, 0, 168]
+    changed['elements'][20]['status'] = [1, 0, 0, 0]
+
+    with patch.object(Enclosure, '_parse_element', autospec=True, side_effect=Enclosure._parse_element) as parse:
+        enc.update_status(changed)
+
+    assert sorted(call.args[1] for call in parse.call_args_list) == [20, 26]
+    assert enc.elements == es24(changed).elements
+    assert enc.elements['Power Supply'][26]['status'] == 'Critical'
+
+    with patch.object(Enclosure, '_parse_element', autospec=True) as parse:
+        enc.update_status(changed)
+
+    parse.assert_not_called()
+    assert enc.elements == es24(changed).elements
+
+
+def test_update_status_keeps_ignored_elements_ignored(es24):
+    page = load_ses_page('ES24.json')
+    page['elements'][37] = {'type': 23, 'descriptor': 'SLOT 25', 'status': [0, 0, 0, 0]}
+    enc = es24(page)
+    enc.update_status(page)
+
+    assert 25 not in enc.elements['Array Device Slot']
+    assert enc.elements == es24(page).elements
+
+
+@pytest.fixture()
+def service():
+    ses = [{'should_ignore': False, 'controller': False, 'id': 'ses0', 'name': 'ES24', 'model': 'ES24',
+            'elements': {'Array Device Slot': {}, 'Power Supply': {1: {'status': 'OK'}}}}]
+    e = Enclosure2Service(Mock())
+    e.middleware = Middleware()
+    e.middleware['enclosure2.map_jbof'] = Mock(return_value=[])
+    e.map_nvme = Mock(return_value=[])
+    with patch('middlewared.plugins.enclosure_.enclosure2.get_ses_enclosures', Mock(return_value=ses)) as get_ses:
+        yield e, get_ses
+
+
+def test_enclosures_are_served_from_cache(service):
+    e, get_ses = service
+
+    enclosures = e.get_enclosures()
+    assert [enc['id'] for enc in enclosures] == ['ses0']
+    # Results can be modified by the caller
+    enclosures[0]['elements'].pop('Power Supply')
+
+    assert e.get_enclosures()[0]['elements']['Power Supply'] == {1: {'status': 'OK'}}
+    assert get_ses.call_count == 1
+    assert e.map_nvme.call_count == 1
+    assert e.middleware['enclosure2.map_jbof'].call_count == 1
+
+
+def test_status_is_refreshed_after_ttl(service):
+    e, get_ses = service
+
+    e.get_enclosures()
+    with patch('middlewared.plugins.enclosure_.enclosure2.ENCLOSURE_STATUS_TTL', 0):
+        e.get_enclosures()
+
+    # Only SES status is read again, enclosures are not re-created
+    assert get_ses.call_count == 2
+    assert get_ses.call_args.kwargs['cache'] is e._ses_cache
+    assert e.map_nvme.call_count == 1
+    assert e.middleware['enclosure2.map_jbof'].call_count == 1
+
+
+def test_invalidate(service):
+    e, get_ses = service
+
+    e.get_enclosures()
+    e._ses_cache['/dev/bsg/17:0:0:0'] = Mock()
+    e.invalidate(['ses', 'jbof'])
+    e.get_enclosures()
+
+    assert get_ses.call_count == 2
+    assert e._ses_cache == {}
+    assert e.map_nvme.call_count == 1
+    assert e.middleware['enclosure2.map_jbof'].call_count == 2
+
+
+def test_set_slot_status_invalidates_after_write(service):
+    e, get_ses = service
+    e.middleware['enclosure2.query'] = Mock(return_value={'id': 'es24n_0', 'model': 'ES24N'})
+    # Enclosures are queried while the status is being written
+    e.middleware['enclosure2.jbof_set_slot_status'] = Mock(side_effect=lambda *args: e.get_enclosures())
+
+    e.get_enclosures()
+    e.set_slot_status({'enclosure_id': 'es24n_0', 'slot': 1, 'status': 'ON'})
+    map_jbof_calls = e.middleware['enclosure2.map_jbof'].call_count
+
+    # Identification status is read again after it was written
+    e.get_enclosures()
+    assert e.middleware['enclosure2.map_jbof'].call_count == map_jbof_calls + 1
+
+
+@pytest.mark.asyncio
+async def test_disk_added_invalidates_views_with_disks():
+    m = Middleware()
+    m['enclosure2.invalidate'] = Mock()
+    await udev_block_devices_hook(m, {'DEVTYPE': 'disk', 'ACTION': 'add'})
+
+    m['enclosure2.invalidate'].assert_called_once_with(['ses', 'nvme', 'jbof'])
@@ -0,0 +1,193 @@
+import contextlib
+import json
+import os
+import textwrap
+import threading
+from unittest.mock import Mock, patch
+
+import pytest
+
+from middlewared.plugins.ipmi_ import sel, sensors, utils
+from middlewared.plugins.ipmi_.sel import IpmiSelService
+from middlewared.plugins.ipmi_.sensors import IpmiSensorsService
+from middlewared.pytest.unit.middleware import Middleware
+
+SENSORS = [
+    "1,CPU Temp,Temperature,Nominal,45.00,C,N/A,N/A,N/A,N/A,100.00,105.00,'OK'",
+    "2,PSU1 Status,Power Supply,Critical,N/A,N/A,N/A,N/A,N/A,N/A,N/A,N/A,"
+    "'Presence detected' 'Power Supply Failure detected'",
+]
+
+
+@contextlib.contextmanager
+def mock_binary(path, name, code):
+    """
+    Puts a fake `name` executable that runs `code` first in `PATH`. Its `argv` for every launch is recorded.
+    """
+    launches = path / f"{name}.launches"
+    binary = path / name
+    binary.write_text(textwrap.dedent("""\
+        #!/usr/bin/env python3
+        import json
+        import sys
+        import time
+
+        with open(%r, "a") as f:
+            f.write(json.dumps(sys.argv[1:]) + "\\n")
+
+    """ % str(launches)) + textwrap.dedent(code))
+    binary.chmod(0o755)
+
+    def launched():
+        if not launches.exists():
+            return []
+
+        return [json.loads(line) for line in launches.read_text().splitlines()]
+
+    with patch.dict(os.environ, {"PATH": f"{path}:{os.environ['PATH']}"}):
+        yield launched
+
+
+@pytest.fixture(autouse=True)
+def samplers(tmp_path):
+    with patch.object(utils, "IPMI_SDR_CACHE_DIR", str(tmp_path / "sdr-cache")):
+        with patch.object(sensors, "SENSORS_SAMPLER", utils.IpmiSampler()):
+            with patch.object(sel, "SEL_SAMPLER", utils.IpmiSampler()):
+                yield
+
+
+@pytest.fixture()
+def middleware():
+    m = Middleware()
+    m["ipmi.is_loaded"] = Mock(return_value=True)
+    m["failover.hardware"] = Mock(return_value="BHYVE")
+    return m
+
+
+@pytest.fixture()
+def ipmi_sensors(tmp_path):
+    with mock_binary(tmp_path, "ipmi-sensors", f"""\
+        time.sleep(0.2)
+        print({SENSORS!r}[0])
+        print({SENSORS!r}[1])
+    """) as launched:
+        yield launched
+
+
+def test_sensors_are_read_once(middleware, ipmi_sensors):
+    service = IpmiSensorsService(middleware)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.sample()["sensors"])) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(ipmi_sensors()) == 1
+    assert all(result == results[0] for result in results)
+    assert results[0][0]["reading"] == "45.00"
+    assert results[0][1]["event"] == ["presence detected", "power supply failure detected"]
+
+    # Later queries are served from the cache
+    assert service.sample()["sensors"] == results[0]
+    assert len(ipmi_sensors()) == 1
+
+    # SDR repository is cached
+    assert f"--sdr-cache-directory={utils.IPMI_SDR_CACHE_DIR}" in ipmi_sensors()[0]
+    assert os.path.isdir(utils.IPMI_SDR_CACHE_DIR)
+
+
+def test_sensors_are_reread_when_stale(middleware, ipmi_sensors):
+    service = IpmiSensorsService(middleware)
+    first = service.sample()
+    assert service.sample({"cache": 60})["timestamp"] == first["timestamp"]
+    assert len(ipmi_sensors()) == 1
+
+    second = service.sample({"cache": 0})
+    assert second["timestamp"] > first["timestamp"]
+    assert second["sensors"] == first["sensors"]
+    assert len(ipmi_sensors()) == 2
+
+
+def test_cached_sensors_are_not_modified_by_callers(middleware, ipmi_sensors):
+    service = IpmiSensorsService(middleware)
+    service.sample()["sensors"][1]["event"].append("modified")
+    assert service.sample()["sensors"][1]["event"] == ["presence detected", "power supply failure detected"]
+
+
+@pytest.fixture()
+def sel_log(tmp_path):
+    path = tmp_path / "sel.json"
+
+    def write(records, erased="01/01/2024 - 00:00:00"):
+        path.write_text(json.dumps({"records": records, "erased": erased}))
+
+    write([])
+    with mock_binary(tmp_path, "ipmi-sel", f"""\
+        with open({str(path)!r}) as f:
+            sel = json.load(f)
+
+        if "--info" in sys.argv:
+            print("Number of log entries : %d" % len(sel["records"]))
+            print("Recent addition timestamp : %s" % (sel["records"][-1][0] if sel["records"] else "N/A"))
+            print("Recent erase timestamp : %s" % sel["erased"])
+        else:
+            first = 0
+            for arg in sys.argv:
+                if arg.startswith("--range="):
+                    first = int(arg.split("=")[1].split("-")[0])
+
+            for id_, event in sel["records"]:
+                if id_ >= first:
+                    print(f"{{id_}},Jan-01-2024,00:00:00,PSU1 Status,Power Supply,Assertion Event,{{event}}")
+    """) as launched:
+        yield write, launched
+
+
+def elist(service):
+    return [(int(record["id"]), record["event"]) for record in service.sample({"cache": 0})["records"]]
+
+
+def test_sel_is_read_incrementally(middleware, sel_log):
+    write, launched = sel_log
+    service = IpmiSelService(middleware)
+
+    write([(1, "Presence detected"), (2, "Failure detected")])
+    assert elist(service) == [(1, "Presence detected"), (2, "Failure detected")]
+    assert [argv for argv in launched() if "--info" not in argv][-1][-1].startswith("--sdr-cache-directory")
+
+    # Nothing changed, only SEL info is read
+    launches = len(launched())
+    assert elist(service) == [(1, "Presence detected"), (2, "Failure detected")]
+    assert launched()[launches:] == [["--info"]]
+
+    # Only new records are read
+    write([(1, "Presence detected"), (2, "Failure detected"), (3, "Power Supply AC lost")])
+    launches = len(launched())
+    assert elist(service) == [(1, "Presence detected"), (2, "Failure detected"), (3, "Power Supply AC lost")]
+    assert launched()[launches + 1][-1] == f"--range=3-{sel.SEL_RECORD_ID_MAX}"
+
+
+def test_sel_is_reread_after_erase(middleware, sel_log):
+    write, launched = sel_log
+    service = IpmiSelService(middleware)
+
+    write([(1, "Presence detected"), (2, "Failure detected")])
+    elist(service)
+
+    write([(1, "Power Supply AC lost")], erased="02/01/2024 - 00:00:00")
+    launches = len(launched())
+    assert elist(service) == [(1, "Power Supply AC lost")]
+    assert not any(arg.startswith("--range") for argv in launched()[launches:] for arg in argv)
+
+
+def test_sel_is_reread_if_records_were_overwritten(middleware, sel_log):
+    write, launched = sel_log
+    service = IpmiSelService(middleware)
+
+    write([(1, "Presence detected"), (2, "Failure detected")])
+    elist(service)
+
+    # SEL is full and the oldest record was overwritten
+    write([(2, "Failure detected"), (3, "Power Supply AC lost"), (4, "Presence detected")])
+    assert elist(service) == [(2, "Failure detected"), (3, "Power Supply AC lost"), (4, "Presence detected")]
@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from middlewared.plugins.iscsi_ import scst
+from middlewared.plugins.iscsi_.scst import iSCSITargetService, scst_batch_write
+from middlewared.pytest.unit.middleware import Middleware
+from middlewared.service_exception import CallError
+
+EXTENTS = 1000
+TARGETS = 100
+WRITE_LATENCY = 0.001
+
+
+@pytest.fixture()
+def sysfs(tmp_path):
+    """
+    Fake SCST sysfs tree with `EXTENTS` devices exported by `TARGETS` iSCSI targets.
+    """
+    base = str(tmp_path / 'scst_tgt')
+    for i in range(EXTENTS):
+        os.makedirs(f'{base}/devices/extent{i}')
+        with open(f'{base}/devices/extent{i}/cluster_mode', 'w') as f:
+            f.write('0\n')
+
+        os.makedirs(f'{base}/handlers/vdisk_blockio/extent{i}')
+        with open(f'{base}/handlers/vdisk_blockio/extent{i}/active', 'w') as f:
+            f.write('0\n')
+
+    for i in range(TARGETS):
+        os.makedirs(f'{base}/targets/iscsi/iqn.2005-10.org.freenas.ctl:target{i}/ini_groups/security_group/luns')
+        with open(f'{base}/targets/iscsi/iqn.2005-10.org.freenas.ctl:target{i}/ini_groups/security_group/luns/mgmt',
+                  'w'):
+            pass
+
+    with patch.object(scst, 'SCST_BASE', base):
+        with patch.object(scst, 'SCST_DEVICES', f'{base}/devices'):
+            yield base
+
+
+class Recorder:
+    """
+    Records SCST sysfs writes (appending to the files, as `mgmt` files are command channels) and the number of
+    writes done in parallel.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, path, text):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.latency)
+            if not os.path.exists(path):
+                raise ValueError(f'Unexpected path "{path}"')
+
+            with open(path, 'a') as f:
+                f.write(text)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_set_devices_cluster_mode(sysfs):
+    service = iSCSITargetService(Middleware())
+    service.set_devices_cluster_mode([f'extent{i}' for i in range(EXTENTS)], 1)
+    assert all(read(f'{sysfs}/devices/extent{i}/cluster_mode') == '1\n' for i in range(EXTENTS))
+    assert service.cluster_mode_devices_set() and service.check_cluster_modes_clear() is False
+
+    service.set_all_cluster_mode(0)
+    assert service.check_cluster_modes_clear()
+
+
+def test_errors_are_reported_per_path(sysfs):
+    service = iSCSITargetService(Middleware())
+    with pytest.raises(CallError) as ve:
+        service.set_devices_cluster_mode(['extent1', 'missing', 'extent2'], 1)
+
+    assert f'{sysfs}/devices/missing/cluster_mode' in ve.value.errmsg
+    assert 'failed to write 1 of 3 paths' in ve.value.errmsg
+    # Other writes are done
+    assert read(f'{sysfs}/devices/extent1/cluster_mode') == '1\n'
+    assert read(f'{sysfs}/devices/extent2/cluster_mode') == '1\n'
+
+
+def test_writes_outside_of_scst_are_refused(sysfs, tmp_path):
+    (tmp_path / 'other').write_text('0\n')
+    result = scst_batch_write([(str(tmp_path / 'other'), '1\n')])
+    assert result['errors'][0]['path'] == str(tmp_path / 'other')
+    assert (tmp_path / 'other').read_text() == '0\n'
+
+
+def test_replace_luns(sysfs):
+    service = iSCSITargetService(Middleware())
+    recorder = Recorder()
+    iscsi_luns = [[f'iqn.2005-10.org.freenas.ctl:target{i % TARGETS}', f'extent{i}', i // TARGETS]
+                  for i in range(EXTENTS)]
+    with patch.object(scst, 'scst_path_write', recorder):
+        result = service.replace_luns(iscsi_luns, [])
+
+    assert result['errors'] == []
+    assert result['trace']['writes'] == EXTENTS
+    assert result['trace']['groups'] == TARGETS
+    assert len(result['trace']['slowest']) == scst.SCST_WRITE_TRACE_SLOWEST
+    # LUNs of a target are replaced in order
+    assert read(f'{sysfs}/targets/iscsi/iqn.2005-10.org.freenas.ctl:target7/ini_groups/security_group/luns/mgmt') == (
+        ''.join(f'replace extent{lun * TARGETS + 7} {lun}\n' for lun in range(EXTENTS // TARGETS))
+    )
+
+
+def test_activate_extents(sysfs, tmp_path):
+    service = iSCSITargetService(Middleware())
+    (tmp_path / 'file').write_text('')
+    failed = service.activate_extents(
+        [[f'extent{i}', 'DISK', str(tmp_path / 'file')] for i in range(10)] +
+        [['extent10', 'DISK', str(tmp_path / 'missing')], ['extent11', 'FILE', str(tmp_path / 'file')]]
+    )
+
+    assert failed == [['extent10', 'DISK', str(tmp_path / 'missing')], ['extent11', 'FILE', str(tmp_path / 'file')]]
+    assert all(read(f'{sysfs}/handlers/vdisk_blockio/extent{i}/active') == '1\n' for i in range(10))
+    assert read(f'{sysfs}/handlers/vdisk_blockio/extent10/active') == '0\n'
+
+
+def test_benchmark(sysfs):
+    """
+    Setting cluster_mode for `EXTENTS` devices on a sysfs where every write takes `WRITE_LATENCY` seconds.
+    """
+    service = iSCSITargetService(Middleware())
+    devices = [f'extent{i}' for i in range(EXTENTS)]
+
+    recorder = Recorder(WRITE_LATENCY)
+    with patch.object(scst, 'scst_path_write', recorder):
+        start = time.monotonic()
+        for device in devices:
+            service.path_write(f'{sysfs}/devices/{device}/cluster_mode', '1\n')
+        sequential = time.monotonic() - start
+
+        start = time.monotonic()
+        service.set_devices_cluster_mode(devices, 1)
+        batched = time.monotonic() - start
+
+    assert recorder.max_running == scst.SCST_WRITE_WORKERS
+    assert batched < sequential / 2, (batched, sequential)
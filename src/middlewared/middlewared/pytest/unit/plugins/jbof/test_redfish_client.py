@@ -0,0 +1,202 @@
+import datetime
+import hashlib
+import http.server
+import json
+import ssl
+import threading
+import time
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+import pytest
+
+from middlewared.plugins.jbof.redfish import RedfishClient
+from middlewared.plugins.jbof.redfish.client import REDFISH_MAX_CONNECTIONS
+
+IOMS = ['IOM1', 'IOM2']
+ETH_PER_IOM = 2
+
+
+def redfish_resources():
+    resources = {
+        '/redfish/v1': {'Links': {'Sessions': {'@odata.id': '/redfish/v1/SessionService/Sessions'}}},
+        '/redfish/v1/SessionService/Sessions': {'Members': []},
+        '/redfish/v1/Managers': {'Members': [{'@odata.id': f'/redfish/v1/Managers/{iom}'} for iom in IOMS]},
+    }
+    for i, iom in enumerate(IOMS):
+        eth_uris = [f'/redfish/v1/Managers/{iom}/EthernetInterfaces/{j}' for j in range(1, ETH_PER_IOM + 1)]
+        resources[f'/redfish/v1/Managers/{iom}/EthernetInterfaces'] = {
+            'Members': [{'@odata.id': uri} for uri in eth_uris],
+        }
+        for j, uri in enumerate(eth_uris, 1):
+            resources[uri] = {'IPv4Addresses': [{'Address': f'10.0.{i}.{j}'}]}
+
+    return resources
+
+
+def self_signed_certificate():
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'redfish')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key()).serial_number(
+        x509.random_serial_number()
+    ).not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1)).sign(key, hashes.SHA256())
+    return cert.public_bytes(serialization.Encoding.PEM), key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    )
+
+
+class RedfishHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', f'"{hashlib.sha256(body).hexdigest()}"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.rstrip('/')
+        with self.server.lock:
+            self.server.requests.append(path)
+            self.server.running += 1
+            self.server.max_running = max(self.server.max_running, self.server.running)
+
+        try:
+            time.sleep(self.server.delay)
+            if (data := self.server.resources.get(path)) is None:
+                self.send_error(404)
+                return
+
+            body = json.dumps(data).encode()
+            if self.headers.get('If-None-Match') == f'"{hashlib.sha256(body).hexdigest()}"':
+                self.server.not_modified.append(path)
+                self.send_response(304)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            self.send_json(data)
+        finally:
+            with self.server.lock:
+                self.server.running -= 1
+
+    def do_POST(self):
+        path = self.path.rstrip('/')
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.resources[path].update(payload)
+        self.send_json(self.server.resources[path])
+
+
+@pytest.fixture()
+def redfish_server(tmp_path):
+    cert, key = self_signed_certificate()
+    (tmp_path / 'cert.pem').write_bytes(cert)
+    (tmp_path / 'key.pem').write_bytes(key)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(tmp_path / 'cert.pem', tmp_path / 'key.pem')
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RedfishHandler)
+    server.daemon_threads = True
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    server.lock = threading.Lock()
+    server.resources = redfish_resources()
+    server.connections = 0
+    server.requests = []
+    server.not_modified = []
+    server.running = 0
+    server.max_running = 0
+    server.delay = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def redfish_client(server, **kwargs):
+    client = RedfishClient(f'https://127.0.0.1:{server.server_address[1]}', **kwargs)
+    client.login('admin', 'password')
+    return client
+
+
+def test_connection_is_reused(redfish_server):
+    client = redfish_client(redfish_server)
+    for iom in client.managers():
+        for uri in client.mgmt_ethernet_interfaces(iom).values():
+            client.iom_eth_mgmt_ips(uri)
+            client.iom_eth_mgmt_ips(uri)
+
+    assert len(redfish_server.requests) > 10
+    assert redfish_server.connections == 1
+
+    for i in range(10):
+        client.mgmt_ips()
+
+    assert redfish_server.connections <= REDFISH_MAX_CONNECTIONS
+
+
+def test_responses_are_cached(redfish_server):
+    client = redfish_client(redfish_server)
+    managers = client.managers()
+    assert managers == {iom: f'/redfish/v1/Managers/{iom}' for iom in IOMS}
+    assert client.managers() is managers
+    assert client.get_uri('/Managers/IOM1/EthernetInterfaces/1') is client.get_uri(
+        '/Managers/IOM1/EthernetInterfaces/1'
+    )
+
+    assert redfish_server.requests.count('/redfish/v1/Managers') == 1
+    assert redfish_server.requests.count('/redfish/v1/Managers/IOM1/EthernetInterfaces/1') == 1
+
+
+def test_expired_responses_are_revalidated(redfish_server):
+    client = redfish_client(redfish_server, cache_ttl=0)
+    managers = client.managers()
+    assert client.managers() is managers
+    assert redfish_server.not_modified == ['/redfish/v1/Managers']
+
+    redfish_server.resources['/redfish/v1/Managers']['Members'].pop()
+    assert client.managers() == {'IOM1': '/redfish/v1/Managers/IOM1'}
+
+
+def test_modified_resources_are_invalidated(redfish_server):
+    client = redfish_client(redfish_server)
+    uri = '/Managers/IOM1/EthernetInterfaces/1'
+    assert client.get_uri(uri)['IPv4Addresses'] == [{'Address': '10.0.0.1'}]
+
+    client.post(uri, data={'IPv4Addresses': [{'Address': '10.0.0.100'}]})
+    assert client.get_uri(uri)['IPv4Addresses'] == [{'Address': '10.0.0.100'}]
+
+    redfish_server.resources[f'/redfish/v1{uri}']['IPv4Addresses'] = [{'Address': '10.0.0.200'}]
+    assert client.get_uri(uri)['IPv4Addresses'] == [{'Address': '10.0.0.100'}]
+    client.invalidate(uri)
+    assert client.get_uri(uri)['IPv4Addresses'] == [{'Address': '10.0.0.200'}]
+
+
+def test_sub_resources_are_fetched_concurrently(redfish_server):
+    client = redfish_client(redfish_server)
+    client.managers()
+    for iom in IOMS:
+        client.mgmt_ethernet_interfaces(iom)
+
+    redfish_server.delay = 0.1
+    assert sorted(client.mgmt_ips()) == ['10.0.0.1', '10.0.0.2', '10.0.1.1', '10.0.1.2']
+    assert redfish_server.max_running > 1
+    # IPs are never served from the cache
+    assert sorted(client.mgmt_ips()) == ['10.0.0.1', '10.0.0.2', '10.0.1.1', '10.0.1.2']
+    assert redfish_server.requests.count('/redfish/v1/Managers/IOM2/EthernetInterfaces/2') == 2
@@ -0,0 +1,268 @@
+import itertools
+import threading
+import time
+from unittest.mock import Mock, patch
+
+from kmip.core import enums
+from kmip.pie.exceptions import KmipOperationFailure
+import pytest
+
+from middlewared.plugins.kmip.sed_keys import KMIPService as KMIPSEDKeysService
+from middlewared.plugins.kmip.utils import KMIP_MAX_CONNECTIONS
+from middlewared.plugins.kmip.zfs_keys import KMIPService as KMIPZFSKeysService
+from middlewared.pytest.unit.middleware import Middleware
+from middlewared.utils import filter_list
+
+DATASETS = 200
+
+
+class MockKmipServer:
+    """
+    In-memory KMIP server implementing the subset of operations used by `ProxyKmipClient` consumers.
+    """
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.objects = {}
+        self.active = set()
+        self.uids = itertools.count(1)
+        self.connections = 0
+        self.open_connections = 0
+        self.max_running = 0
+        self.running = 0
+        self.fail_register = set()
+
+    def client(self, **kwargs):
+        return MockProxyKmipClient(self)
+
+    def operation(self, func, *args):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+
+        try:
+            time.sleep(self.delay)
+            with self.lock:
+                return func(*args)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def not_found(self, uid):
+        if uid not in self.objects:
+            raise KmipOperationFailure(
+                enums.ResultStatus.OPERATION_FAILED, enums.ResultReason.ITEM_NOT_FOUND, f'{uid} not found',
+            )
+
+    def register(self, secret_data):
+        if secret_data.value.decode() in self.fail_register:
+            raise KmipOperationFailure(
+                enums.ResultStatus.OPERATION_FAILED, enums.ResultReason.GENERAL_FAILURE, 'Register failed',
+            )
+
+        uid = str(next(self.uids))
+        self.objects[uid] = secret_data
+        return uid
+
+    def activate(self, uid):
+        self.not_found(uid)
+        self.active.add(uid)
+
+    def get(self, uid):
+        self.not_found(uid)
+        return self.objects[uid]
+
+    def revoke(self, reason, uid):
+        self.not_found(uid)
+        self.active.discard(uid)
+
+    def destroy(self, uid):
+        self.not_found(uid)
+        self.objects.pop(uid)
+
+    def secret(self, uid):
+        return self.objects[uid].value.decode()
+
+
+class MockProxyKmipClient:
+    def __init__(self, server):
+        self.server = server
+
+    def __enter__(self):
+        with self.server.lock:
+            self.server.connections += 1
+            self.server.open_connections += 1
+        return self
+
+    def __exit__(self, *args):
+        with self.server.lock:
+            self.server.open_connections -= 1
+
+    def __getattr__(self, name):
+        return lambda *args: self.server.operation(getattr(self.server, name), *args)
+
+
+class Datastore:
+    def __init__(self, rows):
+        self.rows = rows
+        self.bulk_writes = []
+
+    def query(self, name, filters=None, options=None):
+        return [dict(row) for row in filter_list(list(self.rows.values()), filters)]
+
+    def bulk_write(self, name, operations, options=None):
+        self.bulk_writes.append(operations)
+        for operation in operations:
+            self.rows[operation['id']].update(operation['data'])
+
+
+@pytest.fixture()
+def kmip_server():
+    server = MockKmipServer()
+    with patch('middlewared.plugins.kmip.connection.ProxyKmipClient', server.client):
+        yield server
+
+
+def middleware(datastore, datasets=()):
+    m = Middleware()
+    m['datastore.query'] = datastore.query
+    m['datastore.bulk_write'] = datastore.bulk_write
+    m['datastore.config'] = Mock(return_value={'id': 1, 'sed_passwd': '', 'kmip_uid': None})
+    m['zfs.dataset.query'] = Mock(return_value=[{'id': name} for name in datasets])
+    m['zfs.dataset.check_keys'] = Mock(side_effect=lambda keys: {name: True for name in keys})
+    m['kmip.connection_config'] = Mock(return_value={})
+    m['kmip.test_connection'] = Mock(return_value=True)
+    m['network.general.will_perform_activity'] = Mock()
+    return m
+
+
+def encrypted_datasets(count):
+    return {
+        i: {'id': i, 'name': f'tank/ds{i}', 'encryption_key': f'key{i}', 'kmip_uid': None}
+        for i in range(1, count + 1)
+    }
+
+
+def test_push_zfs_keys(kmip_server):
+    kmip_server.delay = 0.005
+    datastore = Datastore(encrypted_datasets(DATASETS))
+    # This dataset no longer exists
+    datastore.rows[DATASETS + 1] = {'id': DATASETS + 1, 'name': 'tank/gone', 'encryption_key': 'key', 'kmip_uid': None}
+    m = middleware(datastore, [f'tank/ds{i}' for i in range(1, DATASETS + 1)])
+    service = KMIPZFSKeysService(m)
+    job = Mock()
+
+    assert service.push_zfs_keys(job=job) == []
+
+    assert len(datastore.bulk_writes) == 1
+    for i in range(1, DATASETS + 1):
+        row = datastore.rows[i]
+        assert row['encryption_key'] is None
+        assert kmip_server.secret(row['kmip_uid']) == f'key{i}'
+        assert service.zfs_keys[f'tank/ds{i}'] == f'key{i}'
+
+    assert datastore.rows[DATASETS + 1]['kmip_uid'] is None
+    assert 'tank/gone' not in service.zfs_keys
+
+    assert 1 < kmip_server.max_running <= KMIP_MAX_CONNECTIONS
+    assert kmip_server.connections <= KMIP_MAX_CONNECTIONS
+    assert kmip_server.open_connections == 0
+    assert job.set_progress.call_count == DATASETS
+    job.set_progress.assert_called_with(100, f'{DATASETS}/{DATASETS} datasets synced')
+
+
+def test_push_zfs_keys_replaces_existing_keys(kmip_server):
+    datastore = Datastore(encrypted_datasets(3))
+    m = middleware(datastore, ['tank/ds1', 'tank/ds2', 'tank/ds3'])
+    service = KMIPZFSKeysService(m)
+    service.push_zfs_keys()
+    old_uids = {row['kmip_uid'] for row in datastore.rows.values()}
+
+    datastore.rows[1]['encryption_key'] = 'new key'
+    kmip_server.fail_register.add('key3')
+    datastore.rows[3]['encryption_key'] = 'key3'
+    assert service.push_zfs_keys() == ['tank/ds3']
+
+    assert kmip_server.secret(datastore.rows[1]['kmip_uid']) == 'new key'
+    # Old keys were destroyed
+    assert set(kmip_server.objects) == {datastore.rows[1]['kmip_uid'], datastore.rows[2]['kmip_uid']}
+    assert datastore.rows[1]['kmip_uid'] not in old_uids
+    assert datastore.rows[3] == {'id': 3, 'name': 'tank/ds3', 'encryption_key': 'key3', 'kmip_uid': None}
+
+
+def test_push_zfs_keys_checks_memory_keys_in_batch(kmip_server):
+    datastore = Datastore(encrypted_datasets(10))
+    m = middleware(datastore, [f'tank/ds{i}' for i in range(1, 11)])
+    service = KMIPZFSKeysService(m)
+    service.push_zfs_keys()
+
+    service.zfs_keys['tank/ds1'] = 'stale key'
+    m['zfs.dataset.check_keys'].side_effect = lambda keys: {name: key != 'stale key' for name, key in keys.items()}
+    service.push_zfs_keys()
+
+    m['zfs.dataset.check_keys'].assert_called_with({f'tank/ds{i}': f'key{i}' if i != 1 else 'stale key'
+                                                    for i in range(1, 11)})
+    # Only the key which did not match was retrieved from the KMIP server
+    assert service.zfs_keys['tank/ds1'] == 'key1'
+
+
+def test_pull_zfs_keys(kmip_server):
+    datastore = Datastore(encrypted_datasets(DATASETS))
+    m = middleware(datastore, [f'tank/ds{i}' for i in range(1, DATASETS + 1)])
+    service = KMIPZFSKeysService(m)
+    service.push_zfs_keys()
+    service.zfs_keys = {}
+    # Key was removed from KMIP server
+    kmip_server.destroy(datastore.rows[1]['kmip_uid'])
+    datastore.bulk_writes.clear()
+    job = Mock()
+
+    assert service.pull_zfs_keys(job) == ['tank/ds1']
+
+    assert len(datastore.bulk_writes) == 1
+    for i in range(2, DATASETS + 1):
+        assert datastore.rows[i]['encryption_key'] == f'key{i}'
+        assert datastore.rows[i]['kmip_uid'] is None
+
+    assert datastore.rows[1]['kmip_uid'] is not None
+    assert kmip_server.objects == {}
+    assert kmip_server.open_connections == 0
+    job.set_progress.assert_called_with(100, f'{DATASETS - 1}/{DATASETS - 1} keys removed from KMIP server')
+
+
+def test_pull_zfs_keys_without_connection(kmip_server):
+    datastore = Datastore(encrypted_datasets(3))
+    m = middleware(datastore, ['tank/ds1', 'tank/ds2', 'tank/ds3'])
+    service = KMIPZFSKeysService(m)
+    service.push_zfs_keys()
+    m['kmip.test_connection'].return_value = False
+
+    assert service.pull_zfs_keys() == []
+    assert [row['encryption_key'] for row in datastore.rows.values()] == ['key1', 'key2', 'key3']
+    # Keys could not be removed from the KMIP server
+    assert len(kmip_server.objects) == 3
+
+
+def test_push_and_pull_sed_keys(kmip_server):
+    datastore = Datastore({
+        f'disk{i}': {'identifier': f'disk{i}', 'passwd': f'passwd{i}', 'kmip_uid': None} for i in range(DATASETS)
+    })
+    datastore.rows['nokey'] = {'identifier': 'nokey', 'passwd': '', 'kmip_uid': None}
+    m = middleware(datastore)
+    service = KMIPSEDKeysService(m)
+
+    assert service.push_sed_keys(job=Mock()) == []
+    assert len(datastore.bulk_writes) == 1
+    assert all(not row['passwd'] for row in datastore.rows.values())
+    assert len(kmip_server.objects) == DATASETS
+    assert service.disks_keys == {f'disk{i}': f'passwd{i}' for i in range(DATASETS)}
+
+    service.disks_keys = {}
+    assert service.pull_sed_keys(Mock()) == []
+    assert len(datastore.bulk_writes) == 2
+    assert datastore.rows['disk10'] == {'identifier': 'disk10', 'passwd': 'passwd10', 'kmip_uid': None}
+    assert kmip_server.objects == {}
+    # One pool for push, one for retrieving and one for removing the keys in pull
+    assert kmip_server.connections <= 3 * KMIP_MAX_CONNECTIONS
+    assert kmip_server.open_connections == 0
@@ -0,0 +1,96 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+import pam
+import pytest
+
+from middlewared.plugins.api_key import ApiKeyService
+from middlewared.pytest.unit.middleware import Middleware
+from middlewared.utils.api_key_cache import ApiKeyCache
+
+KEY = '1-' + 'a' * 64
+USER_DATA = {'username': 'user', 'privilege': {'roles': ['READONLY_ADMIN']}}
+
+
+@pytest.fixture()
+def api_key():
+    m = Middleware()
+    m['auth.authenticate_plain'] = AsyncMock(return_value={
+        'pam_response': {'code': pam.PAM_SUCCESS, 'reason': ''},
+        'user_data': USER_DATA,
+    })
+    m['datastore.update'] = AsyncMock()
+    m['etc.generate'] = AsyncMock()
+    service = ApiKeyService(m)
+    service.get_instance = AsyncMock(return_value={
+        'id': 1, 'name': 'key', 'username': 'user', 'expires_at': None, 'revoked': False,
+    })
+    service.check_status = AsyncMock()
+    with patch('middlewared.plugins.api_key.API_KEY_CACHE', ApiKeyCache()):
+        yield m, service
+
+
+@pytest.mark.asyncio
+async def test_pam_is_called_once(api_key):
+    m, service = api_key
+    for i in range(3):
+        user_data, key = await service.authenticate(KEY)
+        assert user_data == USER_DATA
+        assert key == {'id': 1, 'name': 'key'}
+
+    m['auth.authenticate_plain'].assert_called_once_with('user', KEY, True)
+
+    # Cached result can not be modified by the caller
+    user_data['privilege']['roles'].append('FULL_ADMIN')
+    assert (await service.authenticate(KEY))[0] == USER_DATA
+
+
+@pytest.mark.asyncio
+async def test_failures_are_cached(api_key):
+    m, service = api_key
+    m['auth.authenticate_plain'].return_value = {
+        'pam_response': {'code': pam.PAM_AUTH_ERR, 'reason': 'Authentication failure'},
+        'user_data': None,
+    }
+    for i in range(3):
+        assert await service.authenticate(KEY) is None
+
+    m['auth.authenticate_plain'].assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_revoked_key_is_not_cached(api_key):
+    m, service = api_key
+    assert await service.authenticate(KEY) is not None
+
+    await service.revoke(1)
+    m['auth.authenticate_plain'].return_value = {
+        'pam_response': {'code': pam.PAM_AUTH_ERR, 'reason': 'Authentication failure'},
+        'user_data': None,
+    }
+    assert await service.authenticate(KEY) is None
+    assert m['auth.authenticate_plain'].call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_key_revoked_during_verification_is_not_cached(api_key):
+    m, service = api_key
+    revoked = asyncio.Event()
+
+    async def authenticate_plain(username, password, is_api_key):
+        # PAM conversation still sees the key as valid
+        await revoked.wait()
+        return {'pam_response': {'code': pam.PAM_SUCCESS, 'reason': ''}, 'user_data': USER_DATA}
+
+    m['auth.authenticate_plain'] = Mock(side_effect=authenticate_plain)
+    verification = asyncio.create_task(service.authenticate(KEY))
+    await asyncio.sleep(0)
+    await service.revoke(1)
+    revoked.set()
+    assert await verification is not None
+
+    m['auth.authenticate_plain'] = AsyncMock(return_value={
+        'pam_response': {'code': pam.PAM_AUTH_ERR, 'reason': 'Authentication failure'},
+        'user_data': None,
+    })
+    assert await service.authenticate(KEY) is None
@@ -0,0 +1,176 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+from middlewared.plugins.boot_ import environments
+from middlewared.plugins.boot_.environments import BootEnvironmentService, zfs_events_hook
+from middlewared.pytest.unit.middleware import Middleware
+
+
+def dataset(name, creation=0, used=0, origin="", children=None, **user_props):
+    properties = {
+        "creation": {"value": str(creation), "rawvalue": str(creation)},
+        "used": {"value": str(used), "rawvalue": str(used)},
+        "origin": {"value": origin, "rawvalue": origin},
+    }
+    properties.update({k.replace("__", ":"): {"value": v, "rawvalue": v} for k, v in user_props.items()})
+    return {"name": name, "properties": properties, "children": children or []}
+
+
+class FakeZFS:
+    """
+    libzfs handle with a boot pool containing an active `25.04` boot environment (with a cloned `var/log`) and
+    an old `24.10` boot environment.
+    """
+
+    def __init__(self):
+        self.bootfs = "boot-pool/ROOT/25.04"
+        self.passes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def get(self, name):
+        assert name == "boot-pool"
+        return SimpleNamespace(properties={"bootfs": SimpleNamespace(value=self.bootfs)})
+
+    def datasets_serialized(self, datasets, props, user_props, retrieve_children):
+        assert datasets == ["boot-pool/ROOT"]
+        self.passes += 1
+        return iter([dataset("boot-pool/ROOT", children=[
+            dataset("boot-pool/ROOT/24.10", 1700000000, 2048, truenas__kernel_version="6.6.44", zectl__keep="True",
+                    children=[dataset("boot-pool/ROOT/24.10/var"), dataset("boot-pool/ROOT/24.10/var/log")]),
+            dataset("boot-pool/ROOT/25.04", 1730000000, 4096, truenas__kernel_version="6.12.15", children=[
+                dataset("boot-pool/ROOT/25.04/var", children=[
+                    dataset("boot-pool/ROOT/25.04/var/log", origin="boot-pool/ROOT/24.10/var/log@25.04"),
+                ]),
+                dataset("boot-pool/ROOT/25.04/audit"),
+            ]),
+            dataset("boot-pool/ROOT/initial", 1600000000, 1024),
+        ])])
+
+
+@pytest.fixture()
+def service():
+    environments.BE_CACHE.invalidate()
+    zfs = FakeZFS()
+    m = Middleware()
+    m["boot.pool_name"] = Mock(return_value="boot-pool")
+    m["filesystem.mount_info"] = Mock(return_value={"mount_source": "boot-pool/ROOT/25.04"})
+    m["zfs.dataset.update"] = Mock()
+    m["pool.dataset.promote"] = Mock()
+    with patch.object(environments.libzfs, "ZFS", Mock(return_value=zfs), create=True):
+        yield BootEnvironmentService(m), zfs
+
+    environments.BE_CACHE.invalidate()
+
+
+def test_query(service):
+    svc, zfs = service
+    assert svc.query([], {}) == [
+        {
+            "id": "24.10",
+            "dataset": "boot-pool/ROOT/24.10",
+            "active": False,
+            "activated": False,
+            "created": datetime.datetime(2023, 11, 14, 22, 13, 20),
+            "used_bytes": 2048,
+            "used": "2 KiB",
+            "keep": True,
+            "can_activate": True,
+        },
+        {
+            "id": "25.04",
+            "dataset": "boot-pool/ROOT/25.04",
+            "active": True,
+            "activated": True,
+            "created": datetime.datetime(2024, 10, 27, 3, 33, 20),
+            "used_bytes": 4096,
+            "used": "4 KiB",
+            "keep": False,
+            "can_activate": True,
+        },
+        {
+            "id": "initial",
+            "dataset": "boot-pool/ROOT/initial",
+            "active": False,
+            "activated": False,
+            "created": datetime.datetime(2020, 9, 13, 12, 26, 40),
+            "used_bytes": 1024,
+            "used": "1 KiB",
+            "keep": False,
+            "can_activate": False,
+        },
+    ]
+
+
+def test_query_is_cached(service):
+    svc, zfs = service
+    svc.query([], {})
+    # Mutating the results does not affect the cache
+    svc.query([["id", "=", "25.04"]], {"get": True})["keep"] = True
+    assert svc.query([["id", "=", "25.04"]], {"get": True})["keep"] is False
+    assert zfs.passes == 1
+
+
+def test_keep_invalidates_cache(service):
+    svc, zfs = service
+    svc.query([], {})
+    svc.keep({"id": "24.10", "value": False})
+    svc.middleware["zfs.dataset.update"].assert_called_once_with(
+        "boot-pool/ROOT/24.10", {"properties": {"zectl:keep": {"value": "False"}}},
+    )
+    assert zfs.passes == 2
+
+
+def test_activate_invalidates_cache(service):
+    svc, zfs = service
+    with patch.object(environments, "run_zectl_cmd") as run_zectl_cmd:
+        run_zectl_cmd.side_effect = lambda cmd: setattr(zfs, "bootfs", "boot-pool/ROOT/24.10")
+        assert svc.activate({"id": "24.10"})["activated"] is True
+
+    run_zectl_cmd.assert_called_once_with(["activate", "24.10"])
+
+
+@pytest.mark.parametrize("event,invalidated", [
+    ({"class": "sysevent.fs.zfs.history_event", "pool": "boot-pool", "history_dsname": "boot-pool/ROOT/25.05"}, True),
+    ({"class": "sysevent.fs.zfs.config_sync", "pool": "boot-pool"}, True),
+    ({"class": "sysevent.fs.zfs.history_event", "pool": "tank", "history_dsname": "tank/work"}, False),
+    ({"class": "sysevent.fs.zfs.scrub_start", "pool": "boot-pool"}, False),
+])
+def test_zfs_events_invalidate_cache(service, event, invalidated):
+    svc, zfs = service
+    svc.query([], {})
+    asyncio.run(zfs_events_hook(svc.middleware, event))
+    svc.query([], {})
+    assert zfs.passes == (2 if invalidated else 1)
+
+
+def test_result_gathered_during_invalidation_is_discarded(service):
+    svc, zfs = service
+    datasets_serialized = zfs.datasets_serialized
+
+    def invalidating_datasets_serialized(**kwargs):
+        environments.BE_CACHE.invalidate()
+        return datasets_serialized(**kwargs)
+
+    zfs.datasets_serialized = invalidating_datasets_serialized
+    svc.query([], {})
+    zfs.datasets_serialized = datasets_serialized
+    svc.query([], {})
+    assert zfs.passes == 2
+
+
+def test_promote_current_datasets(service):
+    svc, zfs = service
+    svc.promote_current_datasets()
+    svc.middleware["pool.dataset.promote"].assert_called_once_with("boot-pool/ROOT/25.04/var/log")
+    # Promotion changes origins
+    svc.query([], {})
+    assert zfs.passes == 2
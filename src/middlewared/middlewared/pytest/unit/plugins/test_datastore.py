@@ -41,6 +41,7 @@ async def datastore_test():
 
                 m["datastore.execute"] = ds.execute
                 m["datastore.execute_write"] = ds.execute_write
+                m["datastore.execute_write_many"] = ds.execute_write_many
                 m["datastore.fetchall"] = ds.fetchall
 
                 m["datastore.query"] = ds.query
@@ -51,6 +52,7 @@ async def datastore_test():
                 m["datastore.insert"] = ds.insert
                 m["datastore.update"] = ds.update
                 m["datastore.delete"] = ds.delete
+                m["datastore.bulk_write"] = ds.bulk_write
 
                 yield ds
 
@@ -591,6 +593,49 @@ async def test__delete_by_filter():
         assert await ds.query("test.custompk", [], {"count": True}) == 1
 
 
+@pytest.mark.asyncio
+async def test__bulk_write():
+    async with datastore_test() as ds:
+        ds.execute("INSERT INTO test_custompk VALUES ('ID1', 'Test 1')")
+        ds.execute("INSERT INTO test_custompk VALUES ('ID2', 'Test 2')")
+
+        await ds.bulk_write("test.custompk", [
+            {"action": "DELETE", "id": "ID1"},
+            {"action": "UPDATE", "id": "ID2", "data": {"name": "Updated"}},
+            {"action": "INSERT", "data": {"identifier": "ID3", "name": "Test 3"}},
+        ], {"prefix": "custom_"})
+
+        assert await ds.query("test.custompk", [], {"prefix": "custom_"}) == [
+            {"identifier": "ID2", "name": "Updated"},
+            {"identifier": "ID3", "name": "Test 3"},
+        ]
+        ds.middleware.call_hook_inline.assert_called_once_with(
+            "datastore.post_execute_write_many",
+            [
+                ("DELETE FROM test_custompk WHERE test_custompk.custom_identifier = ?", ["ID1"]),
+                ("UPDATE test_custompk SET custom_name=? WHERE test_custompk.custom_identifier = ?",
+                 ["Updated", "ID2"]),
+                ("INSERT INTO test_custompk (custom_identifier, custom_name) VALUES (?, ?)", ["ID3", "Test 3"]),
+            ],
+            ANY,
+        )
+
+
+@pytest.mark.asyncio
+async def test__bulk_write_rollback():
+    async with datastore_test() as ds:
+        ds.execute("INSERT INTO test_custompk VALUES ('ID1', 'Test 1')")
+
+        with pytest.raises(RuntimeError):
+            await ds.bulk_write("test.custompk", [
+                {"action": "UPDATE", "id": "ID1", "data": {"name": "Updated"}},
+                {"action": "UPDATE", "id": "ID2", "data": {"name": "Updated"}},
+            ], {"prefix": "custom_"})
+
+        assert await ds.query("test.custompk", [], {"prefix": "custom_"}) == [{"identifier": "ID1", "name": "Test 1"}]
+        ds.middleware.call_hook_inline.assert_not_called()
+
+
 class DiskModel(Model):
     __tablename__ = 'storage_disk'
 
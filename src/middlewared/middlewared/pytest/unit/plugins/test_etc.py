@@ -0,0 +1,185 @@
+import asyncio
+from collections import Counter
+import copy
+import gc
+import os
+from unittest.mock import Mock
+
+import pytest
+
+from middlewared.plugins.etc import EtcService, PyRenderer
+from middlewared.pytest.unit.middleware import Middleware
+
+CTX_LATENCY = 0.02
+
+
+class FakeRenderer:
+    def __init__(self):
+        self.contexts = {}
+        # keeps contexts alive so that their ids are not reused
+        self.seen = []
+
+    async def render(self, path, ctx):
+        if ctx is not None:
+            # entries of the same group share the context, only keep the one the first of them got
+            if id(ctx) not in self.contexts:
+                self.contexts[id(ctx)] = copy.deepcopy(ctx)
+                self.seen.append(ctx)
+            # renderers are allowed to modify the context
+            for value in ctx.values():
+                value.clear()
+
+
+class CtxMiddleware(Middleware):
+    """
+    Answers every `ctx` method as if it were a datastore query taking `CTX_LATENCY` seconds.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls = Counter()
+        self.log = []
+        self.failing = set()
+        self.running = 0
+        self.max_running = 0
+
+    async def call(self, name, *args):
+        self.calls[(name, repr(args))] += 1
+        self.log.append(('call', name))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(CTX_LATENCY)
+        finally:
+            self.running -= 1
+        if name in self.failing:
+            raise ValueError(f'{name} failed')
+
+        return [{'id': 1, 'method': name}]
+
+
+def ctx_methods(checkpoint):
+    for name, group in EtcService.GROUPS.items():
+        if isinstance(group, dict) and any(e.get('checkpoint', 'initial') == checkpoint for e in group['entries']):
+            yield from group['ctx']
+
+
+@pytest.fixture()
+def etc():
+    m = CtxMiddleware()
+    svc = EtcService(m)
+    renderer = FakeRenderer()
+    svc._renderers = {'mako': renderer, 'py': renderer}
+
+    generate = svc._generate
+
+    async def logged_generate(name, *args, **kwargs):
+        m.log.append(('start', name))
+        try:
+            return await generate(name, *args, **kwargs)
+        finally:
+            m.log.append(('end', name))
+
+    svc._generate = logged_generate
+    return m, svc, renderer
+
+
+@pytest.mark.asyncio
+async def test_generate_checkpoint_benchmark(etc):
+    m, svc, renderer = etc
+    methods = list(ctx_methods('initial'))
+    distinct = {(method['method'], repr(tuple(method.get('args', [])))) for method in methods}
+    assert len(distinct) < len(methods)
+
+    await svc.generate_checkpoint('initial')
+
+    # Every distinct ctx call is only made once
+    assert set(m.calls) == distinct
+    assert set(m.calls.values()) == {1}
+    # ...and calls of the same group are made concurrently
+    assert m.max_running > 1
+
+    timings = await svc.get_timings()
+    assert timings['smb']['checkpoint'] == 'initial'
+    assert set(timings['smb']) == {'checkpoint', 'ctx', 'render'}
+    # groups without entries for the checkpoint are skipped altogether
+    assert 'libvirt' not in timings
+
+
+@pytest.mark.asyncio
+async def test_generate_checkpoint_groups_get_own_ctx(etc):
+    m, svc, renderer = etc
+
+    await svc.generate_checkpoint('initial')
+
+    # `shadow` and `user` groups share `user.query` result but changes made by one group are not seen by another
+    user_queries = [ctx['user.query'] for ctx in renderer.contexts.values() if 'user.query' in ctx]
+    assert len(user_queries) > 2
+    assert all(user_query == [{'id': 1, 'method': 'user.query'}] for user_query in user_queries)
+    assert m.calls[('user.query', repr(([['local', '=', True]],)))] == 1
+
+
+@pytest.mark.asyncio
+async def test_generate_checkpoint_keeps_group_order(etc):
+    m, svc, renderer = etc
+
+    await svc.generate_checkpoint('initial')
+
+    # ctx methods of a group are only called once the previous groups have been rendered
+    group = None
+    for event, name in m.log:
+        if event == 'start':
+            assert group is None
+            group = name
+        elif event == 'end':
+            group = None
+        else:
+            assert name in {method['method'] for method in EtcService.GROUPS[group]['ctx']}
+
+
+@pytest.mark.asyncio
+async def test_generate_checkpoint_ctx_failure(etc):
+    m, svc, renderer = etc
+    m.failing = {'ssh.config', 'ldap.config', 'kerberos.config'}
+    exception_handler = Mock()
+    asyncio.get_running_loop().set_exception_handler(exception_handler)
+
+    await svc.generate_checkpoint('initial')
+    gc.collect()
+
+    # Other groups are still generated
+    assert 'nfsd' in svc.timings
+    assert 'ssh' not in svc.timings
+    exception_handler.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_gather_ctx_prefix(etc):
+    m, svc, renderer = etc
+
+    assert await svc.gather_ctx([
+        {'method': 'service.started_or_enabled', 'args': ['cifs']},
+        {'method': 'service.started_or_enabled', 'args': ['ups'], 'ctx_prefix': 'ups'},
+    ]) == {
+        'service.started_or_enabled': [{'id': 1, 'method': 'service.started_or_enabled'}],
+        'ups.service.started_or_enabled': [{'id': 1, 'method': 'service.started_or_enabled'}],
+    }
+
+
+@pytest.mark.asyncio
+async def test_py_renderer_module_cache(tmp_path):
+    renderer = PyRenderer(Mock(middleware=Middleware()))
+    path = tmp_path / 'renderer'
+    path.with_suffix('.py').write_text('def render(service, middleware):\n    return "v1"\n')
+
+    assert await renderer.render(str(path), None) == 'v1'
+    mod = renderer.modules[str(path)][1]
+    assert await renderer.render(str(path), None) == 'v1'
+    assert renderer.modules[str(path)][1] is mod
+
+    path.with_suffix('.py').write_text('async def render(service, middleware, ctx):\n    return ctx\n')
+    st = os.stat(path.with_suffix('.py'))
+    os.utime(path.with_suffix('.py'), ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+
+    assert await renderer.render(str(path), 'v2') == 'v2'
+    assert renderer.modules[str(path)][1] is not mod
@@ -0,0 +1,326 @@
+import collections
+import os
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from middlewared.plugins.service_.services.base import SimpleService
+from middlewared.plugins.service_.services.base_state import ServiceState
+from middlewared.plugins.service_.services.unit_state import unit_name_from_path, UnitState, UnitStateCache
+from middlewared.pytest.unit.middleware import Middleware
+
+
+class StubMessage:
+    def __init__(self, path, body):
+        self.headers = {"Path": path}
+        self.body = body
+
+    def process_reply(self, full_response):
+        pass
+
+
+class StubDbusMessage:
+    """
+    Like pystemd `DbusMessage` returned by `DBus.process`, it is always truthy and is empty unless there was a message
+    that was not handled by any callback.
+    """
+
+    def __init__(self, msg=None):
+        self.msg = msg
+
+    def is_empty(self):
+        return self.msg is None
+
+
+class StubSystemd:
+    """
+    Stub of systemd D-Bus service: answers manager and unit method calls and delivers signals to subscribers.
+    """
+
+    def __init__(self, units):
+        self.units = units
+        self.calls = collections.Counter()
+        self.process_calls = 0
+        self.matches = {}
+        self.pending = collections.deque()
+        self.read_fd, self.write_fd = os.pipe()
+        self.broken = False
+        self.on_subscribe = None
+
+    def emit(self, member, path, body, buffered=False):
+        """
+        Queue a signal. `buffered` signals are already read from the socket so its file descriptor is not readable.
+        """
+        self.pending.append((member, StubMessage(path, body), buffered))
+        if not buffered:
+            os.write(self.write_fd, b"x")
+
+    def bus(self):
+        systemd = self
+
+        class Bus:
+            def __enter__(self):
+                if systemd.broken:
+                    raise RuntimeError("Connection refused")
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def match_signal(self, sender, path, interface, member, callback, userdata):
+                systemd.matches[member] = callback
+
+            def get_fd(self):
+                return systemd.read_fd
+
+            def process(self):
+                systemd.process_calls += 1
+                if systemd.broken:
+                    raise RuntimeError("Connection reset by peer")
+                if systemd.pending:
+                    member, msg, buffered = systemd.pending.popleft()
+                    if not buffered:
+                        os.read(systemd.read_fd, 1)
+                    if member not in systemd.matches:
+                        return StubDbusMessage(msg)
+
+                    systemd.matches[member](msg)
+
+                return StubDbusMessage()
+
+        return Bus()
+
+    def manager(self, bus):
+        systemd = self
+
+        def list_units_by_names(names):
+            systemd.calls["ListUnitsByNames"] += 1
+            return [
+                (name, b"", b"loaded", systemd.units.get(name, (b"inactive", 0))[0], b"dead", b"", b"", 0, b"", b"")
+                for name in names
+            ]
+
+        def subscribe():
+            systemd.calls["Subscribe"] += 1
+            if systemd.on_subscribe:
+                systemd.on_subscribe()
+
+        return SimpleNamespace(
+            load=lambda: None,
+            Manager=SimpleNamespace(ListUnitsByNames=list_units_by_names, Subscribe=subscribe),
+        )
+
+    def unit(self, name, bus):
+        self.calls["MainPID"] += 1
+        return SimpleNamespace(load=lambda: None, MainPID=self.units[name][1])
+
+
+def wait_for(condition):
+    for i in range(100):
+        if condition():
+            return
+        time.sleep(0.05)
+
+    assert False, "Condition was not met"
+
+
+@pytest.fixture()
+def systemd():
+    systemd = StubSystemd({
+        b"ssh.service": (b"active", 100),
+        b"smbd.service": (b"active", 200),
+        b"nfs-server.service": (b"inactive", 0),
+    })
+    cache = UnitStateCache(systemd.bus, lambda bus: systemd.manager(bus), lambda name, bus: systemd.unit(name, bus))
+    cache.start()
+    assert cache.listening.wait(5)
+    yield systemd, cache
+    systemd.broken = True
+
+
+def test_unit_name_from_path():
+    assert unit_name_from_path(b"/org/freedesktop/systemd1/unit/wg_2dquick_40wg0_2eservice") == b"wg-quick@wg0.service"
+    assert unit_name_from_path("/org/freedesktop/systemd1/job/123") is None
+
+
+def test_cold_cache_loads_units_in_bulk(systemd):
+    systemd, cache = systemd
+    names = [b"ssh.service", b"smbd.service", b"nfs-server.service"]
+
+    assert cache.get(names) == {
+        b"ssh.service": UnitState("active", 100),
+        b"smbd.service": UnitState("active", 200),
+        b"nfs-server.service": UnitState("inactive", 0),
+    }
+    assert systemd.calls == {"Subscribe": 1, "ListUnitsByNames": 1, "MainPID": 2}
+
+    cache.get(names)
+    assert cache.get_cached(b"ssh.service") == UnitState("active", 100)
+    assert systemd.calls == {"Subscribe": 1, "ListUnitsByNames": 1, "MainPID": 2}
+
+
+def test_properties_changed_updates_cache(systemd):
+    systemd, cache = systemd
+    cache.get([b"ssh.service"])
+
+    systemd.emit(b"PropertiesChanged", b"/org/freedesktop/systemd1/unit/ssh_2eservice", (
+        b"org.freedesktop.systemd1.Unit", {b"ActiveState": b"deactivating"}, [],
+    ))
+    systemd.emit(b"PropertiesChanged", b"/org/freedesktop/systemd1/unit/ssh_2eservice", (
+        b"org.freedesktop.systemd1.Service", {b"MainPID": 0}, [],
+    ))
+    wait_for(lambda: cache.get_cached(b"ssh.service") == UnitState("deactivating", 0))
+
+    # Units that are not cached are not affected
+    systemd.emit(b"PropertiesChanged", b"/org/freedesktop/systemd1/unit/smbd_2eservice", (
+        b"org.freedesktop.systemd1.Unit", {b"ActiveState": b"inactive"}, [],
+    ))
+    wait_for(lambda: not systemd.pending)
+    assert cache.get_cached(b"smbd.service") is None
+    assert systemd.calls["ListUnitsByNames"] == 1
+
+
+def test_job_removed_invalidates_unit(systemd):
+    systemd, cache = systemd
+    cache.get([b"ssh.service", b"smbd.service"])
+
+    systemd.units[b"ssh.service"] = (b"active", 101)
+    systemd.emit(b"JobRemoved", b"/org/freedesktop/systemd1", (1, b"/job/1", b"ssh.service", b"done"))
+    wait_for(lambda: cache.get_cached(b"ssh.service") is None)
+
+    assert cache.get([b"ssh.service", b"smbd.service"]) == {
+        b"ssh.service": UnitState("active", 101),
+        b"smbd.service": UnitState("active", 200),
+    }
+    assert systemd.calls["ListUnitsByNames"] == 2
+
+
+def test_listener_waits_for_messages(systemd):
+    systemd, cache = systemd
+    cache.get([b"ssh.service"])
+
+    systemd.emit(b"JobRemoved", b"/org/freedesktop/systemd1", (1, b"", b"ssh.service", b"done"))
+    systemd.emit(b"JobRemoved", b"/org/freedesktop/systemd1", (2, b"", b"smbd.service", b"done"))
+    wait_for(lambda: not systemd.pending)
+
+    # Listener is blocked in `select` instead of spinning on `process`
+    time.sleep(0.2)
+    process_calls = systemd.process_calls
+    time.sleep(0.2)
+    assert systemd.process_calls == process_calls <= 5
+    assert cache.get_cached(b"ssh.service") is None
+
+
+def test_listener_processes_buffered_signals(systemd):
+    systemd, cache = systemd
+    cache.get([b"ssh.service", b"smbd.service"])
+
+    # Signals read from the socket along with the first one do not make its file descriptor readable
+    systemd.emit(b"JobRemoved", b"/org/freedesktop/systemd1", (1, b"", b"ssh.service", b"done"))
+    systemd.emit(b"NameAcquired", b"/org/freedesktop/DBus", (b":1.100",), buffered=True)
+    systemd.emit(b"JobRemoved", b"/org/freedesktop/systemd1", (2, b"", b"smbd.service", b"done"), buffered=True)
+    wait_for(lambda: cache.get_cached(b"smbd.service") is None)
+    assert cache.get_cached(b"ssh.service") is None
+
+
+def test_listener_processes_signals_received_during_subscribe():
+    systemd = StubSystemd({})
+    cache = UnitStateCache(systemd.bus, lambda bus: systemd.manager(bus), lambda name, bus: systemd.unit(name, bus))
+    cache.units[b"ssh.service"] = UnitState("active", 100)
+    systemd.on_subscribe = lambda: systemd.emit(
+        b"JobRemoved", b"/org/freedesktop/systemd1", (1, b"", b"ssh.service", b"done"), buffered=True,
+    )
+    cache.start()
+    assert cache.listening.wait(5)
+
+    try:
+        wait_for(lambda: b"ssh.service" not in cache.units)
+    finally:
+        systemd.broken = True
+
+
+def test_signal_during_load_is_not_overwritten(systemd):
+    systemd, cache = systemd
+    manager = systemd.manager
+
+    def racing_manager(bus):
+        result = manager(bus)
+        list_units_by_names = result.Manager.ListUnitsByNames
+
+        def list_units(names):
+            units = list_units_by_names(names)
+            # unit is stopped after its state was read
+            cache.on_job_removed(StubMessage(None, (1, b"", b"ssh.service", b"done")))
+            return units
+
+        result.Manager.ListUnitsByNames = list_units
+        return result
+
+    cache.manager_factory = racing_manager
+    cache.get([b"ssh.service"])
+    assert cache.get_cached(b"ssh.service") is None
+
+
+def test_listener_failure_disables_cache(systemd):
+    systemd, cache = systemd
+    cache.get([b"ssh.service"])
+
+    with patch("middlewared.plugins.service_.services.unit_state.LISTENER_RESTART_DELAY", 0.1):
+        systemd.broken = True
+        systemd.emit(b"JobRemoved", b"/org/freedesktop/systemd1", (1, b"", b"ssh.service", b"done"))
+        wait_for(lambda: not cache.listening.is_set())
+
+        assert cache.get([b"ssh.service"]) is None
+        assert cache.get_cached(b"ssh.service") is None
+
+        # listener reconnects
+        systemd.broken = False
+        assert cache.listening.wait(5)
+        assert cache.get([b"ssh.service"]) == {b"ssh.service": UnitState("active", 100)}
+
+
+class SSHService(SimpleService):
+    name = "ssh"
+    systemd_unit = "ssh"
+
+
+@pytest.mark.asyncio
+async def test_simple_service_get_state_from_cache():
+    cache = UnitStateCache()
+    cache.listening.set()
+    cache.units[b"ssh.service"] = UnitState("active", 100)
+    m = Middleware()
+    m.run_in_thread = None
+
+    with patch("middlewared.plugins.service_.services.base.UNIT_STATE_CACHE", cache):
+        assert await SSHService(m).get_state() == ServiceState(True, [100])
+
+        cache.units[b"ssh.service"] = UnitState("inactive", 0)
+        assert await SSHService(m).get_state() == ServiceState(False, [])
+
+
+@pytest.mark.asyncio
+async def test_simple_service_action_invalidates_cache():
+    cache = UnitStateCache()
+    cache.listening.set()
+    cache.units[b"ssh.service"] = UnitState("active", 100)
+    m = Middleware()
+
+    with patch("middlewared.plugins.service_.services.base.UNIT_STATE_CACHE", cache):
+        with patch.object(SSHService, "_unit_action_sync"):
+            # The listener has not yet received the signals of the stop job
+            await SSHService(m).stop()
+
+        assert cache.get_cached(b"ssh.service") is None
+
+
+def test_cache_thread_is_started_once(systemd):
+    systemd, cache = systemd
+    thread = cache.thread
+    cache.start()
+
+    assert cache.thread is thread
+    assert len([t for t in threading.enumerate() if t is thread]) == 1
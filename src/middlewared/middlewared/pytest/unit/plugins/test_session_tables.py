@@ -0,0 +1,164 @@
+import os
+from unittest.mock import Mock, patch
+
+import pytest
+
+from middlewared.plugins.iscsi_ import global_linux
+from middlewared.plugins.iscsi_.global_linux import ISCSIGlobalService, read_session, scan_sessions
+from middlewared.plugins.nfs_ import status
+from middlewared.plugins.nfs_.status import NFSService, read_nfs4_client, scan_nfs4_clients
+from middlewared.pytest.unit.middleware import Middleware
+from middlewared.utils.directory_table import DirectoryTable
+
+BASENAME = 'iqn.2005-10.org.freenas.ctl'
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(data)
+
+
+def add_session(root, target, initiator, ip):
+    session_dir = os.path.join(root, target, 'sessions', initiator)
+    write(os.path.join(session_dir, ip, 'ip'), f'{ip}\n')
+    for name, value in (
+        ('HeaderDigest', 'None'),
+        ('DataDigest', 'CRC32C'),
+        ('MaxBurstLength', '1048576'),
+        ('MaxRecvDataSegmentLength', '262144'),
+        ('MaxXmitDataSegmentLength', '65536'),
+        ('FirstBurstLength', '65536'),
+        ('ImmediateData', 'Yes'),
+    ):
+        write(os.path.join(session_dir, name), f'{value}\n')
+
+
+@pytest.fixture()
+def iscsi(tmp_path):
+    root = str(tmp_path / 'iscsi')
+    for i in range(50):
+        add_session(root, f'{BASENAME}:target{i % 5}', f'iqn.1991-05.com.microsoft:host{i}', f'10.0.0.{i}')
+    # ALUA sessions between controllers are not reported
+    add_session(root, f'{BASENAME}:HA:target0', 'iqn.2005-10.org.freenas.ctl:HA:peer', '169.254.10.2')
+
+    reads = []
+
+    def read(session_dir, keys):
+        reads.append(keys['initiator'])
+        return read_session(session_dir, keys)
+
+    m = Middleware()
+    m['iscsi.global.config'] = Mock(return_value={'basename': BASENAME})
+    with patch.object(global_linux, 'SCST_ISCSI_TARGETS_PATH', root):
+        with patch.object(global_linux, 'SESSIONS', DirectoryTable(
+            scan_sessions, read, ['initiator', 'target', 'target_alias'], ttl=0,
+        )):
+            yield ISCSIGlobalService(m), root, reads
+
+
+def test_iscsi_sessions(iscsi):
+    service, root, reads = iscsi
+    sessions = service.sessions([], {'order_by': ['initiator']})
+    assert len(sessions) == 50
+    assert sessions[0] == {
+        'initiator': 'iqn.1991-05.com.microsoft:host0',
+        'initiator_addr': '10.0.0.0',
+        'initiator_alias': None,
+        'target': f'{BASENAME}:target0',
+        'target_alias': 'target0',
+        'header_digest': None,
+        'data_digest': 'CRC32C',
+        'max_data_segment_length': 262144,
+        'max_receive_data_segment_length': 262144,
+        'max_xmit_data_segment_length': 65536,
+        'max_burst_length': 1048576,
+        'first_burst_length': 65536,
+        'immediate_data': True,
+        'iser': False,
+        'offload': False,
+    }
+
+    # Existing sessions are not read again
+    add_session(root, f'{BASENAME}:target1', 'iqn.1991-05.com.microsoft:new', '10.0.1.1')
+    reads.clear()
+    assert len(service.sessions([], {})) == 51
+    assert reads == ['iqn.1991-05.com.microsoft:new']
+
+
+def test_iscsi_sessions_pushdown(iscsi):
+    service, root, reads = iscsi
+    assert service.sessions([['target', '=', f'{BASENAME}:target2']], {'count': True}) == 10
+    reads.clear()
+    assert service.sessions([['target_alias', 'in', ['target0', 'target1']]], {'limit': 3}) == [
+        session for session in service.sessions([], {}) if session['target_alias'] in ('target0', 'target1')
+    ][:3]
+    assert reads[:3] == [session['initiator'] for session in service.sessions(
+        [['target_alias', 'in', ['target0', 'target1']]], {'limit': 3},
+    )]
+
+
+def test_iscsi_session_without_connection_is_skipped(iscsi):
+    service, root, reads = iscsi
+    os.makedirs(os.path.join(root, f'{BASENAME}:target0', 'sessions', 'iqn.1991-05.com.microsoft:logging-in'))
+    assert not service.sessions([['initiator', '=', 'iqn.1991-05.com.microsoft:logging-in']], {})
+
+    add_session(root, f'{BASENAME}:target0', 'iqn.1991-05.com.microsoft:logging-in', '10.0.2.1')
+    assert service.sessions([['initiator', '=', 'iqn.1991-05.com.microsoft:logging-in']], {'get': True})[
+        'initiator_addr'
+    ] == '10.0.2.1'
+
+
+def test_iscsi_pushdown_skips_session_without_connection(iscsi):
+    service, root, reads = iscsi
+    # Sorts first among target0 sessions
+    os.makedirs(os.path.join(root, f'{BASENAME}:target0', 'sessions', 'iqn.1991-05.com.microsoft:a-logging-in'))
+    target0 = [['target', '=', f'{BASENAME}:target0']]
+
+    assert service.sessions(target0, {'count': True}) == 10
+    assert len(service.sessions(target0, {'order_by': ['initiator'], 'limit': 3})) == 3
+    last = service.sessions(target0, {'order_by': ['initiator'], 'offset': 9})
+    assert [session['initiator'] for session in last] == ['iqn.1991-05.com.microsoft:host5']
+    assert service.sessions(target0, {'order_by': ['initiator'], 'get': True})['initiator'] == (
+        'iqn.1991-05.com.microsoft:host0'
+    )
+
+
+@pytest.fixture()
+def nfsd(tmp_path):
+    root = str(tmp_path / 'clients')
+    for i in range(20):
+        write(os.path.join(root, str(i), 'info'), f'clientid: {i}\naddress: "10.0.1.{i}:790"\nstatus: confirmed\n')
+        write(os.path.join(root, str(i), 'states'), '')
+
+    reads = []
+
+    def read(path, keys):
+        reads.append(keys['id'])
+        return read_nfs4_client(path, keys)
+
+    with patch.object(status, 'NFSD_CLIENTS_PATH', root):
+        with patch.object(status, 'NFS4_CLIENTS', DirectoryTable(scan_nfs4_clients, read, ['id'], skips=False)):
+            with patch.object(NFSService, 'get_rmtab', Mock(return_value=[{'ip': '10.0.0.1', 'export': '/mnt'}])):
+                # Query filters and options schemas validation is not tested here
+                with patch.object(NFSService, 'get_nfs3_clients', NFSService.get_nfs3_clients.wraps):
+                    with patch.object(NFSService, 'get_nfs4_clients', NFSService.get_nfs4_clients.wraps):
+                        yield NFSService(Middleware()), reads
+
+
+def test_nfs_client_count_does_not_read_clients(nfsd):
+    service, reads = nfsd
+    assert service.client_count() == 21
+    assert reads == []
+
+
+def test_nfs4_clients(nfsd):
+    service, reads = nfsd
+    assert service.get_nfs4_clients([['id', '=', '7']], {'get': True}) == {
+        'id': '7',
+        'info': {'clientid': 7, 'address': '10.0.1.7:790', 'status': 'confirmed'},
+        'states': [],
+    }
+    assert reads == ['7']
+
+    assert len(service.get_nfs4_clients([['info.status', '=', 'confirmed']], {})) == 20
@@ -0,0 +1,211 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from pyVmomi import vim
+
+from middlewared.plugins import vmware
+from middlewared.plugins.vmware import VMWareService
+from middlewared.plugins.vmware_.inventory import VMInventory
+from middlewared.pytest.unit.middleware import Middleware
+
+VMS = 200
+
+
+def managed_object(type_, moid, **kwargs):
+    obj = Mock(spec=type_, **kwargs)
+    obj._moId = moid
+    return obj
+
+
+def object_content(obj, **props):
+    return SimpleNamespace(
+        obj=obj,
+        propSet=[SimpleNamespace(name=name.replace("__", "."), val=val) for name, val in props.items()],
+    )
+
+
+def disk(datastore):
+    return vim.vm.device.VirtualDisk(
+        backing=vim.vm.device.VirtualDisk.FlatVer2BackingInfo(fileName="[ds] vm/vm.vmdk", datastore=datastore),
+    )
+
+
+class ServiceInstance:
+    """
+    pyVmomi service instance of a vCenter with `VMS` VMs. Every VM has its config data on `config-store` and:
+        * vm0 ... vm9 have their disks on `nfs-store`
+        * vm10 ... vm19 have their disks on `nfs-store` and a PCI pass-through device
+        * vm20 ... vm29 have their disks on `nfs-store` and are powered off
+        * vm30 has its config data on `nfs-store-2` (matched by prefix) and no disks
+        * others have their disks on `iscsi-store`
+    Properties are paged by 50 objects.
+    """
+
+    def __init__(self):
+        self.datastores = {
+            name: managed_object(vim.Datastore, f"datastore-{i}")
+            for i, name in enumerate(["config-store", "nfs-store", "nfs-store-2", "iscsi-store"])
+        }
+        self.vms = []
+        objects = [object_content(datastore, name=name) for name, datastore in self.datastores.items()]
+        for i in range(VMS):
+            vm = managed_object(vim.VirtualMachine, f"vm-{i}")
+            devices = [vim.vm.device.VirtualCdrom(backing=None)]
+            if i < 30:
+                devices.append(disk(self.datastores["nfs-store"]))
+            elif i > 30:
+                devices.append(disk(self.datastores["iscsi-store"]))
+            if 10 <= i < 20:
+                devices.append(vim.VirtualPCIPassthrough())
+
+            self.vms.append(vm)
+            objects.append(object_content(
+                vm,
+                name=f"vm{i}",
+                config__uuid=f"uuid-{i}",
+                config__hardware__device=devices,
+                runtime__powerState="poweredOff" if 20 <= i < 30 else "poweredOn",
+                datastore=[self.datastores["nfs-store-2" if i == 30 else "config-store"]],
+            ))
+
+        self.pages = [
+            SimpleNamespace(objects=objects[i:i + 50], token=str(i + 50) if i + 50 < len(objects) else None)
+            for i in range(0, len(objects), 50)
+        ]
+        self.content = Mock()
+        self.content.viewManager.CreateContainerView.return_value = managed_object(vim.view.ContainerView, "view-1")
+        self.content.propertyCollector.RetrievePropertiesEx.side_effect = lambda specs, options: self.pages[0]
+        self.content.propertyCollector.ContinueRetrievePropertiesEx.side_effect = (
+            lambda token: self.pages[int(token) // 50]
+        )
+
+    def RetrieveContent(self):
+        return self.content
+
+
+def test_inventory():
+    si = ServiceInstance()
+    inventory = VMInventory.retrieve(si.RetrieveContent())
+
+    si.content.propertyCollector.RetrievePropertiesEx.assert_called_once()
+    assert si.content.propertyCollector.ContinueRetrievePropertiesEx.call_count == len(si.pages) - 1
+    si.content.viewManager.CreateContainerView.return_value.Destroy.assert_called_once_with()
+
+    assert len(inventory.vms) == VMS
+    assert [vm["name"] for vm in inventory.depending_on("nfs-store")] == [f"vm{i}" for i in range(31)]
+    assert [vm["name"] for vm in inventory.depending_on("iscsi-store")] == [f"vm{i}" for i in range(31, VMS)]
+    assert len(inventory.depending_on("config-store")) == VMS - 1
+    assert inventory.depending_on("unknown") == []
+
+    vm = inventory.by_uuid["uuid-15"][0]
+    assert vm["vm"] is si.vms[15]
+    assert vm["can_snapshot"] is False
+    assert inventory.by_uuid["uuid-25"][0]["powered_on"] is False
+    assert inventory.by_uuid["uuid-35"][0]["can_snapshot"] is True
+
+
+def vmsnapobj(datastore):
+    return {"hostname": "vcenter", "username": "root", "password": "password", "datastore": datastore}
+
+
+def test_snapshot_proceed_and_end():
+    si = ServiceInstance()
+    m = Middleware()
+    m["network.general.will_perform_activity"] = Mock()
+    m["alert.oneshot_create"] = Mock()
+    m["alert.oneshot_delete"] = Mock()
+    m["datastore.query"] = Mock(return_value=[])
+    service = VMWareService(m)
+
+    lock = threading.Lock()
+    running = {"now": 0, "max": 0}
+
+    def wait_for_task(task):
+        with lock:
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+        time.sleep(0.01)
+        with lock:
+            running["now"] -= 1
+
+    si.vms[5].CreateSnapshot_Task.side_effect = vim.fault.TaskInProgress(msg="Busy")
+    with patch.object(VMWareService, "connect", Mock(return_value=si)) as connect:
+        with patch.object(VMWareService, "disconnect") as disconnect:
+            with patch.object(vmware.VimTask, "WaitForTask", side_effect=wait_for_task):
+                context = service.snapshot_proceed("tank/vmware", [vmsnapobj("nfs-store"), vmsnapobj("nfs-store")])
+
+    # vCenter is connected to and its inventory is retrieved once per run
+    connect.assert_called_once()
+    disconnect.assert_called_once_with(si)
+    si.content.propertyCollector.RetrievePropertiesEx.assert_called_once()
+
+    assert running["max"] == vmware.VMWARE_SNAPSHOT_WORKERS
+    for i, vm in enumerate(si.vms):
+        # VM that depends on both datastores is only snapshotted once unless its snapshot failed
+        assert vm.CreateSnapshot_Task.call_count == (2 if i == 5 else 1 if i < 10 or i == 30 else 0), i
+
+    first, second = context["vmsnapobjs"]
+    assert first["snapvms"] == [f"uuid-{i}" for i in list(range(20)) + [30]]
+    assert first["snapvmskips"] == [[f"uuid-{i}", f"vm{i}"] for i in range(10, 20)]
+    assert first["snapvmfails"] == [["uuid-5", "vm5"]]
+    assert second["snapvms"] == first["snapvms"]
+    assert second["snapvmfails"] == [["uuid-5", "vm5"]]
+    assert context["vmsynced"] is False
+    m["alert.oneshot_create"].assert_called_with("VMWareSnapshotCreateFailed", {
+        "hostname": "vcenter", "vm": "vm5", "snapshot": context["vmsnapname"], "error": "Busy",
+    })
+
+    with patch.object(VMWareService, "connect", Mock(return_value=si)) as connect:
+        with patch.object(VMWareService, "disconnect"):
+            with patch.object(VMWareService, "delete_snapshot") as delete_snapshot:
+                service.snapshot_end(context)
+
+    connect.assert_called_once()
+    deleted = [call.args[0] for call in delete_snapshot.call_args_list]
+    assert deleted == 2 * [si.vms[i] for i in list(range(10)) + [30] if i != 5]
+
+
+def test_match_datastores_with_datasets():
+    m = Middleware()
+    m["interface.query"] = Mock(return_value=[
+        {"state": {"aliases": [{"type": "INET", "address": "192.168.0.2"}, {"type": "LINK", "address": "x"}]}},
+        {"state": {"aliases": [{"type": "INET6", "address": "fe80::1"}]}},
+    ])
+    m["iscsi.extent.query"] = Mock(return_value=[
+        {"path": "zvol/tank/vol", "naa": "0x6589cfc000000b3f0a891a2c4e187594"},
+        {"path": "/mnt/tank/file", "naa": "0x6589cfc000000000000000000000000"},
+    ])
+    m["zfs.pool.query_imported_fast"] = Mock(return_value={"1": {"name": "tank"}})
+    m["pool.dataset.query"] = Mock(return_value=[
+        {"type": "FILESYSTEM", "name": "tank", "mountpoint": "/mnt/tank"},
+        {"type": "FILESYSTEM", "name": "tank/nfs", "mountpoint": "/mnt/tank/nfs"},
+        {"type": "VOLUME", "name": "tank/vol", "mountpoint": None},
+        {"type": "VOLUME", "name": "tank/unshared", "mountpoint": None},
+    ])
+    service = VMWareService(m)
+    with patch.object(VMWareService, "_VMWareService__get_datastores", Mock(return_value={
+        "nfs": {
+            "type": "NFS", "remote_path": "/mnt/tank/nfs", "remote_hostnames": ["10.0.0.1", "192.168.0.2"],
+        },
+        "both": {
+            "type": "NFS41", "remote_path": "/mnt/tank", "remote_hostnames": ["192.168.0.2", "fe80::1"],
+        },
+        "zvol": {"type": "VMFS", "extent": ["naa.6589cfc000000b3f0a891a2c4e187594"]},
+        "local": {"type": "VMFS", "extent": ["mpx.vmhba0:C0:T0:L0"]},
+        "vffs": {"type": "VFFS"},
+    })):
+        result = service.match_datastores_with_datasets({"hostname": "vcenter", "username": "root", "password": ""})
+
+    assert [(datastore["name"], datastore["filesystems"]) for datastore in result["datastores"]] == [
+        ("both", ["tank"]),
+        ("local", []),
+        ("nfs", ["tank/nfs"]),
+        ("zvol", ["tank/vol"]),
+    ]
+    assert result["filesystems"][2] == {
+        "type": "VOLUME",
+        "name": "tank/unshared",
+        "description": "Not shared via iSCSI",
+    }
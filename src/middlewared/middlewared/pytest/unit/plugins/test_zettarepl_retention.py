@@ -0,0 +1,189 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import time
+
+import pytest
+
+from middlewared.plugins.zettarepl_.retention import (
+    owned_snapshots, owned_snapshots_diff, ownership_changed, SnapshotNameCache, SnapshotOwnerMatcher,
+)
+
+DATASETS = 10
+SNAPSHOTS_PER_DATASET = 10000
+
+ParsedSnapshotName = namedtuple("ParsedSnapshotName", ["naming_schema", "datetime"])
+Snapshot = namedtuple("Snapshot", ["dataset", "name"])
+Snapshot.__str__ = lambda self: f"{self.dataset}@{self.name}"
+
+
+class CountingParser:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, name, naming_schema):
+        self.calls += 1
+        return ParsedSnapshotName(naming_schema, datetime.strptime(name, naming_schema))
+
+
+class SnapshotOwner:
+    def __init__(self, dataset, recursive, naming_schema, hours):
+        self.dataset = dataset
+        self.recursive = recursive
+        self.hours = hours
+        self.periodic_snapshot_task = SimpleNamespace(id=1, naming_schema=naming_schema, lifetime=timedelta(days=1))
+
+    def owns_dataset(self, dataset):
+        return dataset == self.dataset or self.recursive and dataset.startswith(f"{self.dataset}/")
+
+    def owns_snapshot(self, dataset, parsed_snapshot_name):
+        return parsed_snapshot_name.datetime.hour in self.hours
+
+
+def generate_snapshots():
+    start = datetime(2024, 1, 1)
+    snapshots = []
+    for i in range(DATASETS):
+        dataset = "tank" if i == 0 else f"tank/ds{i}"
+        for j in range(SNAPSHOTS_PER_DATASET):
+            d = start + timedelta(minutes=15 * j)
+            if j % 10 == 0:
+                snapshots.append(Snapshot(dataset, d.strftime("manual-%Y%m%d%H%M")))
+            else:
+                snapshots.append(Snapshot(dataset, d.strftime("auto-%Y-%m-%d_%H-%M")))
+
+    return snapshots
+
+
+def reference_owned_snapshots(owner, snapshots):
+    """
+    The way `zettarepl.periodic_snapshot_task_snapshots` used to compute task snapshots.
+    """
+    result = set()
+    for snapshot in snapshots:
+        if owner.owns_dataset(snapshot.dataset):
+            try:
+                parsed = CountingParser()(snapshot.name, owner.periodic_snapshot_task.naming_schema)
+            except ValueError:
+                continue
+
+            if owner.owns_snapshot(snapshot.dataset, parsed):
+                result.add(str(snapshot))
+
+    return result
+
+
+@pytest.fixture(scope="module")
+def snapshots():
+    return generate_snapshots()
+
+
+def test_owned_snapshots(snapshots):
+    parser = CountingParser()
+    cache = SnapshotNameCache(parser)
+    owner = SnapshotOwner("tank", True, "auto-%Y-%m-%d_%H-%M", range(0, 24, 2))
+
+    start = time.monotonic()
+    result = owned_snapshots(SnapshotOwnerMatcher(owner, cache), snapshots)
+    elapsed = time.monotonic() - start
+
+    assert result == reference_owned_snapshots(owner, snapshots)
+    assert parser.calls == len(snapshots)
+
+    start = time.monotonic()
+    assert owned_snapshots(SnapshotOwnerMatcher(owner, cache), snapshots) == result
+    cached_elapsed = time.monotonic() - start
+
+    # Names are only parsed once
+    assert parser.calls == len(snapshots)
+    assert cached_elapsed < elapsed
+
+
+@pytest.mark.parametrize("old,new", [
+    # schedule change
+    (("tank", True, "auto-%Y-%m-%d_%H-%M", range(24)), ("tank", True, "auto-%Y-%m-%d_%H-%M", range(0, 24, 3))),
+    # task no longer recursive
+    (("tank", True, "auto-%Y-%m-%d_%H-%M", range(24)), ("tank", False, "auto-%Y-%m-%d_%H-%M", range(24))),
+    # naming schema change
+    (("tank", True, "auto-%Y-%m-%d_%H-%M", range(24)), ("tank", True, "manual-%Y%m%d%H%M", range(24))),
+    # dataset change
+    (("tank/ds1", False, "auto-%Y-%m-%d_%H-%M", range(24)), ("tank/ds2", False, "auto-%Y-%m-%d_%H-%M", range(24))),
+])
+def test_owned_snapshots_diff(snapshots, old, new):
+    parser = CountingParser()
+    cache = SnapshotNameCache(parser)
+    old_owner = SnapshotOwner(*old)
+    new_owner = SnapshotOwner(*new)
+
+    diff = owned_snapshots_diff(SnapshotOwnerMatcher(old_owner, cache), SnapshotOwnerMatcher(new_owner, cache),
+                                snapshots)
+
+    assert diff == reference_owned_snapshots(old_owner, snapshots) - reference_owned_snapshots(new_owner, snapshots)
+    assert diff
+    # Only snapshots owned by the old task are parsed with the new naming schema
+    assert parser.calls <= 2 * len(snapshots)
+
+
+def test_ownership_changed():
+    definition = {
+        "dataset": "tank", "recursive": True, "exclude": [], "lifetime": "P2W", "naming-schema": "auto-%Y",
+        "schedule": {"minute": "0"}, "allow-empty": True,
+    }
+
+    assert not ownership_changed(definition, dict(definition, lifetime="P1W", **{"allow-empty": False}))
+    assert ownership_changed(definition, dict(definition, exclude=["tank/work"]))
+    assert ownership_changed(definition, dict(definition, schedule={"minute": "30"}))
+
+
+def test_cache_invalidation():
+    parser = CountingParser()
+    cache = SnapshotNameCache(parser)
+    schema = "auto-%Y-%m-%d_%H-%M"
+    for dataset in ("tank", "tank/work", "tank/work/child", "tank/workspace"):
+        cache.parse(dataset, "auto-2024-01-01_00-00", schema)
+        cache.parse(dataset, "auto-2024-01-01_00-15", schema)
+
+    cache.remove_snapshot("tank/work", "auto-2024-01-01_00-00", recursive=True)
+    assert set(cache.datasets["tank"]) == {"auto-2024-01-01_00-00", "auto-2024-01-01_00-15"}
+    assert set(cache.datasets["tank/work"]) == {"auto-2024-01-01_00-15"}
+    assert set(cache.datasets["tank/work/child"]) == {"auto-2024-01-01_00-15"}
+    assert set(cache.datasets["tank/workspace"]) == {"auto-2024-01-01_00-00", "auto-2024-01-01_00-15"}
+
+    cache.remove_dataset("tank/work")
+    assert set(cache.datasets) == {"tank", "tank/workspace"}
+
+    cache.sync([Snapshot("tank", "auto-2024-01-01_00-15")])
+    assert set(cache.datasets["tank"]) == {"auto-2024-01-01_00-15"}
+
+    calls = parser.calls
+    cache.parse("tank", "auto-2024-01-01_00-00", schema)
+    assert parser.calls == calls + 1
+
+
+def test_cache_unparseable_name():
+    parser = CountingParser()
+    cache = SnapshotNameCache(parser)
+
+    assert cache.parse("tank", "manual", "auto-%Y-%m-%d_%H-%M") is None
+    assert cache.parse("tank", "manual", "auto-%Y-%m-%d_%H-%M") is None
+    assert parser.calls == 1
+
+
+def test_cache_sync_while_parsing():
+    schema = "auto-%Y-%m-%d_%H-%M"
+    parser = CountingParser()
+
+    def parse(name, naming_schema):
+        # Another thread syncs the cache while we are parsing
+        cache.sync([Snapshot("tank", "auto-2024-01-01_00-15"), Snapshot("tank", "auto-2024-01-01_00-45")])
+        return parser(name, naming_schema)
+
+    cache = SnapshotNameCache(parse)
+    cache.datasets["tank"] = {
+        "auto-2024-01-01_00-00": {schema: None},
+        "auto-2024-01-01_00-15": {schema: None},
+        "auto-2024-01-01_00-30": {schema: None},
+    }
+
+    parsed = cache.parse("tank", "auto-2024-01-01_00-45", schema)
+    assert cache.datasets["tank"] == {"auto-2024-01-01_00-15": {schema: None}, "auto-2024-01-01_00-45": {schema: parsed}}
@@ -0,0 +1,89 @@
+from unittest.mock import Mock, patch
+
+import pytest
+
+from middlewared.plugins.zfs_.dataset_quota import ZFSDatasetService
+from middlewared.service_exception import MatchNotFound
+
+QUOTAS = 100000
+
+
+def entries():
+    return [
+        {'quota_type': 'USER', 'id': i, 'used_bytes': (i * 7919) % QUOTAS, 'quota': 1024 if i % 2 else 0}
+        for i in range(QUOTAS)
+    ]
+
+
+def names(quota_type, ids):
+    return {i: None if i % 10 == 0 else f'user{i}' for i in ids}
+
+
+@pytest.fixture()
+def service():
+    resolve_names = Mock(side_effect=names)
+    with patch('middlewared.plugins.zfs_.dataset_quota.resolve_names', resolve_names):
+        yield ZFSDatasetService(Mock()), resolve_names
+
+
+def resolved_ids(resolve_names):
+    return sum((list(call.args[1]) for call in resolve_names.call_args_list), [])
+
+
+def test_page_resolves_only_returned_entries(service):
+    svc, resolve_names = service
+
+    result = svc.filter_quota_entries('USER', entries(), [['quota', '!=', 0]], {
+        'order_by': ['-used_bytes'], 'offset': 10, 'limit': 20,
+    })
+
+    expected = sorted((e for e in entries() if e['quota']), key=lambda e: e['used_bytes'], reverse=True)[10:30]
+    assert [e['id'] for e in result] == [e['id'] for e in expected]
+    assert resolve_names.call_count == 1
+    assert sorted(resolved_ids(resolve_names)) == sorted(e['id'] for e in expected)
+    for entry in result:
+        assert entry.get('name') == names('USER', [entry['id']])[entry['id']]
+
+
+def test_name_filter_resolves_all_entries(service):
+    svc, resolve_names = service
+
+    result = svc.filter_quota_entries('USER', entries(), [['name', '^', 'user12']], {
+        'order_by': ['id'], 'limit': 3, 'select': ['id', 'name'],
+    })
+
+    assert result == [{'id': 12, 'name': 'user12'}, {'id': 121, 'name': 'user121'}, {'id': 122, 'name': 'user122'}]
+    assert resolve_names.call_count == 1
+    assert len(resolved_ids(resolve_names)) == QUOTAS
+
+
+def test_order_by_name(service):
+    svc, resolve_names = service
+
+    result = svc.filter_quota_entries('USER', entries()[:20], [], {'order_by': ['nulls_last:-name'], 'limit': 2})
+
+    assert [e['id'] for e in result] == [9, 8]
+
+
+def test_count_does_not_resolve_names(service):
+    svc, resolve_names = service
+
+    assert svc.filter_quota_entries('USER', entries(), [['quota', '=', 0]], {'count': True}) == QUOTAS // 2
+    resolve_names.assert_not_called()
+
+
+def test_get(service):
+    svc, resolve_names = service
+
+    assert svc.filter_quota_entries('USER', entries(), [['id', '=', 5]], {'get': True})['name'] == 'user5'
+    assert resolved_ids(resolve_names) == [5]
+
+    with pytest.raises(MatchNotFound):
+        svc.filter_quota_entries('USER', entries(), [['id', '=', -1]], {'get': True})
+
+
+def test_project_quotas_are_not_resolved(service):
+    svc, resolve_names = service
+
+    assert len(svc.filter_quota_entries('PROJECT', entries(), [], {'limit': 5})) == 5
+    resolve_names.assert_not_called()
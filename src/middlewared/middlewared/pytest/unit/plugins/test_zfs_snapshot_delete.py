@@ -0,0 +1,97 @@
+import pytest
+
+from middlewared.plugins.zfs_.utils import delete_snapshots_batch, expand_snapshot_specs, parse_snapshot_spec
+
+
+@pytest.mark.parametrize("spec,result", [
+    ("tank/work@auto-1", ("tank/work", "auto-1")),
+    ("tank/work@auto-1%auto-9", ("tank/work", ("auto-1", "auto-9"))),
+    ("tank/work@%auto-9", ("tank/work", (None, "auto-9"))),
+    ("tank/work@auto-1%", ("tank/work", ("auto-1", None))),
+    ("tank@%", ("tank", (None, None))),
+])
+def test_parse_snapshot_spec(spec, result):
+    assert parse_snapshot_spec(spec) == result
+
+
+@pytest.mark.parametrize("spec", ["tank/work", "tank/work@", "@snap", "tank@a%b%c"])
+def test_parse_snapshot_spec_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_snapshot_spec(spec)
+
+
+SNAPSHOTS = ["a", "b", "c", "d", "e"]
+
+
+@pytest.mark.parametrize("specs,to_delete,errors", [
+    ([(0, "b"), (1, "d")], [(0, "b"), (1, "d")], {}),
+    ([(0, ("b", "d"))], [(0, "b"), (0, "c"), (0, "d")], {}),
+    ([(0, (None, "b")), (1, ("d", None))], [(0, "a"), (0, "b"), (1, "d"), (1, "e")], {}),
+    # Snapshot referenced by multiple specs is only deleted once
+    ([(0, "c"), (1, ("b", "d"))], [(0, "c"), (1, "b"), (1, "d")], {}),
+    ([(0, "x"), (1, ("b", "x")), (2, ("d", "b")), (3, "a")], [(3, "a")], {
+        0: "Snapshot 'x' does not exist",
+        1: "Snapshot 'x' does not exist",
+        2: "Snapshot 'd' was created after 'b'",
+    }),
+])
+def test_expand_snapshot_specs(specs, to_delete, errors):
+    assert expand_snapshot_specs(specs, SNAPSHOTS) == (to_delete, errors)
+
+
+class SnapshotBusy(Exception):
+    pass
+
+
+def snapshot_error(e):
+    return isinstance(e, SnapshotBusy)
+
+
+class FakeDataset:
+    def __init__(self, snapshots, busy, error=None):
+        self.snapshots = set(snapshots)
+        self.busy = set(busy)
+        self.error = error
+        self.calls = 0
+
+    def delete(self, names):
+        # ZFS destroys snapshots atomically, either all of them or none
+        self.calls += 1
+        if self.error:
+            raise self.error
+        if busy := self.busy.intersection(names):
+            raise SnapshotBusy(f"{sorted(busy)[0]}: dataset is busy")
+
+        self.snapshots -= set(names)
+
+
+def test_delete_snapshots_batch_single_call():
+    snapshots = [f"auto-{i}" for i in range(10000)]
+    ds = FakeDataset(snapshots, [])
+
+    assert delete_snapshots_batch(ds.delete, list(enumerate(snapshots)), snapshot_error) == {}
+    assert ds.snapshots == set()
+    assert ds.calls == 1
+
+
+def test_delete_snapshots_batch_reports_failures():
+    snapshots = [f"auto-{i}" for i in range(10000)]
+    ds = FakeDataset(snapshots, ["auto-17", "auto-5000"])
+
+    assert delete_snapshots_batch(ds.delete, list(enumerate(snapshots)), snapshot_error) == {
+        "auto-17": "auto-17: dataset is busy",
+        "auto-5000": "auto-5000: dataset is busy",
+    }
+    assert ds.snapshots == {"auto-17", "auto-5000"}
+    # Only the halves containing busy snapshots are retried
+    assert ds.calls < 60
+
+
+def test_delete_snapshots_batch_does_not_split_on_other_errors():
+    snapshots = [f"auto-{i}" for i in range(10000)]
+    ds = FakeDataset(snapshots, [], RuntimeError("pool is read-only"))
+
+    assert delete_snapshots_batch(ds.delete, list(enumerate(snapshots)), snapshot_error) == {
+        snapshot: "pool is read-only" for snapshot in snapshots
+    }
+    assert ds.calls == 1
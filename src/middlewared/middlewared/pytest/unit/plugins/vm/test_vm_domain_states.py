@@ -0,0 +1,234 @@
+import collections
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import libvirt
+import pytest
+
+from middlewared.plugins.vm.connection import LibvirtConnectionMixin
+from middlewared.plugins.vm.domain_states import DomainStates
+from middlewared.plugins.vm.supervisor.utils import DomainState
+from middlewared.plugins.vm.vm_supervisor import VMSupervisorMixin
+from middlewared.plugins.vm.vms import VMService
+from middlewared.pytest.unit.middleware import Middleware
+
+DOMAIN_XML = '''
+<domain type="test">
+  <name>{name}</name>
+  <memory>8192</memory>
+  <os><type>hvm</type></os>
+</domain>
+'''
+
+
+class CountingConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.calls = collections.Counter()
+
+    def __getattr__(self, name):
+        self.calls[name] += 1
+        return getattr(self.connection, name)
+
+
+def wait_for(predicate, timeout=5):
+    stop = time.monotonic() + timeout
+    while time.monotonic() < stop:
+        if predicate():
+            return True
+        time.sleep(0.01)
+
+    return predicate()
+
+
+@pytest.fixture(scope='module')
+def event_loop_impl():
+    libvirt.virEventRegisterDefaultImpl()
+
+    def run():
+        while True:
+            libvirt.virEventRunDefaultImpl()
+
+    # Make sure the loop wakes up regularly even if there are no events
+    libvirt.virEventAddTimeout(100, lambda timer, opaque: None, None)
+    threading.Thread(target=run, daemon=True).start()
+
+
+@pytest.fixture()
+def connection(event_loop_impl):
+    conn = libvirt.open('test:///default')
+    domains = []
+
+    def define(name, start=False):
+        domain = conn.defineXML(DOMAIN_XML.format(name=name))
+        domains.append(domain)
+        if start:
+            domain.create()
+        return domain
+
+    conn.define = define
+    try:
+        yield conn
+    finally:
+        for domain in domains:
+            try:
+                if domain.isActive():
+                    domain.destroy()
+                domain.undefine()
+            except libvirt.libvirtError:
+                pass
+        conn.close()
+
+
+def test_reconcile(connection):
+    connection.define('1_vm1', start=True)
+    connection.define('2_vm2')
+    counting = CountingConnection(connection)
+    states = DomainStates()
+
+    result = states.get_states(counting)
+    assert result['1_vm1'] == (DomainState.RUNNING, True)
+    assert result['2_vm2'] == (DomainState.SHUTOFF, False)
+    assert states.get_states(counting) == result
+    assert counting.calls == {'listAllDomains': 1}
+
+    # New connection
+    assert states.get_states(CountingConnection(connection)) == result
+
+
+def test_lifecycle_events(connection):
+    vm1 = connection.define('1_vm1', start=True)
+    states = DomainStates()
+    states.get_states(connection)
+    callback_id = connection.domainEventRegisterAny(
+        None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, lambda conn, dom, event, detail, opaque: states.update(dom), None,
+    )
+    try:
+        vm1.suspend()
+        assert wait_for(lambda: states.states['1_vm1'] == (DomainState.PAUSED, True))
+
+        vm1.resume()
+        assert wait_for(lambda: states.states['1_vm1'] == (DomainState.RUNNING, True))
+
+        vm1.destroy()
+        assert wait_for(lambda: states.states['1_vm1'] == (DomainState.SHUTOFF, False))
+
+        connection.define('2_vm2')
+        assert wait_for(lambda: states.states.get('2_vm2') == (DomainState.SHUTOFF, False))
+
+        vm1.undefine()
+        assert wait_for(lambda: '1_vm1' not in states.states)
+    finally:
+        connection.domainEventDeregisterAny(callback_id)
+
+
+def test_events_received_while_reconciling_are_kept(connection):
+    connection.define('1_vm1', start=True)
+    states = DomainStates()
+
+    class Domain:
+        def __init__(self, domain):
+            self.domain = domain
+
+        def name(self):
+            return self.domain.name()
+
+        def state(self):
+            # Domain is paused by the time the event is processed, but we have listed it as running
+            states.update(Mock(**{'name.return_value': '1_vm1', 'state.return_value': [libvirt.VIR_DOMAIN_PAUSED, 0],
+                                  'isActive.return_value': 1}))
+            return [libvirt.VIR_DOMAIN_RUNNING, 0]
+
+        def isActive(self):
+            return 1
+
+    conn = Mock(**{'listAllDomains.return_value': [Domain(connection.lookupByName('1_vm1'))]})
+    assert states.get_states(conn)['1_vm1'] == (DomainState.PAUSED, True)
+
+
+def test_concurrent_reconcile(connection):
+    connection.define('1_vm1', start=True)
+    states = DomainStates()
+    listing = threading.Barrier(2, timeout=1)
+    calls = collections.Counter()
+
+    def list_all_domains():
+        calls['listAllDomains'] += 1
+        try:
+            # Wait for the other reconciliation to start listing domains too (it must not)
+            listing.wait()
+        except threading.BrokenBarrierError:
+            pass
+
+        return connection.listAllDomains()
+
+    conn = Mock(**{'listAllDomains.side_effect': list_all_domains})
+    errors = []
+
+    def run(method):
+        try:
+            method(conn)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=run, args=(states.reconcile,)),
+        threading.Thread(target=run, args=(states.get_states,)),
+        threading.Thread(target=run, args=(states.get_states,)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert states.get_states(conn)['1_vm1'] == (DomainState.RUNNING, True)
+    # `get_states` callers that waited for a reconciliation in progress do not repeat it
+    assert calls['listAllDomains'] <= 2
+    assert states.updated is None
+
+
+def test_vm_query_does_not_query_libvirt_per_vm(connection):
+    connection.define('1_vm1', start=True)
+    connection.define('2_vm2')
+    counting = CountingConnection(connection)
+
+    m = Middleware()
+    m['system.state'] = Mock(return_value='READY')
+    service = VMService(m)
+    rows = [{'id': 1, 'name': 'vm1'}, {'id': 2, 'name': 'vm2'}, {'id': 3, 'name': 'vm3'}]
+    with patch.object(LibvirtConnectionMixin, 'LIBVIRT_CONNECTION', counting):
+        with patch.object(LibvirtConnectionMixin, 'KVM_SUPPORTED', True):
+            # Domain objects are not used
+            with patch.object(VMSupervisorMixin, 'vms', {'vm1': Mock(spec=[]), 'vm2': Mock(spec=[])}):
+                with patch('middlewared.plugins.vm.vms.DOMAIN_STATES', DomainStates()):
+                    service.extend_context(rows, {})
+                    counting.calls.clear()
+                    status = service.extend_context(rows, {})['status']
+
+    assert status[1]['state'] == 'RUNNING'
+    assert status[1]['domain_state'] == 'RUNNING'
+    assert status[2]['state'] == 'STOPPED'
+    assert status[3]['state'] == 'ERROR'
+    # Only the connection liveness check
+    assert counting.calls == {'isAlive': 1, 'listAllDomains': 1}
+
+
+@pytest.mark.parametrize('action,state', [
+    ('_poweroff', (DomainState.SHUTOFF, False)),
+    ('_suspend', (DomainState.PAUSED, True)),
+])
+def test_lifecycle_action_updates_state(connection, action, state):
+    vm1 = connection.define('1_vm1', start=True)
+    states = DomainStates()
+    states.get_states(connection)
+
+    # Lifecycle events are not received
+    vm = Mock(domain=vm1, poweroff=vm1.destroy, suspend=vm1.suspend)
+    with patch.object(VMSupervisorMixin, 'vms', {'vm1': vm}):
+        with patch.object(VMSupervisorMixin, '_check_domain_status'):
+            with patch('middlewared.plugins.vm.vm_supervisor.DOMAIN_STATES', states):
+                getattr(VMService(Middleware()), action)('vm1')
+
+    assert states.states['1_vm1'] == state
@@ -0,0 +1,156 @@
+import gzip
+import json
+from unittest.mock import Mock
+
+from aiohttp.test_utils import make_mocked_request
+import pytest
+
+from middlewared.pytest.unit.middleware import Middleware
+from middlewared.restful import OpenAPIResource, OPENAPI_DOCUMENT_VARIANTS
+
+
+def method(**kwargs):
+    return {
+        'description': 'Method description',
+        'downloadable': False,
+        'uploadable': False,
+        'check_pipes': True,
+        'filterable': False,
+        'item_method': False,
+        'accepts': [],
+        'returns': [],
+        'examples': {'rest': []},
+        **kwargs,
+    }
+
+
+@pytest.fixture()
+def openapi():
+    rest = Mock()
+    rest.middleware = Middleware()
+    rest._methods = {
+        'user.query': method(filterable=True, accepts=[{'type': 'array', 'title': 'query-filters'}]),
+        'user.create': method(
+            accepts=[{'type': 'object', 'title': 'user_create', 'properties': {
+                'username': {'type': 'string'}, 'full_name': {'type': ['string', 'null']},
+            }}],
+            returns=[{'type': 'integer', 'title': 'user_create_returns'}],
+            examples={'rest': ['Create a user\n{"username": "ünïcode"}']},
+        ),
+        'user.update': method(item_method=True, accepts=[
+            {'type': 'integer', 'title': 'id'}, {'type': 'object', 'title': 'user_update'},
+        ]),
+        'user.delete': method(item_method=True, accepts=[{'type': 'integer', 'title': 'id'}]),
+        'pool.dataset.export': method(downloadable=True, check_pipes=False, accepts=[
+            {'type': 'string', 'title': 'name'}, {'type': 'boolean', 'title': 'recursive'},
+        ]),
+    }
+    resource = OpenAPIResource(rest)
+    config = {'datastore_primary_key_type': 'integer'}
+    resource.add_path('user', 'get', 'user.query', config)
+    resource.add_path('user', 'post', 'user.create', config)
+    resource.add_path('user/id/{id_}', 'put', 'user.update', config)
+    resource.add_path('user/id/{id_}', 'delete', 'user.delete', config)
+    resource.add_path('pool/dataset/export', 'post', 'pool.dataset.export', config)
+    resource.render()
+    return resource
+
+
+def legacy_get(openapi, req):
+    servers = []
+    host = req.headers.get('Host')
+    scheme = req.headers.get('X-Scheme') or req.scheme
+    port = int(req.headers.get('X-Server-Port') or 80)
+    if host:
+        if port not in [80, 443]:
+            host = f'{host}:{port}'
+        servers.append({
+            'url': f'{scheme}://{host}/api/v2.0',
+        })
+
+    result = {
+        'openapi': '3.0.0',
+        'info': {
+            'title': 'TrueNAS RESTful API',
+            'version': 'v2.0',
+        },
+        'paths': openapi._paths,
+        'servers': servers,
+        'components': openapi._components,
+        'security': [{'basic': []}],
+    }
+    return json.dumps(result, indent=True).encode()
+
+
+@pytest.mark.parametrize('headers', [
+    {},
+    {'Host': 'truenas.local'},
+    {'Host': 'truenas.local', 'X-Server-Port': '8080', 'X-Scheme': 'https'},
+])
+@pytest.mark.asyncio
+async def test_document_is_identical_to_legacy(openapi, headers):
+    req = make_mocked_request('GET', '/api/v2.0', headers=headers)
+    resp = await openapi.get(req)
+    assert resp.status == 200
+    assert resp.content_type == 'application/json'
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.body == legacy_get(openapi, req)
+
+
+@pytest.mark.asyncio
+async def test_document_is_compressed(openapi):
+    req = make_mocked_request('GET', '/api/v2.0', headers={'Host': 'truenas.local', 'Accept-Encoding': 'gzip, deflate'})
+    resp = await openapi.get(req)
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(resp.body) == legacy_get(openapi, req)
+
+    req = make_mocked_request('GET', '/api/v2.0', headers={'Accept-Encoding': 'gzip;q=0, identity'})
+    assert 'Content-Encoding' not in (await openapi.get(req)).headers
+
+
+@pytest.mark.asyncio
+async def test_conditional_get(openapi):
+    req = make_mocked_request('GET', '/api/v2.0', headers={'Host': 'truenas.local'})
+    etag = (await openapi.get(req)).headers['ETag']
+
+    req = make_mocked_request('GET', '/api/v2.0', headers={'Host': 'truenas.local', 'If-None-Match': etag})
+    resp = await openapi.get(req)
+    assert resp.status == 304
+    assert resp.body is None
+
+    # Document depends on the server URL
+    req = make_mocked_request('GET', '/api/v2.0', headers={'Host': 'other.local', 'If-None-Match': etag})
+    assert (await openapi.get(req)).status == 200
+
+    # Representations with different content coding have different ETags
+    req = make_mocked_request('GET', '/api/v2.0', headers={
+        'Host': 'truenas.local', 'If-None-Match': etag, 'Accept-Encoding': 'gzip',
+    })
+    assert (await openapi.get(req)).status == 200
+
+
+@pytest.mark.asyncio
+async def test_document_is_rendered_once(openapi, monkeypatch):
+    dumps = Mock(wraps=json.dumps)
+    monkeypatch.setattr('middlewared.restful.json.dumps', dumps)
+    req = make_mocked_request('GET', '/api/v2.0', headers={'Host': 'truenas.local'})
+    first = await openapi.get(req)
+    calls = dumps.call_count
+    for i in range(10):
+        assert (await openapi.get(req)).body == first.body
+
+    assert dumps.call_count == calls
+    # Only the list of servers was serialized
+    assert all(len(call.args[0]) == 1 for call in dumps.call_args_list)
+
+    # Adding a path renders the document again
+    openapi.add_path('group', 'get', 'user.query', {'datastore_primary_key_type': 'integer'})
+    assert b'"/group"' in (await openapi.get(req)).body
+
+
+def test_variants_are_bounded(openapi):
+    for i in range(OPENAPI_DOCUMENT_VARIANTS * 2):
+        openapi.document([{'url': f'http://host{i}/api/v2.0'}])
+
+    assert len(openapi._documents) == OPENAPI_DOCUMENT_VARIANTS
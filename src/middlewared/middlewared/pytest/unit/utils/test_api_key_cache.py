@@ -0,0 +1,140 @@
+import threading
+import time
+from unittest.mock import patch
+
+from middlewared.utils.api_key_cache import ApiKeyCache
+
+KEY = '1-' + 'a' * 64
+
+
+def test_verification_is_cached():
+    cache = ApiKeyCache()
+    digest = cache.digest(KEY)
+    assert cache.get(digest) is None
+
+    cache.put(digest, cache.generation, 1, 'user', 'result')
+    assert cache.get(digest).result == 'result'
+    assert cache.get(cache.digest('1-' + 'b' * 64)) is None
+    # Digest is keyed by per-process secret
+    assert digest != ApiKeyCache().digest(KEY)
+
+
+def test_verification_expires():
+    cache = ApiKeyCache(ttl=60)
+    digest = cache.digest(KEY)
+    now = time.monotonic()
+    with patch('middlewared.utils.api_key_cache.time.monotonic', return_value=now):
+        cache.put(digest, cache.generation, 1, 'user', 'result')
+
+    with patch('middlewared.utils.api_key_cache.time.monotonic', return_value=now + 59):
+        assert cache.get(digest) is not None
+
+    with patch('middlewared.utils.api_key_cache.time.monotonic', return_value=now + 60):
+        assert cache.get(digest) is None
+
+
+def test_verification_does_not_outlive_key():
+    cache = ApiKeyCache(ttl=60)
+    digest = cache.digest(KEY)
+    cache.put(digest, cache.generation, 1, 'user', 'result', time.time() - 1)
+    assert cache.get(digest) is None
+
+
+def test_invalidate():
+    cache = ApiKeyCache()
+    keys = {f'{i}-key': cache.digest(f'{i}-key') for i in range(4)}
+    for i, digest in enumerate(keys.values()):
+        cache.put(digest, cache.generation, i, f'user{i % 2}', i)
+
+    cache.invalidate(key_id=0)
+    assert [cache.get(digest) is not None for digest in keys.values()] == [False, True, True, True]
+
+    cache.invalidate(username='user1')
+    assert [cache.get(digest) is not None for digest in keys.values()] == [False, False, True, False]
+
+    cache.invalidate()
+    assert not cache.entries
+
+
+def test_verification_started_before_revocation_is_not_cached():
+    cache = ApiKeyCache()
+    digest = cache.digest(KEY)
+    generation = cache.generation
+    # Key is revoked while PAM conversation is in progress
+    cache.invalidate(key_id=1)
+    cache.put(digest, generation, 1, 'user', 'result')
+    assert cache.get(digest) is None
+
+    cache.put_failure(digest, generation)
+    assert not cache.failed(digest)
+
+
+def test_failures():
+    cache = ApiKeyCache(failure_ttl=10)
+    digest = cache.digest(KEY)
+    now = time.monotonic()
+    with patch('middlewared.utils.api_key_cache.time.monotonic', return_value=now):
+        cache.put_failure(digest, cache.generation)
+        assert cache.failed(digest)
+
+    with patch('middlewared.utils.api_key_cache.time.monotonic', return_value=now + 10):
+        assert not cache.failed(digest)
+
+    cache.put_failure(digest, cache.generation)
+    # User may have been unlocked
+    cache.invalidate(username='user')
+    assert not cache.failed(digest)
+
+
+def test_cache_is_bounded():
+    cache = ApiKeyCache(maxsize=10, failure_maxsize=10)
+    for i in range(100):
+        cache.put(cache.digest(f'{i}-key'), cache.generation, i, 'user', i)
+        cache.put_failure(cache.digest(f'{i}-bad'), cache.generation)
+
+    assert len(cache.entries) == 10
+    assert len(cache.failures) == 10
+    assert cache.get(cache.digest('99-key')).result == 99
+    assert cache.get(cache.digest('0-key')) is None
+
+
+def test_concurrent_revocation():
+    cache = ApiKeyCache()
+    digest = cache.digest(KEY)
+    revoked = threading.Event()
+    stop = threading.Event()
+
+    def authenticate():
+        while not stop.is_set():
+            generation = cache.generation
+            # Simulate PAM conversation that only succeeds for a key that has not been revoked yet
+            valid = not revoked.is_set()
+            if valid:
+                cache.put(digest, generation, 1, 'user', 'result')
+
+    threads = [threading.Thread(target=authenticate) for i in range(4)]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(0.05)
+    revoked.set()
+    cache.invalidate(key_id=1)
+    time.sleep(0.05)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    assert cache.get(digest) is None
+
+
+def test_throughput():
+    cache = ApiKeyCache()
+    digests = [cache.digest(f'{i}-key') for i in range(100)]
+    for i, digest in enumerate(digests):
+        cache.put(digest, cache.generation, i, 'user', i)
+
+    start = time.monotonic()
+    for i in range(100000):
+        assert cache.get(cache.digest(f'{i % 100}-key')) is not None
+    # A single pbkdf2-sha512 verification takes longer than this per request
+    assert (time.monotonic() - start) / 100000 < 0.001
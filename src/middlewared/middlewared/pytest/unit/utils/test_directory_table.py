@@ -0,0 +1,153 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from middlewared.service_exception import MatchNotFound
+from middlewared.utils.directory_table import DirectoryTable, scan_directory
+
+
+class Tree:
+    """
+    Synthetic sysfs-like tree: every directory in `root` is an entry with a `value` attribute file.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.reads = []
+        self.scans = 0
+
+    def add(self, name, value):
+        os.makedirs(os.path.join(self.root, name), exist_ok=True)
+        with open(os.path.join(self.root, name, 'value'), 'w') as f:
+            f.write(str(value))
+
+    def remove(self, name):
+        os.unlink(os.path.join(self.root, name, 'value'))
+        os.rmdir(os.path.join(self.root, name))
+
+    def scan(self):
+        self.scans += 1
+        for path, inode in scan_directory(self.root):
+            yield path, inode, {'name': os.path.basename(path)}
+
+    def read(self, path, keys):
+        self.reads.append(keys['name'])
+        try:
+            with open(os.path.join(path, 'value')) as f:
+                return {'name': keys['name'], 'value': int(f.read())}
+        except FileNotFoundError:
+            return None
+
+
+@pytest.fixture()
+def tree(tmp_path):
+    tree = Tree(str(tmp_path))
+    for i in range(100):
+        tree.add(f'entry{i:03d}', i)
+    return tree
+
+
+def test_entries_are_read_once(tree):
+    table = DirectoryTable(tree.scan, tree.read, ['name'], ttl=0)
+
+    assert table.query([['value', '>=', 50]], {'count': True}) == 50
+    assert len(tree.reads) == 100
+
+    tree.add('entry100', 100)
+    tree.remove('entry000')
+    tree.reads.clear()
+    result = table.query([], {'order_by': ['-value'], 'limit': 2})
+    assert result == [{'name': 'entry100', 'value': 100}, {'name': 'entry099', 'value': 99}]
+    # Only the added directory was read
+    assert tree.reads == ['entry100']
+    assert ('entry000' not in {os.path.basename(path) for path, inode in table.entries})
+
+
+def test_recreated_directory_is_read_again(tree):
+    table = DirectoryTable(tree.scan, tree.read, ['name'], ttl=0)
+    assert table.query([['name', '=', 'entry001']], {'get': True})['value'] == 1
+
+    tree.remove('entry001')
+    # Make sure the new directory does not get the inode of the removed one
+    tree.add('placeholder', 0)
+    tree.add('entry001', 1001)
+    assert table.query([['name', '=', 'entry001']], {'get': True})['value'] == 1001
+
+
+def test_filters_and_pagination_are_pushed_down(tree):
+    table = DirectoryTable(tree.scan, tree.read, ['name'], skips=False)
+
+    assert table.query([], {'count': True}) == 100
+    assert table.query([['name', '^', 'entry01']], {'count': True}) == 10
+    assert tree.reads == []
+
+    assert table.query([['name', '^', 'entry01']], {'order_by': ['-name'], 'offset': 1, 'limit': 2,
+                                                    'select': ['value']}) == [{'value': 18}, {'value': 17}]
+    assert sorted(tree.reads) == ['entry017', 'entry018']
+
+    assert table.query([['name', '=', 'entry050']], {'get': True}) == {'name': 'entry050', 'value': 50}
+    with pytest.raises(MatchNotFound):
+        table.query([['name', '=', 'missing']], {'get': True})
+
+    assert sorted(tree.reads) == ['entry017', 'entry018', 'entry050']
+
+
+def test_listing_is_cached(tree):
+    table = DirectoryTable(tree.scan, tree.read, ['name'], ttl=60)
+    table.query([], {'count': True})
+    tree.add('entry100', 100)
+    assert table.query([], {'count': True}) == 100
+    assert tree.scans == 1
+
+    with patch('middlewared.utils.directory_table.time.monotonic', return_value=table.listed + 61):
+        assert table.query([], {'count': True}) == 101
+
+    assert tree.scans == 2
+
+
+def test_skipped_entries_are_read_again(tree):
+    table = DirectoryTable(tree.scan, tree.read, ['name'], ttl=0)
+    os.unlink(os.path.join(tree.root, 'entry005', 'value'))
+    assert table.query([['name', '=', 'entry005']]) == []
+
+    tree.add('entry005', 5)
+    assert table.query([['name', '=', 'entry005']]) == [{'name': 'entry005', 'value': 5}]
+
+
+def test_pagination_skips_skipped_entries(tree):
+    table = DirectoryTable(tree.scan, tree.read, ['name'], ttl=0)
+    for i in (10, 12):
+        os.unlink(os.path.join(tree.root, f'entry{i:03d}', 'value'))
+
+    assert table.query([['name', '^', 'entry01']], {'count': True}) == 8
+    assert table.query([['name', '^', 'entry01']], {'order_by': ['name'], 'offset': 1, 'limit': 2}) == [
+        {'name': 'entry013', 'value': 13}, {'name': 'entry014', 'value': 14},
+    ]
+    assert table.query([['name', '^', 'entry01']], {'order_by': ['name'], 'get': True}) == {
+        'name': 'entry011', 'value': 11,
+    }
+    assert table.query([['name', '=', 'entry010']], {'count': True}) == 0
+
+
+def test_entry_ttl(tree):
+    table = DirectoryTable(tree.scan, tree.read, ['name'], ttl=0, entry_ttl=60)
+    assert table.query([['name', '=', 'entry005']], {'get': True})['value'] == 5
+
+    tree.add('entry005', 500)
+    assert table.query([['name', '=', 'entry005']], {'get': True})['value'] == 5
+
+    monotonic = table.entries[next(iter(table.entries))][1] + 61
+    with patch('middlewared.utils.directory_table.time.monotonic', return_value=monotonic):
+        assert table.query([['name', '=', 'entry005']], {'get': True})['value'] == 500
+
+
+def test_results_can_be_modified(tree):
+    table = DirectoryTable(tree.scan, tree.read, ['name'])
+    table.query([['name', '=', 'entry005']], {'get': True})['value'] = 0
+    assert table.query([['name', '=', 'entry005']], {'get': True})['value'] == 5
+
+
+def test_missing_root(tmp_path):
+    tree = Tree(str(tmp_path / 'missing'))
+    assert DirectoryTable(tree.scan, tree.read, ['name']).query() == []
@@ -0,0 +1,175 @@
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+
+from middlewared.utils import disk_stats
+from middlewared.utils.disk_stats import DiskStatsSampler
+
+DISKS = 400
+SAMPLES = 20
+
+
+def diskstats_line(major, minor, name, read_ops, read_sectors, write_ops, write_sectors, busy):
+    return (
+        f'{major:4d} {minor:7d} {name} {read_ops} 0 {read_sectors} 0 {write_ops} 0 {write_sectors} 0 0 {busy} '
+        f'{busy} 0 0 0 0 0 0\n'
+    )
+
+
+def disk_name(i):
+    return f'sd{chr(ord("a") + i // 26 - 1) if i >= 26 else ""}{chr(ord("a") + i % 26)}'
+
+
+@pytest.fixture()
+def fs(tmp_path):
+    """
+    `/proc/diskstats` and `/sys/block` fixtures for `DISKS` disks (with a partition each), every fourth disk
+    having 4k sectors.
+    """
+    diskstats = tmp_path / 'diskstats'
+    sys_block = tmp_path / 'block'
+    disks = [disk_name(i) for i in range(DISKS)]
+    for i, name in enumerate(disks):
+        os.makedirs(sys_block / name / 'queue')
+        (sys_block / name / 'queue/hw_sector_size').write_text('4096\n' if i % 4 == 0 else '512\n')
+
+    write_diskstats(diskstats, disks, 0)
+    with patch.object(disk_stats, 'get_disk_names', lambda: list(disks)):
+        with patch.object(disk_stats, 'get_disks_with_identifiers', side_effect=identifiers) as get_identifiers:
+            yield diskstats, sys_block, disks, get_identifiers
+
+
+def write_diskstats(path, disks, counter):
+    with open(path, 'w') as f:
+        f.write(diskstats_line(7, 0, 'loop0', 1, 1, 1, 1, 1))
+        for i, name in enumerate(disks):
+            f.write(diskstats_line(8, i * 16, name, counter + i, counter + 2 * i, counter + 3 * i, counter + 4 * i,
+                                   counter + 5 * i))
+            f.write(diskstats_line(8, i * 16 + 1, f'{name}1', 1, 1, 1, 1, 1))
+        f.write('   8       0 truncated 1 2 3\n')
+
+
+def identifiers(names):
+    return {name: f'{{serial}}SERIAL_{name}' for name in names}
+
+
+def legacy_get_disk_stats(diskstats, sys_block, available_disks, disk_identifier_mapping):
+    stats = {}
+    with open(diskstats, 'r') as disk_stats_fd:
+        for entry in disk_stats_fd:
+            parts = entry.strip().split()
+            if len(parts) < 14:
+                continue
+
+            disk_name = parts[2]
+            if disk_name not in available_disks:
+                continue
+
+            sector_size = 512
+            with open(os.path.join(sys_block, disk_name, 'queue/hw_sector_size'), 'r') as f:
+                sector_size = int(f.read().strip())
+
+            stats[disk_identifier_mapping.get(disk_name, disk_name)] = {
+                'reads': (int(parts[5]) * sector_size) / 1024,
+                'writes': (int(parts[9]) * sector_size) / 1024,
+                'read_ops': int(parts[3]),
+                'write_ops': int(parts[7]),
+                'busy': int(parts[12]),
+            }
+
+    return stats
+
+
+def test_sample(fs):
+    diskstats, sys_block, disks, get_identifiers = fs
+    sampler = DiskStatsSampler(diskstats_path=str(diskstats), sys_block_path=str(sys_block))
+    assert sampler.sample() == legacy_get_disk_stats(diskstats, sys_block, disks, identifiers(disks))
+    assert sampler.sample()['{serial}SERIAL_sda'] == {
+        'reads': 0.0, 'writes': 0.0, 'read_ops': 0, 'write_ops': 0, 'busy': 0,
+    }
+    assert sampler.sample()['{serial}SERIAL_sdb'] == {
+        'reads': 1.0, 'writes': 2.0, 'read_ops': 1, 'write_ops': 3, 'busy': 5,
+    }
+
+
+def test_sample_updates_stats_in_place(fs):
+    diskstats, sys_block, disks, get_identifiers = fs
+    sampler = DiskStatsSampler(diskstats_path=str(diskstats), sys_block_path=str(sys_block))
+    stats = sampler.sample()
+    sda = stats['{serial}SERIAL_sda']
+
+    write_diskstats(diskstats, disks, 100)
+    assert sampler.sample() is stats
+    assert stats['{serial}SERIAL_sda'] is sda
+    assert sda['read_ops'] == 100
+    assert sda['reads'] == 400.0
+    get_identifiers.assert_called_once()
+    assert sampler.generation == 1
+
+
+def test_initial_mapping(fs):
+    diskstats, sys_block, disks, get_identifiers = fs
+    sampler = DiskStatsSampler(
+        {name: f'{{devicename}}{name}' for name in disks[1:]}, str(diskstats), str(sys_block),
+    )
+    stats = sampler.sample()
+    assert '{serial}SERIAL_sda' in stats and '{devicename}sdb' in stats
+    get_identifiers.assert_called_once_with(['sda'])
+
+
+def test_disk_added_and_removed(fs):
+    diskstats, sys_block, disks, get_identifiers = fs
+    sampler = DiskStatsSampler(diskstats_path=str(diskstats), sys_block_path=str(sys_block))
+    sampler.sample()
+
+    removed = disks.pop(3)
+    write_diskstats(diskstats, disks, 0)
+    stats = sampler.sample()
+    assert f'{{serial}}SERIAL_{removed}' not in stats
+    assert len(stats) == DISKS - 1
+    assert sampler.generation == 2
+
+    disks.append('sdzz')
+    os.makedirs(sys_block / 'sdzz/queue')
+    (sys_block / 'sdzz/queue/hw_sector_size').write_text('4096\n')
+    write_diskstats(diskstats, disks, 0)
+    stats = sampler.sample()
+    assert stats['{serial}SERIAL_sdzz']['reads'] == (DISKS - 1) * 2 * 4
+    assert sampler.generation == 3
+    assert get_identifiers.call_count == 3
+
+
+def test_disk_not_in_dev_is_ignored(fs):
+    diskstats, sys_block, disks, get_identifiers = fs
+    sampler = DiskStatsSampler(diskstats_path=str(diskstats), sys_block_path=str(sys_block))
+    with patch.object(disk_stats, 'get_disk_names', lambda: disks[1:]):
+        assert '{serial}SERIAL_sda' not in sampler.sample()
+        sampler.sample()
+
+    # Set of disks did not change so there is no need to look for them again
+    assert sampler.generation == 1
+
+
+def test_missing_diskstats(tmp_path):
+    assert DiskStatsSampler(diskstats_path=str(tmp_path / 'diskstats')).sample() == {}
+
+
+def test_sample_benchmark(fs):
+    diskstats, sys_block, disks, get_identifiers = fs
+    start = time.monotonic()
+    for i in range(SAMPLES):
+        legacy = legacy_get_disk_stats(diskstats, sys_block, disks, identifiers(disks))
+    legacy_elapsed = time.monotonic() - start
+
+    sampler = DiskStatsSampler(diskstats_path=str(diskstats), sys_block_path=str(sys_block))
+    sampler.sample()
+    start = time.monotonic()
+    for i in range(SAMPLES):
+        result = sampler.sample()
+    elapsed = time.monotonic() - start
+
+    assert result == legacy
+    # Sector sizes are not read from `/sys/block` for every sample
+    assert elapsed < legacy_elapsed / 2, (elapsed, legacy_elapsed)
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from truenas_api_client import json
+
+from middlewared.utils.json_ import dumps_chunked
+
+
+def entry(i):
+    return {"id": i, "name": f"tank/dataset{i}", "properties": {"used": i * 1024, "readonly": bool(i % 2)}}
+
+
+@pytest.mark.parametrize("data", [
+    {"id": 1, "msg": "result", "result": None},
+    {"jsonrpc": "2.0", "result": [], "id": 1},
+    {"jsonrpc": "2.0", "result": [entry(i) for i in range(10)], "id": 1},
+    {"jsonrpc": "2.0", "result": [entry(i) for i in range(25)], "id": 1},
+    {"jsonrpc": "2.0", "result": [entry(i) for i in range(30)], "id": 1},
+    {"id": "ñ", "msg": "result", "result": [["a", "ü"]] * 21},
+])
+def test_dumps_chunked(data):
+    assert asyncio.run(dumps_chunked(data, 10)) == json.dumps(data)
+
+
+def test_dumps_chunked_yields():
+    data = {"jsonrpc": "2.0", "result": [entry(i) for i in range(100)], "id": 1}
+    ticks = []
+
+    async def main():
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(tick())
+        await asyncio.sleep(0)
+        try:
+            return await dumps_chunked(data, 10)
+        finally:
+            task.cancel()
+
+    assert asyncio.run(main()) == json.dumps(data)
+    assert len(ticks) >= 10
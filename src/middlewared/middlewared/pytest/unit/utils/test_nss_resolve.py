@@ -0,0 +1,132 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from middlewared.utils.nss import resolve
+from middlewared.utils.nss.nss_common import NssError, NssModule, NssOperation, NssReturnCode
+from middlewared.utils.nss.pwd import pwd_struct
+
+LOCAL_USERS = 1000
+IDS = 100000
+
+
+class StubPasswd:
+    """
+    NSS backend with `LOCAL_USERS` local users and directory service users for all other uids below `IDS`.
+    """
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.lookups = 0
+        self.enumerations = 0
+
+    def user(self, uid, module):
+        return pwd_struct(f'{module.lower()}-{uid}', uid, uid, '', '/var/empty', '/usr/sbin/nologin', module)
+
+    def getpwuid(self, uid, module=NssModule.ALL.name, as_dict=False):
+        self.lookups += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        match module:
+            case NssModule.FILES.name if uid < LOCAL_USERS:
+                return self.user(uid, module)
+            case NssModule.WINBIND.name if LOCAL_USERS <= uid < IDS:
+                return self.user(uid, module)
+            case NssModule.SSS.name:
+                raise NssError(0, NssOperation.GETPWUID, NssReturnCode.UNAVAIL, NssModule.SSS)
+
+        raise KeyError(uid)
+
+    def iterpw(self, module=NssModule.FILES.name, as_dict=False):
+        self.enumerations += 1
+        for uid in range(LOCAL_USERS):
+            yield self.user(uid, module)
+
+
+@pytest.fixture()
+def stub_pwd():
+    resolve.clear_cache()
+    stub = StubPasswd()
+    with patch.object(resolve, 'pwd', SimpleNamespace(getpwuid=stub.getpwuid, iterpw=stub.iterpw)):
+        yield stub
+
+    resolve.clear_cache()
+
+
+def test_resolve_names_few_ids(stub_pwd):
+    assert resolve.resolve_names('USER', [1, 1, 5000, IDS + 1]) == {
+        1: 'files-1',
+        5000: 'winbind-5000',
+        IDS + 1: None,
+    }
+    assert stub_pwd.enumerations == 0
+
+
+def test_resolve_names_caches_results(stub_pwd):
+    resolve.resolve_names('USER', [1, 5000, IDS + 1])
+    lookups = stub_pwd.lookups
+
+    assert resolve.resolve_names('USER', [1, 5000, IDS + 1]) == {1: 'files-1', 5000: 'winbind-5000', IDS + 1: None}
+    assert stub_pwd.lookups == lookups
+
+    assert resolve.resolve_names('USER', [1], use_cache=False) == {1: 'files-1'}
+    assert stub_pwd.lookups == lookups + 1
+
+
+def test_resolve_names_temporary_failure_not_cached(stub_pwd):
+    getpwuid = stub_pwd.getpwuid
+
+    def failing(uid, module=NssModule.ALL.name, as_dict=False):
+        if module == NssModule.WINBIND.name:
+            raise NssError(0, NssOperation.GETPWUID, NssReturnCode.TRYAGAIN, NssModule.WINBIND)
+        return getpwuid(uid, module)
+
+    with patch.object(resolve.pwd, 'getpwuid', failing):
+        assert resolve.resolve_names('USER', [5000]) == {5000: None}
+
+    assert resolve.resolve_names('USER', [5000]) == {5000: 'winbind-5000'}
+
+
+def test_id_name_cache_lru():
+    cache = resolve.IdNameCache(maxsize=2)
+    cache.put(1, 'a')
+    cache.put(2, 'b')
+    cache.get(1)
+    cache.put(3, 'c')
+
+    assert cache.get(1) == (True, 'a')
+    assert cache.get(2) == (False, None)
+    assert cache.get(3) == (True, 'c')
+
+
+def test_id_name_cache_expires():
+    cache = resolve.IdNameCache(ttl=-1)
+    cache.put(1, 'a')
+
+    assert cache.get(1) == (False, None)
+
+
+def test_resolve_names_benchmark(stub_pwd):
+    # Every id appears twice, e.g. both in user quota and user object quota lists
+    ids = list(range(IDS)) * 2
+
+    start = time.monotonic()
+    names = resolve.resolve_names('USER', ids)
+    elapsed = time.monotonic() - start
+
+    assert len(names) == IDS
+    assert names[0] == 'files-0'
+    assert names[IDS - 1] == f'winbind-{IDS - 1}'
+    # Local users are enumerated once, every other id is looked up exactly once in each directory service
+    assert stub_pwd.enumerations == 1
+    assert stub_pwd.lookups == (IDS - LOCAL_USERS) * 2
+
+    lookups = stub_pwd.lookups
+    start = time.monotonic()
+    assert resolve.resolve_names('USER', ids) == names
+    cached_elapsed = time.monotonic() - start
+
+    assert stub_pwd.lookups == lookups
+    assert cached_elapsed < elapsed
@@ -0,0 +1,130 @@
+import contextlib
+import os
+import time
+
+import pytest
+
+from middlewared.utils.open_files import resolve_targets, scan_processes
+
+
+def make_process(proc, pid, fds=(), cwd='/proc', maps=()):
+    os.makedirs(proc / str(pid) / 'fd')
+    for i, target in enumerate(fds):
+        os.symlink(target, proc / str(pid) / 'fd' / str(i))
+    os.symlink(cwd, proc / str(pid) / 'cwd')
+    with open(proc / str(pid) / 'maps', 'w') as f:
+        f.write('7f0000000000-7f0000001000 rw-p 00000000 00:00 0 \n')
+        for path in maps:
+            st = os.stat(path)
+            f.write(
+                f'7f0000001000-7f0000002000 r--p 00000000 {os.major(st.st_dev):02x}:{os.minor(st.st_dev):02x} '
+                f'{st.st_ino}                    {path}\n'
+            )
+
+
+@pytest.fixture()
+def fs(tmp_path):
+    proc = tmp_path / 'proc'
+    proc.mkdir()
+    (proc / 'self').mkdir()
+    data = tmp_path / 'data'
+    data.mkdir()
+    (data / 'file').write_text('')
+    (data / 'lib.so').write_text('')
+    return proc, data
+
+
+def test_scan_processes(fs):
+    proc, data = fs
+    make_process(proc, 1, fds=['/proc/version', data / 'file'])
+    make_process(proc, 2, fds=['/proc/version'], cwd=data)
+    make_process(proc, 3, fds=['/proc/version'], maps=[data / 'lib.so'])
+    make_process(proc, 4, fds=['/proc/version', '/dev/null'])
+    make_process(proc, 5, fds=[data / 'file'])
+
+    targets = resolve_targets({'data': [str(data)], 'null': ['/dev/null'], 'missing': ['/nonexistent']})
+    result = scan_processes(targets, proc_path=str(proc), include_paths=True, exclude_pids=[5])
+
+    assert result == {
+        'data': {
+            1: {str(data / 'file')},
+            2: {str(data)},
+            3: {str(data / 'lib.so')},
+        },
+        'null': {4: {'/dev/null'}},
+    }
+
+
+def test_scan_processes_no_targets(fs):
+    proc, data = fs
+    make_process(proc, 1, fds=[data / 'file'])
+
+    assert scan_processes(resolve_targets({'missing': ['/nonexistent']}), proc_path=str(proc)) == {}
+
+
+def test_scan_processes_without_paths(fs):
+    proc, data = fs
+    make_process(proc, 1, fds=[data / 'file', data / 'lib.so'])
+
+    result = scan_processes(resolve_targets({'data': [str(data)]}), proc_path=str(proc))
+
+    assert result == {'data': {1: set()}}
+
+
+def test_scan_processes_vanished_process(fs):
+    proc, data = fs
+    make_process(proc, 1, fds=[data / 'file'])
+    make_process(proc, 2, fds=[data / 'file'])
+    # process exited while we were iterating
+    os.unlink(proc / '2' / 'fd' / '0')
+    os.symlink(data / 'deleted', proc / '2' / 'fd' / '0')
+
+    result = scan_processes(resolve_targets({'data': [str(data)]}), proc_path=str(proc))
+
+    assert result == {'data': {1: set()}}
+
+
+def legacy_scan(proc, path):
+    """
+    The way `pool.dataset.processes_using_paths` used to walk `/proc` for a single dataset.
+    """
+    include_devs = [os.stat(path).st_dev]
+    result = []
+    for pid in os.listdir(proc):
+        if not pid.isdigit():
+            continue
+
+        with contextlib.suppress(FileNotFoundError, ProcessLookupError):
+            for f in os.listdir(f'{proc}/{pid}/fd'):
+                with contextlib.suppress(FileNotFoundError):
+                    if os.stat(f'{proc}/{pid}/fd/{f}').st_dev in include_devs:
+                        result.append(int(pid))
+                        break
+
+    return sorted(result)
+
+
+def test_scan_processes_benchmark(fs):
+    proc, data = fs
+    datasets = []
+    for i in range(5):
+        (data / f'ds{i}').mkdir()
+        datasets.append(str(data / f'ds{i}'))
+
+    for pid in range(1, 301):
+        fds = ['/proc/version'] * 100
+        if pid % 3 == 0:
+            fds[-1] = data / 'file'
+        make_process(proc, pid, fds=fds)
+
+    start = time.monotonic()
+    legacy = {path: legacy_scan(str(proc), path) for path in datasets}
+    legacy_elapsed = time.monotonic() - start
+
+    start = time.monotonic()
+    result = scan_processes(resolve_targets({path: [path] for path in datasets}), proc_path=str(proc))
+    elapsed = time.monotonic() - start
+
+    assert {path: sorted(pids) for path, pids in result.items()} == legacy
+    # Single pass over `/proc` for all datasets instead of one pass per dataset
+    assert elapsed < legacy_elapsed
@@ -1,16 +1,24 @@
 import asyncio
 import base64
 import binascii
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import copy
 import errno
+import gzip
+import hashlib
 import pam
+import threading
 import traceback
 import types
 import urllib.parse
 
 from aiohttp import web
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 from truenas_api_client import json
 
 from .api.base.server.app import App
@@ -22,6 +30,11 @@ from .service_exception import adapt_exception, CallError, MatchNotFound, Valida
 from .utils.auth import AA_LEVEL1, CURRENT_AAL
 from .utils.origin import ConnectionOrigin
 
+# Rendered OpenAPI documents are kept for this many distinct server URLs (these are derived from client-provided
+# headers, so their number must be bounded)
+OPENAPI_DOCUMENT_VARIANTS = 16
+OPENAPI_SERVERS_PLACEHOLDER = '\x00servers\x00'
+
 
 def parse_credentials(request):
     auth = request.headers.get('Authorization')
@@ -233,6 +246,9 @@ class RESTfulAPI(object):
 
             await asyncio.sleep(0)  # Force context switch
 
+        # All the paths are known now. Render the OpenAPI document once instead of serializing it on every request.
+        await self.middleware.run_in_thread(self._openapi.render)
+
 
 class OpenAPIResource(object):
 
@@ -262,6 +278,11 @@ class OpenAPIResource(object):
                 'scheme': 'basic'
             },
         }
+        self._lock = threading.Lock()
+        # JSON text of the document before and after the list of servers
+        self._template = None
+        # Content coding -> (ETag, body) of the document keyed by the list of servers
+        self._documents = OrderedDict()
 
     def add_path(self, path, operation, methodname, service_config):
         assert operation in ('get', 'post', 'put', 'delete')
@@ -350,6 +371,9 @@ class OpenAPIResource(object):
                 opobject['responses']['200'] = self._returns_to_request(methodname, method_returns)
 
         self._paths[f'/{path}'][operation] = opobject
+        with self._lock:
+            self._template = None
+            self._documents.clear()
 
     def _convert_schema(self, schema):
         """
@@ -437,8 +461,7 @@ class OpenAPIResource(object):
             }
         }
 
-    def get(self, req, **kwargs):
-
+    def servers(self, req):
         servers = []
         host = req.headers.get('Host')
         scheme = req.headers.get('X-Scheme') or req.scheme
@@ -451,7 +474,10 @@ class OpenAPIResource(object):
                 'url': f'{scheme}://{host}/api/v2.0',
             })
 
-        result = {
+        return servers
+
+    def result(self, servers):
+        return {
             'openapi': '3.0.0',
             'info': {
                 'title': 'TrueNAS RESTful API',
@@ -463,10 +489,87 @@ class OpenAPIResource(object):
             'security': [{'basic': []}],
         }
 
-        resp = web.Response()
-        resp.headers['Content-type'] = 'application/json'
-        resp.text = json.dumps(result, indent=True)
-        return resp
+    def render(self):
+        """
+        Serialize the document once. Only the list of servers depends on the request, so the document is
+        serialized with a placeholder in its place which is then replaced with the actual list.
+        """
+        text = json.dumps(self.result(OPENAPI_SERVERS_PLACEHOLDER), indent=True)
+        prefix, suffix = text.split(json.dumps(OPENAPI_SERVERS_PLACEHOLDER))
+        with self._lock:
+            self._template = (prefix, suffix)
+            self._documents.clear()
+
+        return prefix, suffix
+
+    def document(self, servers):
+        key = tuple(server['url'] for server in servers)
+        with self._lock:
+            if (encodings := self._documents.get(key)) is not None:
+                self._documents.move_to_end(key)
+                return encodings
+
+            template = self._template
+
+        if template is None:
+            template = self.render()
+
+        prefix, suffix = template
+        # Serialize the servers list at the same indentation level as it has in the document
+        servers_text = json.dumps({'servers': servers}, indent=True)[len('{\n "servers": '):-len('\n}')]
+        body = (prefix + servers_text + suffix).encode('utf-8')
+
+        digest = hashlib.sha256(body).hexdigest()
+        encodings = {'identity': (f'"{digest}"', body)}
+        encodings['gzip'] = (f'"{digest}-gzip"', gzip.compress(body, mtime=0))
+        if brotli is not None:
+            encodings['br'] = (f'"{digest}-br"', brotli.compress(body, mode=brotli.MODE_TEXT, quality=9))
+
+        with self._lock:
+            if self._template is template:
+                self._documents[key] = encodings
+                while len(self._documents) > OPENAPI_DOCUMENT_VARIANTS:
+                    self._documents.popitem(last=False)
+
+        return encodings
+
+    def _encoding(self, req, encodings):
+        accepted = {}
+        for coding in req.headers.get('Accept-Encoding', '').split(','):
+            coding, *params = [v.strip() for v in coding.split(';')]
+            q = 1.0
+            for param in params:
+                if param.startswith('q='):
+                    try:
+                        q = float(param[2:])
+                    except ValueError:
+                        pass
+
+            if coding:
+                accepted[coding.lower()] = q
+
+        for coding in ('br', 'gzip'):
+            if coding in encodings and accepted.get(coding, accepted.get('*', 0)) > 0:
+                return coding
+
+        return 'identity'
+
+    async def get(self, req, **kwargs):
+        encodings = await self.rest.middleware.run_in_thread(self.document, self.servers(req))
+        coding = self._encoding(req, encodings)
+        etag, body = encodings[coding]
+
+        headers = {'ETag': etag, 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+        if_none_match = req.headers.get('If-None-Match')
+        if if_none_match is not None and (
+            if_none_match.strip() == '*' or etag in [v.strip() for v in if_none_match.split(',')]
+        ):
+            return web.Response(status=304, headers=headers)
+
+        if coding != 'identity':
+            headers['Content-Encoding'] = coding
+
+        return web.Response(body=body, content_type='application/json', headers=headers)
 
 
 class Resource(object):
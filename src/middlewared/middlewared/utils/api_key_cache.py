@@ -0,0 +1,127 @@
+import collections
+import hashlib
+import hmac
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+
+# Successful API key verifications are reused for this long so that REST API clients sending the same key with every
+# request do not go through PAM (and pbkdf2 hash verification) each time
+API_KEY_CACHE_TTL = 60
+API_KEY_CACHE_SIZE = 1024
+# Failed verifications are remembered for this long to reduce load generated by brute-force attempts
+API_KEY_FAILURE_TTL = 10
+API_KEY_FAILURE_CACHE_SIZE = 4096
+
+
+@dataclass(slots=True, frozen=True)
+class VerifiedApiKey:
+    key_id: int
+    username: str
+    result: Any
+    expires: float  # monotonic
+
+
+class ApiKeyCache:
+    """
+    Bounded cache of API key verification results.
+
+    Entries are keyed by HMAC of the presented key with a per-process random secret so that neither plain-text keys
+    nor anything that can be used to verify a guessed key offline is kept in memory.
+
+    Every invalidation bumps `generation`. Verification results are only stored if no invalidation happened since
+    the verification started (see `put`), so a key revoked while it was being verified is never cached as valid.
+    """
+
+    def __init__(self, ttl: int = API_KEY_CACHE_TTL, maxsize: int = API_KEY_CACHE_SIZE,
+                 failure_ttl: int = API_KEY_FAILURE_TTL, failure_maxsize: int = API_KEY_FAILURE_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.failure_ttl = failure_ttl
+        self.failure_maxsize = failure_maxsize
+        self.secret = os.urandom(32)
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.failures = collections.OrderedDict()
+        self.generation = 0
+
+    def digest(self, key: str) -> bytes:
+        return hmac.new(self.secret, key.encode(), hashlib.sha256).digest()
+
+    def get(self, digest: bytes) -> VerifiedApiKey | None:
+        """Returns valid cached verification for the key with `digest`."""
+        with self.lock:
+            if (entry := self.entries.get(digest)) is None:
+                return None
+
+            if time.monotonic() >= entry.expires:
+                self.entries.pop(digest)
+                return None
+
+            self.entries.move_to_end(digest)
+            return entry
+
+    def put(self, digest: bytes, generation: int, key_id: int, username: str, result: Any,
+            expires_at: float | None = None) -> None:
+        """
+        Cache successful verification of the key with `digest` that was started when the cache was at `generation`.
+        `expires_at` is the key expiration (UNIX timestamp); the entry never outlives the key.
+        """
+        expires = time.monotonic() + self.ttl
+        if expires_at is not None:
+            expires = min(expires, time.monotonic() + expires_at - time.time())
+
+        with self.lock:
+            if generation != self.generation:
+                return
+
+            self.failures.pop(digest, None)
+            self.entries[digest] = VerifiedApiKey(key_id, username, result, expires)
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def failed(self, digest: bytes) -> bool:
+        """Returns `True` if verification of the key with `digest` has failed recently."""
+        with self.lock:
+            if (expires := self.failures.get(digest)) is None:
+                return False
+
+            if time.monotonic() >= expires:
+                self.failures.pop(digest)
+                return False
+
+            return True
+
+    def put_failure(self, digest: bytes, generation: int) -> None:
+        with self.lock:
+            if generation != self.generation:
+                return
+
+            self.failures[digest] = time.monotonic() + self.failure_ttl
+            self.failures.move_to_end(digest)
+            while len(self.failures) > self.failure_maxsize:
+                self.failures.popitem(last=False)
+
+    def invalidate(self, key_id: int | None = None, username: str | None = None) -> None:
+        """
+        Forget verifications of the API key `key_id` or of any API key belonging to `username`. All the
+        verifications are forgotten if neither is specified. Remembered failures are always forgotten as the change
+        might have made failing keys valid.
+        """
+        with self.lock:
+            self.generation += 1
+            self.failures.clear()
+            if key_id is None and username is None:
+                self.entries.clear()
+                return
+
+            for digest, entry in list(self.entries.items()):
+                if entry.key_id == key_id or entry.username == username:
+                    self.entries.pop(digest)
+
+
+API_KEY_CACHE = ApiKeyCache()
@@ -0,0 +1,131 @@
+import copy
+import itertools
+import os
+import threading
+import time
+
+from middlewared.utils import filter_getattrs, filter_list, NULLS_FIRST, NULLS_LAST, REVERSE_CHAR
+
+DIRECTORY_TABLE_TTL = 5
+
+
+def scan_directory(path):
+    """
+    Yields `(path, inode)` of the sub-directories of `path`. Inodes come from the directory entries so no
+    sub-directory is stat'ed.
+    """
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    yield entry.path, entry.inode()
+    except (FileNotFoundError, NotADirectoryError):
+        return
+
+
+class DirectoryTable:
+    """
+    Table of entries read from directories that the kernel creates and removes (e.g. iSCSI sessions in SCST sysfs,
+    NFSv4 clients in nfsd procfs).
+
+    `scan()` yields `(path, inode, keys)` for every directory where `keys` are the entry fields that can be derived
+    from the path alone. `read(path, keys)` reads the complete entry (or returns `None` to skip the directory).
+
+    Directory listing is cached for `ttl` seconds. Entries are read only when they are needed and then kept for as
+    long as the directory exists (or for `entry_ttl` seconds if their values change over time). Directories are
+    identified by their path and inode so that a directory re-created with the same name is read again.
+
+    `skips` must be set to `False` if `read` never returns `None`, so that the directories can be counted without
+    reading them.
+    """
+
+    def __init__(self, scan, read, key_fields, ttl=DIRECTORY_TABLE_TTL, entry_ttl=None, skips=True):
+        self.scan = scan
+        self.read = read
+        self.key_fields = set(key_fields)
+        self.skips = skips
+        self.ttl = ttl
+        self.entry_ttl = entry_ttl
+        self.lock = threading.Lock()
+        self.listed = None
+        self.directories = []
+        # (path, inode) -> (entry, time.monotonic() it was read at)
+        self.entries = {}
+
+    def listing(self):
+        with self.lock:
+            if self.listed is None or self.listed <= time.monotonic() - self.ttl:
+                self.directories = list(self.scan())
+                self.listed = time.monotonic()
+                current = {(path, inode) for path, inode, keys in self.directories}
+                for key in self.entries.keys() - current:
+                    del self.entries[key]
+
+            return self.directories
+
+    def entry(self, path, inode, keys):
+        with self.lock:
+            cached = self.entries.get((path, inode))
+
+        if cached is not None and (self.entry_ttl is None or cached[1] > time.monotonic() - self.entry_ttl):
+            return cached[0]
+
+        # Entries that are skipped are not remembered, the directory might be incomplete yet
+        if (entry := self.read(path, keys)) is not None:
+            with self.lock:
+                self.entries[(path, inode)] = (entry, time.monotonic())
+
+        return entry
+
+    def keys_suffice(self, filters, options):
+        if not filter_getattrs(filters) <= self.key_fields:
+            return False
+
+        return all(
+            o.removeprefix(NULLS_FIRST).removeprefix(NULLS_LAST).removeprefix(REVERSE_CHAR) in self.key_fields
+            for o in options.get('order_by', [])
+        )
+
+    def query(self, filters=None, options=None):
+        """
+        Apply `filters` and `options` to the table entries.
+
+        Unless fields that are not derived from directory paths are used for filtering or sorting, directories are
+        filtered and sorted first so that only the entries in the returned page are read (and none for `count` unless
+        `read` can skip directories). Skipped directories are not included in the page.
+        """
+        options = options or {}
+        directories = self.listing()
+        if not self.keys_suffice(filters, options):
+            entries = [entry for entry in (self.entry(*directory) for directory in directories) if entry is not None]
+            return copy.deepcopy(filter_list(entries, filters, options))
+
+        rows = {}
+        for directory in directories:
+            row = dict(directory[2])
+            rows[id(row)] = row, directory
+
+        matching = filter_list(
+            [row for row, directory in rows.values()], filters, {'order_by': options.get('order_by', [])},
+        )
+        offset = options.get('offset', 0)
+        limit = 1 if options.get('get') else options.get('limit', 0)
+        if not self.skips:
+            if options.get('count'):
+                return len(matching)
+
+            matching = matching[offset:offset + limit if limit else None]
+            offset = 0
+
+        entries = (entry for entry in (self.entry(*rows[id(row)][1]) for row in matching) if entry is not None)
+        if options.get('count'):
+            return sum(1 for entry in entries)
+
+        page = list(itertools.islice(entries, offset, offset + limit if limit else None))
+        return copy.deepcopy(filter_list(page, [], {k: v for k, v in options.items() if k in ('select', 'get')}))
+
+    def clear(self):
+        with self.lock:
+            self.listed = None
+            self.directories = []
+            self.entries = {}
@@ -2,48 +2,102 @@ import contextlib
 import logging
 import os
 
-from .disks import get_disk_names, get_disks_with_identifiers
+from .disks import get_disk_names, get_disks_with_identifiers, VALID_WHOLE_DISK
 
 
 logger = logging.getLogger(__name__)
 
+DISKSTATS_PATH = '/proc/diskstats'
+SYS_BLOCK_PATH = '/sys/block'
+# default sector size if we are not able to find it keeping in line with netdata
+DEFAULT_SECTOR_SIZE = 512
+
+
+class DiskStatsSampler:
+    """
+    Samples `/proc/diskstats` for whole disks reporting them by their identifiers.
+
+    Identifiers and sector sizes of the disks are retrieved when a disk is added or removed (i.e. the set of whole
+    disks listed in `/proc/diskstats` changes) and are reused otherwise. Per-disk stats dicts are updated in place
+    by every sample, `generation` is increased whenever the set of sampled disks changes.
+    """
+
+    def __init__(
+        self, disk_identifier_mapping: dict | None = None, diskstats_path: str = DISKSTATS_PATH,
+        sys_block_path: str = SYS_BLOCK_PATH,
+    ):
+        self.diskstats_path = diskstats_path
+        self.sys_block_path = sys_block_path
+        self.disk_identifier_mapping = disk_identifier_mapping or {}
+        self.disk_names = None
+        # disk name => (stats dict, sector size in KiB)
+        self.disks = {}
+        self.stats = {}
+        self.generation = 0
+
+    def sector_size(self, disk_name: str) -> int:
+        with contextlib.suppress(FileNotFoundError, ValueError):
+            with open(os.path.join(self.sys_block_path, disk_name, 'queue/hw_sector_size'), 'r') as f:
+                return int(f.read().strip())
+
+        return DEFAULT_SECTOR_SIZE
+
+    def refresh(self, disk_names: set[str]):
+        available_disks = set(get_disk_names())
+        names = [disk_name for disk_name in disk_names if disk_name in available_disks]
+        mapping = {name: self.disk_identifier_mapping[name] for name in names if name in self.disk_identifier_mapping}
+        if missing := [name for name in names if name not in mapping]:
+            mapping.update(get_disks_with_identifiers(missing))
+
+        # Mapping passed by the caller is only trusted for the initial disks
+        self.disk_identifier_mapping = {}
+        self.disks = {}
+        self.stats = {}
+        for name in names:
+            stats = self.stats[mapping.get(name, name)] = {
+                'reads': 0,
+                'writes': 0,
+                'read_ops': 0,
+                'write_ops': 0,
+                'busy': 0,
+            }
+            self.disks[name] = (stats, self.sector_size(name) / 1024)
+
+        self.disk_names = disk_names
+        self.generation += 1
+
+    def sample(self) -> dict[str, dict]:
+        try:
+            with open(self.diskstats_path, 'r') as f:
+                lines = f.read().splitlines()
+        except IOError:
+            return {}
+
+        entries = {}
+        for line in lines:
+            parts = line.split()
+            if len(parts) < 14:
+                continue  # skip lines that don't have all the fields
+
+            if VALID_WHOLE_DISK.match(parts[2]):
+                entries[parts[2]] = parts
+
+        if self.disk_names is None or entries.keys() != self.disk_names:
+            self.refresh(set(entries))
+
+        for disk_name, (stats, sector_size_kb) in self.disks.items():
+            parts = entries[disk_name]
+            try:
+                stats['read_ops'] = int(parts[3])
+                stats['reads'] = int(parts[5]) * sector_size_kb
+                stats['write_ops'] = int(parts[7])
+                stats['writes'] = int(parts[9]) * sector_size_kb
+                stats['busy'] = int(parts[12])
+            except ValueError as e:
+                logger.error('Failed to parse disk stats for %r: %r', disk_name, e)
+
+        return self.stats
+
 
 def get_disk_stats(disk_identifier_mapping: dict | None = None) -> dict[str, dict]:
-    disk_identifier_mapping = disk_identifier_mapping or get_disks_with_identifiers()
-    available_disks = get_disk_names()
-    stats = {}
-    with contextlib.suppress(IOError):
-        with open('/proc/diskstats', 'r') as disk_stats_fd:
-            for entry in disk_stats_fd:
-                parts = entry.strip().split()
-                if len(parts) < 14:
-                    continue  # skip lines that don't have all the fields
-
-                disk_name = parts[2]
-                if disk_name not in available_disks:
-                    continue
-
-                sector_size = 512  # default sector size if we are not able to find it keeping in line with netdata
-                with contextlib.suppress(FileNotFoundError, ValueError):
-                    with open(os.path.join('/sys/block', disk_name, 'queue/hw_sector_size'), 'r') as f:
-                        sector_size = int(f.read().strip())
-
-                try:
-                    read_ops = int(parts[3])
-                    read_sectors = int(parts[5])
-                    write_ops = int(parts[7])
-                    write_sectors = int(parts[9])
-                    busy_time = int(parts[12])
-                except (IndexError, ValueError) as e:
-                    logger.error('Failed to parse disk stats for %r: %r', disk_name, e)
-                    continue
-
-                stats[disk_identifier_mapping.get(disk_name, disk_name)] = {
-                    'reads': (read_sectors * sector_size) / 1024,  # convert to kb
-                    'writes': (write_sectors * sector_size) / 1024,  # convert to kb
-                    'read_ops': read_ops,
-                    'write_ops': write_ops,
-                    'busy': busy_time,
-                }
-
-    return stats
+    return DiskStatsSampler(disk_identifier_mapping).sample()
@@ -30,6 +30,15 @@ def get_disk_serial_from_block_device(block_device: pyudev.Device) -> str:
     )
 
 
+def get_partition_name(disk: str, partition: int) -> str:
+    if disk.startswith(('nvme', 'pmem')):
+        # FIXME: This is a hack for nvme/pmem disks, however let's please come up with a better way
+        # to link disks with their partitions
+        return f'{disk}p{partition}'
+    else:
+        return f'{disk}{partition}'
+
+
 def valid_zfs_partition_uuids():
     # https://salsa.debian.org/debian/gdisk/blob/master/parttypes.cc for valid zfs types
     # 516e7cba was being used by freebsd and 6a898cc3 is being used by linux
@@ -0,0 +1,35 @@
+import asyncio
+
+from truenas_api_client import json
+
+__all__ = ["dumps_chunked"]
+
+# Number of list items JSON-encoded at once before yielding to the event loop
+CHUNK_SIZE = 1000
+
+
+async def dumps_chunked(data: dict, chunk_size: int = CHUNK_SIZE) -> str:
+    """
+    Returns the same string as `json.dumps(data)`, but lists (i.e. method call results) that are values of `data` and
+    contain more than `chunk_size` items are encoded `chunk_size` items at a time, yielding to the event loop in
+    between, so that encoding very large messages does not block it.
+    """
+    if not any(isinstance(value, list) and len(value) > chunk_size for value in data.values()):
+        return json.dumps(data)
+
+    items = []
+    for key, value in data.items():
+        if isinstance(value, list) and len(value) > chunk_size:
+            chunks = []
+            for i in range(0, len(value), chunk_size):
+                # Strip the brackets of the encoded chunk
+                chunks.append(json.dumps(value[i:i + chunk_size])[1:-1])
+                await asyncio.sleep(0)
+
+            encoded = "[" + ", ".join(chunks) + "]"
+        else:
+            encoded = json.dumps(value)
+
+        items.append(f"{json.dumps(key)}: {encoded}")
+
+    return "{" + ", ".join(items) + "}"
@@ -0,0 +1,138 @@
+import enum
+import threading
+import time
+
+from collections import OrderedDict
+from . import grp, pwd
+from .nss_common import NssError, NssModule, NssReturnCode
+
+ID_CACHE_SIZE = 131072
+ID_CACHE_TTL = 300
+# Past this amount of unresolved ids it is cheaper to enumerate local accounts once
+# than to look each of the ids up in the files database individually
+FILES_ENUMERATE_THRESHOLD = 32
+
+
+class IdNameCache:
+    """
+    Thread-safe LRU cache of id -> name mappings. Ids that do not resolve are cached as well
+    (with a name of None) so that listing e.g. quotas of deleted accounts does not hit the
+    directory service over and over again.
+    """
+    def __init__(self, maxsize=ID_CACHE_SIZE, ttl=ID_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+
+    def get(self, xid):
+        """
+        Returns `(found, name)` tuple.
+        """
+        with self.lock:
+            try:
+                name, expires = self.data[xid]
+            except KeyError:
+                return False, None
+
+            if expires < time.monotonic():
+                del self.data[xid]
+                return False, None
+
+            self.data.move_to_end(xid)
+            return True, name
+
+    def put(self, xid, name):
+        with self.lock:
+            self.data[xid] = (name, time.monotonic() + self.ttl)
+            self.data.move_to_end(xid)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class IdType(enum.Enum):
+    USER = ('getpwuid', 'iterpw', 'pw_uid', 'pw_name')
+    GROUP = ('getgrgid', 'itergrp', 'gr_gid', 'gr_name')
+
+    def __init__(self, getbyid, iterall, id_attr, name_attr):
+        self.getbyid = getbyid
+        self.iterall = iterall
+        self.id_attr = id_attr
+        self.name_attr = name_attr
+
+    @property
+    def nss(self):
+        return pwd if self is IdType.USER else grp
+
+
+CACHES = {id_type: IdNameCache() for id_type in IdType}
+
+
+def __lookup(id_type, xid, modules):
+    getbyid = getattr(id_type.nss, id_type.getbyid)
+    for mod in modules:
+        try:
+            return getattr(getbyid(xid, module=mod.name), id_type.name_attr)
+        except KeyError:
+            continue
+        except NssError as e:
+            if e.return_code != NssReturnCode.UNAVAIL:
+                raise
+
+    return None
+
+
+def resolve_names(id_type, ids, use_cache=True):
+    """
+    Resolve uids (`id_type` USER) or gids (`id_type` GROUP) to user or group names.
+
+    Duplicate ids are only resolved once, local accounts are looked up in a single pass over
+    the files database and only the remaining ids are queried from directory services.
+
+    Returns a dictionary keyed by id, the value is None if the id cannot be resolved.
+    """
+    id_type = IdType[id_type]
+    cache = CACHES[id_type]
+    result = {}
+    missing = set()
+    for xid in set(ids):
+        if use_cache:
+            found, name = cache.get(xid)
+            if found:
+                result[xid] = name
+                continue
+
+        missing.add(xid)
+
+    modules = [mod for mod in NssModule if mod != NssModule.ALL]
+    if len(missing) >= FILES_ENUMERATE_THRESHOLD:
+        for entry in getattr(id_type.nss, id_type.iterall)(module=NssModule.FILES.name):
+            if (xid := getattr(entry, id_type.id_attr)) in missing:
+                result[xid] = getattr(entry, id_type.name_attr)
+                missing.discard(xid)
+                if use_cache:
+                    cache.put(xid, result[xid])
+
+        modules.remove(NssModule.FILES)
+
+    for xid in missing:
+        try:
+            result[xid] = __lookup(id_type, xid, modules)
+        except NssError:
+            # Directory service is temporarily failing, do not cache the id as unresolvable
+            result[xid] = None
+            continue
+
+        if use_cache:
+            cache.put(xid, result[xid])
+
+    return result
+
+
+def clear_cache():
+    for cache in CACHES.values():
+        cache.clear()
@@ -0,0 +1,150 @@
+import contextlib
+import os
+import stat
+from collections import defaultdict
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+__all__ = ['ScanTargets', 'resolve_targets', 'scan_processes']
+
+SCAN_WORKERS = 8
+# `/proc/<pid>/maps` marks mappings of unlinked files this way
+DELETED_SUFFIX = ' (deleted)'
+
+
+@dataclass(slots=True)
+class ScanTargets:
+    """
+    Targets resolved to the identifiers that can be compared against `stat()` of a process
+    file descriptor (or the device/inode pair of a memory mapping) without any path lookups.
+
+    `by_dev`: filesystems (i.e. dataset mountpoints) keyed by their `st_dev`. Any file
+        living on the filesystem matches.
+
+    `by_node`: device nodes keyed by their `(st_dev, st_ino)`.
+
+    `by_rdev`: block devices (i.e. zvols) keyed by their `st_rdev` so that a device opened
+        through a different device node (e.g. inside of a container) still matches.
+    """
+    by_dev: dict = field(default_factory=lambda: defaultdict(set))
+    by_node: dict = field(default_factory=lambda: defaultdict(set))
+    by_rdev: dict = field(default_factory=lambda: defaultdict(set))
+
+    def __bool__(self):
+        return bool(self.by_dev or self.by_node or self.by_rdev)
+
+    def match(self, st_dev, st_ino, st_mode=0, st_rdev=0):
+        keys = set()
+        if self.by_dev:
+            keys |= self.by_dev.get(st_dev, set())
+        if self.by_node:
+            keys |= self.by_node.get((st_dev, st_ino), set())
+        if self.by_rdev and stat.S_ISBLK(st_mode):
+            keys |= self.by_rdev.get(st_rdev, set())
+        return keys
+
+
+def resolve_targets(targets: Mapping[str, Iterable[str]]) -> ScanTargets:
+    """
+    Resolve `targets` (a mapping of a result key to the paths it consists of) for `scan_processes`.
+
+    Device nodes are matched by their identity, any other path matches everything on the filesystem
+    it lives on. Paths that do not exist are silently skipped.
+    """
+    resolved = ScanTargets()
+    for key, paths in targets.items():
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            if stat.S_ISBLK(st.st_mode) or stat.S_ISCHR(st.st_mode):
+                resolved.by_node[(st.st_dev, st.st_ino)].add(key)
+                if stat.S_ISBLK(st.st_mode):
+                    resolved.by_rdev[st.st_rdev].add(key)
+            else:
+                resolved.by_dev[st.st_dev].add(key)
+
+    return resolved
+
+
+def _scan_fds(pid_path, targets, include_paths, found):
+    with os.scandir(f'{pid_path}/fd') as it:
+        for entry in it:
+            # Process might close the fd while we're iterating
+            with contextlib.suppress(FileNotFoundError):
+                st = os.stat(entry.path)
+                for key in targets.match(st.st_dev, st.st_ino, st.st_mode, st.st_rdev):
+                    paths = found[key]
+                    if include_paths:
+                        # We need to readlink to convert `/proc/<pid>/fd/<fd>` to the file's path name.
+                        paths.add(os.readlink(entry.path))
+
+
+def _scan_cwd(pid_path, targets, include_paths, found):
+    with contextlib.suppress(FileNotFoundError):
+        st = os.stat(f'{pid_path}/cwd')
+        for key in targets.match(st.st_dev, st.st_ino):
+            paths = found[key]
+            if include_paths:
+                paths.add(os.readlink(f'{pid_path}/cwd'))
+
+
+def _scan_maps(pid_path, targets, include_paths, found):
+    # Memory mappings carry device and inode numbers so there is no need to stat anything
+    with contextlib.suppress(FileNotFoundError), open(f'{pid_path}/maps') as f:
+        for line in f:
+            # address perms offset dev inode pathname
+            fields = line.split(maxsplit=5)
+            if len(fields) < 6 or fields[4] == '0':
+                # anonymous mapping
+                continue
+
+            major, minor = fields[3].split(':')
+            dev = os.makedev(int(major, 16), int(minor, 16))
+            for key in targets.match(dev, int(fields[4])):
+                paths = found[key]
+                if include_paths:
+                    paths.add(fields[5].rstrip('\n').removesuffix(DELETED_SUFFIX))
+
+
+def _scan_pid(proc_path, pid, targets, include_paths):
+    pid_path = f'{proc_path}/{pid}'
+    found = defaultdict(set)
+    # FileNotFoundError/ProcessLookupError for when a process is killed/exits while we're iterating,
+    # PermissionError for processes in other user namespaces we are not allowed to inspect
+    with contextlib.suppress(FileNotFoundError, ProcessLookupError, PermissionError):
+        _scan_fds(pid_path, targets, include_paths, found)
+        _scan_cwd(pid_path, targets, include_paths, found)
+        _scan_maps(pid_path, targets, include_paths, found)
+
+    return pid, found
+
+
+def scan_processes(
+    targets: ScanTargets, *, proc_path: str = '/proc', include_paths: bool = False,
+    exclude_pids: Iterable[int] = (), max_workers: int = SCAN_WORKERS,
+) -> dict[str, dict[int, set[str]]]:
+    """
+    Walk all processes once and find the ones that have open files, memory mappings or current working
+    directory on any of the resolved `targets`.
+
+    Returns a dictionary keyed by target keys, containing a mapping of PIDs that use the target to the set
+    of their paths using it (the set is only populated when `include_paths` is set).
+    """
+    result = defaultdict(dict)
+    if not targets:
+        return result
+
+    exclude_pids = set(exclude_pids)
+    with os.scandir(proc_path) as it:
+        pids = [int(entry.name) for entry in it if entry.name.isdigit() and int(entry.name) not in exclude_pids]
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scan_processes') as executor:
+        for pid, found in executor.map(lambda pid: _scan_pid(proc_path, pid, targets, include_paths), pids):
+            for key, paths in found.items():
+                result[key][pid] = paths
+
+    return result
@@ -0,0 +1,78 @@
+from middlewared.test.integration.utils import call
+from middlewared.test.integration.utils.mock import mock
+from middlewared.test.integration.utils.mock_db import mock_table_contents
+
+DISKS = 1000
+
+
+def sys_disk(i):
+    name = f"sd{chr(ord('a') + i // 26 // 26)}{chr(ord('a') + i // 26 % 26)}{chr(ord('a') + i % 26)}"
+    return name, {
+        "name": name,
+        "serial": f"SERIAL{i}",
+        "lunid": f"5000c500{i:08x}",
+        "serial_lunid": f"SERIAL{i}_5000c500{i:08x}",
+        "rotationrate": 7200,
+        "type": "HDD",
+        "size": 12000138625024,
+        "subsystem": "scsi",
+        "number": 2048 + i,
+        "model": "ST12000NM0027",
+        "bus": "SCSI",
+        "dif": False,
+        "parts": [],
+    }
+
+
+def db_disk(name, disk):
+    return {
+        "disk_identifier": f"{{serial_lunid}}{disk['serial_lunid']}",
+        "disk_name": name,
+        "disk_serial": disk["serial"],
+        "disk_lunid": disk["lunid"],
+        "disk_rotationrate": disk["rotationrate"],
+        "disk_type": disk["type"],
+        "disk_size": str(disk["size"]),
+        "disk_subsystem": disk["subsystem"],
+        "disk_number": disk["number"],
+        "disk_model": disk["model"],
+        "disk_bus": disk["bus"],
+    }
+
+
+def test_sync_all_large_number_of_disks():
+    sys_disks = dict(sys_disk(i) for i in range(DISKS))
+    rows = [db_disk(name, disk) for name, disk in sys_disks.items()]
+    # disks moved to other slots
+    for row in rows[:100]:
+        row["disk_number"] += 1
+    # disks that are gone
+    for row in rows[100:110]:
+        sys_disks.pop(row["disk_name"])
+    # new disks
+    for i in range(DISKS, DISKS + 10):
+        name, disk = sys_disk(i)
+        sys_disks[name] = disk
+
+    with mock_table_contents("storage.disk", rows):
+        with mock("device.get_disks", return_value=sys_disks):
+            with mock("disk.restart_services_after_sync", return_value=None):
+                call("disk.sync_all", job=True)
+
+                disks = {
+                    disk["identifier"]: disk
+                    for disk in call("datastore.query", "storage.disk", [], {"prefix": "disk_"})
+                }
+                assert len(disks) == DISKS + 10
+                for name, disk in sys_disks.items():
+                    stored = disks[f"{{serial_lunid}}{disk['serial_lunid']}"]
+                    assert stored["name"] == name
+                    assert stored["number"] == disk["number"]
+                    assert stored["expiretime"] is None
+
+                for row in rows[100:110]:
+                    assert disks[row["disk_identifier"]]["expiretime"] is not None
+
+                # Nothing to write the second time
+                assert call("disk.sync_all", job=True) == "OK"
+                assert call("datastore.query", "storage.disk", [], {"prefix": "disk_"}) == list(disks.values())
@@ -3,8 +3,14 @@ from unittest.mock import ANY
 
 import pytest
 
-from middlewared.test.integration.utils import call, mock
+from middlewared.test.integration.utils import call, mock, ssh
+from middlewared.test.integration.utils.mock_binary import mock_binary
 
+SMARTCTL_LAUNCHES = "/tmp/smartctl_launches"
+
+
+def smart_sample(temperature):
+    return [{"temperature": {"current": temperature}}, False, None]
 
 
 @pytest.fixture(autouse=True, scope="function")
@@ -13,36 +19,65 @@ def reset_temperature_cache():
 
 
 def test_disk_temperature():
-    with mock("disk.temperature_uncached", return_value=50):
+    with mock("disk.smart_sample", return_value=smart_sample(50)):
         assert call("disk.temperature", "sda") == 50
 
 
 def test_disk_temperature_cache():
-    with mock("disk.temperature_uncached", return_value=50):
+    with mock("disk.smart_sample", return_value=smart_sample(50)):
         call("disk.temperature", "sda")
 
-    with mock("disk.temperature_uncached", exception=True):
+    with mock("disk.smart_sample", exception=True):
         assert call("disk.temperature", "sda", {"cache": 300}) == 50
 
 
 def test_disk_temperature_cache_expires():
-    with mock("disk.temperature_uncached", return_value=50):
+    with mock("disk.smart_sample", return_value=smart_sample(50)):
         call("disk.temperature", "sda")
 
     time.sleep(3)
 
-    with mock("disk.temperature_uncached", return_value=60):
+    with mock("disk.smart_sample", return_value=smart_sample(60)):
         assert call("disk.temperature", "sda", {"cache": 2}) == 60
 
 
 def test_disk_temperatures_only_cached():
-    with mock("disk.temperature_uncached", return_value=50):
+    with mock("disk.smart_sample", return_value=smart_sample(50)):
         call("disk.temperature", "sda")
 
-    with mock("disk.temperature_uncached", exception=True):
+    with mock("disk.smart_sample", exception=True):
         assert call("disk.temperatures", ["sda"], {"only_cached": True}) == {"sda": 50}
 
 
+def test_disk_temperature_standby():
+    with mock("disk.smart_sample", return_value=[None, True, "Device is in STANDBY mode, exit(2)"]):
+        assert call("disk.temperature", "sda", {"powermode": "STANDBY"}) is None
+
+    # Disk in standby is not queried again unless it is allowed to wake it up
+    with mock("disk.smart_sample", exception=True):
+        assert call("disk.temperature", "sda", {"cache": 300, "powermode": "STANDBY"}) is None
+
+    with mock("disk.smart_sample", return_value=smart_sample(50)):
+        assert call("disk.temperature", "sda", {"cache": 300, "powermode": "NEVER"}) == 50
+
+
+def test_disk_temperatures_smartctl_is_launched_once():
+    disks = [disk["name"] for disk in call("disk.query", [["name", "!=", None]])]
+    ssh(f"rm -f {SMARTCTL_LAUNCHES}")
+    with mock("disk.smartctl_args", return_value=["/dev/null"]):
+        with mock_binary("/usr/sbin/smartctl", code=f"""\
+print(json.dumps({{"temperature": {{"current": 40}}, "smart_support": {{"available": True}}}}))
+with open({SMARTCTL_LAUNCHES!r}, "a") as f:
+    f.write(" ".join(sys.argv[1:]) + "\\n")
+""", exitcode=0):
+            assert call("disk.temperatures", disks) == {disk: 40 for disk in disks}
+            assert call("disk.temperatures", disks, {"cache": 60}) == {disk: 40 for disk in disks}
+            assert call("disk.temperature", disks[0], {"cache": 60}) == 40
+
+            launches = ssh(f"cat {SMARTCTL_LAUNCHES}").splitlines()
+            assert sorted(launches) == ["/dev/null -a -n never --json=c"] * len(disks)
+
+
 def test_disk_temperature_alerts():
     sda_temperature_alert = {
         "uuid": "a11a16a9-a28b-4005-b11a-bce6af008d86",
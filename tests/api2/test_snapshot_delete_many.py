@@ -0,0 +1,83 @@
+import contextlib
+import time
+
+import pytest
+
+from middlewared.test.integration.assets.pool import dataset
+from middlewared.test.integration.utils import call, ssh
+
+FILE_POOL = "test_snapshot_delete_many"
+FILE_POOL_VDEV = f"/var/tmp/{FILE_POOL}.img"
+SNAPSHOTS_COUNT = 10000
+
+
+@contextlib.contextmanager
+def file_pool():
+    ssh(f"truncate -s 2G {FILE_POOL_VDEV}")
+    try:
+        ssh(f"zpool create -o altroot=/mnt {FILE_POOL} {FILE_POOL_VDEV}")
+        try:
+            yield FILE_POOL
+        finally:
+            ssh(f"zpool destroy -f {FILE_POOL}")
+    finally:
+        ssh(f"rm -f {FILE_POOL_VDEV}")
+
+
+def create_snapshots(ds, names):
+    # `zfs snapshot` creates all snapshots specified on the command line in a single transaction
+    ssh(f"printf '{ds}@%s\\n' {' '.join(names)} | xargs -n 1000 zfs snapshot")
+
+
+def snapshot_names(ds):
+    return sorted(snap["name"] for snap in call("zfs.snapshot.query", [["dataset", "=", ds]], {"select": ["name"]}))
+
+
+def test_delete_many():
+    with dataset("test_snapshot_delete_many") as ds:
+        create_snapshots(ds, [f"snap-{i}" for i in range(10)])
+
+        result = call("zfs.snapshot.delete_many", [
+            f"{ds}@snap-0",
+            f"{ds}@snap-2%snap-4",
+            f"{ds}@missing",
+            f"{ds}@snap-8%",
+            "invalid",
+        ], job=True)
+
+        assert [status["error"] is None for status in result] == [True, True, False, True, False]
+        assert snapshot_names(ds) == [f"{ds}@snap-{i}" for i in (1, 5, 6, 7)]
+
+
+def test_delete_many_reports_failures_per_snapshot():
+    with dataset("test_snapshot_delete_many_hold") as ds:
+        create_snapshots(ds, [f"snap-{i}" for i in range(10)])
+        ssh(f"zfs hold keep {ds}@snap-3")
+        try:
+            result = call("zfs.snapshot.delete_many", [f"{ds}@snap-{i}" for i in range(10)], job=True)
+        finally:
+            ssh(f"zfs release keep {ds}@snap-3")
+
+        assert [status["snapshot"] for status in result if status["error"]] == [f"{ds}@snap-3"]
+        assert snapshot_names(ds) == [f"{ds}@snap-3"]
+
+
+@pytest.mark.timeout(3600)
+def test_delete_many_benchmark():
+    with file_pool() as pool:
+        ds = f"{pool}/benchmark"
+        ssh(f"zfs create {ds}")
+
+        create_snapshots(ds, [f"bulk-{i}" for i in range(500)])
+        start = time.monotonic()
+        call("core.bulk", "zfs.snapshot.delete", [[f"{ds}@bulk-{i}"] for i in range(500)], job=True)
+        bulk_per_snapshot = (time.monotonic() - start) / 500
+
+        create_snapshots(ds, [f"many-{i}" for i in range(SNAPSHOTS_COUNT)])
+        start = time.monotonic()
+        result = call("zfs.snapshot.delete_many", [f"{ds}@many-0%many-{SNAPSHOTS_COUNT - 1}"], job=True)
+        many_per_snapshot = (time.monotonic() - start) / SNAPSHOTS_COUNT
+
+        assert result == [{"snapshot": f"{ds}@many-0%many-{SNAPSHOTS_COUNT - 1}", "error": None}]
+        assert snapshot_names(ds) == []
+        assert many_per_snapshot < bulk_per_snapshot / 10, (many_per_snapshot, bulk_per_snapshot)